@@ -3,6 +3,7 @@ import asyncio
 import logging
 import os
 import re
+import socket
 import sqlite3
 import sys
 from urllib.parse import urlparse
@@ -91,12 +92,15 @@ except (ImportError, AttributeError, RuntimeError) as e:
         SCHEDULE_ENABLED = False
         SCHEDULE_HOURS = None
         SCHEDULE_ONE_PER_DAY = False
+        QUEUE_LEASE_SECONDS = 600
 
     settings = FallbackSettings()
 
 from database import Database
 from utils.scraper import scrape_yandex_market
-from utils.image_proc import process_image
+from utils.image_proc import prepare_image_cached
+from utils.queue_signal import wait_for_queue_item
+from services.image_dedup_service import format_hash, get_image_dedup_index, image_hash
 from utils.text_gen import generate_post_caption
 from services.utils import (
     is_valid_yandex_market_url,
@@ -105,10 +109,9 @@ from services.utils import (
     extract_discount_from_data,
 )
 from services.dependency_checker import check_dependencies
-from services.image_service import remove_exif, check_image_quality, improve_image
+from services.image_service import check_image_quality
 from services.error_handler import ErrorHandler
 from services.log_service import LogService
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # Logging - для EXE логи в AppData, для скрипта - в logs/
 import sys
@@ -204,6 +207,7 @@ class AdminStates(StatesGroup):
 # Singleton service instances - initialized once at module level
 from services.http_client import HTTPClient
 from database import Database
+from database_async import close_async_db, get_async_db
 
 http_client = HTTPClient()
 db = Database()
@@ -260,7 +264,7 @@ except ImportError:
     generate_qr_code = UrlService.generate_qr_code
     shorten_url = UrlService.shorten_url
 
-analytics = AnalyticsService(settings.DB_FILE)
+analytics = AnalyticsService()
 # auto_search будет инициализирован после создания bot и db
 
 # Инициализация error handler и log service
@@ -1016,8 +1020,10 @@ async def process_and_publish(
         logger.debug("process_and_publish: no title available for de-duplication check")
 
     # 3) Process image if present with quality check
-    photo_path = None
+    photo_bytes = None
+    photo_cache_key = None
     img_hash = None
+    img_phash = None
     if data.get("image_bytes"):
         try:
             # Проверка качества изображения
@@ -1031,26 +1037,40 @@ async def process_and_publish(
                     await bot.send_message(
                         chat_id, f"⚠️ Пропущено из-за качества: {quality_reason}"
                     )
-                photo_path = None
+                photo_bytes = None
                 img_hash = None
             else:
-                # Удаляем EXIF и улучшаем
-                cleaned_image = remove_exif(data["image_bytes"])
-                improved_image = improve_image(cleaned_image)
-                photo_path, img_hash = process_image(
-                    improved_image, settings.IMAGE_MAX_MB
+                # Улучшение и JPEG под лимит за одно декодирование (EXIF не переносится),
+                # повторная картинка берется из кэша
+                prepared = await asyncio.to_thread(
+                    prepare_image_cached, data["image_bytes"], settings.IMAGE_MAX_MB, True
                 )
+                photo_bytes, photo_cache_key, img_hash = (
+                    prepared.data,
+                    prepared.key,
+                    prepared.source_md5,
+                )
+                # Перцептивный хэш исходника - ловит ту же фотографию в другом JPEG
+                img_phash = await asyncio.to_thread(image_hash, data["image_bytes"])
         except Exception as e:
             logger.exception("process_and_publish: image processing failed: %s", e)
             if chat_id:
                 await bot.send_message(
                     chat_id, f"⚠️ Ошибка обработки изображения, продолжу без фото: {e}"
                 )
-            photo_path = None
+            photo_bytes = None
+            photo_cache_key = None
             img_hash = None
-
-    # 4) If image present, check duplicate image
-    if img_hash and db.exists_image(img_hash):
+            img_phash = None
+
+    # 4) If image present, check duplicate image (exact md5, then near-duplicate dHash)
+    duplicate_image = bool(img_hash and db.exists_image(img_hash))
+    if not duplicate_image and img_phash is not None:
+        similar_url = get_image_dedup_index().find_duplicate(img_phash)
+        if similar_url:
+            logger.info("process_and_publish: image of %s is similar to %s", url, similar_url)
+            duplicate_image = True
+    if duplicate_image:
         if chat_id:
             await bot.send_message(
                 chat_id, f"⚠️ Дубликат изображения обнаружен для: {url}"
@@ -1060,9 +1080,6 @@ async def process_and_publish(
             url,
             correlation_id,
         )
-        # cleanup photo if created
-        if photo_path and os.path.exists(photo_path):
-            os.remove(photo_path)
         return False, None
 
     # 4.5) Check filters
@@ -1076,8 +1093,6 @@ async def process_and_publish(
             reason,
             correlation_id,
         )
-        if photo_path and os.path.exists(photo_path):
-            os.remove(photo_path)
         return False, None
 
     # 4) Формирование финального URL для поста
@@ -1115,7 +1130,8 @@ async def process_and_publish(
     send_success, message_id = await send_post_to_channel(
         bot,
         data,
-        photo_path=photo_path,
+        photo_bytes=photo_bytes,
+        photo_cache_key=photo_cache_key,
         retry_count=retry_count,
         chat_id=chat_id,
         correlation_id=correlation_id,
@@ -1123,12 +1139,6 @@ async def process_and_publish(
     )
 
     if not send_success:
-        # Cleanup: удаляем временный файл изображения
-        if photo_path and os.path.exists(photo_path):
-            try:
-                os.remove(photo_path)
-            except Exception:
-                pass
         return False, None
 
     # 5.5) Pin message if flash sale (with 24h cooldown)
@@ -1186,8 +1196,13 @@ async def process_and_publish(
         title=title,
         message_id=message_id,
         channel_id=channel_id,
+        price=data.get("price"),  # база для мониторинга падения цен
         template_type=template_type,
+        brand=data.get("vendor") or data.get("brand"),
+        img_phash=format_hash(img_phash) if img_phash is not None else None,
     )
+    if img_phash is not None:
+        get_image_dedup_index().add(img_phash, url)
 
     # Update publishing state if we have queue_id (from queue processing)
     if queue_id and message_id:
@@ -1197,7 +1212,8 @@ async def process_and_publish(
         # Generate caption for database storage
         formatting_service = get_formatting_service()
         caption = await formatting_service.format_product_post(data)
-        db.update_publishing_state(
+        async_db = await get_async_db()
+        await async_db.update_publishing_state(
             queue_id,
             PublishingState.POSTED.value,
             message_id=message_id,
@@ -1227,48 +1243,31 @@ async def process_and_publish(
             logger.warning(f"Error recording posted product '{product_key}': {e}")
             # Don't fail the posting if recording fails
 
-    # Cleanup: удаляем временный файл изображения
-    if photo_path and os.path.exists(photo_path):
-        try:
-            os.remove(photo_path)
-        except Exception:
-            pass
-
     return True, message_id
 
 
-# --- Price Drop Monitor worker ---
-async def price_monitor_worker():
-    """Фоновый воркер для мониторинга падения цен (каждые 6 часов)"""
-    logger.info("📉 Price Drop Monitor worker started")
-
+# --- Price Drop Monitor job ---
+async def price_monitor_job():
+    """Проверка падения цен (задача планировщика, каждые 6 часов)"""
     from services.price_monitor import PriceMonitorService
 
-    monitor = PriceMonitorService(db)
-
-    while True:
-        try:
-            # Ждем 6 часов (21600 секунд)
-            await asyncio.sleep(6 * 60 * 60)
-
-            logger.info("🔍 Запуск проверки падения цен...")
+    logger.info("🔍 Запуск проверки падения цен...")
 
-            # Проверяем падение цен
-            price_drops = await monitor.check_price_drops(limit=50)
+    monitor = PriceMonitorService(await get_async_db())
 
-            if price_drops:
-                # Обрабатываем найденные падения цен
-                added_count = await monitor.process_price_drops(price_drops)
-                logger.info(
-                    f"📉 Обработано падений цен: {len(price_drops)}, добавлено в очередь: {added_count}"
-                )
-            else:
-                logger.info("📉 Падений цен не обнаружено")
+    # Проверяем падение цен
+    price_drops = await monitor.check_price_drops(
+        limit=getattr(settings, "PRICE_MONITOR_MAX_CHECKS", 50)
+    )
 
-        except Exception as e:
-            logger.exception(f"❌ Ошибка в Price Drop Monitor worker: {e}")
-            # При ошибке ждем 1 час перед следующей попыткой
-            await asyncio.sleep(60 * 60)
+    if price_drops:
+        # Обрабатываем найденные падения цен
+        added_count = await monitor.process_price_drops(price_drops)
+        logger.info(
+            f"📉 Обработано падений цен: {len(price_drops)}, добавлено в очередь: {added_count}"
+        )
+    else:
+        logger.info("📉 Падений цен не обнаружено")
 
 
 # --- Digest generation ---
@@ -1410,18 +1409,19 @@ async def send_digest(
         # Помечаем все товары как опубликованные
         from models.publishing_state import PublishingState
 
+        async_db = await get_async_db()
         for task_id, url in items:
             try:
-                db.update_publishing_state(
+                await async_db.update_publishing_state(
                     task_id,
                     PublishingState.POSTED.value,
                     message_id=message_id,
                     chat_id=settings.CHANNEL_ID,
                     text=digest_message,
                 )
-                db.mark_as_done(task_id)
+                await async_db.mark_as_done(task_id)
                 # Сохраняем в историю
-                db.add_post_to_history(
+                await async_db.add_post_to_history(
                     url=url,
                     img_hash="",  # Дайджест без изображения
                     title=f"Digest item: {url[:50]}",
@@ -1443,21 +1443,55 @@ async def send_digest(
 
 
 # --- Queue worker ---
+QUEUE_SCHEDULE_RECHECK = 600  # Макс. сон вне окна публикации (админ может поменять расписание)
+QUEUE_IDLE_RECHECK = 300  # Макс. ожидание на пустой очереди (истекшие аренды, scheduled_time)
+
+
+def seconds_until_publish_window(
+    schedule_settings: Dict[str, Any], last_publish_time, now
+) -> Optional[float]:
+    """
+    Сколько секунд до разрешенного расписанием времени публикации
+
+    Returns:
+        None - публиковать можно сейчас
+    """
+    from datetime import datetime, timedelta
+
+    if not schedule_settings.get("enabled"):
+        return None
+
+    # Проверка "один в день": уже опубликовано сегодня - ждем полуночи
+    if schedule_settings.get("one_per_day") and last_publish_time:
+        if now.date() == last_publish_time.date():
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            return max((midnight - now).total_seconds(), 1)
+
+    # Не время для публикации - ждем начала ближайшего разрешенного часа
+    schedule_hours = schedule_settings.get("hours", [])
+    if schedule_hours and now.hour not in schedule_hours:
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        for step in range(1, 25):
+            if (now.hour + step) % 24 in schedule_hours:
+                return max((hour_start + timedelta(hours=step) - now).total_seconds(), 1)
+    return None
+
+
 async def queue_worker(db=None, http_client=None) -> None:
     """Воркер автопубликации с поддержкой расписания"""
     from datetime import datetime
     from utils.correlation_id import set_correlation_id
 
-    # Use passed db instance or create a new one as fallback
+    # Очередь разбирается через AsyncDatabase, чтобы не блокировать event loop
     if db is None:
-        from database import Database
-
-        db = Database()
+        db = await get_async_db()
 
     global_settings = get_global_settings()
+    # Идентификатор воркера для аренды задач (несколько процессов могут разбирать одну очередь)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    lease_seconds = getattr(settings, "QUEUE_LEASE_SECONDS", 600)
     logger.info("🚀 Queue worker started")
     logger.info(f"Using db: {db is not None}, http_client: {http_client is not None}")
-    cache_cleanup_counter = 0
     publish_counter = 0
     last_publish_time = None
     posts_since_last_digest = 0  # Счетчик постов с последнего дайджеста
@@ -1469,39 +1503,24 @@ async def queue_worker(db=None, http_client=None) -> None:
                 await asyncio.sleep(60)  # Проверяем каждую минуту
                 continue
 
-            # Проверка расписания
+            # Проверка расписания: вне окна публикации спим до его начала
+            # (настройки перечитываются не реже чем раз в QUEUE_SCHEDULE_RECHECK сек)
             schedule_settings = global_settings.get_schedule_settings()
-            if schedule_settings.get("enabled"):
-                now = datetime.now()
-                current_hour = now.hour
-
-                # Проверяем, можно ли публиковать по расписанию
-                schedule_hours = schedule_settings.get("hours", [])
-                if schedule_hours and current_hour not in schedule_hours:
-                    # Не время для публикации
-                    await asyncio.sleep(60)
-                    continue
-
-                # Проверка "один в день"
-                if schedule_settings.get("one_per_day") and last_publish_time:
-                    if now.date() == last_publish_time.date():
-                        # Уже опубликовано сегодня
-                        await asyncio.sleep(60)
-                        continue
-
-            # Периодическая очистка старого кэша (каждые 100 итераций)
-            cache_cleanup_counter += 1
-            if cache_cleanup_counter >= 100:
-                db.clear_old_cache(max_age_hours=48)
-                cache_cleanup_counter = 0
-                logger.debug("Queue worker: cleared old cache")
+            wait_seconds = seconds_until_publish_window(
+                schedule_settings, last_publish_time, datetime.now()
+            )
+            if wait_seconds:
+                await asyncio.sleep(min(wait_seconds, QUEUE_SCHEDULE_RECHECK))
+                continue
 
             # Проверяем, пора ли отправлять дайджест
             should_send_digest = posts_since_last_digest >= settings.DIGEST_FREQUENCY
 
             if should_send_digest:
-                # Проверяем, достаточно ли товаров в очереди для дайджеста
-                queue_items = db.get_queue_urls(limit=settings.DIGEST_MAX_ITEMS)
+                # Атомарно арендуем товары для дайджеста (статус processing ставится там же)
+                queue_items = await db.claim_batch(
+                    settings.DIGEST_MAX_ITEMS, worker_id, lease_seconds
+                )
 
                 if len(queue_items) >= settings.DIGEST_MIN_ITEMS:
                     # Время для дайджеста! Берем несколько товаров
@@ -1513,14 +1532,8 @@ async def queue_worker(db=None, http_client=None) -> None:
                         f"(posts_since_last_digest={posts_since_last_digest}, correlation_id={correlation_id})"
                     )
 
-                    # Обновляем статусы всех товаров на processing
                     from models.publishing_state import PublishingState
 
-                    for task_id, url in digest_items:
-                        db.update_publishing_state(
-                            task_id, PublishingState.PROCESSING.value
-                        )
-
                     try:
                         # Отправляем дайджест
                         success, message_id = await send_digest(
@@ -1541,12 +1554,12 @@ async def queue_worker(db=None, http_client=None) -> None:
                                 f"Digest failed (correlation_id={correlation_id})"
                             )
                             for task_id, url in digest_items:
-                                db.update_publishing_state(
+                                await db.update_publishing_state(
                                     task_id,
                                     PublishingState.FAILED.value,
                                     error="Digest generation failed",
                                 )
-                                db.mark_as_error(task_id)
+                                await db.mark_as_error(task_id)
 
                             # Продолжаем с обычными постами
                             should_send_digest = False
@@ -1558,12 +1571,12 @@ async def queue_worker(db=None, http_client=None) -> None:
                         # Помечаем товары как failed
                         for task_id, url in digest_items:
                             try:
-                                db.update_publishing_state(
+                                await db.update_publishing_state(
                                     task_id,
                                     PublishingState.FAILED.value,
                                     error=str(digest_error)[:200],
                                 )
-                                db.mark_as_error(task_id)
+                                await db.mark_as_error(task_id)
                             except Exception:
                                 pass
 
@@ -1576,7 +1589,9 @@ async def queue_worker(db=None, http_client=None) -> None:
                     await asyncio.sleep(interval)
                     continue
                 else:
-                    # Недостаточно товаров для дайджеста, продолжаем обычные посты
+                    # Недостаточно товаров для дайджеста: возвращаем арендованные в очередь
+                    for task_id, url in queue_items:
+                        await db.release_claim(task_id, worker_id)
                     logger.debug(
                         f"Not enough items for digest ({len(queue_items)} < {settings.DIGEST_MIN_ITEMS}), "
                         f"continuing with single posts"
@@ -1585,9 +1600,9 @@ async def queue_worker(db=None, http_client=None) -> None:
 
             # Обычный режим: публикуем один товар
             if not should_send_digest:
-                task = db.get_next_from_queue()
-                if task:
-                    task_id, url = task
+                claimed = await db.claim_batch(1, worker_id, lease_seconds)
+                if claimed:
+                    task_id, url = claimed[0]
                     publish_counter += 1
                     # Устанавливаем correlation_id для этой задачи
                     correlation_id = set_correlation_id()
@@ -1600,17 +1615,15 @@ async def queue_worker(db=None, http_client=None) -> None:
                     logger.info(
                         "Queue worker: взял товар из очереди, URL: %s", url[:100]
                     )
-                    # Update publishing state: queued → processing
+                    # Publishing state queued → processing is set by claim_batch
                     from models.publishing_state import PublishingState
 
-                    db.update_publishing_state(
-                        task_id, PublishingState.PROCESSING.value
-                    )
-
                     logger.info("Queue worker: подготовка поста...")
                     try:
                         # Update publishing state: processing → ready (before publishing)
-                        db.update_publishing_state(task_id, PublishingState.READY.value)
+                        await db.update_publishing_state(
+                            task_id, PublishingState.READY.value
+                        )
 
                         success, message_id = await process_and_publish(
                             url, settings.ADMIN_ID, queue_id=task_id
@@ -1618,13 +1631,13 @@ async def queue_worker(db=None, http_client=None) -> None:
                         if success:
                             # Update publishing state: ready → posted (with message_id)
                             if message_id:
-                                db.update_publishing_state(
+                                await db.update_publishing_state(
                                     task_id,
                                     PublishingState.POSTED.value,
                                     message_id=message_id,
                                     chat_id=settings.CHANNEL_ID,
                                 )
-                            db.mark_as_done(task_id)
+                            await db.mark_as_done(task_id)
                             last_publish_time = datetime.now()
                             posts_since_last_digest += 1  # Увеличиваем счетчик постов
                             logger.info(
@@ -1636,12 +1649,12 @@ async def queue_worker(db=None, http_client=None) -> None:
                             )
                         else:
                             # Update publishing state: ready → failed
-                            db.update_publishing_state(
+                            await db.update_publishing_state(
                                 task_id,
                                 PublishingState.FAILED.value,
                                 error="Publication failed",
                             )
-                            db.mark_as_error(task_id)
+                            await db.mark_as_error(task_id)
                             logger.warning(
                                 "Queue worker: ошибка публикации, URL: %s (correlation_id=%s)",
                                 url[:100],
@@ -1650,10 +1663,10 @@ async def queue_worker(db=None, http_client=None) -> None:
                     except Exception as publish_error:
                         error_msg = str(publish_error)[:200]
                         # Update publishing state: ready → failed
-                        db.update_publishing_state(
+                        await db.update_publishing_state(
                             task_id, PublishingState.FAILED.value, error=error_msg
                         )
-                        db.mark_as_error(task_id)
+                        await db.mark_as_error(task_id)
                         logger.exception(
                             "Queue worker: исключение при публикации, URL: %s, error: %s (correlation_id=%s)",
                             url[:100],
@@ -1666,17 +1679,50 @@ async def queue_worker(db=None, http_client=None) -> None:
                     interval = schedule_settings.get("interval", settings.POST_INTERVAL)
                     await asyncio.sleep(interval)
                 else:
-                    # Если очередь пуста, проверяем каждые 60 секунд
+                    # Очередь пуста: ждем сигнала add_to_queue/release_claim
                     if publish_counter == 0:
-                        logger.debug(
-                            "Очередь пуста, жду товары... (проверка каждые 60 сек)"
-                        )
-                    await asyncio.sleep(60)
+                        logger.debug("Очередь пуста, жду товары...")
+                    await wait_for_queue_item(QUEUE_IDLE_RECHECK)
         except Exception as e:
             logger.exception("queue_worker error: %s", e)
             await asyncio.sleep(60)
 
 
+async def publish_next_from_queue(
+    chat_id: int = None, mark_error_on_failure: bool = False
+) -> Tuple[Optional[str], bool]:
+    """
+    Внеочередная публикация следующего товара (админские команды)
+
+    Товар арендуется через claim_batch, как в queue_worker, поэтому воркер
+    не опубликует его параллельно. При неудаче аренда снимается (товар
+    возвращается в очередь) или, с mark_error_on_failure, товар помечается ошибкой.
+
+    Returns:
+        (url, success); url is None - очередь пуста
+    """
+    async_db = await get_async_db()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:admin"
+    claimed = await async_db.claim_batch(
+        1, worker_id, getattr(settings, "QUEUE_LEASE_SECONDS", 600)
+    )
+    if not claimed:
+        return None, False
+
+    task_id, url = claimed[0]
+    success = False
+    try:
+        success, _ = await process_and_publish(url, chat_id, queue_id=task_id)
+    finally:
+        if success:
+            await async_db.mark_as_done(task_id)
+        elif mark_error_on_failure:
+            await async_db.mark_as_error(task_id)
+        else:
+            await async_db.release_claim(task_id, worker_id)
+    return url, success
+
+
 # --- Handlers ---
 def create_main_keyboard() -> InlineKeyboardMarkup:
     """Создает главную клавиатуру с кнопками команд"""
@@ -1956,31 +2002,12 @@ async def handle_log_action(callback: types.CallbackQuery, command: str):
             logs = log_service.get_recent_logs(limit=100, min_level="DEBUG")
             text = f"📋 <b>Все логи (последние {len(logs)}):</b>\n\n"
         elif command == "log_errors":
-            # Только ошибки
-            logs = log_service.get_important_logs(limit=50)
-            logs = [
-                log
-                for log in logs
-                if isinstance(log, dict)
-                and (
-                    "ERROR" in log.get("level", "")
-                    or "EXCEPTION" in log.get("message", "").upper()
-                )
-            ]
+            # Только ошибки (строки ERROR/CRITICAL находятся по индексу лога)
+            logs = log_service.get_recent_logs(limit=50, min_level="ERROR")
             text = f"❌ <b>Только ошибки ({len(logs)}):</b>\n\n"
         elif command == "log_warnings":
             # Ошибки и предупреждения
-            logs = log_service.get_important_logs(limit=50)
-            logs = [
-                log
-                for log in logs
-                if isinstance(log, dict)
-                and (
-                    "ERROR" in log.get("level", "")
-                    or "WARNING" in log.get("level", "")
-                    or "EXCEPTION" in log.get("message", "").upper()
-                )
-            ]
+            logs = log_service.get_recent_logs(limit=50, min_level="WARNING")
             text = f"⚠️ <b>Ошибки и предупреждения ({len(logs)}):</b>\n\n"
         elif command == "log_refresh":
             # Обновить - показываем важные логи
@@ -2143,20 +2170,16 @@ async def cmd_restart_button(callback: types.CallbackQuery):
 async def cmd_force_post_button(callback: types.CallbackQuery):
     """Обработчик кнопки срочного поста"""
     keyboard = create_back_button()
-    task = db.get_next_from_queue()
-    if task:
-        task_id, url = task
-        await callback.message.answer(f"⚡ Обрабатываю срочно: {url[:50]}...")
-        success, _ = await process_and_publish(
-            url, callback.message.chat.id
+    await callback.message.answer("⚡ Обрабатываю срочно следующий товар...")
+    url, success = await publish_next_from_queue(callback.message.chat.id)
+    if url is None:
+        await callback.message.answer("📭 Очередь пуста", reply_markup=keyboard)
+    elif success:
+        await callback.message.answer(
+            f"✅ Опубликовано: {url[:50]}...", reply_markup=keyboard
         )
-        if success:
-            db.mark_as_done(task_id)
-            await callback.message.answer("✅ Опубликовано!", reply_markup=keyboard)
-        else:
-            await callback.message.answer("❌ Ошибка публикации", reply_markup=keyboard)
     else:
-        await callback.message.answer("📭 Очередь пуста", reply_markup=keyboard)
+        await callback.message.answer("❌ Ошибка публикации", reply_markup=keyboard)
 
 
 async def cmd_last_post_button(callback: types.CallbackQuery):
@@ -2232,23 +2255,17 @@ async def cmd_check_auto_button(callback: types.CallbackQuery):
             logger.exception(f"Ошибка поиска товара: {e}")
             search_status += f"❌ Ошибка поиска: {str(e)[:100]}\n"
         # Сразу публикуем найденный товар
-        task = db.get_next_from_queue()
-        if task:
-            task_id, url = task
-            search_status += f"\n📤 Публикую товар...\n"
-            try:
-                success, message_id = await process_and_publish(
-                    url, settings.ADMIN_ID
-                )
-                if success:
-                    search_status += f"✅ Товар успешно опубликован!\n"
-                else:
-                    search_status += f"⚠️ Не удалось опубликовать товар\n"
-            except Exception as e:
-                logger.exception(f"Ошибка публикации {url}: {e}")
-                search_status += f"❌ Ошибка публикации: {str(e)[:100]}\n"
-        else:
-            search_status += f"\n⚠️ В очереди нет товаров для публикации\n"
+        try:
+            url, success = await publish_next_from_queue(settings.ADMIN_ID)
+            if url is None:
+                search_status += f"\n⚠️ В очереди нет товаров для публикации\n"
+            elif success:
+                search_status += f"\n✅ Товар успешно опубликован!\n"
+            else:
+                search_status += f"\n⚠️ Не удалось опубликовать товар\n"
+        except Exception as e:
+            logger.exception(f"Ошибка публикации: {e}")
+            search_status += f"❌ Ошибка публикации: {str(e)[:100]}\n"
 
     except Exception as e:
         logger.exception(f"Ошибка в cmd_check_auto_button: {e}")
@@ -2478,13 +2495,12 @@ async def cmd_turbo(message: types.Message):
         return
 
     # Получаем текущее задание
-    jobs = global_scheduler.get_jobs()
-    if not jobs:
+    job = global_scheduler.get_job("auto_search")
+    if not job:
         await message.answer("❌ Нет активных заданий автопоиска")
         return
 
-    job = jobs[0]  # Предполагаем, что первое задание - автопоиск
-    current_interval = job.trigger.interval.total_seconds()
+    current_interval = job.interval
 
     if current_interval > 60:  # Если интервал больше минуты, переключаем на turbo (10 сек)
         new_interval = 10
@@ -2494,11 +2510,7 @@ async def cmd_turbo(message: types.Message):
         await message.answer("🐢 Normal Mode ON (1 час)")
 
     # Перепланируем задание с новым интервалом
-    global_scheduler.reschedule_job(
-        job.id,
-        trigger='interval',
-        seconds=new_interval
-    )
+    global_scheduler.reschedule("auto_search", new_interval)
 
 @dp.message(Command("run_now"))
 async def cmd_run_now(message: types.Message):
@@ -2646,12 +2658,17 @@ async def cmd_ai_metrics(message: types.Message):
     try:
         from services.ai_metrics import get_ai_metrics
         from services.ai_cache import get_ai_cache
+        from services.ai_enrichment_service import get_ai_enrichment_service
 
         metrics = get_ai_metrics()
         cache = get_ai_cache()
 
         stats = metrics.get_stats()
         cache_stats = cache.get_stats()
+        gateway_stats = get_ai_enrichment_service().gateway.get_stats()
+        from services.ai_worker import get_ai_worker
+
+        worker_stats = get_ai_worker().get_stats()
 
         response = (
             f"🤖 <b>Метрики AI обогащения</b>\n\n"
@@ -2662,7 +2679,10 @@ async def cmd_ai_metrics(message: types.Message):
             f"  • Fallback (ai_fallback): {stats['ai_fallback']}\n"
             f"  • Успешность: {stats['ai_ok_ratio']:.1f}%\n\n"
             f"⏱ <b>Производительность:</b>\n"
-            f"  • Среднее время ответа: {stats['avg_timing_ms']:.0f} мс\n\n"
+            f"  • Среднее время ответа: {stats['avg_timing_ms']:.0f} мс\n"
+            f"  • Токены промпта: в среднем {stats['prompt_tokens_avg']:.0f}, p95 {stats['prompt_tokens_p95']:.0f}\n"
+            f"  • Токены ответа: в среднем {stats['completion_tokens_avg']:.0f}, p95 {stats['completion_tokens_p95']:.0f}\n"
+            f"  • Погрешность оценки токенов: {stats['token_estimate_error_pct']:.0f}%\n\n"
             f"💰 <b>Стоимость (24ч):</b>\n"
             f"  • Токены: {stats['total_tokens_24h']}\n"
             f"  • Стоимость: {stats['total_cost_24h']:.2f} ₽\n\n"
@@ -2675,7 +2695,27 @@ async def cmd_ai_metrics(message: types.Message):
             f"  • Всего записей: {cache_stats['total']}\n"
             f"  • Активных: {cache_stats['active']}\n"
             f"  • Истекших: {cache_stats['expired']}\n"
+            f"  • L2: {cache_stats['l2']}\n"
+            f"  • Попаданий: {stats['cache_hits']} (доля {stats['cache_hit_ratio']:.1f}%)\n"
+            f"  • Объединено промахов: {stats['cache_coalesced']}\n"
+            f"  • Выдано устаревших: {stats['cache_stale']}\n"
+            f"  • Сэкономлено: {stats['cache_cost_saved']:.2f} ₽\n\n"
+            f"🚦 <b>Очередь запросов:</b>\n"
+            f"  • HTTP запросов: {gateway_stats['requests']} (товаров на запрос: {gateway_stats['items_per_request']:.1f})\n"
+            f"  • Пакетов: {gateway_stats['batches']} (в среднем {gateway_stats['avg_batch_size']:.1f} товаров)\n"
+            f"  • Среднее ожидание лимита: {gateway_stats['avg_wait_ms']:.0f} мс\n"
+            f"  • Сейчас в очереди: {gateway_stats['queued']}\n\n"
+            f"⚙️ <b>AI воркер:</b>\n"
+            f"  • Лимит параллельности: {worker_stats['limit']} (активно {worker_stats['active']}, в очереди {worker_stats['queued']})\n"
+            f"  • Отброшено по дедлайну: {worker_stats['dropped_expired'] + worker_stats['dropped_deadline']}\n"
         )
+        for name in ("interactive", "normal", "background"):
+            if name in worker_stats:
+                timing = worker_stats[name]
+                response += (
+                    f"  • {name}: ожидание p95 {timing['queue_wait_p95_ms']:.0f} мс, "
+                    f"обработка p95 {timing['service_p95_ms']:.0f} мс\n"
+                )
 
         await message.answer(response, parse_mode=ParseMode.HTML)
 
@@ -2684,6 +2724,62 @@ async def cmd_ai_metrics(message: types.Message):
         await message.answer(f"❌ Ошибка: {str(e)[:200]}")
 
 
+@dp.message(Command("http_cache"))
+async def cmd_http_cache(message: types.Message):
+    """Кэш HTTP ответов страниц товаров: /http_cache [clear | <url>]"""
+    if message.from_user.id != settings.ADMIN_ID:
+        await message.answer("❌ Нет прав.")
+        return
+
+    try:
+        from html import escape
+
+        from services.http_response_cache import get_response_cache, normalize_url
+
+        cache = get_response_cache()
+        args = (message.text or "").split(maxsplit=1)
+        arg = args[1].strip() if len(args) > 1 else ""
+
+        if arg == "clear":
+            removed = cache.clear()
+            await message.answer(f"🧹 Кэш HTTP ответов очищен: {removed} записей")
+            return
+        if arg:
+            removed = cache.invalidate(arg)
+            await message.answer(
+                f"{'✅ Удалено' if removed else '⚠️ Нет в кэше'}: {escape(normalize_url(arg))}",
+                parse_mode=ParseMode.HTML,
+            )
+            return
+
+        stats = cache.get_stats()
+        response = (
+            f"🗄 <b>Кэш HTTP ответов</b>{'' if stats['enabled'] else ' (выключен)'}\n\n"
+            f"  • Записей: {stats['entries']}\n"
+            f"  • Объем: {stats['bytes'] / 1024:.0f} КБ (сжатие x{stats['compression_ratio']:.1f})\n"
+            f"  • Попаданий: {stats['hits']}, объединено запросов: {stats['coalesced']} "
+            f"(доля {stats['hit_ratio']:.0%})\n"
+            f"  • Запросов в сеть: {stats['network']}\n"
+            f"  • Перепроверок: {stats['revalidations']}, из них 304: {stats['not_modified']}\n"
+            f"  • Вытеснено: {stats['evicted']}\n"
+        )
+        top = cache.entries(limit=5)
+        if top:
+            response += "\n<b>Чаще всего:</b>\n"
+            for entry in top:
+                response += (
+                    f"  • {entry['hits']}× {entry['age_s'] / 60:.0f} мин "
+                    f"{escape(entry['url'][:80])}\n"
+                )
+        response += "\n<code>/http_cache clear</code> или <code>/http_cache &lt;url&gt;</code>"
+
+        await message.answer(response, parse_mode=ParseMode.HTML)
+
+    except Exception as e:
+        logger.exception("http_cache error: %s", e)
+        await message.answer(f"❌ Ошибка: {str(e)[:200]}")
+
+
 @dp.message(Command("login"))
 async def cmd_login(message: types.Message):
     """Интерактивный вход в Яндекс для сохранения cookies (только для админа)"""
@@ -3773,13 +3869,13 @@ async def cmd_analytics(message: types.Message):
         await message.answer("❌ Нет прав.")
         return
 
-    daily_stats = analytics.get_daily_stats(days=7)
-    category_stats = analytics.get_category_stats()
+    daily_stats = await analytics.get_daily_stats(days=7)
+    category_stats = await analytics.get_category_stats()
 
     text = "📊 <b>Детальная аналитика</b>\n\n"
     text += "<b>За последние 7 дней:</b>\n"
-    for stat in daily_stats[:7]:
-        text += f"📅 {stat['date']}: {stat['count']} постов\n"
+    for date_str, count in sorted(daily_stats.items(), reverse=True)[:7]:
+        text += f"📅 {date_str}: {count} постов\n"
 
     if category_stats:
         text += "\n<b>По категориям:</b>\n"
@@ -3935,6 +4031,17 @@ async def cmd_health(message: types.Message):
     else:
         health_status.append("⚠️ Мало места на диске")
 
+    # Пул HTTP соединений
+    from services.http_registry import get_http_registry
+
+    http_stats = get_http_registry().get_stats()
+    health_status.append(
+        f"🔌 HTTP пул: {http_stats['sessions']} сессий, "
+        f"переиспользовано {http_stats['reuse_ratio']:.0%} соединений "
+        f"({http_stats['connections_reused']}/"
+        f"{http_stats['connections_reused'] + http_stats['connections_created']})"
+    )
+
     text = "🏥 <b>Проверка здоровья бота</b>\n\n" + "\n".join(health_status)
     await message.answer(text, parse_mode=ParseMode.HTML)
 
@@ -3962,16 +4069,16 @@ async def cmd_batch(message: types.Message):
 
     processed = 0
     for _ in range(count):
-        task = db.get_next_from_queue()
-        if task:
-            task_id, url = task
-            success, _ = await process_and_publish(url, show_progress=False)
-            if success:
-                db.mark_as_done(task_id)
-                processed += 1
-            else:
-                db.mark_as_error(task_id)
-            await asyncio.sleep(2)  # Небольшая задержка между постами
+        try:
+            url, success = await publish_next_from_queue(mark_error_on_failure=True)
+        except Exception as e:
+            logger.exception(f"batch publish error: {e}")
+            continue
+        if url is None:
+            break
+        if success:
+            processed += 1
+        await asyncio.sleep(2)  # Небольшая задержка между постами
 
     await message.answer(f"✅ Обработано: {processed} из {count}")
 
@@ -5081,12 +5188,13 @@ async def handle_analytics_action(callback: types.CallbackQuery, command: str):
             queue_count = db.get_queue_count()
 
             # Получаем статистику через AnalyticsService
-            daily_stats = analytics.get_daily_stats(days=7)
-            category_stats = analytics.get_category_stats()
-            price_ranges = analytics.get_price_range_stats()
-            error_stats = analytics.get_error_stats()
-            time_distribution = analytics.get_time_distribution(days=7)
-            top_products = analytics.get_top_products(limit=5)
+            daily_stats = await analytics.get_daily_stats(days=7)
+            category_stats = await analytics.get_category_stats()
+            brand_stats = await analytics.get_brand_stats(limit=5)
+            price_ranges = await analytics.get_price_range_stats()
+            error_stats = await analytics.get_error_stats()
+            time_distribution = await analytics.get_time_distribution(days=7)
+            top_products = await analytics.get_top_products(limit=5)
 
             text = "📈 <b>Детальная аналитика</b>\n\n"
 
@@ -5099,9 +5207,8 @@ async def handle_analytics_action(callback: types.CallbackQuery, command: str):
 
             # Последние 7 дней
             text += f"<b>📅 Последние 7 дней:</b>\n"
-            for stat in daily_stats:
-                date_str = stat["date"][:10] if len(stat["date"]) > 10 else stat["date"]
-                text += f"• {date_str}: {stat['count']} постов\n"
+            for date_str, count in sorted(daily_stats.items(), reverse=True):
+                text += f"• {date_str}: {count} постов\n"
 
             # Топ категорий
             if category_stats:
@@ -5121,6 +5228,12 @@ async def handle_analytics_action(callback: types.CallbackQuery, command: str):
                     }.get(cat, cat)
                     text += f"• {cat_name}: {count} ({percentage:.1f}%)\n"
 
+            # Топ брендов
+            if brand_stats:
+                text += "\n<b>🏷 Топ брендов:</b>\n"
+                for brand, count in brand_stats.items():
+                    text += f"• {brand}: {count}\n"
+
             # Ценовые диапазоны
             if any(price_ranges.values()):
                 text += f"\n<b>💰 Ценовые диапазоны:</b>\n"
@@ -5149,7 +5262,7 @@ async def handle_analytics_action(callback: types.CallbackQuery, command: str):
                     title = (
                         product["title"][:30] if product["title"] else "Без названия"
                     )
-                    text += f"{idx}. {title} ({product['count']} раз)\n"
+                    text += f"{idx}. {title} ({product.get('views', 0)} просмотров)\n"
 
             # Статистика ошибок
             if error_stats.get("by_reason"):
@@ -6146,13 +6259,17 @@ async def main():
             logger.warning(f"Failed to initialize AI content service: {e}")
 
         # Запускаем автопубликацию
-        queue_task = asyncio.create_task(queue_worker(db, http_client))
+        queue_task = asyncio.create_task(
+            queue_worker(await get_async_db(), http_client)
+        )
         background_tasks.append(queue_task)
         logger.info("✅ Queue worker запущен (автопубликация включена)")
 
-        # Настраиваем планировщик для автопоиска
+        # Общий планировщик периодических задач (singleton-задачи выполняет одна реплика)
         global global_scheduler
-        global_scheduler = AsyncIOScheduler()
+        from services.scheduler_service import get_scheduler
+
+        global_scheduler = get_scheduler()
         AUTO_SEARCH_ENABLED = os.getenv("AUTO_SEARCH_ENABLED", "True").lower() in (
             "1",
             "true",
@@ -6163,17 +6280,18 @@ async def main():
         ).lower() in ("1", "true", "yes")
 
         if AUTO_SEARCH_ENABLED or AUTO_MAIN_PAGE_ENABLED:
-            # Используем APScheduler с простым interval заданием
+            from functools import partial
             from services.auto_search_service import AutoSearchService
 
             auto_search_service = AutoSearchService(db, bot)
+            auto_search_interval = int(os.getenv("AUTO_SEARCH_INTERVAL", 3600))  # Default: 1 hour
 
             # Простое interval задание согласно требованиям
-            global_scheduler.add_job(
-                auto_search_service.run_search_and_queue,
-                'interval',
-                seconds=int(os.getenv("AUTO_SEARCH_INTERVAL", 3600)),  # Default: 1 hour
-                args=[bot]  # Remove config from args as it's not needed
+            global_scheduler.add_interval_task(
+                auto_search_interval,
+                partial(auto_search_service.run_search_and_queue, bot),
+                name="auto_search",
+                initial_delay=auto_search_interval,
             )
 
             logger.info("✅ Auto search scheduler настроен (interval режим)")
@@ -6182,10 +6300,6 @@ async def main():
                 "ℹ️ Автопоиск отключен (AUTO_SEARCH_ENABLED и AUTO_MAIN_PAGE_ENABLED)"
             )
 
-        # Запускаем планировщик
-        global_scheduler.start()
-        services_to_cleanup.append(global_scheduler)
-
         # Запускаем сервис автоматизации
         try:
             from services.automation_service import get_automation_service
@@ -6197,40 +6311,34 @@ async def main():
         except Exception as e:
             logger.warning(f"⚠️ Failed to start automation service: {e}")
 
-        # Запускаем сервис резервного копирования (каждые 24 часа)
+        # Резервное копирование (каждые 24 часа)
         if settings.ADMIN_ID:
             try:
-                from services.backup_service import backup_worker
+                from services.backup_service import schedule_backup
 
-                backup_task = asyncio.create_task(
-                    backup_worker(
-                        settings.ADMIN_ID, bot, settings.DB_FILE, interval_hours=24
-                    )
+                schedule_backup(
+                    global_scheduler, settings.ADMIN_ID, bot, settings.DB_FILE, interval_hours=24
                 )
-                background_tasks.append(backup_task)
                 logger.info(
-                    "✅ Backup worker запущен (резервное копирование каждые 24 часа)"
+                    "✅ Backup job запланирован (резервное копирование каждые 24 часа)"
                 )
             except Exception as e:
-                logger.warning(f"⚠️ Failed to start backup worker: {e}")
+                logger.warning(f"⚠️ Failed to schedule backup job: {e}")
 
-        # Запускаем сервис очистки старых постов с мертвыми ссылками (каждые 24 часа)
+        # Очистка старых постов с мертвыми ссылками (каждые 24 часа)
         try:
-            from services.cleanup_service import cleanup_worker
+            from services.cleanup_service import schedule_cleanup
 
-            cleanup_task = asyncio.create_task(
-                cleanup_worker(
-                    db, bot, settings.CHANNEL_ID, interval_hours=24, hours_threshold=48
-                )
+            schedule_cleanup(
+                global_scheduler, db, bot, settings.CHANNEL_ID, interval_hours=24, hours_threshold=48
             )
-            background_tasks.append(cleanup_task)
             logger.info(
-                "✅ Cleanup worker запущен (очистка старых постов каждые 24 часа)"
+                "✅ Cleanup job запланирован (очистка старых постов каждые 24 часа)"
             )
         except Exception as e:
-            logger.warning(f"⚠️ Failed to start cleanup worker: {e}")
+            logger.warning(f"⚠️ Failed to schedule cleanup job: {e}")
 
-        # Запускаем сервис очистки распроданных товаров (опционально)
+        # Очистка распроданных товаров (опционально)
         CLEANER_ENABLED = os.getenv("CLEANER_ENABLED", "True").lower() in (
             "1",
             "true",
@@ -6242,24 +6350,41 @@ async def main():
 
                 cleaner = CleanerService(db=db, bot=bot)
                 cleaner_interval = int(os.getenv("CLEANER_INTERVAL_HOURS", "6"))
-                cleaner_task = asyncio.create_task(
-                    cleaner.run_periodic_cleanup(
-                        interval_hours=cleaner_interval,
-                        check_hours=48,
-                        delete_messages=True,
-                    )
+                cleaner.schedule_periodic_cleanup(
+                    global_scheduler,
+                    interval_hours=cleaner_interval,
+                    check_hours=48,
+                    delete_messages=True,
                 )
-                background_tasks.append(cleaner_task)
                 logger.info(
-                    f"✅ Sold-out cleaner запущен (проверка каждые {cleaner_interval} часов)"
+                    f"✅ Sold-out cleaner запланирован (проверка каждые {cleaner_interval} часов)"
                 )
             except Exception as e:
-                logger.warning(f"⚠️ Failed to start sold-out cleaner: {e}")
+                logger.warning(f"⚠️ Failed to schedule sold-out cleaner: {e}")
         else:
             logger.info(
                 "ℹ️ Sold-out cleaner отключен (установите CLEANER_ENABLED=True в .env для включения)"
             )
 
+        # Мониторинг падения цен (каждые 6 часов)
+        if getattr(settings, "PRICE_MONITOR_ENABLED", True):
+            global_scheduler.add_interval_task(
+                6 * 3600, price_monitor_job, name="price_monitor", initial_delay=6 * 3600
+            )
+            logger.info("✅ Price Drop Monitor запланирован (проверка каждые 6 часов)")
+
+        # Компактор history_rollups: догоняет записи в обход add_post_to_history,
+        # чистит старые почасовые корзины (аналитика сама только читает)
+        from services.analytics_service import refresh_history_rollups_job
+
+        global_scheduler.add_interval_task(
+            3600, refresh_history_rollups_job, name="history_rollups", initial_delay=60
+        )
+
+        # Запускаем планировщик
+        await global_scheduler.start()
+        services_to_cleanup.append(global_scheduler)
+
         logger.info("✅ Бот запущен и готов к работе!")
 
         logger.info("✅ Бот запущен и готов к работе!")
@@ -6320,16 +6445,31 @@ async def main():
                 # Note: In a production app, you'd want to maintain a global instance
                 http_client_cleanup = HTTPClient()
                 await http_client_cleanup.close()
+
+                # Общий пул соединений (aiohttp сессии сервисов и httpx клиент)
+                from services.http_registry import get_http_registry
+
+                await get_http_registry().close_all()
                 logger.info("✅ HTTP клиент закрыт")
             except Exception as e:
                 logger.warning(f"⚠️ Ошибка при закрытии HTTP клиента: {e}")
 
+            # 3.1 Stop HTML parse workers
+            try:
+                from utils.parse_executor import shutdown_parse_executor
+
+                shutdown_parse_executor()
+                logger.info("✅ Пул парсинга остановлен")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка при остановке пула парсинга: {e}")
+
             # 4. Close database connection
             logger.info("💾 Закрываем соединение с базой данных...")
             try:
                 if hasattr(db, "connection") and db.connection:
                     db.connection.close()
-                    logger.info("✅ Соединение с БД закрыто")
+                await close_async_db()
+                logger.info("✅ Соединение с БД закрыто")
             except Exception as e:
                 logger.warning(f"⚠️ Ошибка при закрытии соединения с БД: {e}")
 
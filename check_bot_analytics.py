@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import asyncio
+
 
 def check_bot_analytics():
     try:
         # Имитируем импорт как в bot.py
+        from database_async import close_async_db
         from services.analytics_service import AnalyticsService
         print('AnalyticsService импортируется успешно')
 
         # Проверяю создание экземпляра
-        analytics = AnalyticsService(None)  # None вместо реальной БД для теста
+        analytics = AnalyticsService()  # общий AsyncDatabase из get_async_db()
         print('AnalyticsService создается успешно')
 
         # Проверяю все методы, которые вызываются в bot.py
@@ -21,12 +24,17 @@ def check_bot_analytics():
             ('get_top_products', lambda: analytics.get_top_products(limit=5))
         ]
 
-        for method_name, method_call in methods_to_test:
-            try:
-                result = method_call()
-                print(f'{method_name}: OK (returns {type(result).__name__})')
-            except Exception as e:
-                print(f'{method_name}: FAIL - {e}')
+        # Методы асинхронные (AsyncDatabase) - проверяем в одном event loop
+        async def run_methods():
+            for method_name, method_call in methods_to_test:
+                try:
+                    result = await method_call()
+                    print(f'{method_name}: OK (returns {type(result).__name__})')
+                except Exception as e:
+                    print(f'{method_name}: FAIL - {e}')
+            await close_async_db()
+
+        asyncio.run(run_methods())
 
         print('\nВсе проверки пройдены успешно!')
         return True
@@ -62,10 +62,13 @@ class Settings(BaseSettings):
     KEEP_ORIGINAL_URL: bool = True
 
     IMAGE_MAX_MB: int = 5
+    IMAGE_CACHE_DIR: str = "cache/images"  # Готовые JPEG по md5 исходника (повторные посты без обработки)
+    IMAGE_CACHE_MAX_MB: int = 200  # Лимит размера кэша картинок на диске
     POST_INTERVAL: int = 10800  # 3 часа по умолчанию
 
     # Database
     DB_FILE: Optional[str] = None
+    DB_READER_CONNECTIONS: int = 4  # Read-only соединения AsyncDatabase (0 = одно соединение)
 
     # Фильтры товаров
     MIN_PRICE: float = 0.0  # Минимальная цена
@@ -139,6 +142,10 @@ class Settings(BaseSettings):
 
     # De-duplication settings
     DEDUP_DAYS_CHECK: int = 7  # Количество дней для проверки дубликатов
+    DEDUP_BLOOM_CAPACITY: int = 200_000  # Ожидаемое число ключей в Bloom-фильтре дедупликации
+    DEDUP_BLOOM_ERROR_RATE: float = 0.01  # Допустимая доля ложноположительных срабатываний
+    DEDUP_SEEN_TTL: int = 604800  # TTL ключей seen_products в Redis (7 дней)
+    IMAGE_DEDUP_MAX_DISTANCE: int = 6  # Порог расстояния Хэмминга dHash (из 64 бит) для похожих картинок
 
     # Cookies encryption
     COOKIES_ENCRYPTION_KEY: str = ""  # Ключ для шифрования cookies (опционально)
@@ -196,9 +203,66 @@ class Settings(BaseSettings):
     # Архитектура: Буфер публикации
     PUBLISH_INTERVAL: int = 60  # Секунд между публикациями
     PUBLISH_BATCH_SIZE: int = 1  # Количество постов за раз
+    PUBLISH_VISIBILITY_TIMEOUT: int = 600  # Секунд до возврата неподтвержденного item в буфер
+    PUBLISH_REAP_INTERVAL: int = 60  # Период возврата просроченных in-flight items, сек
+    QUEUE_LEASE_SECONDS: int = 600  # Срок аренды задачи очереди воркером (claim_batch)
+
+    # Архитектура: Конвейер парсинга каталогов
+    CRAWL_HOST_CONCURRENCY: int = 3  # Одновременных запросов к одному хосту
+    CRAWL_PARSE_WORKERS: int = 2  # Параллельных воркеров парсинга HTML
+    CRAWL_STAGE_QUEUE_SIZE: int = 8  # Емкость очередей между стадиями (страниц)
+    CRAWL_MAX_PUBLISH_BACKLOG: int = 500  # Глубина буфера публикации, выше которой fetch ждет
+    PARSE_POOL_SIZE: int = 2  # Процессов для парсинга HTML (0 = синхронно в потоке)
+    PARSE_POOL_START_METHOD: str = ""  # fork / spawn / forkserver (пусто = по умолчанию для ОС)
+
+    # AI обогащение: двухуровневый кэш (L1 в памяти + L2 Redis/SQLite)
+    AI_CACHE_TTL_HOURS: int = 24  # Свежесть результата
+    AI_CACHE_STALE_HOURS: int = 72  # Сколько после TTL отдавать старый результат, обновляя в фоне
+    AI_CACHE_MAX_ENTRIES: int = 2000  # Лимит записей L1
+    AI_CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # Лимит размера L1 (по JSON результатов)
+    AI_CACHE_L2: str = "auto"  # auto (Redis если USE_REDIS, иначе SQLite) / redis / sqlite / none
+    AI_CACHE_DB_FILE: str = "ai_cache.db"  # SQLite файл L2
+    AI_RATE_PER_MINUTE: int = 10  # Лимит запросов к ChatGPT (сверх лимита - очередь)
+    GROQ_RATE_PER_MINUTE: int = 30  # Лимит запросов к Groq
+    AI_RATE_BURST: int = 3  # Сколько запросов можно сделать подряд без ожидания
+    AI_BATCH_MAX_ITEMS: int = 5  # Максимум товаров в одном запросе при глубокой очереди
+    AI_MAX_CONCURRENT_REQUESTS: int = 2  # Одновременных HTTP запросов к одному LLM API
+    AI_PROMPT_MAX_TOKENS: int = 700  # Бюджет данных одного товара в промпте обогащения
+    AI_COMPLETION_MAX_TOKENS: int = 250  # Лимит ответа на один товар
+    AI_PROMPT_REVIEW_SENTENCES: int = 5  # Сколько предложений отзывов попадает в промпт
+    AI_WORKER_MIN_CONCURRENT: int = 1  # Нижняя граница адаптивного лимита AiWorker
+    AI_WORKER_MAX_CONCURRENT: int = 8  # Верхняя граница адаптивного лимита AiWorker
+    AI_WORKER_LATENCY_TARGET_MS: int = 4000  # Дольше - лимит AiWorker снижается вдвое
+    AI_INTERACTIVE_TIMEOUT: int = 15  # Дедлайн интерактивного AI запроса (/get_ref, inline), сек
 
     # HTTP клиент
     USER_AGENT: str = "YandexMarketBot/2.0 (+https://example.com/bot)"
+    HTTP_POOL_LIMIT: int = 100  # Всего соединений в общем пуле (services/http_registry)
+    HTTP_POOL_LIMIT_PER_HOST: int = 30  # Соединений на один хост
+    HTTP_KEEPALIVE_TIMEOUT: int = 30  # Сколько секунд держать простаивающее соединение
+    HTTP_DNS_CACHE_TTL: int = 300  # Кэш DNS резолва, сек
+    HTTP2_ENABLED: bool = True  # HTTP/2 для httpx клиента (если установлен h2)
+    HTTP_CACHE_ENABLED: bool = True  # Кэш страниц под HTTPClient.fetch_text (services/http_response_cache)
+    HTTP_CACHE_MAX_MB: int = 64  # Объем сжатых ответов в памяти
+    HTTP_CACHE_DEFAULT_TTL: int = 300  # Свежесть ответа по умолчанию, сек
+    HTTP_CACHE_PRICE_TTL: int = 600  # Свежесть страницы для мониторинга цен
+    HTTP_CACHE_AVAILABILITY_TTL: int = 900  # Свежесть страницы для проверок наличия
+    PRICE_MONITOR_MAX_CHECKS: int = 50  # Проверок цен за цикл (бюджет запросов)
+    PRICE_MONITOR_CANDIDATES: int = 2000  # Сколько последних товаров истории участвуют в расписании
+    PRICE_MONITOR_CONCURRENCY: int = 5  # Одновременных проверок цен
+    PRICE_MONITOR_MIN_INTERVAL_HOURS: float = 12  # Интервал проверки товара обычной волатильности
+    METRICS_FLUSH_INTERVAL: float = 5  # Период сброса счетчиков кликов/показов, сек
+    METRICS_COUNTER_SHARDS: int = 8  # Шардов счетчиков (своя блокировка и WAL у каждого)
+    METRICS_WAL_DIR: str = "cache/metrics_wal"  # WAL несброшенных кликов/показов
+    ANALYTICS_HOURLY_RETENTION_DAYS: int = 30  # Сколько дней хранить почасовые корзины history_rollups
+    SWEEPER_CONCURRENCY: int = 10  # Одновременных проверок наличия старых постов
+    SWEEPER_REQUESTS_PER_MINUTE: int = 120  # Лимит запросов карточек товаров при очистке канала
+    SWEEPER_RESULT_TTL_HOURS: float = 6  # Сколько часов действителен результат проверки товара
+    SCHEDULER_LEASE_BACKEND: str = "auto"  # Аренда singleton-задач: auto / redis / sqlite / memory
+    SCHEDULER_LEASE_TTL: int = 120  # TTL аренды задачи, сек (продлевается, пока задача идет)
+    SCHEDULER_JITTER_RATIO: float = 0.1  # Разброс запуска interval-задач, доля интервала
+    SCHEDULER_MAX_JITTER: int = 300  # Предел разброса запуска, сек
+    PRICE_MONITOR_ENABLED: bool = True  # Периодическая проверка падения цен (каждые 6 часов)
 
     # Prompt for future LLM integration (kept for reference)
     LLM_SYSTEM_PROMPT: str = """
@@ -326,8 +390,11 @@ YANDEX_OAUTH_TOKEN = settings.YANDEX_OAUTH_TOKEN
 KEEP_ORIGINAL_URL = settings.KEEP_ORIGINAL_URL
 
 IMAGE_MAX_MB = settings.IMAGE_MAX_MB
+IMAGE_CACHE_DIR = settings.IMAGE_CACHE_DIR
+IMAGE_CACHE_MAX_MB = settings.IMAGE_CACHE_MAX_MB
 POST_INTERVAL = settings.POST_INTERVAL
 DB_FILE = settings.DB_FILE
+DB_READER_CONNECTIONS = settings.DB_READER_CONNECTIONS
 
 # Фильтры товаров
 MIN_PRICE = settings.MIN_PRICE
@@ -462,9 +529,73 @@ BRAND_MAX_PER_WINDOW = settings.BRAND_MAX_PER_WINDOW
 # Архитектура: Буфер публикации
 PUBLISH_INTERVAL = settings.PUBLISH_INTERVAL
 PUBLISH_BATCH_SIZE = settings.PUBLISH_BATCH_SIZE
+PUBLISH_VISIBILITY_TIMEOUT = settings.PUBLISH_VISIBILITY_TIMEOUT
+PUBLISH_REAP_INTERVAL = settings.PUBLISH_REAP_INTERVAL
+QUEUE_LEASE_SECONDS = settings.QUEUE_LEASE_SECONDS
+
+# Архитектура: Конвейер парсинга каталогов
+CRAWL_HOST_CONCURRENCY = settings.CRAWL_HOST_CONCURRENCY
+CRAWL_PARSE_WORKERS = settings.CRAWL_PARSE_WORKERS
+CRAWL_STAGE_QUEUE_SIZE = settings.CRAWL_STAGE_QUEUE_SIZE
+CRAWL_MAX_PUBLISH_BACKLOG = settings.CRAWL_MAX_PUBLISH_BACKLOG
+PARSE_POOL_SIZE = settings.PARSE_POOL_SIZE
+PARSE_POOL_START_METHOD = settings.PARSE_POOL_START_METHOD
+
+# AI обогащение: двухуровневый кэш
+AI_CACHE_TTL_HOURS = settings.AI_CACHE_TTL_HOURS
+AI_CACHE_STALE_HOURS = settings.AI_CACHE_STALE_HOURS
+AI_CACHE_MAX_ENTRIES = settings.AI_CACHE_MAX_ENTRIES
+AI_CACHE_MAX_BYTES = settings.AI_CACHE_MAX_BYTES
+AI_CACHE_L2 = settings.AI_CACHE_L2
+AI_CACHE_DB_FILE = settings.AI_CACHE_DB_FILE
+AI_RATE_PER_MINUTE = settings.AI_RATE_PER_MINUTE
+GROQ_RATE_PER_MINUTE = settings.GROQ_RATE_PER_MINUTE
+AI_RATE_BURST = settings.AI_RATE_BURST
+AI_BATCH_MAX_ITEMS = settings.AI_BATCH_MAX_ITEMS
+AI_MAX_CONCURRENT_REQUESTS = settings.AI_MAX_CONCURRENT_REQUESTS
+AI_PROMPT_MAX_TOKENS = settings.AI_PROMPT_MAX_TOKENS
+AI_COMPLETION_MAX_TOKENS = settings.AI_COMPLETION_MAX_TOKENS
+AI_PROMPT_REVIEW_SENTENCES = settings.AI_PROMPT_REVIEW_SENTENCES
+AI_WORKER_MIN_CONCURRENT = settings.AI_WORKER_MIN_CONCURRENT
+AI_WORKER_MAX_CONCURRENT = settings.AI_WORKER_MAX_CONCURRENT
+AI_WORKER_LATENCY_TARGET_MS = settings.AI_WORKER_LATENCY_TARGET_MS
+AI_INTERACTIVE_TIMEOUT = settings.AI_INTERACTIVE_TIMEOUT
+
+# Дедупликация
+DEDUP_DAYS_CHECK = settings.DEDUP_DAYS_CHECK
+DEDUP_BLOOM_CAPACITY = settings.DEDUP_BLOOM_CAPACITY
+DEDUP_BLOOM_ERROR_RATE = settings.DEDUP_BLOOM_ERROR_RATE
+DEDUP_SEEN_TTL = settings.DEDUP_SEEN_TTL
+IMAGE_DEDUP_MAX_DISTANCE = settings.IMAGE_DEDUP_MAX_DISTANCE
 
 # HTTP клиент
 USER_AGENT = settings.USER_AGENT
+HTTP_POOL_LIMIT = settings.HTTP_POOL_LIMIT
+HTTP_POOL_LIMIT_PER_HOST = settings.HTTP_POOL_LIMIT_PER_HOST
+HTTP_KEEPALIVE_TIMEOUT = settings.HTTP_KEEPALIVE_TIMEOUT
+HTTP_DNS_CACHE_TTL = settings.HTTP_DNS_CACHE_TTL
+HTTP2_ENABLED = settings.HTTP2_ENABLED
+HTTP_CACHE_ENABLED = settings.HTTP_CACHE_ENABLED
+HTTP_CACHE_MAX_MB = settings.HTTP_CACHE_MAX_MB
+HTTP_CACHE_DEFAULT_TTL = settings.HTTP_CACHE_DEFAULT_TTL
+HTTP_CACHE_PRICE_TTL = settings.HTTP_CACHE_PRICE_TTL
+HTTP_CACHE_AVAILABILITY_TTL = settings.HTTP_CACHE_AVAILABILITY_TTL
+PRICE_MONITOR_MAX_CHECKS = settings.PRICE_MONITOR_MAX_CHECKS
+PRICE_MONITOR_CANDIDATES = settings.PRICE_MONITOR_CANDIDATES
+PRICE_MONITOR_CONCURRENCY = settings.PRICE_MONITOR_CONCURRENCY
+PRICE_MONITOR_MIN_INTERVAL_HOURS = settings.PRICE_MONITOR_MIN_INTERVAL_HOURS
+METRICS_FLUSH_INTERVAL = settings.METRICS_FLUSH_INTERVAL
+METRICS_COUNTER_SHARDS = settings.METRICS_COUNTER_SHARDS
+METRICS_WAL_DIR = settings.METRICS_WAL_DIR
+ANALYTICS_HOURLY_RETENTION_DAYS = settings.ANALYTICS_HOURLY_RETENTION_DAYS
+SWEEPER_CONCURRENCY = settings.SWEEPER_CONCURRENCY
+SWEEPER_REQUESTS_PER_MINUTE = settings.SWEEPER_REQUESTS_PER_MINUTE
+SWEEPER_RESULT_TTL_HOURS = settings.SWEEPER_RESULT_TTL_HOURS
+SCHEDULER_LEASE_BACKEND = settings.SCHEDULER_LEASE_BACKEND
+SCHEDULER_LEASE_TTL = settings.SCHEDULER_LEASE_TTL
+SCHEDULER_JITTER_RATIO = settings.SCHEDULER_JITTER_RATIO
+SCHEDULER_MAX_JITTER = settings.SCHEDULER_MAX_JITTER
+PRICE_MONITOR_ENABLED = settings.PRICE_MONITOR_ENABLED
 
 # Параметры аффилиатной программы
 AFFILIATE_CC_BASE_URL = "https://market.yandex.ru/cc/"
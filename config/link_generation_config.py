@@ -160,3 +160,16 @@ CIRCUIT_BREAKER_OPEN_DURATION = 300  # 5 minutes in seconds
 # XHR Cache Configuration
 XHR_CACHE_TTL = 3600  # Cache TTL in seconds (1 hour)
 XHR_CACHE_MAX_SIZE = 50  # Maximum cached XHRs
+
+# Browser Farm - постоянные браузеры для генерации cc-ссылок
+BROWSER_FARM_ENABLED = True
+BROWSER_FARM_SIZE = 2  # Number of long-lived Chromium processes
+BROWSER_FARM_CONTEXTS_PER_BROWSER = 2  # Warmed contexts (with page) per browser
+BROWSER_FARM_RECYCLE_JOBS = 50  # Restart browser after N jobs
+BROWSER_FARM_MAX_MEMORY_MB = 1024  # Restart browser when its process tree exceeds this RSS
+
+# XHR Template Fast Path - шаблон share-запроса, обобщенный по id товара
+XHR_TEMPLATE_MAX_FAILURES = 3  # Consecutive failures before a template is benched
+XHR_TEMPLATE_MIN_SUCCESS_RATE = 0.5  # Bench template below this rate (after 10+ attempts)
+XHR_TEMPLATE_STALE_AFTER = 6 * 3600  # Seconds without success before template is stale
+XHR_BATCH_CONCURRENCY = 8  # Concurrent replays over the shared (HTTP/2) client
@@ -8,7 +8,14 @@ import hashlib
 import urllib.parse
 from datetime import datetime as dt, timedelta
 from dataclasses import dataclass
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Tuple, Any, Set
+
+# Корзины history_rollups (общие с database_async.py)
+from utils.history_rollups import (
+    ROLLUP_HISTORY_COLUMNS,
+    ROLLUP_WATERMARK_KEY,
+    history_rollup_keys,
+)
 
 
 @dataclass
@@ -23,6 +30,8 @@ class CachedProduct:
 
 logger = logging.getLogger(__name__)
 
+# Лимит параметров одного IN (...) запроса (SQLITE_MAX_VARIABLE_NUMBER в старых сборках = 999)
+_IN_CHUNK_SIZE = 500
 
 class Database:
     def __init__(self, db_file="bot_database.db"):
@@ -118,6 +127,54 @@ class Database:
             except sqlite3.OperationalError:
                 pass  # Column already exists
 
+            # Image dedup: перцептивный хэш картинки (hex dHash)
+            try:
+                self.cursor.execute("ALTER TABLE history ADD COLUMN image_phash TEXT")
+                logger.info("Added image_phash column to history table")
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+
+            # Price monitor: когда цена проверялась/менялась, скидка и категория
+            # для расписания проверок по ожидаемой волатильности
+            # (last_price - цена публикации, база для падений; last_checked_price - последняя проверка;
+            # brand - срез history_rollups)
+            for column, column_type in (
+                ("last_checked_price", "REAL"),
+                ("brand", "TEXT"),
+                ("price_checked_at", "TIMESTAMP"),
+                ("price_changed_at", "TIMESTAMP"),
+                ("discount", "REAL"),
+                ("category", "TEXT"),
+            ):
+                try:
+                    self.cursor.execute(
+                        f"ALTER TABLE history ADD COLUMN {column} {column_type}"
+                    )
+                    logger.info(f"Added {column} column to history table")
+                except sqlite3.OperationalError:
+                    pass  # Column already exists
+
+            # История цен (как database_postgres.PriceHistory)
+            self.cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS price_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT NOT NULL,
+                    url TEXT,
+                    price REAL NOT NULL,
+                    old_price REAL,
+                    discount_percent REAL,
+                    timestamp TIMESTAMP NOT NULL
+                )
+            """
+            )
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_price_history_product_id ON price_history(product_id)"
+            )
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_price_history_timestamp ON price_history(timestamp)"
+            )
+
             # Index for faster queries by message_id
             self.cursor.execute(
                 "CREATE INDEX IF NOT EXISTS idx_history_message_id ON history(message_id)"
@@ -162,6 +219,20 @@ class Database:
             except sqlite3.OperationalError:
                 pass  # Column already exists
 
+            # Queue leasing: owner and expiry of a claim made by claim_batch()
+            try:
+                self.cursor.execute("ALTER TABLE queue ADD COLUMN worker_id TEXT")
+                logger.info("Added worker_id column to queue table")
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            try:
+                self.cursor.execute(
+                    "ALTER TABLE queue ADD COLUMN lease_until TIMESTAMP NULL"
+                )
+                logger.info("Added lease_until column to queue table")
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+
             # Создаем индексы для оптимизации
             self.cursor.execute(
                 "CREATE INDEX IF NOT EXISTS idx_history_url ON history(url)"
@@ -190,6 +261,14 @@ class Database:
                 "CREATE INDEX IF NOT EXISTS idx_queue_normalized_url ON queue(normalized_url)"
             )
 
+            # Covering index for claim_batch(): filter by status/schedule, order by priority/age
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_queue_claim ON queue(status, scheduled_time, priority, created_at)"
+            )
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_queue_lease ON queue(status, lease_until)"
+            )
+
             # Таблица для кэширования результатов парсинга
             self.cursor.execute(
                 """
@@ -269,6 +348,22 @@ class Database:
                 "CREATE INDEX IF NOT EXISTS idx_error_queue_resolved ON error_queue(resolved)"
             )
 
+            # Почасовые и дневные счетчики публикаций для аналитики (history_rollups):
+            # пост учитывается при вставке в history, хвост догоняет refresh_history_rollups
+            self.cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS history_rollups (
+                    granularity TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    value TEXT NOT NULL DEFAULT '',
+                    posts INTEGER NOT NULL DEFAULT 0,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, dimension, bucket, value)
+                ) WITHOUT ROWID
+            """
+            )
+
             # Таблица для настроек бота
             self.cursor.execute(
                 """
@@ -525,7 +620,7 @@ class Database:
     # PERFORMANCE FIX (Problem #2): O(1) SQL query instead of O(n) Python loop
     def exists_url_in_queue(self, url: str, check_normalized: bool = True) -> bool:
         """
-        Check if URL exists in pending queue using fast SQL index lookup.
+        Check if URL exists in pending (or leased) queue using fast SQL index lookup.
 
         Args:
             url: URL to check
@@ -539,18 +634,103 @@ class Database:
                 # Fast O(1) lookup using indexed normalized_url column
                 normalized = self.normalize_url(url)
                 res = self.cursor.execute(
-                    "SELECT 1 FROM queue WHERE normalized_url = ? AND status = 'pending' LIMIT 1",
+                    "SELECT 1 FROM queue WHERE normalized_url = ? AND status IN ('pending', 'leased') LIMIT 1",
                     (normalized,),
                 ).fetchone()
                 return bool(res)
             else:
                 # Exact URL match
                 res = self.cursor.execute(
-                    "SELECT 1 FROM queue WHERE url = ? AND status = 'pending' LIMIT 1",
+                    "SELECT 1 FROM queue WHERE url = ? AND status IN ('pending', 'leased') LIMIT 1",
                     (url,),
                 ).fetchone()
                 return bool(res)
 
+    def find_existing_normalized_urls(self, normalized_urls: List[str]) -> Set[str]:
+        """
+        Batch-проверка дубликатов: какие normalized_url уже есть в истории
+        или в активной очереди (pending/leased).
+
+        Args:
+            normalized_urls: Нормализованные URL (см. normalize_url)
+
+        Returns:
+            Множество найденных normalized_url
+        """
+        keys = list({u for u in normalized_urls if u})
+        found: Set[str] = set()
+        with self.connection:
+            for i in range(0, len(keys), _IN_CHUNK_SIZE):
+                chunk = keys[i : i + _IN_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.cursor.execute(
+                    f"""
+                    SELECT normalized_url FROM history WHERE normalized_url IN ({placeholders})
+                    UNION
+                    SELECT normalized_url FROM queue
+                    WHERE normalized_url IN ({placeholders}) AND status IN ('pending', 'leased')
+                    """,
+                    chunk + chunk,
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def find_recent_product_keys(
+        self, product_keys: List[str], days_to_check: int = 7
+    ) -> Set[str]:
+        """
+        Batch-вариант has_been_posted_recently: какие product_key публиковались
+        за последние N дней.
+
+        Args:
+            product_keys: Ключи товаров (см. make_product_key)
+            days_to_check: Окно проверки в днях
+
+        Returns:
+            Множество найденных product_key
+        """
+        keys = list({k for k in product_keys if k})
+        found: Set[str] = set()
+        cutoff = (
+            datetime.datetime.utcnow() - datetime.timedelta(days=days_to_check)
+        ).isoformat()
+        try:
+            with self.connection:
+                for i in range(0, len(keys), _IN_CHUNK_SIZE):
+                    chunk = keys[i : i + _IN_CHUNK_SIZE]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self.cursor.execute(
+                        f"SELECT DISTINCT product_key FROM posted_products "
+                        f"WHERE product_key IN ({placeholders}) AND posted_at >= ?",
+                        chunk + [cutoff],
+                    ).fetchall()
+                    found.update(row[0] for row in rows)
+        except Exception as e:
+            logger.warning(f"Error checking posted products batch: {e}")
+        return found
+
+    def get_dedup_keys(self, days_to_check: int = 7) -> List[str]:
+        """
+        Все ключи дедупликации для прогрева Bloom-фильтра:
+        normalized_url из истории и активной очереди + недавние product_key.
+        """
+        cutoff = (
+            datetime.datetime.utcnow() - datetime.timedelta(days=days_to_check)
+        ).isoformat()
+        with self.connection:
+            rows = self.cursor.execute(
+                """
+                SELECT normalized_url FROM history WHERE normalized_url IS NOT NULL
+                UNION
+                SELECT normalized_url FROM queue
+                WHERE normalized_url IS NOT NULL AND status IN ('pending', 'leased')
+                UNION
+                SELECT product_key FROM posted_products WHERE posted_at >= ?
+                """,
+                (cutoff,),
+            ).fetchall()
+        return [row[0] for row in rows if row[0]]
+
     def exists_image(self, img_hash: str) -> bool:
         with self.connection:
             res = self.cursor.execute(
@@ -558,6 +738,206 @@ class Database:
             ).fetchone()
             return bool(res)
 
+    def get_image_phashes(self) -> List[tuple]:
+        """(image_phash, url) опубликованных картинок для индекса похожих картинок"""
+        with self.connection:
+            rows = self.cursor.execute(
+                "SELECT image_phash, url FROM history WHERE image_phash IS NOT NULL"
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def get_price_watch_candidates(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Товары из истории для мониторинга цен (последние limit публикаций)
+
+        Returns:
+            Список dict: id, url, title, last_price, last_checked_price,
+            discount, category, price_checked_at, price_changed_at, date_added
+        """
+        with self.connection:
+            rows = self.cursor.execute(
+                """
+                SELECT id, url, title, last_price, last_checked_price, discount, category,
+                       price_checked_at, price_changed_at, date_added
+                FROM history
+                WHERE COALESCE(deleted, 0) = 0
+                ORDER BY date_added DESC
+                LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_price_checks(self, checks: List[Dict[str, Any]]) -> int:
+        """
+        Записать результаты проверки цен одной транзакцией
+
+        Цена проверки пишется в last_checked_price; last_price (цена публикации)
+        остается базой для падений и заполняется, только если ее не было.
+
+        Args:
+            checks: dict с history_id, product_id, url, price, old_price,
+                discount_percent, category, changed (bool), checked_at
+
+        Returns:
+            Количество записей в price_history
+        """
+        if not checks:
+            return 0
+        with self.connection:
+            self.cursor.executemany(
+                """
+                INSERT INTO price_history (product_id, url, price, old_price, discount_percent, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (c["product_id"], c["url"], c["price"], c.get("old_price"),
+                     c.get("discount_percent"), c["checked_at"])
+                    for c in checks
+                ],
+            )
+            self.cursor.executemany(
+                """
+                UPDATE history SET
+                    last_price = COALESCE(last_price, ?),
+                    last_checked_price = ?,
+                    price_checked_at = ?,
+                    price_changed_at = CASE WHEN ? THEN ? ELSE price_changed_at END,
+                    discount = COALESCE(?, discount),
+                    category = COALESCE(?, category)
+                WHERE id = ?
+                """,
+                [
+                    (c["price"], c["price"], c["checked_at"], c.get("changed", False), c["checked_at"],
+                     c.get("discount_percent"), c.get("category"), c["history_id"])
+                    for c in checks
+                ],
+            )
+        return len(checks)
+
+    def mark_price_checked(self, history_ids: List[int], checked_at: Optional[dt] = None) -> None:
+        """Отметить проверку без цены (чтобы не проверять товар снова в этом цикле)"""
+        if not history_ids:
+            return
+        checked_at = checked_at or datetime.datetime.utcnow()
+        with self.connection:
+            self.cursor.executemany(
+                "UPDATE history SET price_checked_at = ? WHERE id = ?",
+                [(checked_at, history_id) for history_id in history_ids],
+            )
+
+    def _apply_history_rollups(self, counts: Dict[Tuple[str, str, str, str], List[int]]) -> None:
+        """Прибавить (posts, deleted) к корзинам (внутри открытой транзакции)"""
+        self.cursor.executemany(
+            """
+            INSERT INTO history_rollups (granularity, dimension, bucket, value, posts, deleted)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, dimension, bucket, value) DO UPDATE SET
+                posts = posts + excluded.posts,
+                deleted = deleted + excluded.deleted
+            """,
+            [(*key, posts, deleted) for key, (posts, deleted) in counts.items()],
+        )
+
+    def _history_rollup_watermark(self) -> int:
+        row = self.cursor.execute(
+            "SELECT value FROM bot_settings WHERE key = ?", (ROLLUP_WATERMARK_KEY,)
+        ).fetchone()
+        return int(row["value"]) if row and row["value"] else 0
+
+    def _append_history_rollups(self, batch_size: int = 5000) -> int:
+        """
+        Учесть в history_rollups до batch_size постов после watermark
+        (внутри открытой транзакции записи)
+
+        Returns:
+            Количество учтенных постов
+        """
+        rows = self.cursor.execute(
+            f"SELECT {ROLLUP_HISTORY_COLUMNS} FROM history WHERE id > ? ORDER BY id LIMIT ?",
+            (self._history_rollup_watermark(), batch_size),
+        ).fetchall()
+        if not rows:
+            return 0
+        counts: Dict[Tuple[str, str, str, str], List[int]] = {}
+        for row in rows:
+            for key in history_rollup_keys(row):
+                sums = counts.setdefault(key, [0, 0])
+                sums[0] += 1
+                if row["deleted"]:
+                    sums[1] += 1
+        self._apply_history_rollups(counts)
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO bot_settings (key, value, updated_at) VALUES (?, ?, ?)",
+            (ROLLUP_WATERMARK_KEY, str(rows[-1]["id"]), datetime.datetime.utcnow()),
+        )
+        return len(rows)
+
+    def refresh_history_rollups(
+        self, batch_size: int = 5000, hourly_retention_days: int = 30
+    ) -> int:
+        """
+        Компактор history_rollups: дописать посты, не учтенные при вставке,
+        и удалить старые почасовые корзины
+
+        add_post_to_history учитывает пост сам; здесь догоняются записи в
+        обход него (миграции, другие процессы). Стоимость - O(новых строк):
+        history читается по первичному ключу от сохраненного watermark.
+        Первый вызов один раз проходит всю историю.
+
+        Args:
+            batch_size: Строк history за транзакцию
+            hourly_retention_days: Почасовые корзины старше удаляются (дневные остаются)
+
+        Returns:
+            Количество учтенных постов
+        """
+        processed = 0
+        while True:
+            with self.connection:
+                # Watermark читается и сдвигается под блокировкой записи
+                self.cursor.execute("BEGIN IMMEDIATE")
+                count = self._append_history_rollups(batch_size)
+            processed += count
+            if count < batch_size:
+                break
+
+        if hourly_retention_days:
+            cutoff = datetime.datetime.utcnow() - timedelta(days=hourly_retention_days)
+            with self.connection:
+                self.cursor.execute(
+                    "DELETE FROM history_rollups WHERE granularity = 'hour' AND bucket < ?",
+                    (cutoff.strftime("%Y-%m-%d %H"),),
+                )
+        if processed:
+            logger.debug(f"History rollups: +{processed} posts")
+        return processed
+
+    def get_history_rollups(
+        self, dimension: str, granularity: str = "day", since: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Корзины history_rollups (без обновления, см. refresh_history_rollups)
+
+        Args:
+            dimension: all / category / template / price_band
+            granularity: day ("YYYY-MM-DD") или hour ("YYYY-MM-DD HH")
+            since: Нижняя граница bucket включительно (None - все)
+
+        Returns:
+            Список dict: bucket, value, posts, deleted
+        """
+        with self.connection:
+            rows = self.cursor.execute(
+                """
+                SELECT bucket, value, posts, deleted FROM history_rollups
+                WHERE granularity = ? AND dimension = ? AND bucket >= ?
+                ORDER BY bucket
+                """,
+                (granularity, dimension, since or ""),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
     def add_post_to_history(
         self,
         url: str,
@@ -567,9 +947,12 @@ class Database:
         channel_id: Optional[str] = None,
         price: Optional[float] = None,
         template_type: Optional[str] = None,
+        img_phash: Optional[str] = None,
+        brand: Optional[str] = None,
     ) -> None:
         """
         Add post to history with auto-computed normalized_url and Telegram message info.
+        The post is counted in history_rollups in the same transaction.
 
         Args:
             url: Product URL
@@ -579,6 +962,8 @@ class Database:
             channel_id: Telegram channel ID (for sold out cleaner)
             price: Product price (for price drop monitoring)
             template_type: A/B test template type ("emoji_heavy" or "professional")
+            img_phash: Perceptual image hash (hex dHash, services/image_dedup_service)
+            brand: Product brand (vendor), history_rollups dimension
         """
         try:
             normalized = self.normalize_url(url)
@@ -602,8 +987,8 @@ class Database:
             with self.connection:
                 self.cursor.execute(
                     """INSERT INTO history
-                       (url, image_hash, date_added, title, normalized_url, message_id, channel_id, last_price, template_type)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                       (url, image_hash, date_added, title, normalized_url, message_id, channel_id, last_price, template_type, image_phash, brand)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                     (
                         url,
                         img_hash,
@@ -614,19 +999,33 @@ class Database:
                         channel_id,
                         price_num,
                         template_type,
+                        img_phash,
+                        brand,
                     ),
                 )
+                # Аналитика не должна ронять публикацию: не учтенное догонит компактор
+                try:
+                    self._append_history_rollups()
+                except sqlite3.Error as e:
+                    logger.warning(f"history_rollups append failed: {e}")
+
+            # Запись в обход DedupService.claim - ключи в Bloom-фильтр
+            from services.dedup_service import remember_product
+
+            remember_product({"url": url, "title": title})
         except sqlite3.IntegrityError:
             # If duplicate, update message_id, channel_id and template_type
             logger.debug(
                 "Updating existing history entry with message_id for url=%s", url
             )
+            # Повторная публикация (падение цены) - новая база для падений
             with self.connection:
                 self.cursor.execute(
                     """UPDATE history
-                       SET message_id = ?, channel_id = ?, template_type = ?
+                       SET message_id = ?, channel_id = ?, template_type = ?,
+                           last_price = COALESCE(?, last_price)
                        WHERE url = ?""",
-                    (message_id, channel_id, template_type, url),
+                    (message_id, channel_id, template_type, price_num, url),
                 )
 
     def get_history(self, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
@@ -735,9 +1134,18 @@ class Database:
                 pass  # Колонка уже существует
 
             with self.connection:
+                row = self.cursor.execute(
+                    f"SELECT {ROLLUP_HISTORY_COLUMNS} FROM history WHERE id = ?",
+                    (history_id,),
+                ).fetchone()
                 cursor = self.cursor.execute(
                     "UPDATE history SET deleted = 1 WHERE id = ?", (history_id,)
                 )
+                # Пост уже учтен в history_rollups - отмечаем удаление в его корзинах
+                if row and not row["deleted"] and history_id <= self._history_rollup_watermark():
+                    self._apply_history_rollups(
+                        {key: [0, 1] for key in history_rollup_keys(row)}
+                    )
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"Error marking history entry {history_id} as deleted: {e}")
@@ -988,7 +1396,14 @@ class Database:
                     logger.warning(f"Failed to create/update publishing entry: {e}")
                     # Continue anyway, queue entry is created
 
-                return queue_id
+            # Запись в обход DedupService.claim - ключи в Bloom-фильтр
+            from services.dedup_service import remember_product
+
+            remember_product({"url": url})
+            from utils.queue_signal import notify_queue_item
+
+            notify_queue_item()
+            return queue_id
         except sqlite3.IntegrityError:
             return None
         except Exception as e:
@@ -1017,14 +1432,18 @@ class Database:
                 for url, priority, scheduled_time in urls:
                     try:
                         self.cursor.execute(
-                            "INSERT INTO queue (url, created_at, priority, scheduled_time) VALUES (?, ?, ?, ?)",
-                            (url, now, priority, scheduled_time),
+                            "INSERT INTO queue (url, created_at, priority, scheduled_time, normalized_url) VALUES (?, ?, ?, ?, ?)",
+                            (url, now, priority, scheduled_time, self.normalize_url(url)),
                         )
                         added_count += 1
                     except sqlite3.IntegrityError:
                         # URL уже существует, пропускаем
                         continue
-                return added_count
+            if added_count:
+                from utils.queue_signal import notify_queue_item
+
+                notify_queue_item()
+            return added_count
         except Exception as e:
             logger.error(f"Error in batch add_to_queue: {e}")
             return added_count
@@ -1034,10 +1453,19 @@ class Database:
     ) -> Optional[Tuple[int, str]]:
         """Получает следующий товар из очереди с учетом приоритета и расписания
 
+        DEPRECATED: товар не арендуется, параллельный воркер может опубликовать
+        его повторно. Используйте claim_batch + mark_as_done/release_claim.
+
         Args:
             respect_schedule: учитывать расписание
             rotate: ротация - если True, берет товары по кругу (старые первыми)
         """
+        import warnings
+        warnings.warn(
+            "get_next_from_queue() does not lease the task; use claim_batch()",
+            DeprecationWarning,
+            stacklevel=2
+        )
         with self.connection:
             now = datetime.datetime.utcnow()
             if respect_schedule:
@@ -1076,16 +1504,163 @@ class Database:
                 return (row["id"], row["url"])
             return None
 
+    def claim_batch(
+        self, n: int, worker_id: str, lease_seconds: int = 300
+    ) -> List[Tuple[int, str]]:
+        """
+        Atomically lease up to N pending queue entries for one worker.
+
+        Expired leases of crashed workers are returned to 'pending' first, then
+        the next N due rows are switched to 'leased' by a single
+        UPDATE ... RETURNING, so concurrent publishers never get the same row.
+        Publishing state of claimed rows is moved to 'processing' in the same
+        transaction.
+
+        Args:
+            n: Maximum number of entries to claim
+            worker_id: Identifier of the claiming worker (e.g. "host:pid")
+            lease_seconds: How long the claim is valid before it can be reclaimed
+
+        Returns:
+            List of (id, url) tuples ordered by priority and age
+        """
+        if n <= 0:
+            return []
+
+        try:
+            from models.publishing_state import PublishingState
+
+            now = datetime.datetime.utcnow()
+            lease_until = now + datetime.timedelta(seconds=lease_seconds)
+            with self.connection:
+                self._reclaim_expired_leases(now)
+                rows = self.cursor.execute(
+                    """
+                    UPDATE queue
+                    SET status = 'leased', worker_id = ?, lease_until = ?
+                    WHERE id IN (
+                        SELECT id FROM queue
+                        WHERE status = 'pending'
+                        AND (scheduled_time IS NULL OR scheduled_time <= ?)
+                        ORDER BY priority DESC, created_at ASC, id ASC
+                        LIMIT ?
+                    )
+                    RETURNING id, url, priority, created_at
+                """,
+                    (worker_id, lease_until, now, n),
+                ).fetchall()
+                if not rows:
+                    return []
+
+                # RETURNING does not preserve ORDER BY of the subquery
+                rows = sorted(
+                    rows,
+                    key=lambda r: (-(r["priority"] or 0), str(r["created_at"]), r["id"]),
+                )
+                ids = [row["id"] for row in rows]
+                placeholders = ",".join("?" * len(ids))
+                self.cursor.execute(
+                    f"""
+                    UPDATE publishing_state
+                    SET state = ?, updated_at = ?
+                    WHERE queue_id IN ({placeholders})
+                """,
+                    (PublishingState.PROCESSING.value, now.isoformat(), *ids),
+                )
+            logger.debug(f"claim_batch: {worker_id} leased {len(rows)} queue entries")
+            return [(row["id"], row["url"]) for row in rows]
+        except Exception as e:
+            logger.error(f"Error in claim_batch: {e}")
+            return []
+
+    def _reclaim_expired_leases(self, now: dt) -> int:
+        """Return leased entries with an expired lease back to 'pending' (caller holds the transaction)"""
+        from models.publishing_state import PublishingState
+
+        rows = self.cursor.execute(
+            """
+            UPDATE queue
+            SET status = 'pending', worker_id = NULL, lease_until = NULL
+            WHERE status = 'leased' AND lease_until < ?
+            RETURNING id
+        """,
+            (now,),
+        ).fetchall()
+        if not rows:
+            return 0
+
+        ids = [row["id"] for row in rows]
+        placeholders = ",".join("?" * len(ids))
+        self.cursor.execute(
+            f"""
+            UPDATE publishing_state
+            SET state = ?, updated_at = ?
+            WHERE queue_id IN ({placeholders})
+        """,
+            (PublishingState.QUEUED.value, now.isoformat(), *ids),
+        )
+        logger.info(f"Reclaimed {len(ids)} expired queue leases")
+        return len(ids)
+
+    def reclaim_expired_leases(self) -> int:
+        """
+        Return entries whose lease has expired (crashed or stuck worker) to the queue.
+
+        Returns:
+            Number of reclaimed entries
+        """
+        try:
+            with self.connection:
+                return self._reclaim_expired_leases(datetime.datetime.utcnow())
+        except Exception as e:
+            logger.warning(f"reclaim_expired_leases error: {e}")
+            return 0
+
+    def release_claim(self, task_id: int, worker_id: str) -> bool:
+        """
+        Give a leased entry back to the queue without processing it.
+
+        Publishing state goes back to 'queued' in the same transaction, so a
+        released entry does not stay 'processing'.
+
+        Returns:
+            True if the entry was leased by this worker and is pending again
+        """
+        from models.publishing_state import PublishingState
+
+        with self.connection:
+            cursor = self.cursor.execute(
+                """
+                UPDATE queue
+                SET status = 'pending', worker_id = NULL, lease_until = NULL
+                WHERE id = ? AND status = 'leased' AND worker_id = ?
+            """,
+                (task_id, worker_id),
+            )
+            if cursor.rowcount == 0:
+                return False
+            self.cursor.execute(
+                "UPDATE publishing_state SET state = ?, updated_at = ? WHERE queue_id = ?",
+                (
+                    PublishingState.QUEUED.value,
+                    datetime.datetime.utcnow().isoformat(),
+                    task_id,
+                ),
+            )
+            return True
+
     def mark_as_done(self, task_id: int) -> None:
         with self.connection:
             self.cursor.execute(
-                "UPDATE queue SET status = 'done' WHERE id = ?", (task_id,)
+                "UPDATE queue SET status = 'done', lease_until = NULL WHERE id = ?",
+                (task_id,),
             )
 
     def mark_as_error(self, task_id: int) -> None:
         with self.connection:
             self.cursor.execute(
-                "UPDATE queue SET status = 'error' WHERE id = ?", (task_id,)
+                "UPDATE queue SET status = 'error', lease_until = NULL WHERE id = ?",
+                (task_id,),
             )
 
     def get_queue_count(self) -> int:
@@ -1118,8 +1693,9 @@ class Database:
             stats["history"] = stats["published"]
             # Успешных сегодня
             today = datetime.datetime.utcnow().date()
+            # Сравнение с началом дня использует idx_history_date (date(...) - нет)
             stats["today"] = self.cursor.execute(
-                "SELECT count(*) as c FROM history WHERE date(date_added) = date(?)",
+                "SELECT count(*) as c FROM history WHERE date_added >= ?",
                 (today.isoformat(),),
             ).fetchone()["c"]
             return stats
@@ -1778,6 +2354,9 @@ class Database:
                 (url, title, product_key, now)
             )
             self.connection.commit()
+            from utils.queue_signal import notify_queue_item
+
+            notify_queue_item()
         except Exception:
             # в случае, если в схеме нет колонок — упадёт, но главное: не вставит дубликат
             pass
@@ -17,20 +17,30 @@ Date: 2026-01-01
 """
 
 import aiosqlite
+import asyncio
 import datetime
 import logging
 import json
 import re
 import hashlib
+from contextlib import asynccontextmanager
 from datetime import datetime as dt, timedelta
 from dataclasses import dataclass
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Set, Tuple, Any
 
 # Use unified product key generation
 from utils.product_key import generate_product_key, normalize_url
+from utils.history_rollups import (
+    ROLLUP_HISTORY_COLUMNS,
+    ROLLUP_WATERMARK_KEY,
+    history_rollup_keys,
+)
 
 logger = logging.getLogger(__name__)
 
+# Max bound parameters per IN (...) chunk (SQLite limit is 999 on old builds)
+_IN_CHUNK_SIZE = 500
+
 
 @dataclass
 class CachedProduct:
@@ -51,13 +61,21 @@ class AsyncDatabase:
     - Atomic transactions
     - Connection pooling
     - Proper error handling
+
+    Pooled mode (readers > 0): one writer connection serialized by an
+    asyncio.Lock plus a pool of N read-only connections, so handler reads
+    never queue behind a write transaction (WAL allows concurrent readers).
     """
     
-    def __init__(self, db_file: str = "bot_database.db"):
+    def __init__(self, db_file: str = "bot_database.db", readers: int = 0):
         self.db_file = db_file
+        # In-memory databases are per-connection, so they cannot have readers
+        self.readers = readers if db_file != ":memory:" else 0
         self._connection: Optional[aiosqlite.Connection] = None
+        self._reader_connections: List[aiosqlite.Connection] = []
+        self._reader_pool: Optional[asyncio.Queue] = None
         self._lock = None  # Will be created in async context
-        logger.info(f"AsyncDatabase initialized: {db_file}")
+        logger.info(f"AsyncDatabase initialized: {db_file} (readers={self.readers})")
     
     async def connect(self):
         """
@@ -71,6 +89,7 @@ class AsyncDatabase:
                 timeout=20.0  # 20s timeout for lock acquisition
             )
             self._connection.row_factory = aiosqlite.Row
+            self._lock = asyncio.Lock()
             
             # Enable WAL mode for better concurrency
             await self._connection.execute("PRAGMA journal_mode=WAL")
@@ -85,13 +104,74 @@ class AsyncDatabase:
             
             # Run migrations
             await self._migrate_normalized_urls()
+
+            # Readers are opened after the schema exists
+            if self.readers > 0:
+                self._reader_pool = asyncio.Queue()
+                for _ in range(self.readers):
+                    reader = await aiosqlite.connect(
+                        self.db_file, isolation_level=None, timeout=20.0
+                    )
+                    reader.row_factory = aiosqlite.Row
+                    await reader.execute("PRAGMA query_only=ON")
+                    self._reader_connections.append(reader)
+                    self._reader_pool.put_nowait(reader)
+                logger.info(f"AsyncDatabase reader pool opened ({self.readers} connections)")
     
     async def close(self):
         """Close database connection gracefully."""
+        for reader in self._reader_connections:
+            await reader.close()
+        self._reader_connections = []
+        self._reader_pool = None
+
         if self._connection:
             await self._connection.close()
             self._connection = None
             logger.info("AsyncDatabase closed")
+
+    # ==========================================
+    # CONNECTION HELPERS
+    # ==========================================
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Borrow a read-only connection from the pool (writer if pooling is off)."""
+        if self._reader_pool is None:
+            yield self._connection
+            return
+
+        conn = await self._reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    async def _fetchone(self, query: str, params: tuple = ()) -> Optional[aiosqlite.Row]:
+        async with self._reader() as conn:
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+    async def _fetchall(self, query: str, params: tuple = ()) -> List[aiosqlite.Row]:
+        async with self._reader() as conn:
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchall()
+
+    @asynccontextmanager
+    async def _write(self):
+        """
+        Serialized write transaction on the single writer connection.
+        Commits on success, rolls back on any exception.
+        """
+        async with self._lock:
+            await self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                await self._connection.rollback()
+                raise
+            else:
+                await self._connection.commit()
     
     async def __aenter__(self):
         """Context manager entry."""
@@ -173,6 +253,28 @@ class AsyncDatabase:
                 resolved BOOLEAN DEFAULT 0
             );
             
+            -- Hourly/daily post counters for analytics (see refresh_history_rollups)
+            CREATE TABLE IF NOT EXISTS history_rollups (
+                granularity TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                value TEXT NOT NULL DEFAULT '',
+                posts INTEGER NOT NULL DEFAULT 0,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, dimension, bucket, value)
+            ) WITHOUT ROWID;
+            
+            -- Price history (price monitor, same as database.py)
+            CREATE TABLE IF NOT EXISTS price_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id TEXT NOT NULL,
+                url TEXT,
+                price REAL NOT NULL,
+                old_price REAL,
+                discount_percent REAL,
+                timestamp TIMESTAMP NOT NULL
+            );
+            
             -- Bot settings table
             CREATE TABLE IF NOT EXISTS bot_settings (
                 key TEXT PRIMARY KEY,
@@ -259,6 +361,47 @@ class AsyncDatabase:
                 logger.info("Adding title column to queue table")
                 await self._connection.execute("ALTER TABLE queue ADD COLUMN title TEXT")
 
+            # Queue leasing (claim_batch)
+            if 'worker_id' not in column_names:
+                logger.info("Adding worker_id column to queue table")
+                await self._connection.execute("ALTER TABLE queue ADD COLUMN worker_id TEXT")
+
+            if 'lease_until' not in column_names:
+                logger.info("Adding lease_until column to queue table")
+                await self._connection.execute(
+                    "ALTER TABLE queue ADD COLUMN lease_until TIMESTAMP NULL"
+                )
+
+            # history.category (price monitor, history_rollups)
+            cursor = await self._connection.execute("PRAGMA table_info(history)")
+            history_columns = [col[1] for col in await cursor.fetchall()]
+            if 'category' not in history_columns:
+                logger.info("Adding category column to history table")
+                await self._connection.execute("ALTER TABLE history ADD COLUMN category TEXT")
+
+            # Image dedup, price monitor, rollup brand (same columns as database.py)
+            # (last_price = posted price, the price-drop baseline)
+            for column, column_type in (
+                ("image_phash", "TEXT"),
+                ("last_checked_price", "REAL"),
+                ("brand", "TEXT"),
+                ("price_checked_at", "TIMESTAMP"),
+                ("price_changed_at", "TIMESTAMP"),
+                ("discount", "REAL"),
+            ):
+                if column not in history_columns:
+                    logger.info(f"Adding {column} column to history table")
+                    await self._connection.execute(
+                        f"ALTER TABLE history ADD COLUMN {column} {column_type}"
+                    )
+
+            await self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_queue_claim ON queue(status, scheduled_time, priority, created_at)"
+            )
+            await self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_queue_lease ON queue(status, lease_until)"
+            )
+
             logger.debug("Missing columns check completed")
 
         except Exception as e:
@@ -304,6 +447,9 @@ class AsyncDatabase:
             
             "CREATE INDEX IF NOT EXISTS idx_product_key ON posted_products(product_key)",
 
+            "CREATE INDEX IF NOT EXISTS idx_price_history_product_id ON price_history(product_id)",
+            "CREATE INDEX IF NOT EXISTS idx_price_history_timestamp ON price_history(timestamp)",
+
             "CREATE INDEX IF NOT EXISTS idx_shadow_ban_url ON shadow_ban_log(catalog_url)",
             "CREATE INDEX IF NOT EXISTS idx_shadow_ban_detected ON shadow_ban_log(detected_at)",
         ]
@@ -371,51 +517,254 @@ class AsyncDatabase:
             True if URL exists, False otherwise
         """
         if check_normalized:
-            normalized = normalize_url(url)
-            async with self._connection.execute(
+            row = await self._fetchone(
                 "SELECT 1 FROM history WHERE normalized_url = ? LIMIT 1",
-                (normalized,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return bool(row)
+                (normalize_url(url),)
+            )
         else:
-            async with self._connection.execute(
+            row = await self._fetchone(
                 "SELECT 1 FROM history WHERE url = ? LIMIT 1",
                 (url,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return bool(row)
+            )
+        return bool(row)
     
     async def exists_url_in_queue(self, url: str, check_normalized: bool = True) -> bool:
         """
-        Check if URL exists in pending queue.
+        Check if URL exists in pending (or leased) queue.
         FIXED: Truly async, no event loop blocking.
         """
         if check_normalized:
-            normalized = normalize_url(url)
-            async with self._connection.execute(
-                "SELECT 1 FROM queue WHERE normalized_url = ? AND status = 'pending' LIMIT 1",
-                (normalized,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return bool(row)
+            row = await self._fetchone(
+                "SELECT 1 FROM queue WHERE normalized_url = ? AND status IN ('pending', 'leased') LIMIT 1",
+                (normalize_url(url),)
+            )
         else:
-            async with self._connection.execute(
-                "SELECT 1 FROM queue WHERE url = ? AND status = 'pending' LIMIT 1",
+            row = await self._fetchone(
+                "SELECT 1 FROM queue WHERE url = ? AND status IN ('pending', 'leased') LIMIT 1",
                 (url,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return bool(row)
+            )
+        return bool(row)
     
     async def exists_image(self, img_hash: str) -> bool:
         """Check if image hash exists in history."""
-        async with self._connection.execute(
+        row = await self._fetchone(
             "SELECT 1 FROM history WHERE image_hash = ? LIMIT 1",
             (img_hash,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            return bool(row)
+        )
+        return bool(row)
     
+    # ==========================================
+    # DEDUPLICATION (BATCH LOOKUPS)
+    # ==========================================
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """Same as Database.normalize_url (utils.product_key.normalize_url)."""
+        return normalize_url(url)
+
+    @staticmethod
+    def make_product_key(
+        *, title: str = "", vendor: str = "", offerid: str = "", url: str = "", market_id: str = ""
+    ) -> str:
+        """Same as Database.make_product_key (utils.product_key.generate_product_key)."""
+        return generate_product_key(
+            title=title, vendor=vendor, offerid=offerid, url=url, market_id=market_id
+        )
+
+    async def queue_contains_product_key(self, product_key: str) -> bool:
+        """Check if any queue entry has this product_key."""
+        row = await self._fetchone(
+            "SELECT 1 FROM queue WHERE product_key = ? LIMIT 1", (product_key,)
+        )
+        return bool(row)
+
+    async def has_recent_post(self, product_key: str, days: int = 7) -> bool:
+        """Check the legacy posts table for a publication within N days."""
+        try:
+            row = await self._fetchone(
+                "SELECT 1 FROM posts WHERE product_key = ? AND published_at >= datetime('now', '-' || ? || ' days') LIMIT 1",
+                (product_key, str(days)),
+            )
+            return bool(row)
+        except Exception as e:
+            logger.warning(f"has_recent_post failed: {e}")
+            return False
+
+    async def has_recent_post_duplicate(self, product_key: str, days: int = 7) -> bool:
+        """DEPRECATED: use has_been_posted_recently (posted_products)."""
+        return await self.has_been_posted_recently(product_key, days_to_check=days)
+
+    async def add_queue_item_with_key(
+        self, url: str, title: str, product_key: str, extra: dict = None
+    ) -> bool:
+        """
+        Add URL to queue under product_key.
+
+        Returns:
+            True if the key is in the queue afterwards (added now or earlier)
+        """
+        if await self.add_to_queue(url, title=title, product_key=product_key):
+            return True
+        return await self.queue_contains_product_key(product_key)
+
+    async def find_existing_normalized_urls(self, normalized_urls: List[str]) -> Set[str]:
+        """
+        Batch duplicate check: which normalized_url are already in history
+        or in the active queue (pending/leased).
+        """
+        keys = list({u for u in normalized_urls if u})
+        found: Set[str] = set()
+        for i in range(0, len(keys), _IN_CHUNK_SIZE):
+            chunk = keys[i : i + _IN_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = await self._fetchall(
+                f"""
+                SELECT normalized_url FROM history WHERE normalized_url IN ({placeholders})
+                UNION
+                SELECT normalized_url FROM queue
+                WHERE normalized_url IN ({placeholders}) AND status IN ('pending', 'leased')
+                """,
+                tuple(chunk + chunk),
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    async def find_recent_product_keys(
+        self, product_keys: List[str], days_to_check: int = 7
+    ) -> Set[str]:
+        """Batch variant of has_been_posted_recently."""
+        keys = list({k for k in product_keys if k})
+        found: Set[str] = set()
+        cutoff = (
+            datetime.datetime.utcnow() - datetime.timedelta(days=days_to_check)
+        ).isoformat()
+        try:
+            for i in range(0, len(keys), _IN_CHUNK_SIZE):
+                chunk = keys[i : i + _IN_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = await self._fetchall(
+                    f"SELECT DISTINCT product_key FROM posted_products "
+                    f"WHERE product_key IN ({placeholders}) AND posted_at >= ?",
+                    tuple(chunk + [cutoff]),
+                )
+                found.update(row[0] for row in rows)
+        except Exception as e:
+            logger.warning(f"Error checking posted products batch: {e}")
+        return found
+
+    async def get_dedup_keys(self, days_to_check: int = 7) -> List[str]:
+        """
+        All dedup keys for warming the Bloom filter: normalized_url from
+        history and the active queue + recent product_key.
+        """
+        cutoff = (
+            datetime.datetime.utcnow() - datetime.timedelta(days=days_to_check)
+        ).isoformat()
+        rows = await self._fetchall(
+            """
+            SELECT normalized_url FROM history WHERE normalized_url IS NOT NULL
+            UNION
+            SELECT normalized_url FROM queue
+            WHERE normalized_url IS NOT NULL AND status IN ('pending', 'leased')
+            UNION
+            SELECT product_key FROM posted_products WHERE posted_at >= ?
+            """,
+            (cutoff,),
+        )
+        return [row[0] for row in rows if row[0]]
+
+    async def get_image_phashes(self) -> List[Tuple[str, str]]:
+        """(image_phash, url) of published images for the similar-image index."""
+        rows = await self._fetchall(
+            "SELECT image_phash, url FROM history WHERE image_phash IS NOT NULL"
+        )
+        return [(row[0], row[1]) for row in rows]
+
+    # ==========================================
+    # PRICE MONITOR
+    # ==========================================
+
+    async def get_price_watch_candidates(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Latest `limit` published products for price monitoring.
+
+        Returns:
+            List of dicts: id, url, title, last_price, last_checked_price,
+            discount, category, price_checked_at, price_changed_at, date_added
+        """
+        rows = await self._fetchall(
+            """
+            SELECT id, url, title, last_price, last_checked_price, discount, category,
+                   price_checked_at, price_changed_at, date_added
+            FROM history
+            WHERE COALESCE(deleted, 0) = 0
+            ORDER BY date_added DESC
+            LIMIT ?
+            """,
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    async def save_price_checks(self, checks: List[Dict[str, Any]]) -> int:
+        """
+        Store price check results in one transaction.
+
+        The checked price goes to last_checked_price; last_price (the posted
+        price) stays the price-drop baseline and is only filled when empty.
+
+        Args:
+            checks: dicts with history_id, product_id, url, price, old_price,
+                discount_percent, category, changed (bool), checked_at
+
+        Returns:
+            Number of price_history rows written
+        """
+        if not checks:
+            return 0
+        async with self._write() as conn:
+            await conn.executemany(
+                """
+                INSERT INTO price_history (product_id, url, price, old_price, discount_percent, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (c["product_id"], c["url"], c["price"], c.get("old_price"),
+                     c.get("discount_percent"), c["checked_at"])
+                    for c in checks
+                ],
+            )
+            await conn.executemany(
+                """
+                UPDATE history SET
+                    last_price = COALESCE(last_price, ?),
+                    last_checked_price = ?,
+                    price_checked_at = ?,
+                    price_changed_at = CASE WHEN ? THEN ? ELSE price_changed_at END,
+                    discount = COALESCE(?, discount),
+                    category = COALESCE(?, category)
+                WHERE id = ?
+                """,
+                [
+                    (c["price"], c["price"], c["checked_at"], c.get("changed", False), c["checked_at"],
+                     c.get("discount_percent"), c.get("category"), c["history_id"])
+                    for c in checks
+                ],
+            )
+        return len(checks)
+
+    async def mark_price_checked(
+        self, history_ids: List[int], checked_at: Optional[dt] = None
+    ) -> None:
+        """Mark a check without a price (so the product is skipped this cycle)."""
+        if not history_ids:
+            return
+        checked_at = checked_at or datetime.datetime.utcnow()
+        async with self._write() as conn:
+            await conn.executemany(
+                "UPDATE history SET price_checked_at = ? WHERE id = ?",
+                [(checked_at, history_id) for history_id in history_ids],
+            )
+
     # ==========================================
     # HISTORY OPERATIONS
     # ==========================================
@@ -429,9 +778,12 @@ class AsyncDatabase:
         channel_id: Optional[str] = None,
         price: Optional[float] = None,
         template_type: Optional[str] = None,
+        img_phash: Optional[str] = None,
+        brand: Optional[str] = None,
     ) -> bool:
         """
         Add post to history with auto-computed normalized_url.
+        The post is counted in history_rollups in the same transaction.
         FIXED: Atomic operation with proper transaction handling.
         
         Returns:
@@ -454,74 +806,294 @@ class AsyncDatabase:
                 elif isinstance(price, (int, float)):
                     price_num = float(price)
             
-            # FIXED: Transaction with ROLLBACK on failure
-            await self._connection.execute("BEGIN IMMEDIATE")
-            
             try:
-                await self._connection.execute(
-                    """INSERT INTO history
-                       (normalized_url, url, image_hash, date_added, title, message_id, 
-                        channel_id, last_price, template_type)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        normalized,
-                        url,
-                        img_hash,
-                        datetime.datetime.utcnow(),
-                        title,
-                        message_id,
-                        channel_id,
-                        price_num,
-                        template_type,
-                    ),
-                )
-                await self._connection.commit()
+                async with self._write() as conn:
+                    await conn.execute(
+                        """INSERT INTO history
+                           (normalized_url, url, image_hash, date_added, title, message_id, 
+                            channel_id, last_price, template_type, image_phash, brand)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (
+                            normalized,
+                            url,
+                            img_hash,
+                            datetime.datetime.utcnow(),
+                            title,
+                            message_id,
+                            channel_id,
+                            price_num,
+                            template_type,
+                            img_phash,
+                            brand,
+                        ),
+                    )
+                    # Analytics must not fail the post: the compactor catches up
+                    try:
+                        await self._append_history_rollups(conn)
+                    except aiosqlite.Error as e:
+                        logger.warning(f"history_rollups append failed: {e}")
+                # Written around DedupService.claim - add the keys to its Bloom filter
+                from services.dedup_service import remember_product
+
+                remember_product({"url": url, "title": title})
                 return True
                 
             except aiosqlite.IntegrityError:
                 # Duplicate - update message_id if provided
-                await self._connection.rollback()
-                
                 if message_id:
                     logger.debug(f"Updating existing history entry with message_id for url={url}")
-                    await self._connection.execute(
-                        """UPDATE history
-                           SET message_id = ?, channel_id = ?, template_type = ?
-                           WHERE normalized_url = ?""",
-                        (message_id, channel_id, template_type, normalized),
-                    )
-                    await self._connection.commit()
+                    # Re-post (price drop): the new price is the new baseline
+                    async with self._write() as conn:
+                        await conn.execute(
+                            """UPDATE history
+                               SET message_id = ?, channel_id = ?, template_type = ?,
+                                   last_price = COALESCE(?, last_price)
+                               WHERE normalized_url = ?""",
+                            (message_id, channel_id, template_type, price_num, normalized),
+                        )
                 
                 return False
                 
         except Exception as e:
             logger.error(f"add_post_to_history failed: {e}")
-            if self._connection:
-                await self._connection.rollback()
             raise
     
     async def get_history(self, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
         """Get published posts history."""
-        async with self._connection.execute(
+        rows = await self._fetchall(
             "SELECT url, title, date_added FROM history ORDER BY date_added DESC LIMIT ? OFFSET ?",
             (limit, offset),
-        ) as cursor:
-            rows = await cursor.fetchall()
-            
-            return [
-                {
-                    "url": row["url"],
-                    "title": row["title"] if "title" in row.keys() else "",
-                    "date": row["date_added"]
-                }
-                for row in rows
-            ]
+        )
+        return [
+            {
+                "url": row["url"],
+                "title": row["title"] if "title" in row.keys() else "",
+                "date": row["date_added"]
+            }
+            for row in rows
+        ]
     
     async def get_history_count(self) -> int:
         """Get total history count."""
-        async with self._connection.execute("SELECT count(*) as c FROM history") as cursor:
-            row = await cursor.fetchone()
-            return row["c"] if row else 0
+        row = await self._fetchone("SELECT count(*) as c FROM history")
+        return row["c"] if row else 0
+
+    async def get_recent_posts_with_messages(self, hours: int = 48) -> List[Dict[str, Any]]:
+        """Get posts of the last N hours that have message_id and channel_id (sold out checks)."""
+        cutoff_time = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+        rows = await self._fetchall(
+            """
+            SELECT id, url, title, message_id, channel_id, date_added
+            FROM history
+            WHERE date_added >= ?
+            AND message_id IS NOT NULL
+            AND channel_id IS NOT NULL
+            ORDER BY date_added DESC
+        """,
+            (cutoff_time,),
+        )
+        return [self._history_message_row(row) for row in rows]
+
+    async def get_old_posts_for_cleanup(self, hours_threshold: int = 48) -> List[Dict[str, Any]]:
+        """Get non-deleted posts older than N hours for dead link checks."""
+        cutoff_time = datetime.datetime.utcnow() - datetime.timedelta(hours=hours_threshold)
+        rows = await self._fetchall(
+            """
+            SELECT id, url, title, message_id, channel_id, date_added
+            FROM history
+            WHERE date_added <= ?
+            AND (deleted IS NULL OR deleted = 0)
+            AND message_id IS NOT NULL
+            AND channel_id IS NOT NULL
+            ORDER BY date_added ASC
+        """,
+            (cutoff_time,),
+        )
+        return [self._history_message_row(row) for row in rows]
+
+    @staticmethod
+    def _history_message_row(row: aiosqlite.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "url": row["url"],
+            "title": row["title"] if "title" in row.keys() else "",
+            "message_id": row["message_id"],
+            "channel_id": row["channel_id"],
+            "date_added": row["date_added"],
+        }
+
+    async def update_message_id(self, url: str, message_id: int, channel_id: str) -> bool:
+        """Update message_id and channel_id of an existing history entry."""
+        async with self._write() as conn:
+            cursor = await conn.execute(
+                "UPDATE history SET message_id = ?, channel_id = ? WHERE url = ?",
+                (message_id, channel_id, url),
+            )
+            return cursor.rowcount > 0
+
+    async def mark_history_as_deleted(self, history_id: int) -> bool:
+        """Mark history entry as deleted (and in its history_rollups buckets)."""
+        try:
+            async with self._write() as conn:
+                async with conn.execute(
+                    f"SELECT {ROLLUP_HISTORY_COLUMNS} FROM history WHERE id = ?",
+                    (history_id,),
+                ) as cursor:
+                    row = await cursor.fetchone()
+                cursor = await conn.execute(
+                    "UPDATE history SET deleted = 1 WHERE id = ?", (history_id,)
+                )
+                # Already counted in history_rollups - record the deletion there
+                watermark = await self._history_rollup_watermark(conn)
+                if row and not row["deleted"] and history_id <= watermark:
+                    await self._apply_history_rollups(
+                        conn, {key: [0, 1] for key in history_rollup_keys(row)}
+                    )
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error marking history entry {history_id} as deleted: {e}")
+            return False
+
+    async def get_last_post(self) -> Optional[Dict[str, str]]:
+        """Get last published post."""
+        row = await self._fetchone(
+            "SELECT url, title, date_added FROM history ORDER BY date_added DESC LIMIT 1"
+        )
+        if row:
+            return {
+                "url": row["url"],
+                "title": row["title"] if "title" in row.keys() else "",
+                "date": row["date_added"],
+            }
+        return None
+
+    async def get_last_post_time(self) -> Optional[dt]:
+        """Get time of last published post."""
+        try:
+            row = await self._fetchone(
+                "SELECT date_added FROM history ORDER BY date_added DESC LIMIT 1"
+            )
+            if not row:
+                return None
+            date_str = row["date_added"]
+            if isinstance(date_str, datetime.datetime):
+                return date_str
+            try:
+                return datetime.datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+            except ValueError:
+                try:
+                    return datetime.datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    return datetime.datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S.%f")
+        except Exception as e:
+            logger.warning(f"get_last_post_time error: {e}")
+            return None
+
+    async def update_post_views(self, message_id: int, views: int) -> bool:
+        """Update views count of a post."""
+        async with self._write() as conn:
+            cursor = await conn.execute(
+                "UPDATE history SET views_24h = ? WHERE message_id = ?",
+                (views, message_id),
+            )
+            return cursor.rowcount > 0
+
+    async def get_posts_for_views_update(self, hours_old: int = 24) -> List[Dict[str, Any]]:
+        """Get A/B posts older than N hours for views update."""
+        cutoff_time = datetime.datetime.utcnow() - datetime.timedelta(hours=hours_old)
+        rows = await self._fetchall(
+            """
+            SELECT message_id, channel_id, views_24h, date_added
+            FROM history
+            WHERE message_id IS NOT NULL
+            AND channel_id IS NOT NULL
+            AND template_type IS NOT NULL
+            AND date_added <= ?
+            ORDER BY date_added DESC
+        """,
+            (cutoff_time,),
+        )
+        return [
+            {
+                "message_id": row["message_id"],
+                "channel_id": row["channel_id"],
+                "current_views": row["views_24h"] or 0,
+                "date_added": row["date_added"],
+            }
+            for row in rows
+        ]
+
+    async def get_ab_test_stats(self) -> Dict[str, Any]:
+        """Get A/B testing statistics by template type."""
+        template_stats = await self._fetchall(
+            """
+            SELECT
+                template_type,
+                COUNT(*) as total_posts,
+                AVG(views_24h) as avg_views,
+                SUM(views_24h) as total_views,
+                MIN(views_24h) as min_views,
+                MAX(views_24h) as max_views
+            FROM history
+            WHERE template_type IS NOT NULL
+            GROUP BY template_type
+        """
+        )
+
+        week_ago = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+        weekly_stats = await self._fetchall(
+            """
+            SELECT
+                template_type,
+                COUNT(*) as posts_last_week,
+                AVG(views_24h) as avg_views_week,
+                SUM(views_24h) as total_views_week
+            FROM history
+            WHERE template_type IS NOT NULL
+            AND date_added >= ?
+            GROUP BY template_type
+        """,
+            (week_ago,),
+        )
+
+        total_stats = await self._fetchone(
+            """
+            SELECT
+                COUNT(*) as total_ab_posts,
+                AVG(views_24h) as overall_avg_views,
+                SUM(views_24h) as overall_total_views
+            FROM history
+            WHERE template_type IS NOT NULL
+        """
+        )
+
+        return {
+            "template_stats": [
+                {
+                    "template_type": row["template_type"],
+                    "total_posts": row["total_posts"],
+                    "avg_views": row["avg_views"] or 0,
+                    "total_views": row["total_views"] or 0,
+                    "min_views": row["min_views"] or 0,
+                    "max_views": row["max_views"] or 0,
+                }
+                for row in template_stats
+            ],
+            "weekly_stats": [
+                {
+                    "template_type": row["template_type"],
+                    "posts_last_week": row["posts_last_week"],
+                    "avg_views_week": row["avg_views_week"] or 0,
+                    "total_views_week": row["total_views_week"] or 0,
+                }
+                for row in weekly_stats
+            ],
+            "total_stats": {
+                "total_ab_posts": total_stats["total_ab_posts"],
+                "overall_avg_views": total_stats["overall_avg_views"] or 0,
+                "overall_total_views": total_stats["overall_total_views"] or 0,
+            },
+        }
     
     # ==========================================
     # QUEUE OPERATIONS  
@@ -554,11 +1126,10 @@ class AsyncDatabase:
             if not product_key:
                 product_key = generate_product_key(url=url, title=title)
             
-            # FIXED: Atomic transaction
-            await self._connection.execute("BEGIN IMMEDIATE")
-            
-            try:
-                cursor = await self._connection.execute(
+            from models.publishing_state import PublishingState
+
+            async with self._write() as conn:
+                cursor = await conn.execute(
                     """INSERT INTO queue 
                        (normalized_url, url, created_at, priority, scheduled_time, product_key, title)
                        VALUES (?, ?, ?, ?, ?, ?, ?)""",
@@ -575,11 +1146,9 @@ class AsyncDatabase:
                 queue_id = cursor.lastrowid
                 
                 # Create publishing entry
-                from models.publishing_state import PublishingState
                 now = datetime.datetime.utcnow()
-                
-                await self._connection.execute(
-                    """INSERT INTO publishing_state 
+                await conn.execute(
+                    """INSERT OR REPLACE INTO publishing_state 
                        (queue_id, url, state, scheduled_time, created_at, updated_at)
                        VALUES (?, ?, ?, ?, ?, ?)""",
                     (
@@ -591,27 +1160,81 @@ class AsyncDatabase:
                         now.isoformat(),
                     ),
                 )
+            # Written around DedupService.claim - add the keys to its Bloom filter
+            from services.dedup_service import remember_product
+
+            remember_product({"url": url, "title": title})
+            from utils.queue_signal import notify_queue_item
+
+            notify_queue_item()
+            return queue_id
                 
-                # Commit transaction
-                await self._connection.commit()
-                return queue_id
-                
-            except aiosqlite.IntegrityError:
-                await self._connection.rollback()
-                return None
-                
+        except aiosqlite.IntegrityError:
+            return None
         except Exception as e:
             logger.error(f"add_to_queue failed: {e}")
-            if self._connection:
-                await self._connection.rollback()
             return None
+
+    async def add_to_queue_batch(
+        self, urls: List[Tuple[str, int, Optional[dt]]]
+    ) -> int:
+        """
+        Batch add URLs to queue in one transaction.
+
+        Args:
+            urls: List of (url, priority, scheduled_time) tuples
+
+        Returns:
+            Number of added URLs
+        """
+        if not urls:
+            return 0
+
+        added_count = 0
+        try:
+            async with self._write() as conn:
+                now = datetime.datetime.utcnow()
+                for url, priority, scheduled_time in urls:
+                    cursor = await conn.execute(
+                        """INSERT OR IGNORE INTO queue
+                           (normalized_url, url, created_at, priority, scheduled_time, product_key)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (
+                            normalize_url(url),
+                            url,
+                            now,
+                            priority,
+                            scheduled_time,
+                            generate_product_key(url=url),
+                        ),
+                    )
+                    added_count += cursor.rowcount
+            if added_count:
+                from utils.queue_signal import notify_queue_item
+
+                notify_queue_item()
+            return added_count
+        except Exception as e:
+            logger.error(f"Error in batch add_to_queue: {e}")
+            return 0
     
     async def get_next_from_queue(
         self,
         respect_schedule: bool = True,
         rotate: bool = True
     ) -> Optional[Tuple[int, str]]:
-        """Get next item from queue."""
+        """
+        Get next item from queue.
+
+        DEPRECATED: the task is not leased, a concurrent worker may publish it
+        again. Use claim_batch + mark_as_done/release_claim.
+        """
+        import warnings
+        warnings.warn(
+            "get_next_from_queue() does not lease the task; use claim_batch()",
+            DeprecationWarning,
+            stacklevel=2
+        )
         now = datetime.datetime.utcnow()
         
         if respect_schedule:
@@ -641,69 +1264,668 @@ class AsyncDatabase:
                            LIMIT 1"""
             params = ()
         
-        async with self._connection.execute(query, params) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return (row["id"], row["url"])
-            return None
+        row = await self._fetchone(query, params)
+        if row:
+            return (row["id"], row["url"])
+        return None
+
+    async def claim_batch(
+        self, n: int, worker_id: str, lease_seconds: int = 300
+    ) -> List[Tuple[int, str]]:
+        """
+        Atomically lease up to N pending queue entries for one worker.
+        Same semantics as Database.claim_batch.
+
+        Returns:
+            List of (id, url) tuples ordered by priority and age
+        """
+        if n <= 0:
+            return []
+
+        try:
+            from models.publishing_state import PublishingState
+
+            now = datetime.datetime.utcnow()
+            lease_until = now + datetime.timedelta(seconds=lease_seconds)
+            async with self._write() as conn:
+                await self._reclaim_expired_leases(conn, now)
+                async with conn.execute(
+                    """
+                    UPDATE queue
+                    SET status = 'leased', worker_id = ?, lease_until = ?
+                    WHERE id IN (
+                        SELECT id FROM queue
+                        WHERE status = 'pending'
+                        AND (scheduled_time IS NULL OR scheduled_time <= ?)
+                        ORDER BY priority DESC, created_at ASC, id ASC
+                        LIMIT ?
+                    )
+                    RETURNING id, url, priority, created_at
+                """,
+                    (worker_id, lease_until, now, n),
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                if not rows:
+                    return []
+
+                # RETURNING does not preserve ORDER BY of the subquery
+                rows = sorted(
+                    rows,
+                    key=lambda r: (-(r["priority"] or 0), str(r["created_at"]), r["id"]),
+                )
+                ids = [row["id"] for row in rows]
+                placeholders = ",".join("?" * len(ids))
+                await conn.execute(
+                    f"""
+                    UPDATE publishing_state
+                    SET state = ?, updated_at = ?
+                    WHERE queue_id IN ({placeholders})
+                """,
+                    (PublishingState.PROCESSING.value, now.isoformat(), *ids),
+                )
+            return [(row["id"], row["url"]) for row in rows]
+        except Exception as e:
+            logger.error(f"Error in claim_batch: {e}")
+            return []
+
+    async def _reclaim_expired_leases(self, conn: aiosqlite.Connection, now: dt) -> int:
+        """Return expired leases to 'pending' (caller holds the write transaction)."""
+        from models.publishing_state import PublishingState
+
+        async with conn.execute(
+            """
+            UPDATE queue
+            SET status = 'pending', worker_id = NULL, lease_until = NULL
+            WHERE status = 'leased' AND lease_until < ?
+            RETURNING id
+        """,
+            (now,),
+        ) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            return 0
+
+        ids = [row["id"] for row in rows]
+        placeholders = ",".join("?" * len(ids))
+        await conn.execute(
+            f"""
+            UPDATE publishing_state
+            SET state = ?, updated_at = ?
+            WHERE queue_id IN ({placeholders})
+        """,
+            (PublishingState.QUEUED.value, now.isoformat(), *ids),
+        )
+        logger.info(f"Reclaimed {len(ids)} expired queue leases")
+        return len(ids)
+
+    async def reclaim_expired_leases(self) -> int:
+        """Return entries whose lease has expired back to the queue."""
+        try:
+            async with self._write() as conn:
+                return await self._reclaim_expired_leases(conn, datetime.datetime.utcnow())
+        except Exception as e:
+            logger.warning(f"reclaim_expired_leases error: {e}")
+            return 0
+
+    async def release_claim(self, task_id: int, worker_id: str) -> bool:
+        """Give a leased entry back to the queue (publishing state back to 'queued')."""
+        from models.publishing_state import PublishingState
+
+        async with self._write() as conn:
+            cursor = await conn.execute(
+                """
+                UPDATE queue
+                SET status = 'pending', worker_id = NULL, lease_until = NULL
+                WHERE id = ? AND status = 'leased' AND worker_id = ?
+            """,
+                (task_id, worker_id),
+            )
+            if cursor.rowcount == 0:
+                return False
+            await conn.execute(
+                "UPDATE publishing_state SET state = ?, updated_at = ? WHERE queue_id = ?",
+                (
+                    PublishingState.QUEUED.value,
+                    datetime.datetime.utcnow().isoformat(),
+                    task_id,
+                ),
+            )
+        from utils.queue_signal import notify_queue_item
+
+        notify_queue_item()
+        return True
     
     async def mark_as_done(self, task_id: int) -> None:
         """Mark queue task as done."""
-        await self._connection.execute(
-            "UPDATE queue SET status = 'done' WHERE id = ?",
-            (task_id,)
-        )
-        await self._connection.commit()
+        async with self._write() as conn:
+            await conn.execute(
+                "UPDATE queue SET status = 'done', lease_until = NULL WHERE id = ?",
+                (task_id,)
+            )
     
     async def mark_as_error(self, task_id: int) -> None:
         """Mark queue task as error."""
-        await self._connection.execute(
-            "UPDATE queue SET status = 'error' WHERE id = ?",
-            (task_id,)
-        )
-        await self._connection.commit()
+        async with self._write() as conn:
+            await conn.execute(
+                "UPDATE queue SET status = 'error', lease_until = NULL WHERE id = ?",
+                (task_id,)
+            )
     
     async def get_queue_count(self) -> int:
         """Get pending queue count."""
-        async with self._connection.execute(
+        row = await self._fetchone(
             "SELECT count(*) as c FROM queue WHERE status = 'pending'"
-        ) as cursor:
-            row = await cursor.fetchone()
-            return row["c"] if row else 0
+        )
+        return row["c"] if row else 0
     
     async def get_queue_size(self) -> int:
         """Alias for get_queue_count."""
         return await self.get_queue_count()
+
+    async def get_queue_urls(self, limit: int = 20) -> List[Tuple[int, str]]:
+        """Get pending queue entries as (id, url)."""
+        rows = await self._fetchall(
+            "SELECT id, url FROM queue WHERE status = 'pending' ORDER BY id ASC LIMIT ?",
+            (limit,),
+        )
+        return [(row["id"], row["url"]) for row in rows]
     
     async def clear_queue(self) -> int:
         """Clear all pending tasks from queue."""
-        async with self._connection.execute(
-            "SELECT count(*) as c FROM queue WHERE status = 'pending'"
-        ) as cursor:
-            row = await cursor.fetchone()
-            count = row["c"] if row else 0
-        
-        await self._connection.execute("DELETE FROM queue WHERE status = 'pending'")
-        await self._connection.commit()
-        return count
+        async with self._write() as conn:
+            cursor = await conn.execute("DELETE FROM queue WHERE status = 'pending'")
+            return cursor.rowcount
     
     async def remove_from_queue(self, url: str = None, task_id: int = None) -> bool:
         """Remove URL from queue by URL or task_id."""
         if task_id:
-            cursor = await self._connection.execute(
-                "DELETE FROM queue WHERE id = ? AND status = 'pending'",
-                (task_id,)
-            )
+            query, params = "DELETE FROM queue WHERE id = ? AND status = 'pending'", (task_id,)
         elif url:
-            cursor = await self._connection.execute(
-                "DELETE FROM queue WHERE url = ? AND status = 'pending'",
-                (url,)
-            )
+            query, params = "DELETE FROM queue WHERE url = ? AND status = 'pending'", (url,)
         else:
             return False
         
-        await self._connection.commit()
-        return cursor.rowcount > 0
+        async with self._write() as conn:
+            cursor = await conn.execute(query, params)
+            return cursor.rowcount > 0
+
+    async def get_queue_stats(self) -> Dict[str, int]:
+        """Get queue statistics."""
+        try:
+            published = await self._fetchone(
+                "SELECT count(*) as c FROM queue WHERE status = 'done'"
+            )
+            errors = await self._fetchone(
+                "SELECT count(*) as c FROM queue WHERE status = 'error'"
+            )
+            today = datetime.datetime.utcnow().date()
+            today_row = await self._fetchone(
+                "SELECT count(*) as c FROM queue WHERE status = 'done' AND date(created_at) = date(?)",
+                (today.isoformat(),),
+            )
+            return {
+                "published": published["c"],
+                "errors": errors["c"],
+                "today": today_row["c"],
+            }
+        except Exception as e:
+            logger.warning(f"get_queue_stats error: {e}")
+            return {"published": 0, "errors": 0, "today": 0}
+
+    # ==========================================
+    # PARSING CACHE
+    # ==========================================
+
+    async def get_cached_data(
+        self, url: str, max_age_hours: int = 24
+    ) -> Optional[Dict[str, Any]]:
+        """Get cached parsing data if younger than max_age_hours."""
+        row = await self._fetchone(
+            "SELECT data, cached_at FROM cache WHERE url = ?", (url,)
+        )
+        if row:
+            cached_at = datetime.datetime.fromisoformat(str(row["cached_at"]))
+            age = datetime.datetime.utcnow() - cached_at
+            if age.total_seconds() < max_age_hours * 3600:
+                try:
+                    return json.loads(row["data"])
+                except Exception:
+                    return None
+        return None
+
+    async def set_cached_data(self, url: str, data: Dict[str, Any]) -> None:
+        """Store parsing data in cache (image_bytes are not serialized)."""
+        try:
+            cache_data = {k: v for k, v in data.items() if k != "image_bytes"}
+            async with self._write() as conn:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO cache (url, data, cached_at) VALUES (?, ?, ?)",
+                    (url, json.dumps(cache_data), datetime.datetime.utcnow()),
+                )
+        except Exception as e:
+            logger.warning("set_cached_data error: %s", e)
+
+    async def clear_old_cache(self, max_age_hours: int = 48) -> None:
+        """Remove stale parsing cache entries."""
+        try:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=max_age_hours)
+            async with self._write() as conn:
+                await conn.execute("DELETE FROM cache WHERE cached_at < ?", (cutoff,))
+        except Exception as e:
+            logger.warning("clear_old_cache error: %s", e)
+
+    # ==========================================
+    # PRODUCT CACHE (CachedProduct)
+    # ==========================================
+
+    async def cache_product(self, product: "CachedProduct") -> bool:
+        """Cache product data after successful CC generation."""
+        try:
+            from models.cached_product import CachedProduct
+
+            if not isinstance(product, CachedProduct):
+                logger.warning("cache_product: invalid product type")
+                return False
+
+            if not product.title or not product.title.strip():
+                logger.warning("cache_product: empty title, skipping cache")
+                return False
+
+            if product.price <= 0:
+                logger.warning(f"cache_product: invalid price {product.price}, skipping cache")
+                return False
+
+            async with self._write() as conn:
+                await conn.execute(
+                    """
+                    INSERT OR REPLACE INTO product_cache 
+                    (product_id, title, price, cc_link, discount, category, rating, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        product.product_id,
+                        product.title,
+                        product.price,
+                        product.cc_link,
+                        product.discount,
+                        product.category,
+                        product.rating,
+                        (
+                            product.created_at.isoformat()
+                            if isinstance(product.created_at, datetime.datetime)
+                            else product.created_at
+                        ),
+                    ),
+                )
+            logger.debug(f"Cached product: {product.product_id} - {product.title[:50]}")
+            return True
+        except Exception as e:
+            logger.warning(f"cache_product error: {e}")
+            return False
+
+    async def get_cached_product(
+        self, product_id: str, ttl_days: int = 7
+    ) -> Optional[Dict[str, Any]]:
+        """Get cached product by ID if fresh (within TTL)."""
+        try:
+            row = await self._fetchone(
+                "SELECT * FROM product_cache WHERE product_id = ?", (product_id,)
+            )
+            return self._fresh_product_row(row, ttl_days)
+        except Exception as e:
+            logger.warning(f"get_cached_product error: {e}")
+            return None
+
+    async def get_cached_product_by_cc_link(
+        self, cc_link: str, ttl_days: int = 7
+    ) -> Optional[Dict[str, Any]]:
+        """Get cached product by CC link if fresh (within TTL)."""
+        try:
+            row = await self._fetchone(
+                "SELECT * FROM product_cache WHERE cc_link = ?", (cc_link,)
+            )
+            return self._fresh_product_row(row, ttl_days)
+        except Exception as e:
+            logger.warning(f"get_cached_product_by_cc_link error: {e}")
+            return None
+
+    @staticmethod
+    def _fresh_product_row(row: Optional[aiosqlite.Row], ttl_days: int) -> Optional[Dict[str, Any]]:
+        if not row:
+            return None
+
+        created_at = datetime.datetime.fromisoformat(row["created_at"])
+        age = datetime.datetime.utcnow() - created_at
+        if age.days >= ttl_days:
+            logger.debug(f"Product {row['product_id']} cache expired (age: {age.days} days)")
+            return None
+
+        return {
+            "product_id": row["product_id"],
+            "title": row["title"],
+            "price": row["price"],
+            "cc_link": row["cc_link"],
+            "discount": row["discount"],
+            "category": row["category"],
+            "rating": row["rating"],
+            "created_at": row["created_at"],
+        }
+
+    async def clear_old_product_cache(self, ttl_days: int = 7) -> int:
+        """Remove expired product cache entries."""
+        try:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=ttl_days)
+            async with self._write() as conn:
+                cursor = await conn.execute(
+                    "DELETE FROM product_cache WHERE created_at < ?",
+                    (cutoff.isoformat(),),
+                )
+                count = cursor.rowcount
+            logger.info(f"Cleared {count} expired product cache entries")
+            return count
+        except Exception as e:
+            logger.warning(f"clear_old_product_cache error: {e}")
+            return 0
+
+    # ==========================================
+    # BLACKLIST & ERROR QUEUE
+    # ==========================================
+
+    async def is_blacklisted(self, url: str) -> bool:
+        """Check if URL is blacklisted."""
+        row = await self._fetchone("SELECT 1 FROM blacklist WHERE url = ? LIMIT 1", (url,))
+        return bool(row)
+
+    async def add_to_blacklist(self, url: str, reason: str = "") -> bool:
+        """Add URL to blacklist."""
+        try:
+            async with self._write() as conn:
+                await conn.execute(
+                    "INSERT INTO blacklist (url, reason, added_at) VALUES (?, ?, ?)",
+                    (url, reason, datetime.datetime.utcnow()),
+                )
+            return True
+        except aiosqlite.IntegrityError:
+            return False
+
+    async def remove_from_blacklist(self, url: str) -> bool:
+        """Remove URL from blacklist."""
+        async with self._write() as conn:
+            cursor = await conn.execute("DELETE FROM blacklist WHERE url = ?", (url,))
+            return cursor.rowcount > 0
+
+    async def get_blacklist(self) -> List[Dict[str, str]]:
+        """Get blacklist entries."""
+        rows = await self._fetchall(
+            "SELECT url, reason FROM blacklist ORDER BY added_at DESC"
+        )
+        return [
+            {"url": row["url"], "reason": row["reason"] or ""}
+            for row in rows
+        ]
+
+    async def add_to_error_queue(self, url: str, reason: str) -> None:
+        """Add product to error queue for debugging."""
+        try:
+            async with self._write() as conn:
+                await conn.execute(
+                    "INSERT INTO error_queue (url, reason, added_at) VALUES (?, ?, ?)",
+                    (url, reason, datetime.datetime.utcnow()),
+                )
+        except Exception as e:
+            logger.warning("add_to_error_queue error: %s", e)
+
+    async def get_error_queue(self, limit: int = 50) -> List[Dict[str, str]]:
+        """Get unresolved error queue entries."""
+        rows = await self._fetchall(
+            "SELECT url, reason, added_at FROM error_queue WHERE resolved = 0 ORDER BY added_at DESC LIMIT ?",
+            (limit,),
+        )
+        return [
+            {"url": row["url"], "reason": row["reason"] or "", "date": row["added_at"]}
+            for row in rows
+        ]
+
+    # ==========================================
+    # PUBLISHING STATE MACHINE
+    # ==========================================
+
+    @staticmethod
+    def _publishing_row(row: aiosqlite.Row) -> Dict[str, Any]:
+        return {
+            "queue_id": row["queue_id"],
+            "url": row["url"],
+            "state": row["state"],
+            "message_id": row["message_id"],
+            "chat_id": row["chat_id"],
+            "text": row["text"],
+            "scheduled_time": row["scheduled_time"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "error": row["error"],
+        }
+
+    async def get_publishing_entry(self, queue_id: int) -> Optional[Dict[str, Any]]:
+        """Get publishing entry by queue_id."""
+        try:
+            row = await self._fetchone(
+                "SELECT * FROM publishing_state WHERE queue_id = ?", (queue_id,)
+            )
+            return self._publishing_row(row) if row else None
+        except Exception as e:
+            logger.warning(f"get_publishing_entry error: {e}")
+            return None
+
+    async def update_publishing_state(
+        self,
+        queue_id: int,
+        state: str,
+        message_id: Optional[int] = None,
+        chat_id: Optional[int] = None,
+        text: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> bool:
+        """Update publishing state (queued, processing, ready, posted, failed)."""
+        try:
+            now = datetime.datetime.utcnow()
+            async with self._write() as conn:
+                await conn.execute(
+                    """
+                    UPDATE publishing_state
+                    SET state = ?, message_id = ?, chat_id = ?, text = ?, 
+                        updated_at = ?, error = ?
+                    WHERE queue_id = ?
+                """,
+                    (state, message_id, chat_id, text, now.isoformat(), error, queue_id),
+                )
+            return True
+        except Exception as e:
+            logger.warning(f"update_publishing_state error: {e}")
+            return False
+
+    async def get_ready_posts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get posts in 'ready' state that can be published now."""
+        try:
+            rows = await self._fetchall(
+                """
+                SELECT * FROM publishing_state
+                WHERE state = 'ready'
+                AND (scheduled_time IS NULL OR scheduled_time <= ?)
+                ORDER BY created_at ASC
+                LIMIT ?
+            """,
+                (datetime.datetime.utcnow().isoformat(), limit),
+            )
+            return [self._publishing_row(row) for row in rows]
+        except Exception as e:
+            logger.warning(f"get_ready_posts error: {e}")
+            return []
+
+    async def get_processing_posts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get posts stuck in 'processing' state for more than 10 minutes."""
+        try:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(minutes=10)
+            rows = await self._fetchall(
+                """
+                SELECT * FROM publishing_state
+                WHERE state = 'processing'
+                AND updated_at < ?
+                ORDER BY updated_at ASC
+                LIMIT ?
+            """,
+                (cutoff.isoformat(), limit),
+            )
+            return [self._publishing_row(row) for row in rows]
+        except Exception as e:
+            logger.warning(f"get_processing_posts error: {e}")
+            return []
+
+    # ==========================================
+    # BOT SETTINGS
+    # ==========================================
+
+    async def get_setting(self, key: str, default: str = "False") -> str:
+        """Get setting from bot_settings."""
+        try:
+            row = await self._fetchone(
+                "SELECT value FROM bot_settings WHERE key = ?", (key,)
+            )
+            return row["value"] if row else default
+        except Exception as e:
+            logger.warning(f"get_setting error: {e}")
+            return default
+
+    async def set_setting(self, key: str, value: str) -> None:
+        """Set setting in bot_settings."""
+        try:
+            async with self._write() as conn:
+                await conn.execute(
+                    """
+                    INSERT OR REPLACE INTO bot_settings (key, value, updated_at)
+                    VALUES (?, ?, ?)
+                """,
+                    (key, value, datetime.datetime.utcnow()),
+                )
+        except Exception as e:
+            logger.warning(f"set_setting error: {e}")
+
+    # ==========================================
+    # USERS
+    # ==========================================
+
+    async def add_user(
+        self,
+        user_id: int,
+        username: str = None,
+        first_name: str = None,
+        last_name: str = None,
+    ) -> None:
+        """Add or update user."""
+        try:
+            async with self._write() as conn:
+                await conn.execute(
+                    """
+                    INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, last_activity)
+                    VALUES (?, ?, ?, ?, ?)
+                """,
+                    (user_id, username, first_name, last_name, datetime.datetime.utcnow()),
+                )
+        except Exception as e:
+            logger.warning(f"add_user error: {e}")
+
+    async def get_user_stats(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get user statistics."""
+        try:
+            row = await self._fetchone(
+                "SELECT * FROM users WHERE user_id = ?", (user_id,)
+            )
+            if row:
+                return {
+                    "user_id": row["user_id"],
+                    "username": row["username"],
+                    "first_name": row["first_name"],
+                    "last_name": row["last_name"],
+                    "joined_at": row["joined_at"],
+                    "last_activity": row["last_activity"],
+                    "downloads_count": 0,
+                }
+            return None
+        except Exception as e:
+            logger.warning(f"get_user_stats error: {e}")
+            return None
+
+    # ==========================================
+    # POSTED PRODUCTS (DE-DUPLICATION)
+    # ==========================================
+
+    async def has_been_posted_recently(
+        self, product_key: str, days_to_check: int = 7
+    ) -> bool:
+        """Check if a product with the same key has been posted within the last N days."""
+        try:
+            cutoff_date = datetime.datetime.utcnow() - datetime.timedelta(days=days_to_check)
+            row = await self._fetchone(
+                """
+                SELECT 1 FROM posted_products
+                WHERE product_key = ? AND posted_at >= ?
+                LIMIT 1
+            """,
+                (product_key, cutoff_date.isoformat()),
+            )
+            return bool(row)
+        except Exception as e:
+            logger.warning(f"Error checking for duplicate product '{product_key}': {e}")
+            # Return False on error to avoid blocking posts due to DB issues
+            return False
+
+    async def add_posted_product(self, product_key: str, url: Optional[str] = None) -> bool:
+        """Record that a product has been posted."""
+        try:
+            async with self._write() as conn:
+                await conn.execute(
+                    "INSERT INTO posted_products (product_key, posted_at, url) VALUES (?, ?, ?)",
+                    (product_key, datetime.datetime.utcnow().isoformat(), url),
+                )
+            return True
+        except Exception as e:
+            logger.warning(f"Error recording posted product '{product_key}': {e}")
+            return False
+
+    async def get_recent_posted_products(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get recently posted products for debugging/monitoring."""
+        try:
+            rows = await self._fetchall(
+                """
+                SELECT product_key, posted_at
+                FROM posted_products
+                ORDER BY posted_at DESC
+                LIMIT ?
+            """,
+                (limit,),
+            )
+            return [
+                {"product_key": row["product_key"], "posted_at": row["posted_at"]}
+                for row in rows
+            ]
+        except Exception as e:
+            logger.warning(f"Error getting recent posted products: {e}")
+            return []
+
+    async def cleanup_old_posted_products(self, days_to_keep: int = 30) -> int:
+        """Remove old posted product records."""
+        try:
+            cutoff_date = datetime.datetime.utcnow() - datetime.timedelta(days=days_to_keep)
+            async with self._write() as conn:
+                cursor = await conn.execute(
+                    "DELETE FROM posted_products WHERE posted_at < ?",
+                    (cutoff_date.isoformat(),),
+                )
+                count = cursor.rowcount
+            logger.info(f"Cleaned up {count} old posted product records")
+            return count
+        except Exception as e:
+            logger.warning(f"Error cleaning up old posted products: {e}")
+            return 0
     
     # ==========================================
     # STATISTICS
@@ -714,37 +1936,167 @@ class AsyncDatabase:
         stats = {}
         
         # Published total
-        async with self._connection.execute("SELECT count(*) as c FROM history") as cursor:
-            row = await cursor.fetchone()
-            stats["published"] = row["c"] if row else 0
+        row = await self._fetchone("SELECT count(*) as c FROM history")
+        stats["published"] = row["c"] if row else 0
         
         # Pending in queue
-        async with self._connection.execute(
+        row = await self._fetchone(
             "SELECT count(*) as c FROM queue WHERE status = 'pending'"
-        ) as cursor:
-            row = await cursor.fetchone()
-            stats["pending"] = row["c"] if row else 0
+        )
+        stats["pending"] = row["c"] if row else 0
         
         # Errors
-        async with self._connection.execute(
+        row = await self._fetchone(
             "SELECT count(*) as c FROM queue WHERE status = 'error'"
-        ) as cursor:
-            row = await cursor.fetchone()
-            stats["errors"] = row["c"] if row else 0
+        )
+        stats["errors"] = row["c"] if row else 0
         
         stats["history"] = stats["published"]
         
         # Today's posts
         today = datetime.datetime.utcnow().date()
-        async with self._connection.execute(
+        row = await self._fetchone(
             "SELECT count(*) as c FROM history WHERE date(date_added) = date(?)",
             (today.isoformat(),)
-        ) as cursor:
-            row = await cursor.fetchone()
-            stats["today"] = row["c"] if row else 0
+        )
+        stats["today"] = row["c"] if row else 0
         
         return stats
 
+    async def get_error_counts(self, days: int = 7) -> Dict[str, int]:
+        """Error queue size: total and added during the last N days."""
+        row = await self._fetchone("SELECT count(*) as c FROM error_queue")
+        total = row["c"] if row else 0
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        row = await self._fetchone(
+            "SELECT count(*) as c FROM error_queue WHERE added_at >= ?", (cutoff,)
+        )
+        return {"total_errors": total, "recent_errors": row["c"] if row else 0}
+
+    async def get_top_history(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """Not deleted posts with the most views (the most recent ones if nobody has views)."""
+        rows = await self._fetchall(
+            """
+            SELECT id, url, title, last_price, views_24h, date_added FROM history
+            WHERE (deleted IS NULL OR deleted = 0) AND views_24h > 0
+            ORDER BY views_24h DESC LIMIT ?
+            """,
+            (limit,),
+        )
+        if not rows:
+            rows = await self._fetchall(
+                """
+                SELECT id, url, title, last_price, views_24h, date_added FROM history
+                WHERE deleted IS NULL OR deleted = 0
+                ORDER BY date_added DESC LIMIT ?
+                """,
+                (limit,),
+            )
+        return [dict(row) for row in rows]
+
+    # ==========================================
+    # HISTORY ROLLUPS (analytics)
+    # ==========================================
+
+    @staticmethod
+    async def _history_rollup_watermark(conn: aiosqlite.Connection) -> int:
+        async with conn.execute(
+            "SELECT value FROM bot_settings WHERE key = ?", (ROLLUP_WATERMARK_KEY,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return int(row["value"]) if row and row["value"] else 0
+
+    @staticmethod
+    async def _apply_history_rollups(
+        conn: aiosqlite.Connection, counts: Dict[Tuple[str, str, str, str], List[int]]
+    ) -> None:
+        """Add (posts, deleted) to the buckets (inside an open transaction)."""
+        await conn.executemany(
+            """
+            INSERT INTO history_rollups (granularity, dimension, bucket, value, posts, deleted)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, dimension, bucket, value) DO UPDATE SET
+                posts = posts + excluded.posts,
+                deleted = deleted + excluded.deleted
+            """,
+            [(*key, posts, deleted) for key, (posts, deleted) in counts.items()],
+        )
+
+    @classmethod
+    async def _append_history_rollups(
+        cls, conn: aiosqlite.Connection, batch_size: int = 5000
+    ) -> int:
+        """
+        Count up to batch_size history rows after the watermark in
+        history_rollups (inside an open write transaction).
+
+        Returns:
+            Number of posts counted
+        """
+        async with conn.execute(
+            f"SELECT {ROLLUP_HISTORY_COLUMNS} FROM history WHERE id > ? ORDER BY id LIMIT ?",
+            (await cls._history_rollup_watermark(conn), batch_size),
+        ) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            return 0
+        counts: Dict[Tuple[str, str, str, str], List[int]] = {}
+        for row in rows:
+            for key in history_rollup_keys(row):
+                sums = counts.setdefault(key, [0, 0])
+                sums[0] += 1
+                if row["deleted"]:
+                    sums[1] += 1
+        await cls._apply_history_rollups(conn, counts)
+        await conn.execute(
+            "INSERT OR REPLACE INTO bot_settings (key, value, updated_at) VALUES (?, ?, ?)",
+            (ROLLUP_WATERMARK_KEY, str(rows[-1]["id"]), datetime.datetime.utcnow()),
+        )
+        return len(rows)
+
+    async def refresh_history_rollups(
+        self, batch_size: int = 5000, hourly_retention_days: int = 30
+    ) -> int:
+        """
+        history_rollups compactor: count rows written around add_post_to_history
+        (migrations, other processes) and drop old hourly buckets.
+        Same buckets and watermark as Database.refresh_history_rollups.
+
+        Returns:
+            Number of posts counted
+        """
+        processed = 0
+        while True:
+            async with self._write() as conn:
+                count = await self._append_history_rollups(conn, batch_size)
+            processed += count
+            if count < batch_size:
+                break
+
+        if hourly_retention_days:
+            cutoff = datetime.datetime.utcnow() - timedelta(days=hourly_retention_days)
+            async with self._write() as conn:
+                await conn.execute(
+                    "DELETE FROM history_rollups WHERE granularity = 'hour' AND bucket < ?",
+                    (cutoff.strftime("%Y-%m-%d %H"),),
+                )
+        if processed:
+            logger.debug(f"History rollups: +{processed} posts")
+        return processed
+
+    async def get_history_rollups(
+        self, dimension: str, granularity: str = "day", since: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """history_rollups buckets (bucket, value, posts, deleted), no refresh."""
+        rows = await self._fetchall(
+            """
+            SELECT bucket, value, posts, deleted FROM history_rollups
+            WHERE granularity = ? AND dimension = ? AND bucket >= ?
+            ORDER BY bucket
+            """,
+            (granularity, dimension, since or ""),
+        )
+        return [dict(row) for row in rows]
 
 # ==========================================
 # GLOBAL INSTANCE & FACTORY
@@ -762,7 +2114,8 @@ async def get_async_db() -> AsyncDatabase:
     if _async_db_instance is None:
         import config
         db_file = getattr(config, "DB_FILE", "bot_database.db")
-        _async_db_instance = AsyncDatabase(db_file)
+        readers = getattr(config, "DB_READER_CONNECTIONS", 0)
+        _async_db_instance = AsyncDatabase(db_file, readers=readers)
         await _async_db_instance.connect()
     return _async_db_instance
 
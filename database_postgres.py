@@ -3,11 +3,11 @@ import logging
 import json
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, Numeric, Float, Index
+from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, Date, DateTime, Numeric, Float, Index, UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import config
 
 logger = logging.getLogger(__name__)
@@ -120,6 +120,54 @@ class PostMetric(Base):
         Index('idx_post_metrics_brand', 'brand'),
     )
 
+class MetricRollup(Base):
+    """Дневные суммы post_metrics по дню публикации, бренду и шаблону (для get_metrics_summary)"""
+    __tablename__ = 'metric_rollups'
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)  # DATE(post_metrics.published_at)
+    brand = Column(String, nullable=False, default='')  # '' - бренд не указан
+    template_used = Column(String, nullable=False, default='')
+    posts = Column(Integer, nullable=False, default=0)
+    clicks = Column(Integer, nullable=False, default=0)
+    impressions = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('day', 'brand', 'template_used', name='uq_metric_rollups_bucket'),
+    )
+
+# Прибавить дельты к дневной корзине (ключ корзины берется из post_metrics)
+_ROLLUP_UPSERT = (
+    "INSERT INTO metric_rollups (day, brand, template_used, posts, clicks, impressions) "
+    "{select} "
+    "ON CONFLICT (day, brand, template_used) DO UPDATE SET "
+    "posts = metric_rollups.posts + EXCLUDED.posts, "
+    "clicks = metric_rollups.clicks + EXCLUDED.clicks, "
+    "impressions = metric_rollups.impressions + EXCLUDED.impressions"
+)
+
+
+def metric_delta_rows(deltas: Dict[str, Dict[str, int]]) -> List[Tuple[int, int, int]]:
+    """
+    Дельты метрик -> строки (post_id, clicks, impressions) для apply_metric_deltas
+
+    Ключи, которые не являются числовым post_id (и нечисловые счетчики),
+    пропускаются с предупреждением: иначе один такой ключ валит всю пачку,
+    и агрегатор повторяет ее бесконечно.
+    """
+    rows = []
+    for post_id, counters in deltas.items():
+        try:
+            rows.append((
+                int(post_id),
+                int(counters.get('clicks', 0)),
+                int(counters.get('impressions', 0)),
+            ))
+        except (TypeError, ValueError, AttributeError):
+            logger.warning(f"Skipping invalid metric delta: post_id={post_id!r}, counters={counters!r}")
+    return rows
+
+
 class DatabasePostgres:
     """Postgres database implementation for the new architecture"""
 
@@ -142,6 +190,7 @@ class DatabasePostgres:
 
         # Создаем таблицы
         Base.metadata.create_all(bind=self.engine)
+        self._ensure_metric_rollups()
         logger.info("Postgres database initialized")
 
     def get_session(self) -> Session:
@@ -253,6 +302,24 @@ class DatabasePostgres:
             session.add(history)
             session.commit()
 
+    def save_price_history_batch(self, records: List[Dict]) -> int:
+        """Сохранить пачку записей истории цен одним коммитом (product_id, price, old_price, discount_percent, timestamp)"""
+        if not records:
+            return 0
+        with self.get_session() as session:
+            session.bulk_insert_mappings(PriceHistory, [
+                {
+                    'product_id': r['product_id'],
+                    'price': r['price'],
+                    'old_price': r.get('old_price'),
+                    'discount_percent': r.get('discount_percent'),
+                    'timestamp': r.get('timestamp') or datetime.utcnow(),
+                }
+                for r in records
+            ])
+            session.commit()
+        return len(records)
+
     def get_price_history(self, product_id: str, days: int = 30) -> List[Dict]:
         """Получить историю цен за последние N дней"""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
@@ -364,6 +431,7 @@ class DatabasePostgres:
                          price: float = None, template_used: str = None, cta_used: str = None,
                          published_at: datetime = None):
         """Создать запись метрик для поста"""
+        published_at = published_at or datetime.utcnow()
         with self.get_session() as session:
             metrics = PostMetric(
                 post_id=post_id,
@@ -372,29 +440,93 @@ class DatabasePostgres:
                 price=price,
                 template_used=template_used,
                 cta_used=cta_used,
-                published_at=published_at or datetime.utcnow()
+                published_at=published_at
             )
             session.add(metrics)
+            session.execute(
+                text(_ROLLUP_UPSERT.format(select="VALUES (:day, :brand, :template, 1, 0, 0)")),
+                {'day': published_at.date(), 'brand': brand or '', 'template': template_used or ''}
+            )
             session.commit()
             return metrics.id
 
     def increment_clicks(self, post_id: int):
         """Увеличить счетчик кликов"""
-        with self.get_session() as session:
-            metrics = session.query(PostMetric).filter(PostMetric.post_id == post_id).first()
-            if metrics:
-                metrics.clicks += 1
-                metrics.last_updated = datetime.utcnow()
-                session.commit()
+        self.apply_metric_deltas({post_id: {'clicks': 1}})
 
     def increment_impressions(self, post_id: int):
         """Увеличить счетчик просмотров"""
+        self.apply_metric_deltas({post_id: {'impressions': 1}})
+
+    def apply_metric_deltas(self, deltas: Dict[str, Dict[str, int]]) -> int:
+        """
+        Применить накопленные дельты кликов/показов одним UPDATE
+        (и той же транзакцией прибавить их к дневным корзинам metric_rollups)
+
+        Args:
+            deltas: post_id -> {'clicks': n, 'impressions': n} (services/metrics_aggregator)
+
+        Returns:
+            Количество обновленных строк post_metrics
+        """
+        rows = metric_delta_rows(deltas)
+        if not rows:
+            return 0
+        values = []
+        params = {}
+        for i, (post_id, clicks, impressions) in enumerate(rows):
+            values.append(f"(:p{i}, :c{i}, :i{i})")
+            params[f"p{i}"] = post_id
+            params[f"c{i}"] = clicks
+            params[f"i{i}"] = impressions
+        values_sql = f"(VALUES {', '.join(values)}) AS v(post_id, c, i)"
+        statement = text(
+            "UPDATE post_metrics SET "
+            "clicks = COALESCE(post_metrics.clicks, 0) + v.c, "
+            "impressions = COALESCE(post_metrics.impressions, 0) + v.i, "
+            "last_updated = now() "
+            f"FROM {values_sql} "
+            "WHERE post_metrics.post_id = v.post_id"
+        )
+        rollup = text(_ROLLUP_UPSERT.format(select=(
+            "SELECT DATE(pm.published_at), COALESCE(pm.brand, ''), COALESCE(pm.template_used, ''), "
+            "0, SUM(v.c), SUM(v.i) "
+            f"FROM post_metrics pm JOIN {values_sql} ON pm.post_id = v.post_id "
+            "WHERE pm.published_at IS NOT NULL "
+            "GROUP BY 1, 2, 3"
+        )))
         with self.get_session() as session:
-            metrics = session.query(PostMetric).filter(PostMetric.post_id == post_id).first()
-            if metrics:
-                metrics.impressions += 1
-                metrics.last_updated = datetime.utcnow()
-                session.commit()
+            result = session.execute(statement, params)
+            session.execute(rollup, params)
+            session.commit()
+            return result.rowcount
+
+    def _ensure_metric_rollups(self):
+        """Заполнить metric_rollups из post_metrics, если таблица только что создана"""
+        try:
+            with self.get_session() as session:
+                if session.query(MetricRollup.id).first() is not None:
+                    return
+                if session.query(PostMetric.id).first() is None:
+                    return
+            self.rebuild_metric_rollups()
+        except Exception as e:
+            logger.warning(f"Could not build metric rollups: {e}")
+
+    def rebuild_metric_rollups(self) -> int:
+        """Пересчитать metric_rollups целиком (один проход по post_metrics)"""
+        with self.get_session() as session:
+            session.execute(text("DELETE FROM metric_rollups"))
+            result = session.execute(text(
+                "INSERT INTO metric_rollups (day, brand, template_used, posts, clicks, impressions) "
+                "SELECT DATE(published_at), COALESCE(brand, ''), COALESCE(template_used, ''), "
+                "COUNT(*), COALESCE(SUM(clicks), 0), COALESCE(SUM(impressions), 0) "
+                "FROM post_metrics WHERE published_at IS NOT NULL "
+                "GROUP BY 1, 2, 3"
+            ))
+            session.commit()
+            logger.info(f"Rebuilt metric rollups: {result.rowcount} buckets")
+            return result.rowcount
 
     def get_metrics_summary(self, days: int = 30) -> Dict:
         """Получить сводку метрик за период"""
@@ -405,53 +537,50 @@ class DatabasePostgres:
                 .filter(PublishedPost.published_at >= cutoff_date)\
                 .scalar() or 0
 
-            total_clicks = session.query(func.sum(PostMetric.clicks))\
-                .filter(PostMetric.published_at >= cutoff_date)\
-                .scalar() or 0
-
-            total_impressions = session.query(func.sum(PostMetric.impressions))\
-                .filter(PostMetric.published_at >= cutoff_date)\
-                .scalar() or 0
-
-            # CTR по брендам
-            brand_stats = session.query(
-                PostMetric.brand,
-                func.sum(PostMetric.clicks).label('clicks'),
-                func.sum(PostMetric.impressions).label('impressions')
+            # Клики/показы - из дневных корзин metric_rollups (O(дней), а не O(постов))
+            buckets = session.query(
+                MetricRollup.brand,
+                MetricRollup.template_used,
+                func.sum(MetricRollup.clicks).label('clicks'),
+                func.sum(MetricRollup.impressions).label('impressions')
             )\
-                .filter(PostMetric.published_at >= cutoff_date)\
-                .filter(PostMetric.brand.isnot(None))\
-                .group_by(PostMetric.brand)\
+                .filter(MetricRollup.day >= cutoff_date.date())\
+                .group_by(MetricRollup.brand, MetricRollup.template_used)\
                 .all()
 
+            total_clicks = 0
+            total_impressions = 0
+            by_brand: Dict[str, List[int]] = {}
+            by_template: Dict[str, List[int]] = {}
+            for bucket in buckets:
+                clicks, impressions = int(bucket.clicks or 0), int(bucket.impressions or 0)
+                total_clicks += clicks
+                total_impressions += impressions
+                for key, target in ((bucket.brand, by_brand), (bucket.template_used, by_template)):
+                    if key:
+                        sums = target.setdefault(key, [0, 0])
+                        sums[0] += clicks
+                        sums[1] += impressions
+
+            # CTR по брендам
             brand_ctr = []
-            for stat in brand_stats:
-                ctr = (stat.clicks / stat.impressions * 100) if stat.impressions > 0 else 0
+            for brand, (clicks, impressions) in by_brand.items():
+                ctr = (clicks / impressions * 100) if impressions > 0 else 0
                 brand_ctr.append({
-                    'brand': stat.brand,
-                    'clicks': stat.clicks,
-                    'impressions': stat.impressions,
+                    'brand': brand,
+                    'clicks': clicks,
+                    'impressions': impressions,
                     'ctr': round(ctr, 2)
                 })
 
             # CTR по шаблонам
-            template_stats = session.query(
-                PostMetric.template_used,
-                func.sum(PostMetric.clicks).label('clicks'),
-                func.sum(PostMetric.impressions).label('impressions')
-            )\
-                .filter(PostMetric.published_at >= cutoff_date)\
-                .filter(PostMetric.template_used.isnot(None))\
-                .group_by(PostMetric.template_used)\
-                .all()
-
             template_ctr = []
-            for stat in template_stats:
-                ctr = (stat.clicks / stat.impressions * 100) if stat.impressions > 0 else 0
+            for template, (clicks, impressions) in by_template.items():
+                ctr = (clicks / impressions * 100) if impressions > 0 else 0
                 template_ctr.append({
-                    'template': stat.template_used,
-                    'clicks': stat.clicks,
-                    'impressions': stat.impressions,
+                    'template': template,
+                    'clicks': clicks,
+                    'impressions': impressions,
                     'ctr': round(ctr, 2)
                 })
 
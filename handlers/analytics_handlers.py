@@ -25,14 +25,14 @@ async def cmd_stats_visual(message: types.Message, db, analytics_service):
         from utils.queue_pagination import create_stats_keyboard
 
         # Generate text summary
-        summary_text = analytics_service.get_summary_text()
+        summary_text = await analytics_service.get_summary_text()
 
         # Send text first
         await message.answer(summary_text, parse_mode="HTML")
 
         # Try to generate and send graph
         try:
-            graph_buffer = analytics_service.generate_activity_graph(days=7)
+            graph_buffer = await analytics_service.generate_activity_graph(days=7)
             if graph_buffer:
                 # Send as photo
                 photo = BufferedInputFile(graph_buffer.read(), filename="activity.png")
@@ -166,7 +166,7 @@ async def handle_stats_callback(callback: types.CallbackQuery, analytics_service
 
         if data == "stats_graph":
             # Generate and send graph
-            graph_buffer = analytics_service.generate_activity_graph(days=7)
+            graph_buffer = await analytics_service.generate_activity_graph(days=7)
             if graph_buffer:
                 from aiogram.types import BufferedInputFile
 
@@ -180,13 +180,13 @@ async def handle_stats_callback(callback: types.CallbackQuery, analytics_service
 
         elif data == "stats_details":
             # Send detailed text stats
-            summary = analytics_service.get_summary_text()
+            summary = await analytics_service.get_summary_text()
             await callback.message.answer(summary, parse_mode="HTML")
             await callback.answer("✅ Детали отправлены")
 
         elif data == "stats_refresh":
             # Refresh stats
-            summary = analytics_service.get_summary_text()
+            summary = await analytics_service.get_summary_text()
             await callback.message.edit_text(summary, parse_mode="HTML")
             await callback.answer("🔄 Обновлено")
 
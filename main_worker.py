@@ -26,6 +26,7 @@ from services.validator_service import get_product_validator
 from services.content_service import get_content_service
 from services.publish_service import get_publish_service
 from services.metrics_service import get_metrics_service
+from services.scheduler_service import get_scheduler
 from database_postgres import get_postgres_db
 from redis_cache import get_redis_cache
 
@@ -49,6 +50,10 @@ class MainWorker:
 
         # Задачи фоновых процессов
         self.tasks: List[asyncio.Task] = []
+        self.scheduler = get_scheduler()
+        self._stopped = asyncio.Event()
+        self._search_errors = 0
+        self.max_consecutive_search_errors = 5
 
         # Статистика
         self.stats = {
@@ -68,6 +73,7 @@ class MainWorker:
             return
 
         self.running = True
+        self._stopped.clear()
         self.stats['start_time'] = datetime.utcnow()
 
         logger.info("🚀 Starting Advanced Yandex.Market Bot Worker")
@@ -96,6 +102,12 @@ class MainWorker:
 
         logger.info("🛑 Stopping Advanced Yandex.Market Bot Worker")
         self.running = False
+        self._stopped.set()
+
+        try:
+            await self.scheduler.stop()
+        except Exception as e:
+            logger.error(f"Error stopping scheduler: {e}")
 
         # Отменяем все задачи
         for task in self.tasks:
@@ -121,6 +133,17 @@ class MainWorker:
         except Exception as e:
             logger.error(f"Error closing validator session: {e}")
 
+        try:
+            self.metrics_service.close()
+        except Exception as e:
+            logger.error(f"Error flushing metrics: {e}")
+
+        try:
+            from utils.parse_executor import shutdown_parse_executor
+            shutdown_parse_executor()
+        except Exception as e:
+            logger.error(f"Error stopping parse executor: {e}")
+
         self.tasks.clear()
         logger.info("✅ All services stopped")
 
@@ -171,17 +194,15 @@ class MainWorker:
         await self.publish_service.start_publisher()
         logger.info("✅ Publish service started")
 
-        # Создаём задачу для периодического поиска
-        search_task = asyncio.create_task(self._search_cycle())
-        self.tasks.append(search_task)
-
-        # Создаём задачу для очистки и обслуживания
-        maintenance_task = asyncio.create_task(self._maintenance_cycle())
-        self.tasks.append(maintenance_task)
-
-        # Создаём задачу для отчётов
-        reporting_task = asyncio.create_task(self._reporting_cycle())
-        self.tasks.append(reporting_task)
+        # Периодические циклы - задачи общего планировщика (поиск, обслуживание
+        # и отчёты выполняет одна реплика, статус логирует каждая)
+        self.scheduler.add_interval_task(1800, self._search_cycle, name="smart_search")  # 30 минут
+        self.scheduler.add_interval_task(3600, self._maintenance_cycle, name="maintenance")  # 1 час
+        self.scheduler.add_interval_task(86400, self._reporting_cycle, name="performance_report")  # 24 часа
+        self.scheduler.add_interval_task(
+            300, self._log_status, name="status_log", initial_delay=300, singleton=False
+        )  # 5 минут
+        await self.scheduler.start()
 
         logger.info("✅ Background services started")
 
@@ -198,12 +219,8 @@ class MainWorker:
         signal.signal(signal.SIGTERM, signal_handler)
 
         try:
-            # Основной цикл - просто ждём завершения
-            while self.running:
-                await asyncio.sleep(1)
-
-                # Периодически логируем статус
-                await self._log_status()
+            # Основной цикл - просто ждём завершения (всё остальное делает планировщик)
+            await self._stopped.wait()
 
         except asyncio.CancelledError:
             logger.info("Main loop cancelled")
@@ -213,133 +230,102 @@ class MainWorker:
 
     async def _search_cycle(self):
         """Цикл поиска новых товаров"""
-        logger.info("🔍 Starting search cycle")
-
-        search_interval = 1800  # 30 минут между циклами поиска
-        consecutive_errors = 0
-        max_consecutive_errors = 5
-
-        while self.running:
-            try:
-                start_time = datetime.utcnow()
-                logger.info("🌐 Starting smart search cycle...")
+        start_time = datetime.utcnow()
+        logger.info("🌐 Starting smart search cycle...")
 
-                # Выполняем поиск
-                result = await self.smart_search.run_smart_search_cycle(max_catalogs=5)
-
-                # Логируем метрики поиска
-                metrics = self.smart_search.get_metrics()
-                logger.info(f"Search metrics: {metrics}")
+        try:
+            # Выполняем поиск
+            result = await self.smart_search.run_smart_search_cycle(max_catalogs=5)
 
-                # Обновляем статистику
-                self.stats['cycles_completed'] += 1
-                self.stats['products_found'] += result.get('total_added', 0)
+            # Логируем метрики поиска
+            metrics = self.smart_search.get_metrics()
+            logger.info(f"Search metrics: {metrics}")
 
-                duration = (datetime.utcnow() - start_time).total_seconds()
-                logger.info(f"✅ Search cycle completed: added={result.get('total_added', 0)}, skipped={result.get('total_skipped', 0)}, time={duration:.1f}s")
-                consecutive_errors = 0  # Сбрасываем счетчик ошибок
+            # Обновляем статистику
+            self.stats['cycles_completed'] += 1
+            self.stats['products_found'] += result.get('total_added', 0)
 
-            except Exception as e:
-                consecutive_errors += 1
-                self.stats['search_errors'] += 1
-                logger.error(f"Search cycle error ({consecutive_errors}/{max_consecutive_errors}): {e}")
+            duration = (datetime.utcnow() - start_time).total_seconds()
+            logger.info(f"✅ Search cycle completed: added={result.get('total_added', 0)}, skipped={result.get('total_skipped', 0)}, time={duration:.1f}s")
+            self._search_errors = 0  # Сбрасываем счетчик ошибок
 
-                if consecutive_errors >= max_consecutive_errors:
-                    logger.error("Too many consecutive search errors, pausing search cycle")
-                    await asyncio.sleep(3600)  # Пауза на час
-                    consecutive_errors = 0
-                    continue
+        except Exception as e:
+            self._search_errors += 1
+            self.stats['search_errors'] += 1
+            logger.error(f"Search cycle error ({self._search_errors}/{self.max_consecutive_search_errors}): {e}")
 
-            # Ждём до следующего цикла
-            await asyncio.sleep(search_interval)
+            if self._search_errors >= self.max_consecutive_search_errors:
+                logger.error("Too many consecutive search errors, pausing search cycle")
+                self.scheduler.postpone("smart_search", 3600)  # Пауза на час
+                self._search_errors = 0
 
     async def _maintenance_cycle(self):
         """Цикл обслуживания и очистки"""
-        logger.info("🧹 Starting maintenance cycle")
-
-        maintenance_interval = 3600  # 1 час
-
-        while self.running:
-            try:
-                logger.info("🧹 Running maintenance tasks...")
+        try:
+            logger.info("🧹 Running maintenance tasks...")
 
-                # Очищаем старые кэши в Redis
-                if self.redis:
-                    # Очищаем старые дедупликационные записи (старше 24 часов)
-                    # TODO: Добавить метод очистки в redis_cache.py
+            # Очищаем старые кэши в Redis
+            if self.redis:
+                # Очищаем старые дедупликационные записи (старше 24 часов)
+                # TODO: Добавить метод очистки в redis_cache.py
 
-                    # Проверяем здоровье Redis
-                    if not self.redis.health_check():
-                        logger.warning("Redis health check failed")
+                # Проверяем здоровье Redis
+                if not self.redis.health_check():
+                    logger.warning("Redis health check failed")
 
-                # Проверяем и пересоздаём индексы в Postgres (если нужно)
-                # TODO: Добавить проверки в database_postgres.py
+            # Проверяем и пересоздаём индексы в Postgres (если нужно)
+            # TODO: Добавить проверки в database_postgres.py
 
-                # Очищаем старые логи метрик (старше 90 дней)
-                cutoff_date = datetime.utcnow() - timedelta(days=90)
-                # TODO: Добавить метод очистки в database_postgres.py
+            # Очищаем старые логи метрик (старше 90 дней)
+            cutoff_date = datetime.utcnow() - timedelta(days=90)
+            # TODO: Добавить метод очистки в database_postgres.py
 
-                logger.info("✅ Maintenance tasks completed")
+            logger.info("✅ Maintenance tasks completed")
 
-            except Exception as e:
-                logger.error(f"Maintenance cycle error: {e}")
-
-            await asyncio.sleep(maintenance_interval)
+        except Exception as e:
+            logger.error(f"Maintenance cycle error: {e}")
 
     async def _reporting_cycle(self):
         """Цикл создания отчётов"""
-        logger.info("📊 Starting reporting cycle")
-
-        report_interval = 86400  # 24 часа
-
-        while self.running:
-            try:
-                logger.info("📊 Generating performance report...")
+        try:
+            logger.info("📊 Generating performance report...")
 
-                # Получаем отчёт о производительности
-                report = self.metrics_service.get_performance_report(days=7)
+            # Получаем отчёт о производительности
+            report = self.metrics_service.get_performance_report(days=7)
 
-                # Логируем ключевые метрики
-                overall_ctr = report.get('overall', {}).get('overall_ctr', 0)
-                total_posts = report.get('overall', {}).get('total_posts', 0)
+            # Логируем ключевые метрики
+            overall_ctr = report.get('overall', {}).get('overall_ctr', 0)
+            total_posts = report.get('overall', {}).get('total_posts', 0)
 
-                logger.info(f"📊 Performance Report (7 days):")
-                logger.info(f"   Posts: {total_posts}")
-                logger.info(f"   Overall CTR: {overall_ctr:.2f}%")
+            logger.info(f"📊 Performance Report (7 days):")
+            logger.info(f"   Posts: {total_posts}")
+            logger.info(f"   Overall CTR: {overall_ctr:.2f}%")
 
-                # Логируем топ брендов по CTR
-                brand_ctr = report.get('overall', {}).get('brand_ctr', [])
-                if brand_ctr:
-                    top_brand = brand_ctr[0]
-                    logger.info(f"   Top Brand: {top_brand['brand']} ({top_brand['ctr']:.2f}%)")
+            # Логируем топ брендов по CTR
+            brand_ctr = report.get('overall', {}).get('brand_ctr', [])
+            if brand_ctr:
+                top_brand = brand_ctr[0]
+                logger.info(f"   Top Brand: {top_brand['brand']} ({top_brand['ctr']:.2f}%)")
 
-                # Сохраняем отчёт в файл (опционально)
-                # self._save_report_to_file(report)
+            # Сохраняем отчёт в файл (опционально)
+            # self._save_report_to_file(report)
 
-            except Exception as e:
-                logger.error(f"Reporting cycle error: {e}")
-
-            await asyncio.sleep(report_interval)
+        except Exception as e:
+            logger.error(f"Reporting cycle error: {e}")
 
     async def _log_status(self):
-        """Логировать текущий статус раз в 5 минут"""
-        if not hasattr(self, '_last_status_log'):
-            self._last_status_log = datetime.utcnow()
-
-        if (datetime.utcnow() - self._last_status_log).total_seconds() >= 300:  # 5 минут
-            uptime = datetime.utcnow() - self.stats['start_time']
-
-            # Получаем статус очереди
-            queue_stats = self.publish_service.get_queue_stats()
-
-            logger.info("📈 Status Update:")
-            logger.info(f"   Uptime: {uptime}")
-            logger.info(f"   Search cycles: {self.stats['cycles_completed']}")
-            logger.info(f"   Products found: {self.stats['products_found']}")
-            logger.info(f"   Queue size: {queue_stats.get('queue_size', 0)}")
-            logger.info(f"   Publisher running: {queue_stats.get('publisher_running', False)}")
-
-            self._last_status_log = datetime.utcnow()
+        """Логировать текущий статус (раз в 5 минут, задача планировщика)"""
+        uptime = datetime.utcnow() - self.stats['start_time']
+
+        # Получаем статус очереди
+        queue_stats = self.publish_service.get_queue_stats()
+
+        logger.info("📈 Status Update:")
+        logger.info(f"   Uptime: {uptime}")
+        logger.info(f"   Search cycles: {self.stats['cycles_completed']}")
+        logger.info(f"   Products found: {self.stats['products_found']}")
+        logger.info(f"   Queue size: {queue_stats.get('queue_size', 0)}")
+        logger.info(f"   Publisher running: {queue_stats.get('publisher_running', False)}")
 
     def get_stats(self) -> Dict[str, Any]:
         """Получить статистику работы"""
@@ -1,11 +1,14 @@
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 from services.http_client import HTTPClient  # Adjust import path
+from services.http_registry import HttpClientRegistry, get_http_registry
 
 class HttpClientMiddleware(BaseMiddleware):
-    def __init__(self, http_client: HTTPClient):
+    def __init__(self, http_client: HTTPClient, http_registry: Optional[HttpClientRegistry] = None):
         self.http_client = http_client
+        # Общий пул соединений для хендлеров (data['http_registry'])
+        self.http_registry = http_registry or get_http_registry()
 
     async def __call__(
         self,
@@ -14,7 +17,5 @@ class HttpClientMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         data['http_client'] = self.http_client
+        data['http_registry'] = self.http_registry
         return await handler(event, data)
-
-
-
@@ -8,6 +8,51 @@ import config
 
 logger = logging.getLogger(__name__)
 
+PUBLISH_BUFFER_KEY = "publish_buffer"
+PUBLISH_CONSUMERS_KEY = "publish_consumers"
+DEDUP_SNAPSHOT_KEY = "dedup:bloom"
+
+# Атомарно извлекает до N items с наименьшим score и, если указан consumer,
+# переносит их в его in-flight sorted set (score = дедлайн видимости).
+# Исходный score сохраняется в hash, чтобы reaper вернул item с тем же приоритетом.
+# KEYS: buffer, inflight, inflight_scores, consumers
+# ARGV: count, deadline, consumer_id ("" = без in-flight)
+_DEQUEUE_SCRIPT = """
+local items = redis.call('ZPOPMIN', KEYS[1], ARGV[1])
+if ARGV[3] ~= '' and #items > 0 then
+    for i = 1, #items, 2 do
+        redis.call('ZADD', KEYS[2], ARGV[2], items[i])
+        redis.call('HSET', KEYS[3], items[i], items[i + 1])
+    end
+    redis.call('SADD', KEYS[4], ARGV[3])
+end
+return items
+"""
+
+# Возвращает в буфер items с истекшим дедлайном видимости и, если in-flight
+# consumer опустел, убирает его из множества consumers - в той же атомарной
+# операции, что и dequeue, поэтому новый in-flight не теряется.
+# KEYS: buffer, inflight, inflight_scores, consumers; ARGV: now, consumer_id
+_REAP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, item in ipairs(expired) do
+    local score = redis.call('HGET', KEYS[3], item) or ARGV[1]
+    redis.call('ZADD', KEYS[1], score, item)
+    redis.call('ZREM', KEYS[2], item)
+    redis.call('HDEL', KEYS[3], item)
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('SREM', KEYS[4], ARGV[2])
+end
+return #expired
+"""
+
+
+def _inflight_keys(consumer_id: str) -> Tuple[str, str]:
+    """Ключи in-flight sorted set и hash исходных score для consumer"""
+    return f"publish_inflight:{consumer_id}", f"publish_inflight_scores:{consumer_id}"
+
+
 class RedisCache:
     """Redis cache and queue implementation"""
 
@@ -34,6 +79,10 @@ class RedisCache:
             logger.error(f"Redis connection failed: {e}")
             raise
 
+        # Серверные скрипты буфера публикации (EVALSHA с автоматическим fallback на EVAL)
+        self._dequeue_script = self.client.register_script(_DEQUEUE_SCRIPT)
+        self._reap_script = self.client.register_script(_REAP_SCRIPT)
+
     # Методы для буфера публикации
     def enqueue_publish_item(self, item: Dict, priority: int = 100) -> bool:
         """Добавить товар в очередь публикации с приоритетом"""
@@ -41,38 +90,60 @@ class RedisCache:
             # Используем timestamp с приоритетом для сортировки
             # Чем меньше score, тем выше приоритет
             score = time.time() - priority
-            item_json = json.dumps(item, ensure_ascii=False)
-            self.client.zadd("publish_buffer", {item_json: score})
+            payload = {k: v for k, v in item.items() if k != '_receipt'}
+            item_json = json.dumps(payload, ensure_ascii=False)
+            self.client.zadd(PUBLISH_BUFFER_KEY, {item_json: score})
             logger.debug(f"Enqueued item for publishing: {item.get('title', 'Unknown')}")
             return True
         except Exception as e:
             logger.error(f"Failed to enqueue publish item: {e}")
             return False
 
-    def dequeue_publish_items(self, count: int = 1) -> List[Dict]:
-        """Извлечь товары из очереди публикации"""
+    def dequeue_publish_items(
+        self,
+        count: int = 1,
+        consumer_id: Optional[str] = None,
+        visibility_timeout: int = 300,
+    ) -> List[Dict]:
+        """
+        Атомарно извлечь товары из очереди публикации (один round trip).
+
+        Если передан consumer_id, извлеченные items переносятся в in-flight
+        sorted set этого consumer и должны быть подтверждены через
+        ack_publish_items(). Неподтвержденные за visibility_timeout секунд
+        items возвращаются в буфер reap_expired_publish_items().
+        Каждый item содержит служебное поле '_receipt' для ack/requeue.
+        """
         try:
-            # Получаем items с наименьшими score (высший приоритет)
-            items_with_scores = self.client.zrangebyscore(
-                "publish_buffer",
-                "-inf",
-                "+inf",
-                start=0,
-                num=count,
-                withscores=True
+            if consumer_id:
+                inflight_key, scores_key = _inflight_keys(consumer_id)
+            else:
+                inflight_key, scores_key = _inflight_keys("_")
+            deadline = time.time() + visibility_timeout
+
+            raw = self._dequeue_script(
+                keys=[PUBLISH_BUFFER_KEY, inflight_key, scores_key, PUBLISH_CONSUMERS_KEY],
+                args=[count, deadline, consumer_id or ""],
             )
 
             items = []
-            for item_json, score in items_with_scores:
+            corrupted = []
+            # ZPOPMIN возвращает плоский список [member, score, member, score, ...]
+            for item_json in raw[::2]:
                 try:
                     item = json.loads(item_json)
+                    item['_receipt'] = item_json
                     items.append(item)
-                    # Удаляем из очереди
-                    self.client.zrem("publish_buffer", item_json)
                 except json.JSONDecodeError as e:
                     logger.error(f"Failed to decode publish item: {e}")
-                    # Удаляем поврежденный item
-                    self.client.zrem("publish_buffer", item_json)
+                    corrupted.append(item_json)
+
+            # Поврежденные items уже удалены из буфера, убираем их и из in-flight
+            if corrupted and consumer_id:
+                pipe = self.client.pipeline()
+                pipe.zrem(inflight_key, *corrupted)
+                pipe.hdel(scores_key, *corrupted)
+                pipe.execute()
 
             if items:
                 logger.debug(f"Dequeued {len(items)} items for publishing")
@@ -82,10 +153,76 @@ class RedisCache:
             logger.error(f"Failed to dequeue publish items: {e}")
             return []
 
+    def ack_publish_items(self, items: List[Dict], consumer_id: str) -> int:
+        """Подтвердить обработку items: удалить их из in-flight consumer"""
+        receipts = [item['_receipt'] for item in items if item.get('_receipt')]
+        if not receipts:
+            return 0
+
+        try:
+            inflight_key, scores_key = _inflight_keys(consumer_id)
+            pipe = self.client.pipeline()
+            pipe.zrem(inflight_key, *receipts)
+            pipe.hdel(scores_key, *receipts)
+            removed, _ = pipe.execute()
+            return removed
+        except Exception as e:
+            logger.error(f"Failed to ack publish items: {e}")
+            return 0
+
+    def requeue_publish_item(self, item: Dict, consumer_id: str, priority: int = 100) -> bool:
+        """Атомарно вернуть item из in-flight consumer обратно в буфер с новым приоритетом"""
+        try:
+            receipt = item.get('_receipt')
+            payload = {k: v for k, v in item.items() if k != '_receipt'}
+            item_json = json.dumps(payload, ensure_ascii=False)
+            inflight_key, scores_key = _inflight_keys(consumer_id)
+
+            pipe = self.client.pipeline(transaction=True)
+            if receipt:
+                pipe.zrem(inflight_key, receipt)
+                pipe.hdel(scores_key, receipt)
+            pipe.zadd(PUBLISH_BUFFER_KEY, {item_json: time.time() - priority})
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to requeue publish item: {e}")
+            return False
+
+    def reap_expired_publish_items(self) -> int:
+        """Вернуть в буфер items, зависшие в in-flight дольше visibility timeout"""
+        try:
+            now = time.time()
+            reaped = 0
+            for consumer_id in self.client.smembers(PUBLISH_CONSUMERS_KEY):
+                inflight_key, scores_key = _inflight_keys(consumer_id)
+                reaped += self._reap_script(
+                    keys=[PUBLISH_BUFFER_KEY, inflight_key, scores_key, PUBLISH_CONSUMERS_KEY],
+                    args=[now, consumer_id],
+                )
+
+            if reaped:
+                logger.info(f"Returned {reaped} expired in-flight items to publish buffer")
+            return reaped
+        except Exception as e:
+            logger.error(f"Failed to reap in-flight publish items: {e}")
+            return 0
+
+    def get_inflight_count(self) -> int:
+        """Количество items в обработке у всех consumers"""
+        try:
+            return sum(
+                self.client.zcard(_inflight_keys(consumer_id)[0])
+                for consumer_id in self.client.smembers(PUBLISH_CONSUMERS_KEY)
+            )
+        except Exception as e:
+            logger.error(f"Failed to get in-flight count: {e}")
+            return 0
+
     def get_publish_queue_size(self) -> int:
         """Получить размер очереди публикации"""
         try:
-            return self.client.zcard("publish_buffer")
+            return self.client.zcard(PUBLISH_BUFFER_KEY)
         except Exception as e:
             logger.error(f"Failed to get publish queue size: {e}")
             return 0
@@ -94,7 +231,7 @@ class RedisCache:
         """Посмотреть на следующие items в очереди без извлечения"""
         try:
             items_with_scores = self.client.zrangebyscore(
-                "publish_buffer",
+                PUBLISH_BUFFER_KEY,
                 "-inf",
                 "+inf",
                 start=0,
@@ -235,6 +372,52 @@ class RedisCache:
         except Exception as e:
             logger.error(f"Failed to mark product as seen: {e}")
 
+    def find_seen_products(self, keys: List[str]) -> List[str]:
+        """Batch-проверка seen_products:{key} одним pipeline; возвращает найденные ключи"""
+        if not keys:
+            return []
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.exists(f"seen_products:{key}")
+            return [key for key, exists in zip(keys, pipe.execute()) if exists]
+        except Exception as e:
+            logger.error(f"Failed to check seen products batch: {e}")
+            return []
+
+    def claim_seen_products(self, keys: List[str], ttl_seconds: int = 604800) -> List[bool]:
+        """
+        Atomic SET NX для пачки seen_products:{key} одним pipeline.
+        True - ключ установлен сейчас (товар новый), False - уже был.
+        """
+        if not keys:
+            return []
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(f"seen_products:{key}", "1", ex=ttl_seconds, nx=True)
+            return [bool(ok) for ok in pipe.execute()]
+        except Exception as e:
+            logger.error(f"Failed to claim seen products batch: {e}")
+            return [False] * len(keys)
+
+    def save_dedup_snapshot(self, payload: str, ttl_seconds: int = 604800) -> bool:
+        """Сохранить снимок Bloom-фильтра дедупликации (base64)"""
+        try:
+            self.client.set(DEDUP_SNAPSHOT_KEY, payload, ex=ttl_seconds)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save dedup snapshot: {e}")
+            return False
+
+    def load_dedup_snapshot(self) -> Optional[str]:
+        """Загрузить снимок Bloom-фильтра дедупликации"""
+        try:
+            return self.client.get(DEDUP_SNAPSHOT_KEY)
+        except Exception as e:
+            logger.error(f"Failed to load dedup snapshot: {e}")
+            return None
+
     # Методы для rate limiting
     def check_rate_limit(self, key: str, limit: int, window_seconds: int) -> Tuple[bool, int]:
         """Проверить rate limit"""
@@ -322,7 +505,7 @@ class RedisCache:
     def clear_publish_buffer(self):
         """Очистить буфер публикации (для тестирования)"""
         try:
-            self.client.delete("publish_buffer")
+            self.client.delete(PUBLISH_BUFFER_KEY)
             logger.info("Cleared publish buffer")
         except Exception as e:
             logger.error(f"Failed to clear publish buffer: {e}")
@@ -344,6 +527,7 @@ class RedisCache:
                 'used_memory_human': info.get('used_memory_human', '0B'),
                 'total_connections_received': info.get('total_connections_received', 0),
                 'publish_buffer_size': self.get_publish_queue_size(),
+                'publish_inflight_size': self.get_inflight_count(),
                 'brand_window_size': self.client.llen("recent:brands"),
             }
         except Exception as e:
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark - обработка картинки поста
+
+Сравнивает прежнюю цепочку (improve_image -> add_price_overlay ->
+add_watermark, каждая функция декодирует и кодирует JPEG заново) с одним
+ImagePipeline (декодирование один раз, уменьшение до фильтров, одно
+кодирование).
+
+Использование:
+    python scripts/benchmark_image_pipeline.py [image.jpg ...] [--runs N]
+
+Без аргументов генерируется синтетическое фото 3000x3000 (типичный
+размер картинки карточки Маркета).
+"""
+
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from services.image_service import (  # noqa: E402
+    add_price_overlay,
+    add_watermark,
+    improve_image,
+    product_image_pipeline,
+)
+
+
+def synthetic_photo(size: int = 3000) -> bytes:
+    """JPEG с градиентом и фигурами (чтобы кодек не сжимал его в ноль)"""
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for i in range(0, size, size // 30):
+        draw.ellipse([i, i // 2, i + size // 10, i // 2 + size // 10], fill=(i % 255, 80, 200))
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=92)
+    return output.getvalue()
+
+
+def chained(image_bytes: bytes) -> bytes:
+    """Прежний путь: три прохода decode/encode"""
+    improved = improve_image(image_bytes)
+    with_overlays = add_price_overlay(improved, "15 990", 35, "24 990")
+    return add_watermark(with_overlays)
+
+
+def single_pass(image_bytes: bytes) -> bytes:
+    return product_image_pipeline("15 990", 35, "24 990").run(image_bytes)
+
+
+def measure(func, payload, runs: int):
+    result = func(payload)
+    started = time.process_time()
+    for _ in range(runs):
+        func(payload)
+    return (time.process_time() - started) / runs * 1000, result
+
+
+def bench_image(name: str, image_bytes: bytes, runs: int):
+    with Image.open(BytesIO(image_bytes)) as img:
+        print(f"\n{name}: {img.width}x{img.height}, {len(image_bytes) / 1e6:.2f} MB")
+    baseline = None
+    for label, func in (("chained functions", chained), ("single-decode pipeline", single_pass)):
+        ms, result = measure(func, image_bytes, runs)
+        baseline = baseline or ms
+        with Image.open(BytesIO(result)) as out:
+            size = f"{out.width}x{out.height}"
+        print(f"  {label:<24} {ms:9.1f} ms CPU  {size:<10} x{baseline / ms:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post image pipeline benchmark")
+    parser.add_argument("images", nargs="*", help="Картинки товаров")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if not args.images:
+        bench_image("synthetic photo", synthetic_photo(), args.runs)
+    for image in args.images:
+        bench_image(image, Path(image).read_bytes(), args.runs)
+
+
+if __name__ == "__main__":
+    main()
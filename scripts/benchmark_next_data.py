@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark - извлечение товаров из __NEXT_DATA__ / window.__STATE__
+
+Сравнивает прежний путь (BeautifulSoup по всей странице / регулярка +
+json.loads всего blob) с utils/next_data_extractor на сохраненных страницах.
+
+Использование:
+    python scripts/benchmark_next_data.py [page.html ...] [--runs N]
+
+Без аргументов берется yandex_search_page.html (тот же файл, что
+анализирует analyze_yandex_html.py); если его нет - генерируется
+синтетическая страница каталога с 48 товарами.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from utils import next_data_extractor  # noqa: E402
+from utils.next_data_extractor import (  # noqa: E402
+    NEXT_DATA_ITEMS_PATH,
+    WINDOW_STATE_ITEMS_PATH,
+    extract_next_data_items,
+    extract_window_state_items,
+)
+
+DEFAULT_FIXTURE = "yandex_search_page.html"
+
+
+def synthetic_page(count: int = 48) -> str:
+    """Страница, похожая на каталог Маркета: много разметки и тяжелый initialState"""
+    items = [
+        {
+            "id": 100000 + i,
+            "slug": f"item-{i}",
+            "titles": {"raw": f"Товар номер {i}"},
+            "prices": {"value": 1000 + i, "oldValue": 1500 + i, "currency": "RUR"},
+            "rating": 4.5,
+            "reviewsCount": i,
+            "pictures": [{"url": f"https://avatars.mds.yandex.net/{i}/{j}.jpg"} for j in range(8)],
+            "specs": {f"spec{j}": "значение" * 4 for j in range(20)},
+        }
+        for i in range(count)
+    ]
+    widgets = {
+        f"cms{k}": {"widgets": [{"id": j, "html": "<div>" * 40, "props": {"a": list(range(30))}} for j in range(50)]}
+        for k in range(20)
+    }
+    data = {"props": {"pageProps": {"initialState": {**widgets, "search": {"results": {"items": items}}}}}}
+    snippets = "".join(
+        f'<div data-zone-name="productSnippet"><a href="/product--item-{i}/{100000 + i}">'
+        f'<span>Товар номер {i}</span></a><span data-auto="price">{1000 + i} ₽</span></div>'
+        for i in range(count)
+    )
+    markup = "<div class='layout'><span>filler</span></div>" * 3000
+    state = {"search": {"results": {"items": items}}}
+    return (
+        "<html><head><title>Каталог</title>"
+        f"<script>window.__STATE__ = {json.dumps(state, ensure_ascii=False)};</script></head><body>"
+        f"{markup}{snippets}"
+        f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data, ensure_ascii=False, separators=(",", ":"))}</script>'
+        "</body></html>"
+    )
+
+
+def _walk(data, path):
+    for key in path:
+        data = data.get(key, {}) if isinstance(data, dict) else {}
+    return data if isinstance(data, list) else []
+
+
+def soup_next_data(html: str):
+    """Прежний путь: DOM всей страницы -> script -> json.loads всего blob"""
+    script = BeautifulSoup(html, "lxml").find("script", id="__NEXT_DATA__")
+    if not script:
+        return None
+    return _walk(json.loads(script.string), NEXT_DATA_ITEMS_PATH)
+
+
+def regex_window_state(html: str):
+    """Прежний путь: нежадная регулярка по всему документу"""
+    match = re.search(r"window\.__STATE__\s*=\s*({.+?});", html, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return _walk(json.loads(match.group(1)), WINDOW_STATE_ITEMS_PATH)
+    except ValueError:
+        return None
+
+
+def measure(func, html, runs: int):
+    result = func(html)
+    started = time.perf_counter()
+    for _ in range(runs):
+        func(html)
+    return (time.perf_counter() - started) / runs * 1000, result
+
+
+def bench_page(name: str, html: str, runs: int):
+    print(f"\n{name}: {len(html) / 1e6:.2f} MB")
+    html_bytes = html.encode("utf-8")
+    cases = [
+        ("BeautifulSoup __NEXT_DATA__", soup_next_data, html),
+        ("extractor __NEXT_DATA__ (str)", extract_next_data_items, html),
+        ("extractor __NEXT_DATA__ (bytes)", extract_next_data_items, html_bytes),
+        ("regex window.__STATE__", regex_window_state, html),
+        ("extractor window.__STATE__", extract_window_state_items, html),
+    ]
+    baseline = None
+    for label, func, payload in cases:
+        ms, items = measure(func, payload, runs)
+        if not label.startswith("extractor"):
+            baseline = ms
+        found = "not found" if items is None else f"{len(items)} items"
+        speedup = f"x{baseline / ms:.1f}" if baseline and ms else ""
+        print(f"  {label:<34} {ms:9.2f} ms  {found:<12} {speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="__NEXT_DATA__ extraction benchmark")
+    parser.add_argument("pages", nargs="*", help="Сохраненные HTML страницы Маркета")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = args.pages or ([DEFAULT_FIXTURE] if Path(DEFAULT_FIXTURE).exists() else [])
+    print(f"orjson: {'yes' if next_data_extractor.ORJSON_AVAILABLE else 'no'}")
+    if not pages:
+        bench_page("synthetic catalog page", synthetic_page(), args.runs)
+    for page in pages:
+        bench_page(page, Path(page).read_text(encoding="utf-8", errors="replace"), args.runs)
+    print(f"\nextractor stats: {next_data_extractor.stats}")
+
+
+if __name__ == "__main__":
+    main()
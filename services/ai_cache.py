@@ -1,32 +1,193 @@
 """
 AI Cache - кэширование результатов AI обогащения
+
+Два уровня:
+- L1: ограниченный LRU в памяти процесса (по числу записей и размеру JSON)
+- L2: общее для процессов хранилище (Redis при USE_REDIS, иначе SQLite),
+  переживает рестарт
+
+get_or_compute() объединяет одновременные промахи по одному ключу в один
+запрос к LLM и отдает устаревший (но не старше stale-окна) результат,
+обновляя его в фоне (stale-while-revalidate).
 """
 
+import asyncio
 import logging
 import hashlib
 import json
+import sqlite3
+import threading
 import time
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Awaitable, Callable, Tuple
+
+import config
 
 logger = logging.getLogger(__name__)
 
+# compute() для get_or_compute: (результат, стоимость запроса) или None - не кэшировать
+ComputeFn = Callable[[], Awaitable[Optional[Tuple[Dict[str, Any], float]]]]
+
+REDIS_KEY_PREFIX = "ai_cache:"
+
+
+class RedisAiCacheStore:
+    """L2 хранилище в Redis (TTL = свежесть + stale-окно)"""
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        data = self.client.get(REDIS_KEY_PREFIX + key)
+        return json.loads(data) if data else None
+
+    def set(self, key: str, entry: Dict[str, Any], ttl_seconds: int) -> None:
+        self.client.setex(
+            REDIS_KEY_PREFIX + key, ttl_seconds, json.dumps(entry, ensure_ascii=False)
+        )
+
+    def delete(self, key: str) -> None:
+        self.client.delete(REDIS_KEY_PREFIX + key)
+
+    def clear_expired(self) -> int:
+        # Redis удаляет истекшие ключи сам
+        return 0
+
+
+class SqliteAiCacheStore:
+    """L2 хранилище в SQLite (WAL, общий файл для процессов на одной машине)"""
+
+    name = "sqlite"
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM ai_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, entry: Dict[str, Any], ttl_seconds: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(entry, ensure_ascii=False), time.time() + ttl_seconds),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_l2_store(backend: str = None):
+    """
+    Создать L2 хранилище по настройке AI_CACHE_L2
+
+    Returns:
+        Хранилище или None (только L1)
+    """
+    backend = (backend or config.AI_CACHE_L2).lower()
+    if backend == "none":
+        return None
+    if backend in ("auto", "redis") and config.USE_REDIS:
+        try:
+            from redis_cache import get_redis_cache
+
+            redis_cache = get_redis_cache()
+            if redis_cache:
+                return RedisAiCacheStore(redis_cache.client)
+        except Exception as e:
+            logger.warning(f"AI cache: Redis L2 unavailable, using SQLite: {e}")
+    try:
+        return SqliteAiCacheStore(config.AI_CACHE_DB_FILE)
+    except Exception as e:
+        logger.warning(f"AI cache: SQLite L2 unavailable, L1 only: {e}")
+        return None
+
 
 class AiCache:
     """
     Кэш для результатов AI обогащения
-    Кэширует по product_id или final_url на 24 часа
+    Кэширует по product_id или final_url: свежие cache_ttl_hours,
+    затем еще stale_ttl_hours отдаются с фоновым обновлением
     """
 
-    def __init__(self, cache_ttl_hours: int = 24):
+    def __init__(
+        self,
+        cache_ttl_hours: int = None,
+        stale_ttl_hours: int = None,
+        max_entries: int = None,
+        max_bytes: int = None,
+        l2_store=False,
+        metrics=None,
+    ):
         """
         Инициализация кэша
 
         Args:
             cache_ttl_hours: Время жизни кэша в часах
+            stale_ttl_hours: Сколько часов после TTL отдавать устаревший результат
+            max_entries: Лимит записей L1
+            max_bytes: Лимит размера L1 в байтах
+            l2_store: L2 хранилище (False - по настройке AI_CACHE_L2, None - без L2)
+            metrics: AiMetrics для счетчиков (по умолчанию глобальный)
         """
-        self.cache_ttl_hours = cache_ttl_hours
-        self._cache: Dict[str, Dict[str, Any]] = {}
+        self.cache_ttl_hours = (
+            cache_ttl_hours if cache_ttl_hours is not None else config.AI_CACHE_TTL_HOURS
+        )
+        self.stale_ttl_hours = (
+            stale_ttl_hours if stale_ttl_hours is not None else config.AI_CACHE_STALE_HOURS
+        )
+        self.max_entries = max_entries or config.AI_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or config.AI_CACHE_MAX_BYTES
+        self.l2 = create_l2_store() if l2_store is False else l2_store
+        if metrics is None:
+            from services.ai_metrics import get_ai_metrics
+
+            metrics = get_ai_metrics()
+        self.metrics = metrics
+
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refresh_tasks: set = set()
+        self.stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "evictions": 0,
+            "l2_errors": 0,
+        }
 
     def _generate_key(self, url: str, product_id: Optional[str] = None) -> str:
         """
@@ -46,11 +207,108 @@ class AiCache:
         normalized = url.split("?")[0].split("#")[0]
         return f"url:{hashlib.md5(normalized.encode()).hexdigest()}"
 
+    # --- Свежесть ---
+
+    def _age(self, entry: Dict[str, Any]) -> float:
+        return time.time() - entry.get("cached_at", 0)
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return self._age(entry) <= self.cache_ttl_hours * 3600
+
+    def _is_servable(self, entry: Dict[str, Any]) -> bool:
+        return self._age(entry) <= (self.cache_ttl_hours + self.stale_ttl_hours) * 3600
+
+    # --- L1 ---
+
+    def _l1_get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if not self._is_servable(entry):
+            self._l1_remove(key)
+            logger.debug(f"Cache expired for {key}")
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _l1_put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._l1_remove(key)
+        entry.setdefault("size", len(json.dumps(entry["result"], ensure_ascii=False)))
+        self._cache[key] = entry
+        self._bytes += entry["size"]
+        # Вытесняем самые давно использованные, но не только что добавленную
+        while len(self._cache) > 1 and (
+            len(self._cache) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, evicted = self._cache.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self.stats["evictions"] += 1
+
+    def _l1_remove(self, key: str) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    # --- L2 (ошибки хранилища не ломают обогащение) ---
+
+    def _l2_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.l2 is None:
+            return None
+        try:
+            entry = self.l2.get(key)
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.warning(f"AI cache L2 read failed for {key}: {e}")
+            return None
+        if entry is None or not self._is_servable(entry):
+            return None
+        return entry
+
+    def _l2_set(self, key: str, entry: Dict[str, Any]) -> None:
+        if self.l2 is None:
+            return
+        ttl_seconds = int((self.cache_ttl_hours + self.stale_ttl_hours) * 3600)
+        payload = {k: v for k, v in entry.items() if k != "size"}
+        try:
+            self.l2.set(key, payload, ttl_seconds)
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.warning(f"AI cache L2 write failed for {key}: {e}")
+
+    def _l2_delete(self, key: str) -> None:
+        if self.l2 is None:
+            return
+        try:
+            self.l2.delete(key)
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.warning(f"AI cache L2 delete failed for {key}: {e}")
+
+    def _lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """L1, затем L2 (с подъемом в L1). Возвращает (запись, уровень)"""
+        entry = self._l1_get(key)
+        if entry is not None:
+            return entry, "l1"
+        entry = self._l2_get(key)
+        if entry is not None:
+            self._l1_put(key, entry)
+            return entry, "l2"
+        return None, ""
+
+    def _make_entry(self, url: str, result: Dict[str, Any], cost: float) -> Dict[str, Any]:
+        return {"result": result, "cached_at": time.time(), "url": url, "cost": cost}
+
+    def _record_hit(self, level: str, entry: Dict[str, Any]) -> None:
+        self.stats[f"{level}_hits"] += 1
+        self.metrics.record_cache_hit(level, entry.get("cost", 0.0))
+
+    # --- Синхронный API ---
+
     def get(
         self, url: str, product_id: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """
-        Получить результат из кэша
+        Получить свежий результат из кэша (L1, затем L2)
 
         Args:
             url: URL товара
@@ -60,61 +318,155 @@ class AiCache:
             Кэшированный результат или None
         """
         key = self._generate_key(url, product_id)
-
-        if key not in self._cache:
+        entry, level = self._lookup(key)
+        if entry is None or not self._is_fresh(entry):
             return None
 
-        cached = self._cache[key]
-
-        # Проверка TTL
-        cached_time = cached.get("cached_at", 0)
-        if time.time() - cached_time > self.cache_ttl_hours * 3600:
-            # Кэш истек
-            del self._cache[key]
-            logger.debug(f"Cache expired for {key}")
-            return None
-
-        logger.debug(f"Cache hit for {key}")
-        return cached.get("result")
+        logger.debug(f"Cache hit for {key} ({level})")
+        self._record_hit(level, entry)
+        return entry.get("result")
 
     def set(
-        self, url: str, result: Dict[str, Any], product_id: Optional[str] = None
+        self,
+        url: str,
+        result: Dict[str, Any],
+        product_id: Optional[str] = None,
+        cost: float = 0.0,
     ) -> None:
         """
-        Сохранить результат в кэш
+        Сохранить результат в кэш (L1 и L2)
 
         Args:
             url: URL товара
             result: Результат для кэширования
             product_id: Опциональный product_id
+            cost: Стоимость получения результата (для подсчета сэкономленного)
         """
         key = self._generate_key(url, product_id)
-
-        self._cache[key] = {"result": result, "cached_at": time.time(), "url": url}
+        entry = self._make_entry(url, result, cost)
+        self._l1_put(key, entry)
+        self._l2_set(key, entry)
 
         logger.debug(f"Cached result for {key}")
 
+    def invalidate(self, url: str, product_id: Optional[str] = None) -> None:
+        """Удалить результат из L1 и L2"""
+        key = self._generate_key(url, product_id)
+        self._l1_remove(key)
+        self._l2_delete(key)
+
+    # --- Асинхронный API с объединением промахов и stale-while-revalidate ---
+
+    async def get_or_compute(
+        self,
+        url: str,
+        compute: ComputeFn,
+        product_id: Optional[str] = None,
+    ) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Получить результат из кэша или вычислить его
+
+        Одновременные промахи по одному ключу ждут один вызов compute().
+        Устаревший результат отдается сразу, compute() выполняется в фоне.
+
+        Args:
+            url: URL товара
+            compute: Корутина-фабрика, возвращающая (результат, стоимость) или None
+            product_id: Опциональный product_id
+
+        Returns:
+            (результат или None, источник: l1 / l2 / stale / coalesced / computed)
+        """
+        key = self._generate_key(url, product_id)
+
+        entry = self._l1_get(key)
+        level = "l1"
+        if entry is None:
+            entry = await asyncio.to_thread(self._l2_get, key)
+            level = "l2"
+            if entry is not None:
+                self._l1_put(key, entry)
+
+        if entry is not None:
+            if self._is_fresh(entry):
+                self._record_hit(level, entry)
+                return entry["result"], level
+            # Устаревший результат: отдаем, обновляем в фоне (один refresh на ключ)
+            self.stats["stale_served"] += 1
+            self.metrics.record_cache_stale()
+            if key not in self._inflight:
+                self._start_compute(key, url, compute, background=True)
+            return entry["result"], "stale"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            self.metrics.record_cache_coalesced()
+            result = await asyncio.shield(inflight)
+            return result, "coalesced"
+
+        self.stats["misses"] += 1
+        self.metrics.record_cache_miss()
+        result = await asyncio.shield(self._start_compute(key, url, compute))
+        return result, "computed"
+
+    def _start_compute(
+        self, key: str, url: str, compute: ComputeFn, background: bool = False
+    ) -> asyncio.Future:
+        """Запустить compute() для ключа; future доступен ожидающим промахам"""
+        task = asyncio.ensure_future(self._compute(key, url, compute))
+        self._inflight[key] = task
+        if background:
+            self.stats["refreshes"] += 1
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        return task
+
+    async def _compute(
+        self, key: str, url: str, compute: ComputeFn
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            computed = await compute()
+            if not computed:
+                return None
+            result, cost = computed
+            entry = self._make_entry(url, result, cost)
+            self._l1_put(key, entry)
+            await asyncio.to_thread(self._l2_set, key, entry)
+            return result
+        except Exception as e:
+            logger.warning(f"AI cache compute failed for {key}: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+    # --- Обслуживание ---
+
     def clear_expired(self) -> int:
         """
-        Очистить истекшие записи из кэша
+        Очистить истекшие записи из кэша (за пределами stale-окна)
 
         Returns:
             Количество удаленных записей
         """
-        now = time.time()
         expired_keys = [
-            key
-            for key, cached in self._cache.items()
-            if now - cached.get("cached_at", 0) > self.cache_ttl_hours * 3600
+            key for key, entry in self._cache.items() if not self._is_servable(entry)
         ]
 
         for key in expired_keys:
-            del self._cache[key]
+            self._l1_remove(key)
+
+        removed = len(expired_keys)
+        if self.l2 is not None:
+            try:
+                removed += self.l2.clear_expired()
+            except Exception as e:
+                logger.warning(f"AI cache L2 cleanup failed: {e}")
 
-        if expired_keys:
-            logger.debug(f"Cleared {len(expired_keys)} expired cache entries")
+        if removed:
+            logger.debug(f"Cleared {removed} expired cache entries")
 
-        return len(expired_keys)
+        return removed
 
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -123,15 +475,24 @@ class AiCache:
         Returns:
             Словарь со статистикой
         """
-        now = time.time()
         total = len(self._cache)
-        expired = sum(
-            1
-            for cached in self._cache.values()
-            if now - cached.get("cached_at", 0) > self.cache_ttl_hours * 3600
-        )
-
-        return {"total": total, "active": total - expired, "expired": expired}
+        expired = sum(1 for entry in self._cache.values() if not self._is_fresh(entry))
+        lookups = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+
+        return {
+            "total": total,
+            "active": total - expired,
+            "expired": expired,
+            "bytes": self._bytes,
+            "l2": self.l2.name if self.l2 is not None else "none",
+            "inflight": len(self._inflight),
+            "hit_rate": (
+                (self.stats["l1_hits"] + self.stats["l2_hits"]) / lookups
+                if lookups
+                else 0.0
+            ),
+            **self.stats,
+        }
 
 
 # Глобальный экземпляр кэша
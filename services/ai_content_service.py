@@ -1,12 +1,25 @@
 # services/ai_content_service.py
 """AI content generation service using Groq API with dynamic strategies"""
+import json
 import logging
 import random
 from typing import Dict, Any, Optional, List
 from groq import AsyncGroq
 
+import config
+from services.ai_metrics import get_ai_metrics
+from services.llm_gateway import LlmGateway
+from utils.prompt_generator import estimate_tokens, top_review_sentences, truncate_to_tokens
+
 logger = logging.getLogger(__name__)
 
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+# Бюджет токенов на вставляемые в промпт данные товара
+REVIEWS_MAX_TOKENS = 300
+SPECS_MAX_TOKENS = 200
+MARKETING_MAX_TOKENS = 250
+
 
 class AIContentService:
     """Service for generating dynamic product descriptions using Groq AI with multiple strategies"""
@@ -20,6 +33,17 @@ class AIContentService:
         """
         self.api_key = groq_api_key
         self.client = None
+        # Очередь запросов: ждет лимит вместо ошибки 429, при всплеске
+        # несколько описаний генерируются одним запросом
+        self.gateway = LlmGateway(
+            self._complete,
+            self._complete_many,
+            rate_per_minute=getattr(config, "GROQ_RATE_PER_MINUTE", 30),
+            burst=getattr(config, "AI_RATE_BURST", 3),
+            max_batch=getattr(config, "AI_BATCH_MAX_ITEMS", 5),
+            max_concurrent=getattr(config, "AI_MAX_CONCURRENT_REQUESTS", 2),
+            name="groq",
+        )
 
         if groq_api_key:
             try:
@@ -71,7 +95,8 @@ class AIContentService:
     # --- Strategy 1: Reviews Summary ---
     async def _strategy_reviews_summary(self, data: Dict[str, Any]) -> str:
         """Analyze customer reviews and create a summary description."""
-        reviews = data.get('reviews', [])
+        # Частые предложения отзывов без повторов вместо полного текста
+        reviews = top_review_sentences(data.get('reviews', []), limit=5)
         if not reviews:
             # Fallback to key feature strategy if no reviews
             return await self._strategy_key_feature(data)
@@ -81,7 +106,7 @@ class AIContentService:
         Проанализируй эти отзывы покупателей о товаре '{title}'. Выдели 1-2 самых частых положительных момента и, если есть, один некритичный недостаток. Сформулируй это в виде одного честного, живого предложения.
 
         Отзывы:
-        {", ".join(reviews[:5])}
+        {truncate_to_tokens(" ".join(reviews), REVIEWS_MAX_TOKENS)}
 
         Ответь только одним предложением, без лишних слов.
         """
@@ -93,6 +118,9 @@ class AIContentService:
         """Focus on one compelling feature of the product."""
         title = data.get('title', 'Товар')
         specs = data.get('specs', '')
+        if isinstance(specs, dict):
+            specs = "; ".join(f"{key}: {value}" for key, value in specs.items())
+        specs = truncate_to_tokens(str(specs), SPECS_MAX_TOKENS)
 
         prompt = f"""
         Проанализируй название товара: '{title}' и его характеристики (если есть): {specs}. Найди одну, самую 'убойную' и интересную фишку. Построй вокруг нее одно яркое, образное предложение.
@@ -122,7 +150,9 @@ class AIContentService:
     # --- Strategy 4: Human Translation ---
     async def _strategy_human_translation(self, data: Dict[str, Any]) -> str:
         """Make marketing text more human and natural."""
-        marketing_description = data.get('marketing_description', '').strip()
+        marketing_description = truncate_to_tokens(
+            data.get('marketing_description', '').strip(), MARKETING_MAX_TOKENS
+        )
 
         if not marketing_description:
             # Fallback to key feature strategy if no marketing text
@@ -142,29 +172,88 @@ class AIContentService:
 
     # --- Base Method to Call Groq ---
     async def _get_ai_response(self, prompt: str) -> str:
-        """Get AI response from Groq API."""
+        """Get AI response from Groq API (queued, possibly batched with other prompts)."""
+        response = await self.gateway.submit(prompt)
+        if response is None:
+            logger.error("Error calling Groq API: no response")
+            raise RuntimeError("Groq API returned no response")
+        return response
+
+    async def _complete(self, prompt: str) -> Optional[str]:
+        """Single prompt completion."""
+        completion = await self.client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=150,  # Increased for potentially longer responses
+        )
+        self._record_usage(completion, prompt)
+        return self._clean_response(completion.choices[0].message.content)
+
+    async def _complete_many(self, prompts: List[str]) -> Optional[List[Optional[str]]]:
+        """
+        Several independent prompts in one request.
+
+        Returns:
+            Answer per prompt (None if missing or empty), None if the response is not parseable
+        """
+        tasks = "\n\n".join(
+            f"### Задание {index}\n{prompt.strip()}" for index, prompt in enumerate(prompts, 1)
+        )
+        batch_prompt = (
+            f"Выполни {len(prompts)} независимых заданий.\n\n{tasks}\n\n"
+            'Верни только JSON вида {"answers": ["ответ на задание 1", "ответ на задание 2", ...]} '
+            "- по одному ответу на каждое задание, в том же порядке."
+        )
+        completion = await self.client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[{"role": "user", "content": batch_prompt}],
+            temperature=0.7,
+            max_tokens=150 * len(prompts),
+            response_format={"type": "json_object"},
+        )
+        self._record_usage(completion, batch_prompt)
         try:
-            completion = await self.client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=150,  # Increased for potentially longer responses
-            )
-            response = completion.choices[0].message.content.strip()
-
-            # Clean up the response - ensure it's not too long and ends properly
-            if len(response) > 200:
-                # If too long, truncate to first sentence or reasonable length
-                sentences = response.split('.')
-                if len(sentences) > 1:
-                    response = sentences[0] + '.'
-                else:
-                    response = response[:197] + '...'
-
-            return response
-        except Exception as e:
-            logger.error(f"Error calling Groq API: {e}")
-            raise
+            answers = json.loads(completion.choices[0].message.content).get("answers")
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Failed to parse Groq batch response: {e}")
+            return None
+        if not isinstance(answers, list):
+            return None
+        return [
+            self._clean_response(answer) if isinstance(answer, str) else None
+            for answer in answers[: len(prompts)]
+        ]
+
+    @staticmethod
+    def _record_usage(completion: Any, prompt: str) -> None:
+        """Record prompt/completion tokens of a Groq call in AiMetrics."""
+        usage = getattr(completion, "usage", None)
+        if usage is None:
+            return
+        get_ai_metrics().record_llm_call(
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+            estimated_prompt_tokens=estimate_tokens(prompt),
+            provider="groq",
+        )
+
+    @staticmethod
+    def _clean_response(response: str) -> Optional[str]:
+        """Clean up the response - ensure it's not too long and ends properly."""
+        response = (response or "").strip()
+        if not response:
+            return None
+
+        if len(response) > 200:
+            # If too long, truncate to first sentence or reasonable length
+            sentences = response.split('.')
+            if len(sentences) > 1:
+                response = sentences[0] + '.'
+            else:
+                response = response[:197] + '...'
+
+        return response
 
 
 # Global instance (will be initialized in main bot file)
@@ -7,7 +7,7 @@ import json
 import os
 import time
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import aiohttp
 from dotenv import load_dotenv
 
@@ -18,6 +18,9 @@ from services.ai_result_validator import (
 )
 from services.ai_cache import get_ai_cache
 from services.ai_metrics import get_ai_metrics
+from services.llm_gateway import LlmGateway
+from utils.prompt_generator import compact_product_context, estimate_tokens, fit_sections
+import config
 
 load_dotenv()
 
@@ -32,6 +35,31 @@ CHATGPT_MODEL = os.getenv(
     "CHATGPT_MODEL", "gpt-4o"
 )  # Можно указать gpt-5.1 когда будет доступен
 
+TASK_TEXT = """Задача:
+1. Нормализовать product_url - извлечь чистый URL карточки товара (https://market.yandex.ru/card/... или https://market.yandex.ru/product/...)
+2. Если найден CC код или хвост - собрать ref_link вида https://market.yandex.ru/cc/<код> (обрезать хвосты по запятую)
+3. Извлечь цену как число (только цифры, без валюты и пробелов)
+4. Извлечь название товара (чистый текст, без лишних символов)
+5. Определить, валиден ли товар (есть название, цена, корректный URL)"""
+
+RESULT_SCHEMA = """{
+    "product_url": "https://market.yandex.ru/card/...",
+    "ref_link": "https://market.yandex.ru/cc/..." или null,
+    "price": 159 или null,
+    "title": "Название товара" или null,
+    "is_valid": true или false,
+    "notes": "Причина если is_valid=false"
+}"""
+
+REQUIRED_FIELDS = ["product_url", "ref_link", "price", "title", "is_valid"]
+
+SYSTEM_PROMPT = "Ты эксперт по анализу данных с Яндекс.Маркета. Всегда возвращай только валидный JSON без дополнительного текста."
+
+
+def _tokens_cost(tokens: int) -> float:
+    """Примерная стоимость: $0.01 за 1K токенов для gpt-4o"""
+    return (tokens / 1000) * 0.01
+
 
 class AiEnrichmentService:
     """
@@ -53,12 +81,57 @@ class AiEnrichmentService:
         self.cache = get_ai_cache()
         self.metrics = get_ai_metrics()
         self.request_timeout = 8  # Таймаут 8 секунд
-        self.rate_limit_per_minute = 10  # Максимум 10 запросов в минуту
-        self._request_times = []  # Временные метки последних запросов
+        # Бюджет токенов: данные одного товара в промпте и ответ по одному товару
+        self.prompt_max_tokens = getattr(config, "AI_PROMPT_MAX_TOKENS", 700)
+        self.completion_max_tokens = getattr(config, "AI_COMPLETION_MAX_TOKENS", 250)
+        self.review_sentences = getattr(config, "AI_PROMPT_REVIEW_SENTENCES", 5)
+        # Лимит запросов - token bucket с очередью; при глубокой очереди
+        # несколько товаров уходят одним запросом
+        self.gateway = LlmGateway(
+            self._send_single,
+            self._send_batch,
+            rate_per_minute=getattr(config, "AI_RATE_PER_MINUTE", 10),
+            burst=getattr(config, "AI_RATE_BURST", 3),
+            max_batch=getattr(config, "AI_BATCH_MAX_ITEMS", 5),
+            max_concurrent=getattr(config, "AI_MAX_CONCURRENT_REQUESTS", 2),
+            name="chatgpt",
+        )
 
         if not self.enabled:
             logger.warning("ChatGPT API key not found. AI enrichment will be disabled.")
 
+    def _product_block(self, raw_data: Dict[str, Any]) -> str:
+        """
+        Исходные данные товара для промпта: вместо фрагмента HTML - извлеченные
+        поля (цены, /cc/ ссылки, характеристики, отзывы) в пределах бюджета токенов
+        """
+        url = raw_data.get("url", "")
+        final_url = raw_data.get("final_url", url)
+        cc_code = raw_data.get("cc_code", "")
+        cc_tail = raw_data.get("cc_tail", "")
+        context = compact_product_context(raw_data, max_reviews=self.review_sentences)
+
+        header = f"""- URL: {url}
+- Финальный URL после редиректов: {final_url}
+- Найденный CC код: {cc_code if cc_code else "не найден"}
+- Найденный CC хвост: {cc_tail if cc_tail else "не найден"}
+- Сырая цена: {context["price"] if context["price"] else "не найдена"}
+- Сырой заголовок: {context["title"] if context["title"] else "не найден"}"""
+
+        # Порядок = важность: при нехватке бюджета обрезаются последние секции
+        sections = [
+            ("Цены на странице", ", ".join(context["prices"])),
+            ("Ссылки /cc/ на странице", "\n".join(context["cc_links"])),
+            ("Характеристики", "\n".join(context["specs"])),
+            ("Отзывы", "\n".join(context["reviews"])),
+        ]
+        if not (context["prices"] or context["specs"]):
+            sections.append(("Текст карточки", context["text"]))
+
+        budget = self.prompt_max_tokens - estimate_tokens(header)
+        body = "\n\n".join(f"{title}:\n{text}" for title, text in fit_sections(sections, budget))
+        return f"{header}\n\n{body}" if body else header
+
     def _build_prompt(self, raw_data: Dict[str, Any]) -> str:
         """
         Формирует промпт для ChatGPT
@@ -69,68 +142,43 @@ class AiEnrichmentService:
         Returns:
             Текст промпта
         """
-        url = raw_data.get("url", "")
-        final_url = raw_data.get("final_url", url)
-        raw_html = raw_data.get("raw_html", "")
-        raw_price = raw_data.get("raw_price", "")
-        raw_title = raw_data.get("raw_title", "")
-        cc_code = raw_data.get("cc_code", "")
-        cc_tail = raw_data.get("cc_tail", "")
-
         prompt = f"""Ты анализируешь данные товара с Яндекс.Маркета.
 
 Исходные данные:
-- URL: {url}
-- Финальный URL после редиректов: {final_url}
-- Найденный CC код: {cc_code if cc_code else "не найден"}
-- Найденный CC хвост: {cc_tail if cc_tail else "не найден"}
-- Сырая цена: {raw_price if raw_price else "не найдена"}
-- Сырой заголовок: {raw_title if raw_title else "не найден"}
+{self._product_block(raw_data)}
 
-HTML фрагмент карточки товара:
-{raw_html[:2000] if raw_html else "не предоставлен"}
-
-Задача:
-1. Нормализовать product_url - извлечь чистый URL карточки товара (https://market.yandex.ru/card/... или https://market.yandex.ru/product/...)
-2. Если найден CC код или хвост - собрать ref_link вида https://market.yandex.ru/cc/<код> (обрезать хвосты по запятую)
-3. Извлечь цену как число (только цифры, без валюты и пробелов)
-4. Извлечь название товара (чистый текст, без лишних символов)
-5. Определить, валиден ли товар (есть название, цена, корректный URL)
+{TASK_TEXT}
 
 Верни ТОЛЬКО валидный JSON без дополнительного текста:
-{{
-    "product_url": "https://market.yandex.ru/card/...",
-    "ref_link": "https://market.yandex.ru/cc/..." или null,
-    "price": 159 или null,
-    "title": "Название товара" или null,
-    "is_valid": true или false,
-    "notes": "Причина если is_valid=false"
-}}"""
+{RESULT_SCHEMA}"""
 
         return prompt
 
-    def _check_rate_limit(self) -> bool:
+    def _build_batch_prompt(self, items: List[Dict[str, Any]]) -> str:
         """
-        Проверить rate limit
+        Промпт для нескольких товаров: общая задача один раз, данные по номерам
+
+        Args:
+            items: Сырые данные товаров
 
         Returns:
-            True если можно делать запрос
+            Текст промпта
         """
-        now = time.time()
-        # Удаляем запросы старше минуты
-        self._request_times = [t for t in self._request_times if now - t < 60]
+        blocks = "\n\n".join(
+            f"### Товар {index}\n{self._product_block(raw_data)}"
+            for index, raw_data in enumerate(items, 1)
+        )
+        return f"""Ты анализируешь данные {len(items)} товаров с Яндекс.Маркета. Каждый товар обрабатывай независимо.
 
-        if len(self._request_times) >= self.rate_limit_per_minute:
-            logger.warning(
-                f"Rate limit exceeded: {len(self._request_times)} requests in last minute"
-            )
-            return False
+{blocks}
 
-        return True
+{TASK_TEXT}
 
-    def _record_request(self):
-        """Записать время запроса"""
-        self._request_times.append(time.time())
+Верни ТОЛЬКО валидный JSON без дополнительного текста - объект со списком items,
+по одному элементу на товар, index - номер товара:
+{{"items": [{{"index": 1, ...поля...}}, ...]}}
+Поля каждого элемента:
+{RESULT_SCHEMA}"""
 
     async def enrich_product(
         self, raw_data: Dict[str, Any], use_cache: bool = True
@@ -158,34 +206,160 @@ HTML фрагмент карточки товара:
         final_url = raw_data.get("final_url", url)
         product_id = raw_data.get("product_id")
 
-        # Проверка кэша
-        if use_cache:
-            cached = self.cache.get(final_url, product_id)
-            if cached:
-                logger.debug("Using cached AI result")
-                # Валидируем кэшированный результат
-                is_valid, validated, invalid = self.validator.validate(cached, raw_data)
-                if is_valid and validated:
-                    validated.source = "cache"
-                    return validated
-                else:
-                    logger.warning("Cached result failed validation, will re-request")
-
-        # Проверка rate limit
-        if not self._check_rate_limit():
-            logger.warning("Rate limit exceeded, skipping AI request")
+        if not use_cache:
+            computed = await self._request_ai(raw_data)
+            return self._validate(computed[0], raw_data) if computed else None
+
+        # Кэш L1/L2; одновременные запросы по одному товару ждут один вызов AI
+        parsed, source = await self.cache.get_or_compute(
+            final_url, lambda: self._request_ai(raw_data), product_id
+        )
+        if parsed is None:
             return None
+        validated = self._validate(parsed, raw_data)
+        if source in ("computed", "coalesced"):
+            return validated
+        if validated:
+            logger.debug(f"Using cached AI result ({source})")
+            validated.source = "cache"
+            return validated
+
+        logger.warning("Cached result failed validation, will re-request")
+        self.cache.invalidate(final_url, product_id)
+        computed = await self._request_ai(raw_data)
+        if not computed:
+            return None
+        self.cache.set(final_url, computed[0], product_id, cost=computed[1])
+        return self._validate(computed[0], raw_data)
 
-        start_time = time.time()
+    def _validate(
+        self, parsed: Dict[str, Any], raw_data: Dict[str, Any]
+    ) -> Optional[ValidatedResult]:
+        """Валидировать ответ AI относительно сырых данных"""
+        is_valid, validated, invalid = self.validator.validate(parsed, raw_data)
+        return validated if is_valid and validated else None
+
+    async def _request_ai(
+        self, raw_data: Dict[str, Any]
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Запрос к ChatGPT через очередь (ждет лимит, может уйти в пакете)
+
+        Args:
+            raw_data: Сырые данные о товаре
+
+        Returns:
+            (ответ AI, стоимость) если ответ прошел валидацию, иначе None
+        """
+        return await self.gateway.submit(raw_data)
+
+    def _accept(
+        self, parsed: Any, raw_data: Dict[str, Any], tokens: int, cost: float
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Проверить ответ по одному товару (структура + AiResultValidator)
+
+        Returns:
+            (ответ AI, стоимость) или None
+        """
+        # Валидация структуры ответа
+        if not isinstance(parsed, dict) or not all(field in parsed for field in REQUIRED_FIELDS):
+            keys = list(parsed.keys()) if isinstance(parsed, dict) else type(parsed).__name__
+            logger.warning(f"ChatGPT returned incomplete data: {keys}")
+            self.metrics.record_ai_error("incomplete_data")
+            return None
+
+        # Валидация результата
+        is_valid, validated, invalid = self.validator.validate(parsed, raw_data)
+
+        if is_valid and validated:
+            # Записываем метрики
+            self.metrics.record_ai_ok(tokens, cost)
 
-        try:
-            # Логируем вход (сокращенно)
             logger.info(
-                f"AI request: url={url[:50]}, html_len={len(raw_data.get('raw_html', ''))}, price={raw_data.get('raw_price', '')[:30]}"
+                f"AI enrichment successful: is_valid={validated.is_valid}, has_ref={bool(validated.ref_link)}"
+            )
+            return parsed, cost
+
+        # Валидация не прошла
+        reason = invalid.reason if invalid else "validation_failed"
+        logger.warning(f"AI result validation failed: {reason}")
+        self.metrics.record_ai_fallback(reason)
+        return None
+
+    async def _send_single(
+        self, raw_data: Dict[str, Any]
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Запрос к ChatGPT по одному товару"""
+        url = raw_data.get("url", "")
+
+        # Логируем вход (сокращенно)
+        logger.info(
+            f"AI request: url={url[:50]}, html_len={len(raw_data.get('raw_html', ''))}, price={raw_data.get('raw_price', '')[:30]}"
+        )
+
+        response = await self._chat(self._build_prompt(raw_data), max_tokens=self.completion_max_tokens)
+        if response is None:
+            return None
+        parsed, tokens = response
+        return self._accept(parsed, raw_data, tokens, _tokens_cost(tokens))
+
+    async def _send_batch(
+        self, items: List[Dict[str, Any]]
+    ) -> Optional[List[Optional[Tuple[Dict[str, Any], float]]]]:
+        """
+        Один запрос к ChatGPT по нескольким товарам
+
+        Returns:
+            Результат по каждому товару (None - товар не разобран), None если запрос не удался
+        """
+        logger.info(f"AI batch request: {len(items)} products")
+
+        response = await self._chat(
+            self._build_batch_prompt(items), max_tokens=self.completion_max_tokens * len(items)
+        )
+        if response is None:
+            return None
+        parsed, tokens = response
+
+        entries = parsed.get("items") if isinstance(parsed, dict) else parsed
+        if not isinstance(entries, list):
+            logger.warning("ChatGPT batch response has no items list")
+            self.metrics.record_ai_error("incomplete_data")
+            return None
+
+        by_index = {}
+        for position, entry in enumerate(entries, 1):
+            if isinstance(entry, dict):
+                by_index.setdefault(entry.get("index", position), entry)
+
+        # Токены пакета делим поровну между товарами
+        item_tokens = tokens // len(items)
+        item_cost = _tokens_cost(tokens) / len(items)
+        results = []
+        for index, raw_data in enumerate(items, 1):
+            entry = by_index.get(index)
+            results.append(
+                self._accept(entry, raw_data, item_tokens, item_cost) if entry is not None else None
             )
+        return results
+
+    async def _chat(
+        self, prompt: str, max_tokens: int
+    ) -> Optional[Tuple[Any, int]]:
+        """
+        Chat completion с JSON ответом
 
-            prompt = self._build_prompt(raw_data)
+        Args:
+            prompt: Текст запроса
+            max_tokens: Лимит токенов ответа
 
+        Returns:
+            (разобранный JSON, всего токенов) или None при ошибке
+        """
+        start_time = time.time()
+
+        try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json",
@@ -194,18 +368,13 @@ HTML фрагмент карточки товара:
             payload = {
                 "model": self.model,
                 "messages": [
-                    {
-                        "role": "system",
-                        "content": "Ты эксперт по анализу данных с Яндекс.Маркета. Всегда возвращай только валидный JSON без дополнительного текста.",
-                    },
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt},
                 ],
                 "temperature": 0.1,
-                "max_tokens": 500,
+                "max_tokens": max_tokens,
             }
 
-            self._record_request()
-
             async with aiohttp.ClientSession() as session:
                 async with session.post(
                     self.api_url,
@@ -235,85 +404,47 @@ HTML фрагмент карточки товара:
                                 )
                                 self.metrics.record_ai_error("http_5xx")
                                 return None
-                            response = retry_response
-
-                    if response.status != 200:
+                            result = await retry_response.json()
+                    elif response.status != 200:
                         error_text = await response.text()
                         logger.warning(
                             f"ChatGPT API error {response.status}: {error_text[:200]}"
                         )
                         self.metrics.record_ai_error(f"http_{response.status}")
                         return None
+                    else:
+                        result = await response.json()
+
+            # Извлекаем токены для оценки стоимости
+            usage = result.get("usage", {})
+            tokens = usage.get("total_tokens", 0)
+            self.metrics.record_llm_call(
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+                estimated_prompt_tokens=estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt),
+            )
 
-                    result = await response.json()
+            # Извлекаем ответ из choices[0].message.content
+            if "choices" not in result or not result["choices"]:
+                logger.warning("ChatGPT API returned no choices")
+                self.metrics.record_ai_error("no_choices")
+                return None
 
-                    # Извлекаем токены для оценки стоимости
-                    usage = result.get("usage", {})
-                    tokens = usage.get("total_tokens", 0)
-                    # Примерная стоимость: $0.01 за 1K токенов для gpt-4o
-                    cost = (tokens / 1000) * 0.01
+            content = result["choices"][0]["message"]["content"]
 
-                    # Извлекаем ответ из choices[0].message.content
-                    if "choices" not in result or not result["choices"]:
-                        logger.warning("ChatGPT API returned no choices")
-                        self.metrics.record_ai_error("no_choices")
-                        return None
+            # Логируем выход (сокращенно)
+            logger.info(f"AI response: {content[:500]}")
 
-                    content = result["choices"][0]["message"]["content"]
-
-                    # Логируем выход (сокращенно)
-                    logger.info(f"AI response: {content[:500]}")
-
-                    # Парсим JSON из ответа
-                    content = content.strip()
-                    if content.startswith("```json"):
-                        content = content[7:]
-                    if content.startswith("```"):
-                        content = content[3:]
-                    if content.endswith("```"):
-                        content = content[:-3]
-                    content = content.strip()
-
-                    parsed = json.loads(content)
-
-                    # Валидация структуры ответа
-                    required_fields = [
-                        "product_url",
-                        "ref_link",
-                        "price",
-                        "title",
-                        "is_valid",
-                    ]
-                    if not all(field in parsed for field in required_fields):
-                        logger.warning(
-                            f"ChatGPT returned incomplete data: {list(parsed.keys())}"
-                        )
-                        self.metrics.record_ai_error("incomplete_data")
-                        return None
+            # Парсим JSON из ответа
+            content = content.strip()
+            if content.startswith("```json"):
+                content = content[7:]
+            if content.startswith("```"):
+                content = content[3:]
+            if content.endswith("```"):
+                content = content[:-3]
 
-                    # Валидация результата
-                    is_valid, validated, invalid = self.validator.validate(
-                        parsed, raw_data
-                    )
-
-                    if is_valid and validated:
-                        # Сохраняем в кэш
-                        if use_cache:
-                            self.cache.set(final_url, parsed, product_id)
-
-                        # Записываем метрики
-                        self.metrics.record_ai_ok(tokens, cost)
-
-                        logger.info(
-                            f"AI enrichment successful: is_valid={validated.is_valid}, has_ref={bool(validated.ref_link)}"
-                        )
-                        return validated
-                    else:
-                        # Валидация не прошла
-                        reason = invalid.reason if invalid else "validation_failed"
-                        logger.warning(f"AI result validation failed: {reason}")
-                        self.metrics.record_ai_fallback(reason)
-                        return None
+            return json.loads(content.strip()), tokens
 
         except asyncio.TimeoutError:
             duration_ms = (time.time() - start_time) * 1000
@@ -5,12 +5,22 @@ AI Metrics - метрики и мониторинг работы AI
 import logging
 import time
 from typing import Dict, Any, Optional
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
 
+def _mean(values) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def _p95(sorted_values) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(0.95 * len(sorted_values)))]
+
+
 class AiMetrics:
     """
     Метрики работы AI обогащения
@@ -25,6 +35,7 @@ class AiMetrics:
         self.hourly_stats = defaultdict(
             lambda: {"ai_ok": 0, "ai_error": 0, "ai_fallback": 0}
         )
+        self.llm_calls = deque(maxlen=1000)  # Токены последних вызовов LLM
 
     def record_ai_ok(self, tokens: int = 0, cost: float = 0.0):
         """Записать успешное AI обогащение"""
@@ -50,6 +61,44 @@ class AiMetrics:
         hour_key = datetime.now().strftime("%Y-%m-%d-%H")
         self.hourly_stats[hour_key]["ai_fallback"] += 1
 
+    def record_cache_hit(self, level: str = "l1", cost_saved: float = 0.0):
+        """Записать попадание в кэш (cost_saved - стоимость несделанного запроса)"""
+        self.counters["cache_hit"] += 1
+        self.counters[f"cache_hit_{level}"] += 1
+        self.counters["cache_cost_saved"] += cost_saved
+
+    def record_cache_miss(self):
+        """Записать промах кэша (будет запрос к AI)"""
+        self.counters["cache_miss"] += 1
+
+    def record_cache_coalesced(self):
+        """Записать промах, присоединенный к уже идущему запросу по тому же ключу"""
+        self.counters["cache_coalesced"] += 1
+
+    def record_cache_stale(self):
+        """Записать выдачу устаревшего результата с фоновым обновлением"""
+        self.counters["cache_stale"] += 1
+
+    def record_llm_call(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        estimated_prompt_tokens: Optional[int] = None,
+        provider: str = "chatgpt",
+    ):
+        """Записать токены одного вызова LLM (по usage ответа) и локальную оценку промпта"""
+        self.counters["llm_calls"] += 1
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["completion_tokens"] += completion_tokens
+        self.llm_calls.append(
+            {
+                "provider": provider,
+                "prompt": prompt_tokens,
+                "completion": completion_tokens,
+                "estimated": estimated_prompt_tokens,
+            }
+        )
+
     def record_timing(self, duration_ms: float):
         """Записать время выполнения AI запроса"""
         self.timings.append(duration_ms)
@@ -91,6 +140,24 @@ class AiMetrics:
             (hour_stats["ai_ok"] / hour_total * 100) if hour_total > 0 else 0
         )
 
+        # Кэш: объединенные промахи тоже не стоили отдельного запроса
+        cache_lookups = (
+            self.counters["cache_hit"]
+            + self.counters["cache_miss"]
+            + self.counters["cache_coalesced"]
+            + self.counters["cache_stale"]
+        )
+        cache_served = cache_lookups - self.counters["cache_miss"]
+
+        # Токены на вызов и точность локальной оценки промпта
+        prompt_sizes = sorted(c["prompt"] for c in self.llm_calls)
+        completion_sizes = sorted(c["completion"] for c in self.llm_calls)
+        estimate_errors = [
+            abs(c["estimated"] - c["prompt"]) / c["prompt"]
+            for c in self.llm_calls
+            if c["estimated"] is not None and c["prompt"] > 0
+        ]
+
         return {
             "total_requests": total_requests,
             "ai_ok": self.counters["ai_ok"],
@@ -106,6 +173,22 @@ class AiMetrics:
             "total_tokens_24h": total_tokens,
             "hour_stats": hour_stats,
             "hour_ai_ratio": hour_ai_ratio,
+            "cache_hits": self.counters["cache_hit"],
+            "cache_misses": self.counters["cache_miss"],
+            "cache_coalesced": self.counters["cache_coalesced"],
+            "cache_stale": self.counters["cache_stale"],
+            "cache_hit_ratio": (
+                (cache_served / cache_lookups * 100) if cache_lookups > 0 else 0
+            ),
+            "cache_cost_saved": self.counters["cache_cost_saved"],
+            "llm_calls": self.counters["llm_calls"],
+            "prompt_tokens": self.counters["prompt_tokens"],
+            "completion_tokens": self.counters["completion_tokens"],
+            "prompt_tokens_avg": _mean(prompt_sizes),
+            "prompt_tokens_p95": _p95(prompt_sizes),
+            "completion_tokens_avg": _mean(completion_sizes),
+            "completion_tokens_p95": _p95(completion_sizes),
+            "token_estimate_error_pct": _mean(estimate_errors) * 100,
         }
 
     def should_disable_ai(self, daily_cost_limit: float = 100.0) -> bool:
@@ -137,6 +220,7 @@ class AiMetrics:
         self.counters.clear()
         self.timings.clear()
         self.costs.clear()
+        self.llm_calls.clear()
         self.last_reset = time.time()
         logger.info("AI metrics reset")
 
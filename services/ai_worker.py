@@ -1,18 +1,43 @@
 """
 AI Worker - воркер для асинхронной обработки AI запросов
+
+Очередь с приоритетами и дедлайнами:
+- интерактивные запросы (/get_ref, inline) обгоняют фоновое обогащение
+  краулера и имеют резервный слот сверх текущего лимита
+- задача, чей дедлайн прошел до начала обработки, отбрасывается (callback(None))
+- число одновременных запросов подстраивается по AIMD: +1/limit за успешный
+  быстрый ответ, x0.5 при 429 от провайдера или превышении целевой задержки
 """
 
 import asyncio
+import itertools
 import logging
+import time
+from collections import defaultdict, deque
 from typing import Dict, Any, Optional, Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
+import config
 from services.ai_enrichment_service import get_ai_enrichment_service
 from services.ai_result_validator import ValidatedResult
 
 logger = logging.getLogger(__name__)
 
+# Приоритеты (меньше - раньше)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# Слотов сверх лимита для интерактивных задач
+INTERACTIVE_HEADROOM = 1
+
 
 @dataclass
 class AiTask:
@@ -22,6 +47,24 @@ class AiTask:
     callback: Optional[Callable] = None
     task_id: Optional[str] = None
     created_at: Optional[datetime] = None
+    priority: int = PRIORITY_BACKGROUND
+    deadline: Optional[float] = None  # time.monotonic(), None - без дедлайна
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def priority_name(self) -> str:
+        return PRIORITY_NAMES.get(self.priority, str(self.priority))
+
+    def remaining(self) -> Optional[float]:
+        """Секунд до дедлайна (None - без дедлайна)"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+
+def _percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
 
 
 class AiWorker:
@@ -29,24 +72,50 @@ class AiWorker:
     Воркер для обработки AI запросов в фоне
     """
 
-    def __init__(self, max_concurrent: int = 3):
+    def __init__(
+        self,
+        max_concurrent: int = None,
+        min_concurrent: int = None,
+        latency_target_ms: float = None,
+    ):
         """
         Инициализация воркера
 
         Args:
             max_concurrent: Максимальное количество одновременных запросов
+            min_concurrent: Нижняя граница адаптивного лимита
+            latency_target_ms: Целевое время обработки задачи; дольше - лимит снижается
         """
-        self.max_concurrent = max_concurrent
-        self.queue: asyncio.Queue = asyncio.Queue()
+        self.max_concurrent = max_concurrent or getattr(config, "AI_WORKER_MAX_CONCURRENT", 8)
+        self.min_concurrent = min(
+            min_concurrent or getattr(config, "AI_WORKER_MIN_CONCURRENT", 1), self.max_concurrent
+        )
+        self.latency_target = (
+            latency_target_ms or getattr(config, "AI_WORKER_LATENCY_TARGET_MS", 4000)
+        ) / 1000
+        self.limit = float(min(3, self.max_concurrent))
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
         self.running = False
         self.workers: list = []
         self.ai_service = get_ai_enrichment_service()
+        self.active = 0
+        self._inflight: set = set()
+        self._pending_interactive = 0
+        self._seq = itertools.count()
+        self._slot_changed: Optional[asyncio.Condition] = None
+        self._last_decrease = 0.0
+        self._seen_429 = self._throttle_count()
+        self.metrics = defaultdict(int)
+        self.queue_wait = defaultdict(lambda: deque(maxlen=500))  # мс, по приоритетам
+        self.service_time = defaultdict(lambda: deque(maxlen=500))
 
     async def add_task(
         self,
         raw_data: Dict[str, Any],
         callback: Optional[Callable] = None,
         task_id: Optional[str] = None,
+        priority: int = PRIORITY_BACKGROUND,
+        timeout: Optional[float] = None,
     ) -> None:
         """
         Добавить задачу в очередь
@@ -55,93 +124,219 @@ class AiWorker:
             raw_data: Сырые данные для обогащения
             callback: Функция обратного вызова (result, task_id)
             task_id: ID задачи
+            priority: PRIORITY_INTERACTIVE / PRIORITY_NORMAL / PRIORITY_BACKGROUND
+            timeout: Сколько секунд результат еще нужен (None - без дедлайна)
         """
         task = AiTask(
             raw_data=raw_data,
             callback=callback,
             task_id=task_id,
             created_at=datetime.now(),
+            priority=priority,
+            deadline=time.monotonic() + timeout if timeout else None,
         )
-        await self.queue.put(task)
-        logger.debug(f"AI task added to queue: {task_id}")
+        if priority <= PRIORITY_INTERACTIVE:
+            self._pending_interactive += 1
+        await self.queue.put((priority, next(self._seq), task))
+        self.metrics["submitted"] += 1
+        await self._notify()
+        logger.debug(f"AI task added to queue: {task_id} ({task.priority_name})")
+
+    async def enrich(
+        self,
+        raw_data: Dict[str, Any],
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> Optional[ValidatedResult]:
+        """
+        Обогатить товар через очередь и дождаться результата
+
+        Если воркер не запущен - запрос выполняется напрямую.
+
+        Returns:
+            ValidatedResult или None (ошибка, дедлайн истек)
+        """
+        if not self.running:
+            return await self.ai_service.enrich_product_safe(raw_data)
+
+        future = asyncio.get_running_loop().create_future()
+
+        async def resolve(result, _task_id):
+            if not future.done():
+                future.set_result(result)
+
+        await self.add_task(raw_data, resolve, priority=priority, timeout=timeout)
+        return await future
+
+    def _throttle_count(self) -> int:
+        """Сколько ответов 429 от провайдера видели метрики AI"""
+        return self.ai_service.metrics.counters.get("ai_error_http_429", 0)
 
-    async def _worker(self):
-        """Воркер для обработки задач"""
+    def _has_slot(self) -> bool:
+        limit = int(self.limit)
+        if self.active < limit:
+            return True
+        return self._pending_interactive > 0 and self.active < limit + INTERACTIVE_HEADROOM
+
+    async def _notify(self) -> None:
+        if self._slot_changed is None:
+            return
+        async with self._slot_changed:
+            self._slot_changed.notify_all()
+
+    async def _dispatch(self):
+        """Выдача задач из очереди в пределах адаптивного лимита"""
+        self._slot_changed = asyncio.Condition()
         while self.running:
             try:
-                # Получаем задачу с таймаутом
+                async with self._slot_changed:
+                    await self._slot_changed.wait_for(self._has_slot)
                 try:
-                    task = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+                    _, _, task = await asyncio.wait_for(self.queue.get(), timeout=1.0)
                 except asyncio.TimeoutError:
                     continue
 
-                if not self.ai_service.enabled:
-                    logger.debug("AI service disabled, skipping task")
-                    if task.callback:
-                        try:
-                            await task.callback(None, task.task_id)
-                        except Exception as e:
-                            logger.error(f"Callback error: {e}")
-                    continue
-
-                try:
-                    # Выполняем обогащение
-                    result = await self.ai_service.enrich_product_safe(task.raw_data)
-
-                    # Вызываем callback если есть
-                    if task.callback:
-                        try:
-                            await task.callback(result, task.task_id)
-                        except Exception as e:
-                            logger.error(f"Callback error: {e}")
+                if task.priority <= PRIORITY_INTERACTIVE:
+                    self._pending_interactive -= 1
 
-                except Exception as e:
-                    logger.error(f"AI task error: {e}", exc_info=True)
-                    if task.callback:
-                        try:
-                            await task.callback(None, task.task_id)
-                        except Exception as callback_error:
-                            logger.error(f"Callback error: {callback_error}")
+                if task.deadline is not None and task.remaining() <= 0:
+                    self.metrics["dropped_expired"] += 1
+                    self.metrics[f"dropped_expired_{task.priority_name}"] += 1
+                    logger.debug(f"AI task {task.task_id} expired in queue, dropped")
+                    await self._finish(task, None)
+                    continue
 
-                finally:
-                    self.queue.task_done()
+                self.queue_wait[task.priority_name].append(
+                    (time.monotonic() - task.enqueued_at) * 1000
+                )
+                self.active += 1
+                runner = asyncio.create_task(self._run(task))
+                self._inflight.add(runner)
+                runner.add_done_callback(self._inflight.discard)
 
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Worker error: {e}", exc_info=True)
                 await asyncio.sleep(1)
 
+    async def _run(self, task: AiTask):
+        """Обработка одной задачи"""
+        started = time.monotonic()
+        result = None
+        try:
+            if not self.ai_service.enabled:
+                logger.debug("AI service disabled, skipping task")
+            else:
+                # Выполняем обогащение (не дольше, чем результат еще нужен)
+                remaining = task.remaining()
+                result = await asyncio.wait_for(
+                    self.ai_service.enrich_product_safe(task.raw_data), timeout=remaining
+                )
+        except asyncio.TimeoutError:
+            self.metrics["dropped_deadline"] += 1
+            logger.debug(f"AI task {task.task_id} missed its deadline")
+        except Exception as e:
+            logger.error(f"AI task error: {e}", exc_info=True)
+        finally:
+            elapsed = time.monotonic() - started
+            self.service_time[task.priority_name].append(elapsed * 1000)
+            self.active -= 1
+            self._adjust_limit(elapsed)
+            await self._finish(task, result)
+            await self._notify()
+
+    async def _finish(self, task: AiTask, result: Optional[ValidatedResult]) -> None:
+        """Вызвать callback и отметить задачу выполненной"""
+        try:
+            if task.callback:
+                try:
+                    await task.callback(result, task.task_id)
+                except Exception as e:
+                    logger.error(f"Callback error: {e}")
+            self.metrics["completed"] += 1
+        finally:
+            self.queue.task_done()
+
+    def _adjust_limit(self, elapsed: float) -> None:
+        """AIMD: аддитивный рост при быстрых ответах, снижение вдвое при 429/медленных ответах"""
+        throttled = self._throttle_count()
+        saw_429 = throttled > self._seen_429
+        self._seen_429 = throttled
+
+        now = time.monotonic()
+        if saw_429 or elapsed > self.latency_target:
+            # Не чаще раза за целевое время: ответы одной волны - один сигнал
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(float(self.min_concurrent), self.limit / 2)
+                self._last_decrease = now
+                self.metrics["limit_decreases"] += 1
+                logger.info(
+                    f"AI worker concurrency -> {self.limit:.1f} "
+                    f"({'429' if saw_429 else f'slow {elapsed * 1000:.0f}ms'})"
+                )
+        else:
+            self.limit = min(float(self.max_concurrent), self.limit + 1 / self.limit)
+
     async def start(self):
         """Запустить воркер"""
         if self.running:
             return
 
         self.running = True
-        self.workers = [
-            asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)
-        ]
-        logger.info(f"AI worker started with {self.max_concurrent} workers")
+        self.workers = [asyncio.create_task(self._dispatch())]
+        logger.info(
+            f"AI worker started: concurrency {self.min_concurrent}..{self.max_concurrent} (adaptive)"
+        )
 
     async def stop(self):
         """Остановить воркер"""
         if not self.running:
             return
 
-        self.running = False
-
         # Ждем завершения всех задач
         await self.queue.join()
 
+        self.running = False
+
         # Останавливаем воркеры
         for worker in self.workers:
             worker.cancel()
 
-        await asyncio.gather(*self.workers, return_exceptions=True)
+        await asyncio.gather(*self.workers, *self._inflight, return_exceptions=True)
         logger.info("AI worker stopped")
 
     def get_queue_size(self) -> int:
         """Получить размер очереди"""
         return self.queue.qsize()
 
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Статистика очереди: ожидание и время обработки (p50/p95) по приоритетам,
+        отброшенные задачи, текущий лимит
+        """
+        stats: Dict[str, Any] = {
+            "queued": self.queue.qsize(),
+            "active": self.active,
+            "limit": round(self.limit, 2),
+            "submitted": self.metrics["submitted"],
+            "completed": self.metrics["completed"],
+            "dropped_expired": self.metrics["dropped_expired"],
+            "dropped_deadline": self.metrics["dropped_deadline"],
+            "limit_decreases": self.metrics["limit_decreases"],
+        }
+        for name in PRIORITY_NAMES.values():
+            waits, services = self.queue_wait[name], self.service_time[name]
+            if waits or services:
+                stats[name] = {
+                    "queue_wait_p50_ms": _percentile(waits, 0.5),
+                    "queue_wait_p95_ms": _percentile(waits, 0.95),
+                    "service_p50_ms": _percentile(services, 0.5),
+                    "service_p95_ms": _percentile(services, 0.95),
+                    "dropped_expired": self.metrics[f"dropped_expired_{name}"],
+                }
+        return stats
+
 
 # Глобальный экземпляр воркера
 _ai_worker: Optional[AiWorker] = None
@@ -1,18 +1,52 @@
-"""Analytics service for bot activity visualization"""
+"""Analytics service for bot activity visualization
 
+Counts come from the pre-aggregated history_rollups table (database.py):
+hourly/daily buckets by category, brand, template and price band, updated
+when a post is added to history and by the history_rollups compactor job.
+Admin screens cost O(days), not O(history), and only read.
+All reads go through AsyncDatabase (database_async.py), charts are rendered
+in a worker thread, so the handlers never block the event loop.
+"""
+
+import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 import io
 
+import config
+from database_async import AsyncDatabase, get_async_db
+from utils.history_rollups import PRICE_BANDS
+
 logger = logging.getLogger(__name__)
 
 
 class AnalyticsService:
-    def __init__(self, db):
+    def __init__(self, db: Optional[AsyncDatabase] = None):
+        # None - shared instance from get_async_db() on first use
         self.db = db
 
-    def get_daily_stats(self, days: int = 7) -> Dict[str, int]:
+    async def _get_db(self) -> AsyncDatabase:
+        if self.db is None:
+            self.db = await get_async_db()
+        return self.db
+
+    async def _rollups(
+        self, dimension: str, granularity: str = "day", since: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Rollup buckets (read-only, see refresh_history_rollups_job)."""
+        db = await self._get_db()
+        return await db.get_history_rollups(dimension, granularity, since)
+
+    async def _totals(self, dimension: str, exclude_deleted: bool = False) -> Dict[str, int]:
+        """All-time post counts per dimension value (sum of daily buckets)."""
+        totals: Dict[str, int] = {}
+        for row in await self._rollups(dimension, "day"):
+            count = row["posts"] - (row["deleted"] if exclude_deleted else 0)
+            totals[row["value"]] = totals.get(row["value"], 0) + count
+        return totals
+
+    async def get_daily_stats(self, days: int = 7) -> Dict[str, int]:
         """
         Get post count per day for the last N days.
 
@@ -24,37 +58,26 @@ class AnalyticsService:
             end_date = datetime.utcnow().date()
             start_date = end_date - timedelta(days=days - 1)
 
-            # Get all posts within date range
-            with self.db.connection:
-                rows = self.db.cursor.execute(
-                    """
-                    SELECT DATE(date_added) as post_date, COUNT(*) as count
-                    FROM history
-                    WHERE DATE(date_added) >= DATE(?)
-                    GROUP BY DATE(date_added)
-                    ORDER BY post_date ASC
-                """,
-                    (start_date.isoformat(),),
-                ).fetchall()
-
-                # Fill all dates (including zeros)
-                current_date = start_date
-                while current_date <= end_date:
-                    date_str = current_date.strftime("%Y-%m-%d")
-                    stats[date_str] = 0
-                    current_date += timedelta(days=1)
-
-                # Update with actual counts
-                for row in rows:
-                    date_str = row["post_date"]
-                    stats[date_str] = row["count"]
-
-                return stats
+            rows = await self._rollups("all", "day", since=start_date.isoformat())
+
+            # Fill all dates (including zeros)
+            current_date = start_date
+            while current_date <= end_date:
+                date_str = current_date.strftime("%Y-%m-%d")
+                stats[date_str] = 0
+                current_date += timedelta(days=1)
+
+            # Update with actual counts
+            for row in rows:
+                if row["bucket"] in stats:
+                    stats[row["bucket"]] = row["posts"]
+
+            return stats
         except Exception as e:
             logger.exception(f"Error getting daily stats: {e}")
             return {}
 
-    def generate_activity_graph(self, days: int = 7) -> Optional[io.BytesIO]:
+    async def generate_activity_graph(self, days: int = 7) -> Optional[io.BytesIO]:
         """
         Generate visual activity graph as image.
 
@@ -64,6 +87,13 @@ class AnalyticsService:
         Returns:
             BytesIO buffer with PNG image, or None if failed
         """
+        stats = await self.get_daily_stats(days)
+        if not stats:
+            return None
+        return await asyncio.to_thread(self._render_activity_graph, stats, days)
+
+    def _render_activity_graph(self, stats: Dict[str, int], days: int) -> Optional[io.BytesIO]:
+        """Render daily stats with matplotlib (ASCII chart fallback)."""
         try:
             # Try using matplotlib for beautiful graphs
             try:
@@ -74,10 +104,6 @@ class AnalyticsService:
                 import matplotlib.dates as mdates
                 from datetime import datetime
 
-                stats = self.get_daily_stats(days)
-                if not stats:
-                    return None
-
                 # Prepare data
                 dates = [datetime.strptime(d, "%Y-%m-%d") for d in sorted(stats.keys())]
                 counts = [stats[d] for d in sorted(stats.keys())]
@@ -139,13 +165,13 @@ class AnalyticsService:
             except ImportError:
                 # Fallback: ASCII chart
                 logger.info("matplotlib not available, using ASCII chart")
-                return self._generate_ascii_chart(days)
+                return self._generate_ascii_chart(stats, days)
 
         except Exception as e:
             logger.exception(f"Error generating activity graph: {e}")
             return None
 
-    def _generate_ascii_chart(self, days: int = 7) -> Optional[io.BytesIO]:
+    def _generate_ascii_chart(self, stats: Dict[str, int], days: int) -> Optional[io.BytesIO]:
         """
         Generate ASCII-based chart as image using PIL.
         Fallback when matplotlib is not available.
@@ -153,10 +179,6 @@ class AnalyticsService:
         try:
             from PIL import Image, ImageDraw, ImageFont
 
-            stats = self.get_daily_stats(days)
-            if not stats:
-                return None
-
             # Prepare data
             dates = sorted(stats.keys())
             counts = [stats[d] for d in dates]
@@ -248,7 +270,7 @@ class AnalyticsService:
             logger.exception(f"Error generating ASCII chart: {e}")
             return None
 
-    def get_summary_text(self) -> str:
+    async def get_summary_text(self) -> str:
         """
         Generate text summary of bot statistics.
 
@@ -256,21 +278,15 @@ class AnalyticsService:
             Formatted text with statistics
         """
         try:
-            stats = self.db.get_stats()
+            stats = await (await self._get_db()).get_stats()
 
             # Get daily stats
-            daily = self.get_daily_stats(7)
+            daily = await self.get_daily_stats(7)
             last_7_days = sum(daily.values())
 
-            # Get hourly stats (last 24h)
-            with self.db.connection:
-                last_24h = self.db.cursor.execute(
-                    """
-                    SELECT COUNT(*) as count
-                    FROM history
-                    WHERE datetime(date_added) >= datetime('now', '-24 hours')
-                """
-                ).fetchone()["count"]
+            # Get hourly stats (last 24h, hour buckets)
+            since = (datetime.utcnow() - timedelta(hours=23)).strftime("%Y-%m-%d %H")
+            last_24h = sum(row["posts"] for row in await self._rollups("all", "hour", since))
 
             text = f"""📊 <b>Статистика бота</b>
 
@@ -298,52 +314,32 @@ class AnalyticsService:
             logger.exception(f"Error generating summary: {e}")
             return "❌ Ошибка получения статистики"
 
-    def get_category_stats(self) -> Dict[str, int]:
+    async def get_category_stats(self) -> Dict[str, int]:
         """
         Returns stats by category (e.g. from history table).
         Since we don't have a category column, we group by template_type from A/B testing.
         """
         try:
-            with self.db.connection:
-                # Group by template_type (A/B testing templates)
-                cursor = self.db.cursor.execute(
-                    """
-                    SELECT
-                        COALESCE(template_type, 'Без шаблона') as category,
-                        COUNT(*) as count
-                    FROM history
-                    WHERE deleted IS NULL OR deleted = 0
-                    GROUP BY template_type
-                    ORDER BY count DESC
-                """
-                )
-                rows = cursor.fetchall()
+            # Group by template_type (A/B testing templates), deleted posts excluded
+            totals = await self._totals("template", exclude_deleted=True)
+            result = {
+                (template or "Без шаблона"): count
+                for template, count in sorted(totals.items(), key=lambda x: x[1], reverse=True)
+                if count > 0
+            }
 
-                # Convert to dict
-                result = {row[0]: row[1] for row in rows}
+            # Add total if no categories
+            if not result:
+                totals = await self._totals("all", exclude_deleted=True)
+                result = {"Всего": sum(totals.values())}
 
-                # Add total if no categories
-                if not result:
-                    total_count = self.db.cursor.execute(
-                        "SELECT COUNT(*) FROM history WHERE deleted IS NULL OR deleted = 0"
-                    ).fetchone()[0]
-                    result = {"Всего": total_count}
-
-                return result
+            return result
 
         except Exception as e:
             logger.error(f"Error getting category stats: {e}")
-            # Fallback: return basic stats
-            try:
-                with self.db.connection:
-                    total = self.db.cursor.execute(
-                        "SELECT COUNT(*) FROM history WHERE deleted IS NULL OR deleted = 0"
-                    ).fetchone()[0]
-                    return {"Всего": total}
-            except Exception:
-                return {"Ошибка": 0}
-
-    def get_price_range_stats(self) -> Dict[str, int]:
+            return {"Ошибка": 0}
+
+    async def get_price_range_stats(self) -> Dict[str, int]:
         """
         Get statistics of products by price ranges.
 
@@ -351,46 +347,37 @@ class AnalyticsService:
             Dict with price ranges as keys and counts as values
         """
         try:
-            with self.db.connection:
-                # Group products by price ranges - use last_price field
-                cursor = self.db.cursor.execute(
-                    """
-                    SELECT
-                        CASE
-                            WHEN last_price < 1000 THEN 'До 1000 ₽'
-                            WHEN last_price >= 1000 AND last_price < 5000 THEN '1000-4999 ₽'
-                            WHEN last_price >= 5000 AND last_price < 10000 THEN '5000-9999 ₽'
-                            WHEN last_price >= 10000 AND last_price < 20000 THEN '10000-19999 ₽'
-                            WHEN last_price >= 20000 THEN '20000+ ₽'
-                            ELSE 'Цена не указана'
-                        END as price_range,
-                        COUNT(*) as count
-                    FROM history
-                    WHERE last_price IS NOT NULL
-                    GROUP BY price_range
-                    ORDER BY
-                        CASE price_range
-                            WHEN 'До 1000 ₽' THEN 1
-                            WHEN '1000-4999 ₽' THEN 2
-                            WHEN '5000-9999 ₽' THEN 3
-                            WHEN '10000-19999 ₽' THEN 4
-                            WHEN '20000+ ₽' THEN 5
-                            ELSE 6
-                        END
-                """
-                )
-                rows = cursor.fetchall()
-
-                # Convert to dict
-                result = {row[0]: row[1] for row in rows}
-
-                return result
+            # Price at the time the post was published (history.last_price)
+            totals = await self._totals("price_band")
+            return {
+                label: totals[label] for _, label in PRICE_BANDS if totals.get(label)
+            }
 
         except Exception as e:
             logger.error(f"Error getting price range stats: {e}")
             return {"Ошибка": 0}
 
-    def get_error_stats(self) -> Dict[str, int]:
+    async def get_brand_stats(self, limit: int = 5) -> Dict[str, int]:
+        """
+        Top brands by published posts (deleted posts excluded).
+
+        Returns:
+            Dict with brands as keys and counts as values, most posted first
+        """
+        try:
+            totals = await self._totals("brand", exclude_deleted=True)
+            ranked = sorted(
+                ((brand, count) for brand, count in totals.items() if brand and count > 0),
+                key=lambda x: x[1],
+                reverse=True,
+            )
+            return dict(ranked[:limit])
+
+        except Exception as e:
+            logger.error(f"Error getting brand stats: {e}")
+            return {}
+
+    async def get_error_stats(self) -> Dict[str, int]:
         """
         Get error statistics.
 
@@ -398,30 +385,14 @@ class AnalyticsService:
             Dict with error types and counts
         """
         try:
-            with self.db.connection:
-                # Get total errors
-                total_errors = self.db.cursor.execute(
-                    "SELECT COUNT(*) FROM error_queue"
-                ).fetchone()[0]
-
-                # Get recent errors (last 7 days) - use date_added
-                recent_errors = self.db.cursor.execute(
-                    """
-                    SELECT COUNT(*) FROM error_queue
-                    WHERE datetime(date_added) >= datetime('now', '-7 days')
-                """
-                ).fetchone()[0]
-
-                return {
-                    "total_errors": total_errors,
-                    "recent_errors": recent_errors,
-                }
+            # Total and recent (last 7 days) errors
+            return await (await self._get_db()).get_error_counts(days=7)
 
         except Exception as e:
             logger.error(f"Error getting error stats: {e}")
             return {"total_errors": 0, "recent_errors": 0}
 
-    def get_time_distribution(self, days: int = 7) -> Dict[str, int]:
+    async def get_time_distribution(self, days: int = 7) -> Dict[str, int]:
         """
         Get posting distribution by hour of day.
 
@@ -432,52 +403,23 @@ class AnalyticsService:
             Dict with hours (0-23) as keys and post counts as values
         """
         try:
-            with self.db.connection:
-                # Get hourly distribution - remove deleted filter if column doesn't exist
-                try:
-                    cursor = self.db.cursor.execute(
-                        f"""
-                        SELECT
-                            strftime('%H', date_added) as hour,
-                            COUNT(*) as count
-                        FROM history
-                        WHERE deleted IS NULL OR deleted = 0
-                        AND date_added >= datetime('now', '-{days} days')
-                        GROUP BY hour
-                        ORDER BY hour
-                    """
-                    )
-                except Exception:
-                    # Fallback if deleted column doesn't exist
-                    cursor = self.db.cursor.execute(
-                        f"""
-                        SELECT
-                            strftime('%H', date_added) as hour,
-                            COUNT(*) as count
-                        FROM history
-                        WHERE date_added >= datetime('now', '-{days} days')
-                        GROUP BY hour
-                        ORDER BY hour
-                    """
-                    )
+            since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H")
 
-                rows = cursor.fetchall()
+            # Initialize all hours with 0
+            result = {f"{h:02d}": 0 for h in range(24)}
 
-                # Initialize all hours with 0
-                result = {f"{h:02d}": 0 for h in range(24)}
+            # Hour buckets are "YYYY-MM-DD HH"; deleted posts excluded
+            for row in await self._rollups("all", "hour", since):
+                hour_str = row["bucket"][11:13]
+                result[hour_str] += row["posts"] - row["deleted"]
 
-                # Update with actual counts
-                for row in rows:
-                    hour_str = row[0]
-                    result[hour_str] = row[1]
-
-                return result
+            return result
 
         except Exception as e:
             logger.error(f"Error getting time distribution: {e}")
             return {f"{h:02d}": 0 for h in range(24)}
 
-    def get_top_products(self, limit: int = 5) -> List[Dict]:
+    async def get_top_products(self, limit: int = 5) -> List[Dict]:
         """
         Get top products by some metric (views, engagement, etc.).
 
@@ -488,93 +430,31 @@ class AnalyticsService:
             List of product dictionaries with basic info
         """
         try:
-            with self.db.connection:
-                # Get products with highest view counts (if available)
-                try:
-                    cursor = self.db.cursor.execute(
-                        """
-                        SELECT
-                            id,
-                            url,
-                            title,
-                            last_price,
-                            views_24h,
-                            date_added
-                        FROM history
-                        WHERE (deleted IS NULL OR deleted = 0)
-                        AND views_24h IS NOT NULL
-                        ORDER BY views_24h DESC
-                        LIMIT ?
-                    """,
-                        (limit,),
-                    )
-                    rows = cursor.fetchall()
-
-                    # Convert to list of dicts
-                    result = []
-                    for row in rows:
-                        result.append({
-                            "id": row[0],
-                            "url": row[1],
-                            "title": row[2] or "Без названия",
-                            "price": f"{row[3]} ₽" if row[3] else "Цена не указана",
-                            "views": row[4] or 0,
-                            "date_added": row[5],
-                        })
-
-                except Exception:
-                    # Fallback if views_24h column doesn't exist
-                    result = []
-
-                # If no products with views, return recent products
-                if not result:
-                    try:
-                        cursor = self.db.cursor.execute(
-                            """
-                            SELECT
-                                id,
-                                url,
-                                title,
-                                last_price,
-                                date_added
-                            FROM history
-                            WHERE deleted IS NULL OR deleted = 0
-                            ORDER BY date_added DESC
-                            LIMIT ?
-                        """,
-                            (limit,),
-                        )
-                    except Exception:
-                        # Fallback if deleted column doesn't exist
-                        cursor = self.db.cursor.execute(
-                            """
-                            SELECT
-                                id,
-                                url,
-                                title,
-                                last_price,
-                                date_added
-                            FROM history
-                            ORDER BY date_added DESC
-                            LIMIT ?
-                        """,
-                            (limit,),
-                        )
-
-                    rows = cursor.fetchall()
-
-                    for row in rows:
-                        result.append({
-                            "id": row[0],
-                            "url": row[1],
-                            "title": row[2] or "Без названия",
-                            "price": f"{row[3]} ₽" if row[3] else "Цена не указана",
-                            "views": 0,
-                            "date_added": row[4],
-                        })
-
-                return result
+            # Highest view counts, most recent posts if there are no views yet
+            rows = await (await self._get_db()).get_top_history(limit)
+            return [
+                {
+                    "id": row["id"],
+                    "url": row["url"],
+                    "title": row["title"] or "Без названия",
+                    "price": f"{row['last_price']} ₽" if row["last_price"] else "Цена не указана",
+                    "views": row["views_24h"] or 0,
+                    "date_added": row["date_added"],
+                }
+                for row in rows
+            ]
 
         except Exception as e:
             logger.error(f"Error getting top products: {e}")
             return []
+
+
+async def refresh_history_rollups_job(db: Optional[AsyncDatabase] = None) -> int:
+    """
+    history_rollups compactor (scheduler task): counts history rows written
+    around add_post_to_history and drops hourly buckets past retention.
+    """
+    db = db or await get_async_db()
+    return await db.refresh_history_rollups(
+        hourly_retention_days=getattr(config, "ANALYTICS_HOURLY_RETENTION_DAYS", 30)
+    )
@@ -158,57 +158,43 @@ async def create_backup(
         return False
 
 
-async def backup_worker(
+def schedule_backup(
+    scheduler,
     admin_id: int,
     bot_instance,
     db_file_path: Optional[str] = None,
     interval_hours: int = 24,
 ):
     """
-    Фоновый воркер для периодического создания резервных копий.
+    Регистрирует периодическое создание резервных копий в планировщике.
+
+    Выполняется одной репликой; если процесс был остановлен дольше
+    интервала, копия создается через минуту после старта.
 
     Args:
+        scheduler: SchedulerService
         admin_id: ID администратора в Telegram
         bot_instance: Экземпляр бота (aiogram Bot)
         db_file_path: Путь к файлу базы данных
         interval_hours: Интервал между резервными копиями в часах (по умолчанию 24)
     """
-    import asyncio
-
-    logger.info(f"🔄 Backup worker запущен (интервал: {interval_hours} часов)")
-
-    # Ждем немного перед первой резервной копией, чтобы бот успел запуститься
-    await asyncio.sleep(60)  # 1 минута
-
-    while True:
-        try:
-            logger.info("📦 Запуск запланированного резервного копирования...")
-            success = await create_backup(admin_id, bot_instance, db_file_path)
-
-            if success:
-                logger.info(
-                    "✅ Запланированное резервное копирование завершено успешно"
-                )
-            else:
-                logger.warning(
-                    "⚠️ Запланированное резервное копирование завершилось с ошибкой"
-                )
-
-        except Exception as e:
-            logger.exception(f"❌ Ошибка в backup_worker: {e}")
-
-        # Ждем указанный интервал перед следующей резервной копией
-        await asyncio.sleep(interval_hours * 3600)  # Конвертируем часы в секунды
-
-
-
-
-
-
-
-
-
 
+    async def run_backup():
+        logger.info("📦 Запуск запланированного резервного копирования...")
+        success = await create_backup(admin_id, bot_instance, db_file_path)
 
+        if success:
+            logger.info(
+                "✅ Запланированное резервное копирование завершено успешно"
+            )
+        else:
+            logger.warning(
+                "⚠️ Запланированное резервное копирование завершилось с ошибкой"
+            )
 
+    logger.info(f"🔄 Backup job запланирован (интервал: {interval_hours} часов)")
 
+    # Первая копия не раньше чем через минуту, чтобы бот успел запуститься
+    return scheduler.add_interval_task(
+        interval_hours * 3600, run_backup, name="backup", initial_delay=60
+    )
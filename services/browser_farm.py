@@ -0,0 +1,459 @@
+# services/browser_farm.py
+"""
+Browser Farm - пул постоянных браузеров для генерации cc-ссылок
+
+Вместо запуска Chromium на каждую задачу держим N долгоживущих браузеров,
+в каждом - несколько прогретых контекстов (storage_state уже загружен,
+anti-bot init script установлен, страница открыта). Задача получает
+готовую страницу у наименее загруженного браузера, поэтому латентность
+ссылки сводится ко времени навигации.
+
+Браузер пересоздается после BROWSER_FARM_RECYCLE_JOBS задач или при росте
+памяти дерева процессов выше BROWSER_FARM_MAX_MEMORY_MB: новый браузер
+поднимается заранее, старый дорабатывает текущие задачи и закрывается.
+Если браузер не может создать контекст и его замена тоже не поднялась,
+слот выводится из ротации, емкость фермы уменьшается.
+
+Контекст задачи со своими cookies в пул не возвращается: после нее
+создается чистый контекст, чтобы cookies не достались следующим задачам.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config.link_generation_config import (
+    BROWSER_FARM_CONTEXTS_PER_BROWSER,
+    BROWSER_FARM_MAX_MEMORY_MB,
+    BROWSER_FARM_RECYCLE_JOBS,
+    BROWSER_FARM_SIZE,
+    BROWSER_LAUNCH_ARGS,
+    BROWSER_LOCALE,
+    BROWSER_TIMEZONE,
+    STORAGE_STATE_DIR,
+    USER_AGENTS,
+    VIEWPORTS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Скрываем navigator.webdriver во всех страницах контекста
+STEALTH_INIT_SCRIPT = """
+Object.defineProperty(navigator, 'webdriver', {
+    get: () => undefined
+});
+"""
+
+# Аргумент-метка, по которой находим процесс браузера для замера памяти
+SLOT_MARKER_ARG = "--browser-farm-slot"
+
+# Как часто мерить память браузера (psutil обходит дерево процессов)
+MEMORY_CHECK_INTERVAL = 30.0
+
+
+def latest_storage_state(directory: Path = STORAGE_STATE_DIR) -> Optional[str]:
+    """Самый свежий сохраненный storage_state (cookies/localStorage) или None"""
+    try:
+        states = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        return str(states[0]) if states else None
+    except Exception as e:
+        logger.debug(f"Failed to find storage state: {e}")
+        return None
+
+
+@dataclass
+class PageLease:
+    """Прогретый контекст со страницей, выдаваемый задаче"""
+    context: Any
+    page: Any
+    slot: "BrowserSlot"
+    uses: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class BrowserSlot:
+    """Один процесс Chromium с пулом прогретых контекстов"""
+
+    def __init__(self, farm: "BrowserFarm", slot_id: int):
+        self.farm = farm
+        self.slot_id = slot_id
+        self.marker = uuid.uuid4().hex[:12]
+        self.browser = None
+        self.idle: asyncio.Queue = asyncio.Queue()
+        self.active = 0
+        self.jobs_done = 0
+        self.draining = False
+        # Контексты пула (уменьшается, если пересоздать контекст не удалось)
+        self.contexts = 0
+        self.broken = False
+        self.started_at = 0.0
+        self._memory_mb = 0.0
+        self._memory_checked_at = 0.0
+
+    async def start(self):
+        args = list(BROWSER_LAUNCH_ARGS) + [f"{SLOT_MARKER_ARG}={self.marker}"]
+        self.browser = await self.farm.playwright.chromium.launch(headless=self.farm.headless, args=args)
+        self.started_at = time.monotonic()
+        for _ in range(self.farm.contexts_per_browser):
+            self.idle.put_nowait(await self._new_lease())
+            self.contexts += 1
+        logger.info(f"🌐 Browser slot {self.slot_id} ready ({self.farm.contexts_per_browser} contexts)")
+
+    async def _new_lease(self) -> PageLease:
+        """Новый контекст: storage_state, случайные UA/viewport, открытая страница"""
+        storage_state = self.farm.storage_state_path
+        context = await self.browser.new_context(
+            storage_state=storage_state if storage_state and Path(storage_state).exists() else None,
+            user_agent=random.choice(USER_AGENTS),
+            viewport=random.choice(VIEWPORTS),
+            locale=BROWSER_LOCALE,
+            timezone_id=BROWSER_TIMEZONE,
+        )
+        await context.add_init_script(STEALTH_INIT_SCRIPT)
+        page = await context.new_page()
+        self.farm.stats["contexts_created"] += 1
+        return PageLease(context=context, page=page, slot=self)
+
+    @property
+    def load(self) -> int:
+        return self.active
+
+    def has_idle(self) -> bool:
+        return not self.draining and not self.idle.empty()
+
+    def acquire(self) -> PageLease:
+        lease = self.idle.get_nowait()
+        self.active += 1
+        lease.uses += 1
+        return lease
+
+    async def release(self, lease: PageLease, healthy: bool):
+        """Вернуть контекст в пул; после ошибки (или чужих cookies) контекст пересоздается"""
+        self.active -= 1
+        self.jobs_done += 1
+
+        if self.draining:
+            await self._close_lease(lease)
+            if self.active == 0:
+                await self.close()
+            return
+
+        if healthy:
+            try:
+                # Уходим со страницы товара, чтобы не держать тяжелый DOM и таймеры
+                await lease.page.goto("about:blank")
+            except Exception:
+                healthy = False
+
+        if not healthy:
+            await self._close_lease(lease)
+            try:
+                lease = await self._new_lease()
+            except Exception as e:
+                logger.warning(f"Browser slot {self.slot_id} failed to recreate context: {e}")
+                self.contexts -= 1
+                self.broken = True
+                self.farm.request_recycle(self)
+                return
+        self.idle.put_nowait(lease)
+
+    async def _close_lease(self, lease: PageLease):
+        try:
+            await lease.context.close()
+        except Exception:
+            pass
+
+    def memory_mb(self) -> float:
+        """RSS процесса браузера и его потомков (renderer, GPU), с кэшированием"""
+        now = time.monotonic()
+        if now - self._memory_checked_at < MEMORY_CHECK_INTERVAL:
+            return self._memory_mb
+        self._memory_checked_at = now
+        try:
+            import psutil
+
+            marker = f"{SLOT_MARKER_ARG}={self.marker}"
+            for proc in psutil.Process().children(recursive=True):
+                try:
+                    if marker in proc.cmdline():
+                        tree = [proc] + proc.children(recursive=True)
+                        self._memory_mb = sum(p.memory_info().rss for p in tree) / (1024 * 1024)
+                        break
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+        except Exception as e:
+            logger.debug(f"Failed to measure browser memory: {e}")
+        return self._memory_mb
+
+    def needs_recycle(self) -> bool:
+        if self.draining:
+            return False
+        if self.farm.recycle_jobs and self.jobs_done >= self.farm.recycle_jobs:
+            return True
+        return bool(self.farm.max_memory_mb) and self.memory_mb() > self.farm.max_memory_mb
+
+    async def close(self):
+        while not self.idle.empty():
+            await self._close_lease(self.idle.get_nowait())
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+            self.browser = None
+            logger.info(f"🗑️ Browser slot {self.slot_id} closed after {self.jobs_done} jobs")
+
+
+class BrowserFarm:
+    """
+    Пул из N браузеров по M прогретых контекстов
+
+    Args:
+        size: Количество процессов Chromium
+        contexts_per_browser: Прогретых контекстов в каждом браузере
+        recycle_jobs: Пересоздать браузер после стольких задач (0 - никогда)
+        max_memory_mb: Пересоздать браузер при превышении RSS (0 - не мерить)
+        headless: Headless-режим
+        storage_state_path: storage_state для новых контекстов (по умолчанию самый свежий на момент создания)
+        playwright: Готовый объект Playwright (иначе запускается async_playwright)
+    """
+
+    def __init__(
+        self,
+        size: int = BROWSER_FARM_SIZE,
+        contexts_per_browser: int = BROWSER_FARM_CONTEXTS_PER_BROWSER,
+        recycle_jobs: int = BROWSER_FARM_RECYCLE_JOBS,
+        max_memory_mb: int = BROWSER_FARM_MAX_MEMORY_MB,
+        headless: bool = True,
+        storage_state_path: Optional[str] = None,
+        playwright: Any = None,
+    ):
+        self.size = size
+        self.contexts_per_browser = contexts_per_browser
+        self.recycle_jobs = recycle_jobs
+        self.max_memory_mb = max_memory_mb
+        self.headless = headless
+        self._storage_state_path = storage_state_path
+        self.playwright = playwright
+        self._owns_playwright = playwright is None
+        self._playwright_manager = None
+
+        self.slots: List[BrowserSlot] = []
+        self._next_slot_id = 0
+        # Ожидание свободного контекста (будится при возврате контекста и замене браузера)
+        self._slot_ready: Optional[asyncio.Condition] = None
+        self._recycling: set = set()
+        self._background: set = set()
+        self._running = False
+        self.stats: Dict[str, Any] = {
+            "jobs": 0,
+            "errors": 0,
+            "recycles": 0,
+            "dead_slots": 0,
+            "contexts_created": 0,
+            "total_job_seconds": 0.0,
+            "total_wait_seconds": 0.0,
+        }
+
+    @property
+    def storage_state_path(self) -> Optional[str]:
+        """Явно заданный storage_state или самый свежий (новые контексты подхватывают обновления)"""
+        return self._storage_state_path or latest_storage_state()
+
+    @property
+    def capacity(self) -> int:
+        """Контекстов в ротации (до запуска - расчетная емкость)"""
+        if not self._running:
+            return self.size * self.contexts_per_browser
+        return sum(slot.contexts for slot in self.slots)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def start(self):
+        """Запустить все браузеры и прогреть контексты"""
+        if self._running:
+            return
+        if self.playwright is None:
+            from playwright.async_api import async_playwright
+
+            self._playwright_manager = async_playwright()
+            self.playwright = await self._playwright_manager.start()
+
+        self._slot_ready = asyncio.Condition()
+        try:
+            self.slots = list(await asyncio.gather(*(self._start_slot() for _ in range(self.size))))
+        except Exception:
+            await self.stop()
+            raise
+        self._running = True
+        logger.info(f"✅ Browser farm started: {self.size} browsers x {self.contexts_per_browser} contexts")
+
+    async def _start_slot(self) -> BrowserSlot:
+        slot = BrowserSlot(self, self._next_slot_id)
+        self._next_slot_id += 1
+        try:
+            await slot.start()
+        except Exception:
+            await slot.close()
+            raise
+        return slot
+
+    async def stop(self):
+        """Закрыть все браузеры"""
+        self._running = False
+        for task in list(self._background):
+            task.cancel()
+        for slot in self.slots:
+            await slot.close()
+        self.slots = []
+        await self._wake_waiters()
+        if self._owns_playwright and self._playwright_manager is not None:
+            try:
+                await self.playwright.stop()
+            except Exception:
+                pass
+            self.playwright = None
+            self._playwright_manager = None
+        logger.info("✅ Browser farm stopped")
+
+    async def _acquire(self) -> PageLease:
+        """Свободный контекст наименее загруженного браузера (ждет, пока не освободится)"""
+        async with self._slot_ready:
+            while True:
+                candidates = [slot for slot in self.slots if slot.has_idle()]
+                if candidates:
+                    return min(candidates, key=lambda slot: (slot.load, slot.jobs_done)).acquire()
+                if not self._running:
+                    raise RuntimeError("Browser farm is not running")
+                if not self.slots:
+                    raise RuntimeError("Browser farm has no live browsers")
+                # Контекст пересоздается или браузер в процессе замены
+                await self._slot_ready.wait()
+
+    async def _wake_waiters(self):
+        if self._slot_ready is None:
+            return
+        async with self._slot_ready:
+            self._slot_ready.notify_all()
+
+    async def run(
+        self,
+        job: Callable[[Any], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        cookies: Optional[list] = None,
+    ) -> Any:
+        """
+        Выполнить job(page) на прогретой странице
+
+        Args:
+            job: async функция, получающая Playwright page
+            timeout: Таймаут выполнения job в секундах
+            cookies: Cookies задачи; контекст после нее закрывается, а не возвращается в пул
+
+        Returns:
+            Результат job
+        """
+        if not self._running:
+            raise RuntimeError("Browser farm is not running")
+
+        wait_started = time.monotonic()
+        lease = await self._acquire()
+        self.stats["total_wait_seconds"] += time.monotonic() - wait_started
+        slot = lease.slot
+        started = time.monotonic()
+        healthy = False
+        try:
+            if cookies:
+                await lease.context.add_cookies(cookies)
+            result = await asyncio.wait_for(job(lease.page), timeout) if timeout else await job(lease.page)
+            healthy = True
+            return result
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["jobs"] += 1
+            self.stats["total_job_seconds"] += time.monotonic() - started
+            await slot.release(lease, healthy and not cookies)
+            if slot.needs_recycle():
+                self.request_recycle(slot)
+            await self._wake_waiters()
+
+    def request_recycle(self, slot: BrowserSlot):
+        """Запланировать замену браузера (не блокируя текущую задачу)"""
+        if slot in self._recycling or slot.draining or not self._running:
+            return
+        self._recycling.add(slot)
+        task = asyncio.create_task(self._recycle(slot))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _recycle(self, slot: BrowserSlot):
+        """Поднять новый браузер, затем вывести старый из ротации"""
+        try:
+            reason = f"{slot.jobs_done} jobs, {slot.memory_mb():.0f} MB"
+            replacement = await self._start_slot()
+            self.slots[self.slots.index(slot)] = replacement
+            slot.draining = True
+            self.stats["recycles"] += 1
+            logger.info(f"♻️ Browser slot {slot.slot_id} recycled ({reason}) -> slot {replacement.slot_id}")
+            if slot.active == 0:
+                await slot.close()
+        except Exception as e:
+            logger.error(f"Failed to recycle browser slot {slot.slot_id}: {e}")
+            if slot.broken:
+                await self._retire(slot)
+        finally:
+            self._recycling.discard(slot)
+            await self._wake_waiters()
+
+    async def _retire(self, slot: BrowserSlot):
+        """Вывести из ротации браузер, который не создает контексты и не заменяется"""
+        if slot in self.slots:
+            self.slots.remove(slot)
+        slot.draining = True
+        self.stats["dead_slots"] += 1
+        logger.error(
+            f"💀 Browser slot {slot.slot_id} is dead, farm capacity is now {self.capacity} contexts"
+        )
+        if slot.active == 0:
+            await slot.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика фермы для мониторинга"""
+        jobs = self.stats["jobs"]
+        return {
+            **self.stats,
+            "running": self._running,
+            "capacity": self.capacity,
+            "avg_job_ms": round(self.stats["total_job_seconds"] / jobs * 1000, 1) if jobs else 0.0,
+            "avg_wait_ms": round(self.stats["total_wait_seconds"] / jobs * 1000, 1) if jobs else 0.0,
+            "browsers": [
+                {
+                    "slot": slot.slot_id,
+                    "active": slot.active,
+                    "idle": slot.idle.qsize(),
+                    "jobs": slot.jobs_done,
+                    "memory_mb": round(slot.memory_mb(), 1),
+                }
+                for slot in self.slots
+            ],
+        }
+
+
+# Глобальный экземпляр
+_browser_farm: Optional[BrowserFarm] = None
+
+
+def get_browser_farm() -> BrowserFarm:
+    """Получить глобальную ферму браузеров (запускается через start())"""
+    global _browser_farm
+    if _browser_farm is None:
+        _browser_farm = BrowserFarm()
+    return _browser_farm
@@ -3,87 +3,35 @@
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
-import re
 
 logger = logging.getLogger(__name__)
 
 
-async def check_url_is_dead(url: str, http_client) -> Tuple[bool, Optional[str]]:
+async def check_url_is_dead(url: str, http_client=None) -> Tuple[bool, Optional[str]]:
     """
-    Проверяет, является ли URL мертвым (404 или "Out of stock").
+    Проверяет, является ли URL мертвым (404/410 или товар распродан).
 
     Args:
         url: URL для проверки
-        http_client: Экземпляр HTTPClient для выполнения запросов
+        http_client: Экземпляр HTTPClient (по умолчанию общий)
 
     Returns:
         Tuple (is_dead: bool, reason: Optional[str])
         - is_dead: True если ссылка мертвая
-        - reason: Причина (например, "404", "out_of_stock", "timeout")
+        - reason: Причина ("404", "410", "out_of_stock")
+        Ошибка сети/таймаут - ссылка считается живой (проверим в следующий раз)
     """
-    try:
-        # Выполняем GET запрос
-        resp = await http_client.get(url, max_retries=2)
-
-        if resp is None:
-            # Не удалось получить ответ (timeout, network error)
-            logger.debug(
-                f"check_url_is_dead: Failed to fetch {url[:100]} (timeout/network error)"
-            )
-            return True, "timeout"
-
-        # Проверяем статус код
-        if resp.status == 404:
-            logger.debug(f"check_url_is_dead: 404 for {url[:100]}")
-            resp.close()
-            return True, "404"
-
-        # Проверяем содержимое страницы на наличие текста "Out of stock" или "Нет в наличии"
-        if resp.status == 200:
-            try:
-                text = await resp.text()
-                resp.close()
-
-                # Проверяем на различные варианты текста "нет в наличии"
-                out_of_stock_patterns = [
-                    r"нет\s+в\s+наличии",
-                    r"out\s+of\s+stock",
-                    r"товар\s+закончился",
-                    r"товар\s+недоступен",
-                    r"распродан",
-                    r"снят\s+с\s+продажи",
-                    r"не\s+доступен\s+для\s+заказа",
-                ]
-
-                text_lower = text.lower()
-                for pattern in out_of_stock_patterns:
-                    if re.search(pattern, text_lower, re.IGNORECASE):
-                        logger.debug(
-                            f"check_url_is_dead: Out of stock detected for {url[:100]}"
-                        )
-                        return True, "out_of_stock"
-
-                # Ссылка живая
-                return False, None
-
-            except Exception as e:
-                logger.warning(
-                    f"check_url_is_dead: Error reading response text for {url[:100]}: {e}"
-                )
-                resp.close()
-                # Если не удалось прочитать текст, считаем ссылку живой (консервативный подход)
-                return False, None
+    from services.link_sweeper import AvailabilityChecker, DEAD, SOLD_OUT, get_availability_checker
 
-        # Другие статус коды (403, 500, etc.) - считаем ссылку живой
-        resp.close()
-        return False, None
-
-    except Exception as e:
-        logger.exception(
-            f"check_url_is_dead: Unexpected error checking {url[:100]}: {e}"
-        )
-        # При ошибке считаем ссылку живой (консервативный подход)
-        return False, None
+    checker = AvailabilityChecker(http_client=http_client) if http_client else get_availability_checker()
+    result = await checker.check(url)
+    if result.status == DEAD:
+        logger.debug(f"check_url_is_dead: {result.reason} for {url[:100]}")
+        return True, result.reason
+    if result.status == SOLD_OUT:
+        logger.debug(f"check_url_is_dead: Out of stock detected for {url[:100]} ({result.reason})")
+        return True, "out_of_stock"
+    return False, None
 
 
 async def cleanup_old_posts(
@@ -92,6 +40,9 @@ async def cleanup_old_posts(
     """
     Очищает старые посты с мертвыми ссылками.
 
+    Ссылки проверяются параллельно (services/link_sweeper), сообщения
+    удаляются пачками.
+
     Args:
         db: Экземпляр Database
         bot_instance: Экземпляр бота (aiogram Bot)
@@ -105,7 +56,7 @@ async def cleanup_old_posts(
             'errors': количество ошибок
         }
     """
-    from services.http_client import HTTPClient
+    from services.link_sweeper import get_availability_checker, remove_channel_posts
 
     stats = {"checked": 0, "deleted": 0, "errors": 0}
 
@@ -122,87 +73,54 @@ async def cleanup_old_posts(
             return stats
 
         logger.info(f"🧹 Found {len(old_posts)} old posts to check")
+        stats["checked"] = len(old_posts)
 
-        # Создаем HTTP клиент
-        http_client = HTTPClient()
-
-        try:
-            for post in old_posts:
-                stats["checked"] += 1
-
-                post_id = post["id"]
-                url = post["url"]
-                message_id = post.get("message_id")
-                channel_id_from_db = post.get("channel_id")
+        # Пропускаем если нет message_id или channel_id
+        posts = [post for post in old_posts if post.get("message_id") and post.get("channel_id")]
+        if len(posts) < len(old_posts):
+            logger.debug(
+                f"🧹 Skipping {len(old_posts) - len(posts)} posts: missing message_id or channel_id"
+            )
 
-                # Пропускаем если нет message_id или channel_id
-                if not message_id or not channel_id_from_db:
-                    logger.debug(
-                        f"🧹 Skipping post {post_id}: missing message_id or channel_id"
-                    )
-                    continue
+        checker = get_availability_checker()
+        results = await checker.check_many([post["url"] for post in posts])
 
-                # Используем channel_id из БД, если он есть, иначе используем переданный
-                target_channel_id = (
-                    channel_id_from_db if channel_id_from_db else channel_id
+        dead_posts = []
+        for post in posts:
+            result = results[post["url"]]
+            if result.is_gone:
+                logger.info(
+                    f"🧹 Dead link detected for post {post['id']} "
+                    f"({result.status}: {result.reason}): {post['url'][:100]}"
                 )
+                dead_posts.append(post)
+
+        if dead_posts:
+            removal = await remove_channel_posts(
+                bot_instance,
+                [
+                    # channel_id из БД, иначе переданный
+                    {"chat_id": post.get("channel_id") or channel_id, "message_id": post["message_id"]}
+                    for post in dead_posts
+                ],
+            )
+            stats["errors"] += removal["errors"]
 
-                logger.debug(f"🧹 Checking post {post_id}: {url[:100]}...")
-
-                # Проверяем, мертвая ли ссылка
-                is_dead, reason = await check_url_is_dead(url, http_client)
-
-                if is_dead:
-                    logger.info(
-                        f"🧹 Dead link detected for post {post_id} (reason: {reason}): {url[:100]}"
-                    )
-
-                    # Удаляем сообщение из канала
-                    try:
-                        await bot_instance.delete_message(
-                            chat_id=target_channel_id, message_id=message_id
-                        )
-                        logger.info(
-                            f"✅ Deleted message {message_id} from channel {target_channel_id} "
-                            f"(post_id: {post_id})"
-                        )
-                    except Exception as e:
-                        error_msg = str(e)
-                        # Игнорируем ошибку если сообщение уже удалено
-                        if (
-                            "message to delete not found" not in error_msg.lower()
-                            and "bad request: message can't be deleted"
-                            not in error_msg.lower()
-                        ):
-                            logger.warning(
-                                f"⚠️ Failed to delete message {message_id} from channel {target_channel_id}: {e}"
-                            )
-                            stats["errors"] += 1
-                        else:
-                            logger.debug(
-                                f"ℹ️ Message {message_id} already deleted or can't be deleted (post_id: {post_id})"
-                            )
-
-                    # Помечаем запись как удаленную в истории
-                    try:
-                        db.mark_history_as_deleted(post_id)
-                        stats["deleted"] += 1
-                        logger.info(f"✅ Marked history entry {post_id} as deleted")
-                    except Exception as e:
-                        logger.warning(
-                            f"⚠️ Failed to mark history entry {post_id} as deleted: {e}"
-                        )
-                        stats["errors"] += 1
-                else:
-                    logger.debug(f"✅ Link is alive for post {post_id}: {url[:100]}")
-
-        finally:
-            # Закрываем HTTP клиент
-            await http_client.close()
+        # Помечаем записи как удаленные в истории
+        for post in dead_posts:
+            try:
+                db.mark_history_as_deleted(post["id"])
+                stats["deleted"] += 1
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ Failed to mark history entry {post['id']} as deleted: {e}"
+                )
+                stats["errors"] += 1
 
         logger.info(
             f"🧹 Cleanup completed: checked={stats['checked']}, "
-            f"deleted={stats['deleted']}, errors={stats['errors']}"
+            f"deleted={stats['deleted']}, errors={stats['errors']}, "
+            f"checker={checker.get_stats()}"
         )
 
     except Exception as e:
@@ -212,7 +130,8 @@ async def cleanup_old_posts(
     return stats
 
 
-async def cleanup_worker(
+def schedule_cleanup(
+    scheduler,
     db,
     bot_instance,
     channel_id: str,
@@ -220,39 +139,32 @@ async def cleanup_worker(
     hours_threshold: int = 48,
 ):
     """
-    Фоновый воркер для периодической очистки старых постов.
+    Регистрирует периодическую очистку старых постов в планировщике.
 
     Args:
+        scheduler: SchedulerService
         db: Экземпляр Database
         bot_instance: Экземпляр бота (aiogram Bot)
         channel_id: ID канала для удаления сообщений
         interval_hours: Интервал между запусками очистки в часах (по умолчанию 24)
         hours_threshold: Минимальный возраст поста в часах для проверки (по умолчанию 48)
     """
-    import asyncio
+
+    async def run_cleanup():
+        logger.info("🧹 Запуск запланированной очистки старых постов...")
+        stats = await cleanup_old_posts(db, bot_instance, channel_id, hours_threshold)
+
+        logger.info(
+            f"✅ Запланированная очистка завершена: "
+            f"проверено={stats['checked']}, удалено={stats['deleted']}, ошибок={stats['errors']}"
+        )
 
     logger.info(
-        f"🔄 Cleanup worker запущен "
+        f"🔄 Cleanup job запланирован "
         f"(интервал: {interval_hours} часов, threshold: {hours_threshold} часов)"
     )
 
-    # Ждем немного перед первой очисткой, чтобы бот успел запуститься
-    await asyncio.sleep(3600)  # 1 час
-
-    while True:
-        try:
-            logger.info("🧹 Запуск запланированной очистки старых постов...")
-            stats = await cleanup_old_posts(
-                db, bot_instance, channel_id, hours_threshold
-            )
-
-            logger.info(
-                f"✅ Запланированная очистка завершена: "
-                f"проверено={stats['checked']}, удалено={stats['deleted']}, ошибок={stats['errors']}"
-            )
-
-        except Exception as e:
-            logger.exception(f"❌ Ошибка в cleanup_worker: {e}")
-
-        # Ждем указанный интервал перед следующей очисткой
-        await asyncio.sleep(interval_hours * 3600)  # Конвертируем часы в секунды
+    # Первый запуск не раньше чем через час, чтобы бот успел запуститься
+    return scheduler.add_interval_task(
+        interval_hours * 3600, run_cleanup, name="dead_link_cleanup", initial_delay=3600
+    )
@@ -0,0 +1,310 @@
+"""
+Crawl Pipeline - Потоковый конвейер парсинга каталогов
+
+fetch -> parse -> validate -> dedup -> enqueue
+
+Стадии связаны ограниченными asyncio.Queue: медленная стадия тормозит
+предыдущие, а парсинг идет параллельно с ожиданием сети и rate limiter.
+Fetch дополнительно ждет, пока буфер публикации не разгрузится (backpressure).
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import config
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('fetch', 'parse', 'validate', 'dedup', 'enqueue')
+
+
+@dataclass
+class CrawlPage:
+    """Страница, проходящая через конвейер"""
+    url: str
+    html: Optional[str] = None
+    products: List[Dict] = field(default_factory=list)
+    parsed_count: int = 0
+    added: int = 0
+    skipped: int = 0
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+class StageMetrics:
+    """Пропускная способность и латентность одной стадии"""
+
+    def __init__(self):
+        self.pages = 0
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_latency = 0.0
+
+    def record(self, started: float, items: int = 0):
+        elapsed = time.monotonic() - started
+        self.pages += 1
+        self.items += items
+        self.busy_seconds += elapsed
+        self.max_latency = max(self.max_latency, elapsed)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'pages': self.pages,
+            'items': self.items,
+            'errors': self.errors,
+            'avg_latency_ms': round(self.busy_seconds / self.pages * 1000, 1) if self.pages else 0.0,
+            'max_latency_ms': round(self.max_latency * 1000, 1),
+            'items_per_sec': round(self.items / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+        }
+
+
+class PipelineMetrics:
+    """Накопительные метрики конвейера (переживают отдельные запуски)"""
+
+    def __init__(self):
+        self.stages: Dict[str, StageMetrics] = {stage: StageMetrics() for stage in STAGES}
+        self.runs = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+        self.added = 0
+        self.skipped = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'runs': self.runs,
+            'stages': {stage: stats.as_dict() for stage, stats in self.stages.items()},
+            'backpressure_waits': self.backpressure_waits,
+            'backpressure_seconds': round(self.backpressure_seconds, 1),
+            'added': self.added,
+            'skipped': self.skipped,
+        }
+
+
+class CrawlPipeline:
+    """
+    Конвейер обработки страниц каталога
+
+    Args:
+        fetch: async (url) -> html | None
+        parse: async (page) -> products (page.html уже заполнен)
+        enqueue: async (page, product) -> None
+        validate: async (product) -> bool, по умолчанию все товары валидны
+        dedup: async (products) -> новые products, по умолчанию без дедупликации
+        on_page: вызывается после полной обработки страницы (обновить кэш/состояние)
+        backlog_depth: () -> глубина буфера публикации для backpressure
+        metrics: общий PipelineMetrics, чтобы копить статистику между запусками
+    """
+
+    BACKPRESSURE_INTERVAL = 5.0  # Секунд между проверками глубины буфера
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Optional[str]]],
+        parse: Callable[[CrawlPage], Awaitable[List[Dict]]],
+        enqueue: Callable[[CrawlPage, Dict], Awaitable[None]],
+        validate: Optional[Callable[[Dict], Awaitable[bool]]] = None,
+        dedup: Optional[Callable[[List[Dict]], Awaitable[List[Dict]]]] = None,
+        on_page: Optional[Callable[[CrawlPage], None]] = None,
+        backlog_depth: Optional[Callable[[], int]] = None,
+        host_concurrency: int = None,
+        parse_workers: int = None,
+        queue_size: int = None,
+        max_backlog: int = None,
+        metrics: Optional[PipelineMetrics] = None,
+    ):
+        self.fetch = fetch
+        self.parse = parse
+        self.enqueue = enqueue
+        self.validate = validate
+        self.dedup = dedup
+        self.on_page = on_page
+        self.backlog_depth = backlog_depth
+        self.host_concurrency = host_concurrency or getattr(config, 'CRAWL_HOST_CONCURRENCY', 3)
+        self.parse_workers = parse_workers or getattr(config, 'CRAWL_PARSE_WORKERS', 2)
+        self.queue_size = queue_size or getattr(config, 'CRAWL_STAGE_QUEUE_SIZE', 8)
+        self.max_backlog = max_backlog or getattr(config, 'CRAWL_MAX_PUBLISH_BACKLOG', 500)
+
+        self.metrics = metrics or PipelineMetrics()
+        self.added = 0
+        self.skipped = 0
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stopped = False
+
+    def stop(self):
+        """Не брать новые URL в работу (уже загруженные страницы дорабатываются)"""
+        self._stopped = True
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        return self._host_semaphores[host]
+
+    async def _wait_for_backlog(self):
+        """Backpressure: не качаем новые страницы, пока буфер публикации переполнен"""
+        if not self.backlog_depth:
+            return
+        started = time.monotonic()
+        waited = False
+        while not self._stopped:
+            try:
+                depth = self.backlog_depth()
+            except Exception as e:
+                logger.debug(f"Failed to get publish backlog depth: {e}")
+                break
+            if depth < self.max_backlog:
+                break
+            if not waited:
+                waited = True
+                self.metrics.backpressure_waits += 1
+                logger.info(f"Publish backlog {depth} >= {self.max_backlog}, pausing fetch")
+            await asyncio.sleep(self.BACKPRESSURE_INTERVAL)
+        if waited:
+            self.metrics.backpressure_seconds += time.monotonic() - started
+
+    async def _fetch_worker(self, urls: asyncio.Queue, out: asyncio.Queue):
+        while not self._stopped:
+            try:
+                url = urls.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._wait_for_backlog()
+            if self._stopped:
+                return
+            stats = self.metrics.stages['fetch']
+            started = time.monotonic()
+            try:
+                async with self._host_semaphore(url):
+                    html = await self.fetch(url)
+            except Exception as e:
+                logger.error(f"Fetch stage failed for {url}: {e}")
+                html = None
+            stats.record(started, 1 if html else 0)
+            if not html:
+                stats.errors += 1
+                continue
+            await out.put(CrawlPage(url=url, html=html))
+
+    async def _parse_worker(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while (page := await inp.get()) is not None:
+            stats = self.metrics.stages['parse']
+            started = time.monotonic()
+            try:
+                page.products = await self.parse(page)
+            except Exception as e:
+                logger.error(f"Parse stage failed for {page.url}: {e}")
+                stats.errors += 1
+                page.products = []
+            page.parsed_count = len(page.products)
+            page.html = None  # HTML больше не нужен, освобождаем память
+            stats.record(started, page.parsed_count)
+            await out.put(page)
+
+    async def _validate_worker(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while (page := await inp.get()) is not None:
+            stats = self.metrics.stages['validate']
+            started = time.monotonic()
+            if self.validate:
+                valid = []
+                for product in page.products:
+                    try:
+                        ok = await self.validate(product)
+                    except Exception as e:
+                        logger.warning(f"Validate stage failed for {product.get('market_id', 'unknown')}: {e}")
+                        stats.errors += 1
+                        ok = False
+                    if ok:
+                        valid.append(product)
+                page.skipped += len(page.products) - len(valid)
+                page.products = valid
+            stats.record(started, len(page.products))
+            await out.put(page)
+
+    async def _dedup_worker(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while (page := await inp.get()) is not None:
+            stats = self.metrics.stages['dedup']
+            started = time.monotonic()
+            if self.dedup and page.products:
+                try:
+                    new_products = await self.dedup(page.products)
+                except Exception as e:
+                    logger.error(f"Dedup stage failed for {page.url}: {e}")
+                    stats.errors += 1
+                    new_products = []
+                page.skipped += len(page.products) - len(new_products)
+                page.products = new_products
+            stats.record(started, len(page.products))
+            await out.put(page)
+
+    async def _enqueue_worker(self, inp: asyncio.Queue):
+        while (page := await inp.get()) is not None:
+            stats = self.metrics.stages['enqueue']
+            started = time.monotonic()
+            for product in page.products:
+                try:
+                    await self.enqueue(page, product)
+                    page.added += 1
+                except Exception as e:
+                    logger.warning(f"Enqueue stage failed for {product.get('market_id', 'unknown')}: {e}")
+                    stats.errors += 1
+                    page.skipped += 1
+            stats.record(started, page.added)
+            self.added += page.added
+            self.skipped += page.skipped
+            self.metrics.added += page.added
+            self.metrics.skipped += page.skipped
+            if self.on_page:
+                try:
+                    self.on_page(page)
+                except Exception as e:
+                    logger.warning(f"on_page callback failed for {page.url}: {e}")
+
+    async def run(self, urls: List[str]) -> Dict[str, int]:
+        """
+        Прогнать URL через конвейер (один запуск на экземпляр)
+
+        Returns:
+            {'added': ..., 'skipped': ...}
+        """
+        if not urls:
+            return {'added': 0, 'skipped': 0}
+        self.metrics.runs += 1
+
+        url_queue: asyncio.Queue = asyncio.Queue()
+        for url in urls:
+            url_queue.put_nowait(url)
+        parse_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        validate_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        dedup_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        enqueue_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        hosts = {urlparse(url).netloc for url in urls}
+        fetch_workers = min(len(urls), self.host_concurrency * len(hosts))
+        fetchers = [asyncio.create_task(self._fetch_worker(url_queue, parse_q)) for _ in range(fetch_workers)]
+        parsers = [asyncio.create_task(self._parse_worker(parse_q, validate_q)) for _ in range(self.parse_workers)]
+        validator = asyncio.create_task(self._validate_worker(validate_q, dedup_q))
+        deduper = asyncio.create_task(self._dedup_worker(dedup_q, enqueue_q))
+        enqueuer = asyncio.create_task(self._enqueue_worker(enqueue_q))
+
+        try:
+            # Останавливаем стадии по очереди: sentinel уходит после того, как предыдущая стадия опустела
+            await asyncio.gather(*fetchers)
+            for _ in parsers:
+                await parse_q.put(None)
+            await asyncio.gather(*parsers)
+            await validate_q.put(None)
+            await validator
+            await dedup_q.put(None)
+            await deduper
+            await enqueue_q.put(None)
+            await enqueuer
+        except BaseException:
+            for task in (*fetchers, *parsers, validator, deduper, enqueuer):
+                task.cancel()
+            raise
+
+        return {'added': self.added, 'skipped': self.skipped}
@@ -0,0 +1,299 @@
+"""
+Dedup Service - Пакетная дедупликация товаров с Bloom-фильтром
+
+Вместо SELECT / SET NX на каждый товар каталога:
+- Bloom-фильтр в памяти по normalized_url и product_key отсекает заведомо новые товары
+- Точная проверка (SQLite batch IN, Redis pipeline) только для срабатываний фильтра
+- Снимок фильтра опционально хранится в Redis и переживает перезапуск
+- SQLite через AsyncDatabase, синхронный Redis-клиент - в asyncio.to_thread:
+  event loop не блокируется
+- Товары с картинкой (image_phash / image_bytes) дополнительно проверяются
+  индексом похожих картинок (services/image_dedup_service)
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import config
+from utils.product_key import normalize_url, generate_product_key_from_data
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Bloom-фильтр на bytearray с double hashing (blake2b)"""
+
+    def __init__(self, capacity: int = 200_000, error_rate: float = 0.01):
+        capacity = max(int(capacity), 1)
+        error_rate = min(max(float(error_rate), 1e-6), 0.5)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> List[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            if item:
+                self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def dumps(self) -> str:
+        """Сериализация в base64 (Redis-клиент работает с decode_responses=True)"""
+        header = f"{self.capacity}:{self.error_rate}:{self.count}:".encode("ascii")
+        return base64.b64encode(header + bytes(self.bits)).decode("ascii")
+
+    @classmethod
+    def loads(cls, payload: str) -> "BloomFilter":
+        raw = base64.b64decode(payload)
+        capacity, error_rate, count, bits = raw.split(b":", 3)
+        bloom = cls(int(capacity), float(error_rate))
+        if len(bits) != len(bloom.bits):
+            raise ValueError("Bloom snapshot size mismatch")
+        bloom.bits = bytearray(bits)
+        bloom.count = int(count)
+        return bloom
+
+
+class DedupService:
+    """
+    Пакетная дедупликация товаров
+
+    Источники истины:
+    - SQLite: history / queue (по normalized_url), posted_products (по product_key)
+    - Redis: seen_products:{product_key} с TTL
+
+    Bloom-фильтр - только ускоритель: промах фильтра означает "точно новый"
+    относительно последнего прогрева, срабатывание всегда подтверждается точно.
+    """
+
+    REBUILD_INTERVAL = 3600  # Периодический прогрев из БД (фильтр не умеет удалять ключи)
+    SNAPSHOT_INTERVAL = 60  # Не чаще раза в минуту пишем снимок в Redis
+
+    def __init__(self, db=None, redis=None, capacity: int = None, error_rate: float = None,
+                 seen_ttl: int = None, days_to_check: int = None, image_index=None):
+        self.db = db
+        self.redis = redis
+        self.image_index = image_index
+        self.capacity = capacity or getattr(config, 'DEDUP_BLOOM_CAPACITY', 200_000)
+        self.error_rate = error_rate or getattr(config, 'DEDUP_BLOOM_ERROR_RATE', 0.01)
+        self.seen_ttl = seen_ttl or getattr(config, 'DEDUP_SEEN_TTL', 604800)
+        self.days_to_check = days_to_check or getattr(config, 'DEDUP_DAYS_CHECK', 7)
+        self.bloom: Optional[BloomFilter] = None
+        self._warmed_at = 0.0
+        self._snapshot_at = 0.0
+        self.metrics = {
+            'checked': 0,
+            'bloom_misses': 0,
+            'bloom_hits': 0,
+            'confirmed_duplicates': 0,
+            'false_positives': 0,
+            'batch_duplicates': 0,
+            'claim_conflicts': 0,
+            'exact_queries': 0,
+            'image_duplicates': 0,
+        }
+
+    @staticmethod
+    def product_keys(product: Dict) -> Tuple[str, str]:
+        """(normalized_url, product_key) товара"""
+        return normalize_url(product.get('url', '')), generate_product_key_from_data(product)
+
+    async def _ensure_warm(self) -> None:
+        """Прогрев фильтра из БД (периодически) и снимка Redis (при старте)"""
+        now = time.time()
+        if self.bloom is not None and (self.db is None or now - self._warmed_at < self.REBUILD_INTERVAL):
+            return
+
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        if self.db is not None:
+            try:
+                bloom.update(await self.db.get_dedup_keys(self.days_to_check))
+            except Exception as e:
+                logger.warning(f"Failed to warm dedup bloom from DB: {e}")
+
+        if self.bloom is None and self.redis:
+            # Снимок хранит и ключи, известные только Redis (seen_products)
+            payload = await asyncio.to_thread(self.redis.load_dedup_snapshot)
+            try:
+                snapshot = BloomFilter.loads(payload) if payload else None
+            except Exception as e:
+                logger.warning(f"Failed to restore dedup bloom snapshot: {e}")
+                snapshot = None
+            if snapshot is not None and len(snapshot.bits) == len(bloom.bits):
+                bloom.bits = bytearray(a | b for a, b in zip(bloom.bits, snapshot.bits))
+                bloom.count += snapshot.count
+
+        self.bloom = bloom
+        self._warmed_at = now
+        logger.debug(f"Dedup bloom warmed: {bloom.count} keys, {len(bloom.bits)} bytes")
+
+    async def _confirm_existing(self, hits: List[Tuple[Dict, str, str]]) -> Set[str]:
+        """Точная проверка срабатываний фильтра: 1-3 запроса на всю пачку"""
+        urls = [nurl for _, nurl, _ in hits if nurl]
+        keys = [pkey for _, _, pkey in hits if pkey]
+        found: Set[str] = set()
+        if self.db is not None:
+            self.metrics['exact_queries'] += 2
+            found |= await self.db.find_existing_normalized_urls(urls)
+            found |= await self.db.find_recent_product_keys(keys, self.days_to_check)
+        if self.redis:
+            self.metrics['exact_queries'] += 1
+            found.update(await asyncio.to_thread(self.redis.find_seen_products, keys))
+        return found
+
+    async def filter_new(self, products: List[Dict]) -> List[Dict]:
+        """
+        Оставить только новые товары (порядок сохраняется)
+
+        Args:
+            products: Товары каталога (url, market_id, title, vendor, offerid)
+
+        Returns:
+            Товары, которых нет ни в истории, ни в очереди, ни среди недавно увиденных
+        """
+        await self._ensure_warm()
+        candidates = []
+        batch_keys: Set[str] = set()
+        for product in products:
+            nurl, pkey = self.product_keys(product)
+            if nurl in batch_keys or pkey in batch_keys:
+                self.metrics['batch_duplicates'] += 1
+                continue
+            batch_keys.update(k for k in (nurl, pkey) if k)
+            candidates.append((product, nurl, pkey))
+
+        self.metrics['checked'] += len(candidates)
+        hits = [c for c in candidates if (c[1] and c[1] in self.bloom) or c[2] in self.bloom]
+        self.metrics['bloom_hits'] += len(hits)
+        self.metrics['bloom_misses'] += len(candidates) - len(hits)
+        if not hits:
+            return await self._filter_similar_images([product for product, _, _ in candidates])
+
+        found = await self._confirm_existing(hits)
+        duplicates = sum(1 for _, nurl, pkey in hits if nurl in found or pkey in found)
+        self.metrics['confirmed_duplicates'] += duplicates
+        self.metrics['false_positives'] += len(hits) - duplicates
+        return await self._filter_similar_images(
+            [p for p, nurl, pkey in candidates if nurl not in found and pkey not in found]
+        )
+
+    async def _filter_similar_images(self, products: List[Dict]) -> List[Dict]:
+        """Отбросить товары с картинкой, похожей на уже опубликованную (или на соседа по пачке)"""
+        with_image = [p for p in products if p.get('image_phash') or p.get('image_bytes')]
+        if not with_image:
+            return products
+        if self.image_index is None:
+            from services.image_dedup_service import ImageDedupIndex
+
+            self.image_index = ImageDedupIndex()
+        if self.db is not None and self.image_index.needs_refresh():
+            try:
+                self.image_index.load(await self.db.get_image_phashes())
+            except Exception as e:
+                logger.warning(f"Failed to warm image dedup index from DB: {e}")
+        kept = {id(p) for p in self.image_index.filter_new(with_image)}
+        dropped = {id(p) for p in with_image} - kept
+        self.metrics['image_duplicates'] += len(dropped)
+        return [p for p in products if id(p) not in dropped]
+
+    async def claim(self, products: List[Dict]) -> List[Dict]:
+        """
+        Пометить товары как увиденные; возвращает те, что удалось "захватить"
+
+        С Redis - atomic SET NX пачкой (race condition safe между процессами),
+        без Redis - все товары считаются захваченными этим процессом.
+        """
+        if not products:
+            return []
+        await self._ensure_warm()
+        keyed = [(p, *self.product_keys(p)) for p in products]
+        claimed = products
+        if self.redis:
+            results = await asyncio.to_thread(
+                self.redis.claim_seen_products, [pkey for _, _, pkey in keyed], self.seen_ttl
+            )
+            claimed = [p for (p, _, _), ok in zip(keyed, results) if ok]
+            self.metrics['claim_conflicts'] += len(products) - len(claimed)
+        for _, nurl, pkey in keyed:
+            self.bloom.update((nurl, pkey))
+        await self._maybe_snapshot()
+        return claimed
+
+    async def claim_new(self, products: List[Dict]) -> List[Dict]:
+        """filter_new + claim одной операцией"""
+        return await self.claim(await self.filter_new(products))
+
+    def remember(self, product: Dict) -> None:
+        """
+        Добавить ключи товара в фильтр (для записей в БД в обход claim)
+
+        Без I/O: непрогретый фильтр при прогреве и так прочитает запись из БД.
+        """
+        if self.bloom is not None:
+            self.bloom.update(self.product_keys(product))
+
+    async def _maybe_snapshot(self) -> None:
+        if not self.redis or time.time() - self._snapshot_at < self.SNAPSHOT_INTERVAL:
+            return
+        self._snapshot_at = time.time()
+        await asyncio.to_thread(self.redis.save_dedup_snapshot, self.bloom.dumps(), self.seen_ttl)
+
+    def get_metrics(self) -> Dict:
+        """Метрики для мониторинга"""
+        return {
+            **self.metrics,
+            'bloom_keys': self.bloom.count if self.bloom else 0,
+            'bloom_bytes': len(self.bloom.bits) if self.bloom else 0,
+        }
+
+
+# Глобальный экземпляр
+_dedup_service = None
+
+
+def remember_product(product: Dict) -> None:
+    """
+    Добавить ключи записанного в БД товара в фильтр общего DedupService
+
+    Для путей записи в обход claim (add_to_queue, add_post_to_history). Без I/O:
+    если сервис еще не создан, его фильтр прогреется из БД вместе с этой записью.
+    """
+    if _dedup_service is not None:
+        _dedup_service.remember(product)
+
+
+async def get_dedup_service() -> DedupService:
+    """Get global dedup service instance"""
+    global _dedup_service
+    if _dedup_service is None:
+        from database_async import get_async_db
+        from redis_cache import get_redis_cache
+
+        redis = None
+        if config.USE_REDIS:
+            try:
+                redis = get_redis_cache()
+            except Exception as e:
+                logger.warning(f"Redis unavailable for dedup, using SQLite only: {e}")
+        _dedup_service = DedupService(db=await get_async_db(), redis=redis)
+    return _dedup_service
@@ -178,6 +178,7 @@ class DistributedRateLimiter:
 _yandex_api_limiter: Optional[DistributedRateLimiter] = None
 _yandex_catalog_limiter: Optional[DistributedRateLimiter] = None
 _telegram_api_limiter: Optional[DistributedRateLimiter] = None
+_yandex_product_limiter: Optional[DistributedRateLimiter] = None
 
 
 def get_yandex_api_limiter() -> DistributedRateLimiter:
@@ -220,6 +221,26 @@ def get_yandex_catalog_limiter() -> DistributedRateLimiter:
     return _yandex_catalog_limiter
 
 
+def get_yandex_product_limiter() -> DistributedRateLimiter:
+    """Get rate limiter for product page checks (dead-link / sold-out sweeps)."""
+    global _yandex_product_limiter
+    if _yandex_product_limiter is None:
+        redis_client = None
+        try:
+            redis_cache = get_redis_cache()
+            redis_client = redis_cache.client if redis_cache else None
+        except:
+            pass
+
+        _yandex_product_limiter = DistributedRateLimiter(
+            redis_client=redis_client,
+            key="yandex_product",
+            limit=getattr(config, "SWEEPER_REQUESTS_PER_MINUTE", 120),
+            window_seconds=60
+        )
+    return _yandex_product_limiter
+
+
 def get_telegram_api_limiter() -> DistributedRateLimiter:
     """Get rate limiter for Telegram Bot API calls."""
     global _telegram_api_limiter
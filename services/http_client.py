@@ -4,12 +4,13 @@ import asyncio
 import logging
 import random
 import time
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Mapping, Tuple
 from collections import deque
 import aiohttp
-from aiohttp import ClientSession, ClientTimeout, ClientProxyConnectionError
+from aiohttp import ClientProxyConnectionError
 import config
-from services.session_manager import get_session_manager
+from services.http_registry import get_http_registry
+from services.http_response_cache import CachedResponse, get_response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +62,7 @@ class HTTPClient:
         # Defer session creation until needed (lazy initialization)
         self._session = None
         self.rate_limiter = RateLimiter(max_requests=10, time_window=60)
+        self.response_cache = get_response_cache()
         # Load proxy list from config
         self.proxy_list: List[str] = getattr(config, "PROXY_LIST", [])
         self._initialized = True
@@ -76,21 +78,9 @@ class HTTPClient:
 
     @property
     def session(self):
-        """Lazy initialization of aiohttp ClientSession"""
-        if self._session is None:
-            timeout = ClientTimeout(total=30, connect=10)
-            connector = aiohttp.TCPConnector(limit=100, limit_per_host=30)
-            self._session = ClientSession(
-                timeout=timeout,
-                connector=connector,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-                },
-            )
-            # Регистрируем сессию в менеджере для автоматического закрытия
-            session_manager = get_session_manager()
-            session_manager.register_session(self._session)
-            logger.debug("HTTPClient session created and registered")
+        """Общая сессия из реестра HTTP клиентов (пул соединений один на все сервисы)"""
+        # Реестр сам кэширует сессию и пересоздает ее в новом event loop
+        self._session = get_http_registry().session("default")
         return self._session
 
     def _get_random_proxy(self) -> Optional[str]:
@@ -160,10 +150,63 @@ class HTTPClient:
         return None
 
     async def fetch_text(
-        self, url: str, headers: Optional[Dict] = None, max_retries: int = 3
+        self,
+        url: str,
+        headers: Optional[Dict] = None,
+        max_retries: int = 3,
+        max_age: Optional[float] = None,
+        use_cache: bool = True,
     ) -> Optional[str]:
-        """Выполняет GET запрос и возвращает текст ответа с поддержкой ротации прокси"""
-        await self.rate_limiter.acquire()
+        """Выполняет GET запрос и возвращает текст ответа с поддержкой ротации прокси
+
+        Ответы 200 кэшируются (services/http_response_cache): ответ не старше
+        max_age секунд берется из кэша, устаревший перепроверяется по ETag/Last-Modified,
+        одновременные запросы одного URL объединяются.
+
+        Args:
+            max_age: Допустимый возраст кэшированного ответа (None - HTTP_CACHE_DEFAULT_TTL)
+            use_cache: False - всегда в сеть
+        """
+        if not use_cache or not self.response_cache.enabled:
+            result = await self._fetch_page(url, headers, max_retries)
+            return result[1] if result and result[0] == 200 else None
+
+        async def fetch(validators: Dict[str, str]):
+            return await self._fetch_page(url, {**(headers or {}), **validators}, max_retries)
+
+        response = await self.response_cache.get_or_fetch(url, fetch, max_age)
+        return response.text if response is not None and response.status == 200 else None
+
+    async def fetch_page(
+        self,
+        url: str,
+        headers: Optional[Dict] = None,
+        max_retries: int = 3,
+        max_age: Optional[float] = None,
+        limiter=None,
+    ) -> Optional[CachedResponse]:
+        """Как fetch_text, но со статусом ответа (200 или 404/410 - страницы нет)
+
+        Args:
+            limiter: Ограничитель частоты вместо встроенного (acquire() только
+                для запросов в сеть - ответ из кэша лимит не тратит)
+
+        Returns:
+            CachedResponse или None при сетевой ошибке/неожиданном статусе
+        """
+        async def fetch(validators: Dict[str, str]):
+            return await self._fetch_page(url, {**(headers or {}), **validators}, max_retries, limiter)
+
+        if not self.response_cache.enabled:
+            result = await fetch({})
+            return CachedResponse.build(result[3] or url, result[0], result[1] or "", result[2]) if result else None
+        return await self.response_cache.get_or_fetch(url, fetch, max_age)
+
+    async def _fetch_page(
+        self, url: str, headers: Optional[Dict] = None, max_retries: int = 3, limiter=None
+    ) -> Optional[Tuple[int, Optional[str], Mapping[str, str], str]]:
+        """Сетевой запрос для fetch_text: (status, text, headers, final_url) для 200/304/404/410"""
+        await (limiter or self.rate_limiter).acquire()
 
         last_error = None
         used_proxies = (
@@ -199,7 +242,11 @@ class HTTPClient:
                         text = await resp.text()
                         if proxy:
                             logger.debug(f"Successfully fetched {url[:100]} via proxy")
-                        return text
+                        return resp.status, text, resp.headers, str(resp.url)
+                    elif resp.status == 304:  # Не изменилось с кэшированной версии
+                        return resp.status, None, resp.headers, str(resp.url)
+                    elif resp.status in (404, 410):  # Страницы нет - повтор не поможет
+                        return resp.status, "", resp.headers, str(resp.url)
                     elif resp.status == 429:  # Too Many Requests
                         wait_time = 2**attempt
                         logger.warning(
@@ -363,18 +410,12 @@ class HTTPClient:
 
     async def close(self):
         """
-        Закрывает HTTP сессию.
-        FIXED: Added graceful cleanup to prevent connection leaks.
+        Отпускает сессию. Сама сессия и соединения принадлежат реестру
+        и закрываются в get_http_registry().close_all() при shutdown.
         """
-        if self._session and not self._session.closed:
-            # Удаляем из менеджера перед закрытием
-            session_manager = get_session_manager()
-            session_manager.unregister_session(self._session)
-            await self._session.close()
-            # Wait for connections to close gracefully
-            await asyncio.sleep(0.25)
-            logger.info("HTTPClient session closed")
+        if self._session is not None:
             self._session = None
+            logger.info("HTTPClient session released")
     
     async def __aenter__(self):
         """Context manager support"""
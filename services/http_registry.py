@@ -0,0 +1,299 @@
+# services/http_registry.py
+"""
+Реестр HTTP клиентов - общий пул соединений для всех сервисов скрапинга
+
+Раньше каждый сервис (scraper, SmartSearchService, ProductValidator, HTTPClient,
+xhr_reproducer) держал свой пул, и каждый запрос товара заново платил за TCP+TLS.
+Теперь:
+- один TCPConnector с keep-alive и DNS кэшем на все aiohttp сессии; сессии
+  различаются только профилем (заголовки, таймауты) и не владеют коннектором
+- SOCKS прокси получают отдельный коннектор на прокси (aiohttp_socks, опционально),
+  HTTP прокси передаются в запрос и пулятся общим коннектором по ключу прокси
+- httpx клиент (xhr_reproducer) тоже общий, с HTTP/2 если установлен h2
+- TraceConfig считает новые и переиспользованные соединения -> reuse_ratio
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiohttp
+import httpx
+
+import config
+from services.session_manager import get_session_manager
+
+logger = logging.getLogger(__name__)
+
+try:
+    from aiohttp_socks import ProxyConnector
+    SOCKS_AVAILABLE = True
+except ImportError:
+    ProxyConnector = None
+    SOCKS_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+BROWSER_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+
+
+def _user_agent() -> str:
+    return config.USER_AGENT or "Mozilla/5.0 (compatible; MarketBot/1.0)"
+
+
+def _profiles() -> Dict[str, Dict[str, Any]]:
+    """Профили сессий: заголовки и таймауты по умолчанию"""
+    return {
+        "default": {
+            "headers": {
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            },
+            "timeout": aiohttp.ClientTimeout(total=30, connect=10),
+        },
+        "catalog": {
+            "headers": {
+                "User-Agent": _user_agent(),
+                "Accept": BROWSER_ACCEPT,
+                "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+                "Accept-Encoding": "gzip, deflate, br",
+            },
+            "timeout": aiohttp.ClientTimeout(total=30),
+        },
+        "validator": {
+            "headers": {
+                "User-Agent": _user_agent(),
+                "Accept": BROWSER_ACCEPT,
+                "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+            },
+            "timeout": aiohttp.ClientTimeout(total=15),
+        },
+        "bare": {"headers": {}, "timeout": aiohttp.ClientTimeout(total=30)},
+    }
+
+
+def _is_socks(proxy_url: Optional[str]) -> bool:
+    return bool(proxy_url) and proxy_url.lower().startswith("socks")
+
+
+class HttpClientRegistry:
+    """Общие aiohttp сессии и httpx клиент поверх одного пула соединений"""
+
+    def __init__(
+        self,
+        limit: int = None,
+        limit_per_host: int = None,
+        keepalive_timeout: float = None,
+        dns_ttl: int = None,
+        http2: bool = None,
+    ):
+        self.limit = limit or getattr(config, "HTTP_POOL_LIMIT", 100)
+        self.limit_per_host = limit_per_host or getattr(config, "HTTP_POOL_LIMIT_PER_HOST", 30)
+        self.keepalive_timeout = keepalive_timeout or getattr(config, "HTTP_KEEPALIVE_TIMEOUT", 30)
+        self.dns_ttl = dns_ttl or getattr(config, "HTTP_DNS_CACHE_TTL", 300)
+        self.http2 = (getattr(config, "HTTP2_ENABLED", True) if http2 is None else http2) and HTTP2_AVAILABLE
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connectors: Dict[Optional[str], aiohttp.BaseConnector] = {}
+        self._sessions: Dict[Tuple[str, Optional[str]], aiohttp.ClientSession] = {}
+        self._httpx: Optional[httpx.AsyncClient] = None
+        self.stats = defaultdict(int)
+
+    # --- пул соединений ---
+
+    def _bind_loop(self) -> None:
+        """Коннектор привязан к event loop: в новом loop пул создается заново"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is self._loop:
+            return
+        if self._loop is not None and (self._sessions or self._connectors):
+            # Старый loop уже не выполняется - закрыть его сессии нельзя, только забыть
+            manager = get_session_manager()
+            for session in self._sessions.values():
+                manager.unregister_session(session)
+            logger.debug("HTTP registry rebound to a new event loop")
+            self._sessions.clear()
+            self._connectors.clear()
+            self._httpx = None
+        self._loop = loop
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.stats["connections_created"] += 1
+
+        async def on_reuse(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        async def on_dns_hit(session, ctx, params):
+            self.stats["dns_cache_hits"] += 1
+
+        async def on_dns_miss(session, ctx, params):
+            self.stats["dns_cache_misses"] += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        return trace
+
+    def _connector(self, socks_proxy: Optional[str] = None) -> aiohttp.BaseConnector:
+        connector = self._connectors.get(socks_proxy)
+        if connector is None or connector.closed:
+            options = dict(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            if socks_proxy:
+                connector = ProxyConnector.from_url(socks_proxy, **options)
+            else:
+                connector = aiohttp.TCPConnector(**options)
+            self._connectors[socks_proxy] = connector
+        return connector
+
+    def session(self, profile: str = "default", socks_proxy: Optional[str] = None) -> aiohttp.ClientSession:
+        """
+        Общая сессия профиля (не закрывать - пул живет до close_all)
+
+        Args:
+            profile: default / catalog / validator / bare
+            socks_proxy: SOCKS прокси со своим коннектором (см. proxy_session)
+        """
+        self._bind_loop()
+        key = (profile, socks_proxy)
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            settings = _profiles().get(profile) or _profiles()["default"]
+            session = aiohttp.ClientSession(
+                connector=self._connector(socks_proxy),
+                connector_owner=False,
+                headers=settings["headers"],
+                timeout=settings["timeout"],
+                trace_configs=[self._trace_config()],
+            )
+            self._sessions[key] = session
+            get_session_manager().register_session(session)
+            self.stats["sessions_created"] += 1
+            logger.debug(f"HTTP registry session created: {profile} {'via socks' if socks_proxy else ''}")
+        return session
+
+    @asynccontextmanager
+    async def borrow(self, profile: str = "default") -> AsyncIterator[aiohttp.ClientSession]:
+        """Замена `async with aiohttp.ClientSession() as session:` - сессия не закрывается"""
+        yield self.session(profile)
+
+    def proxy_session(
+        self,
+        proxy_url: Optional[str],
+        profile: str = "default",
+        fallback: Optional[aiohttp.ClientSession] = None,
+    ) -> Tuple[aiohttp.ClientSession, Optional[str]]:
+        """
+        Сессия для запроса через прокси
+
+        Returns:
+            (session, proxy=) - для SOCKS прокси с aiohttp_socks прокси уже в коннекторе
+            и proxy= будет None; иначе прокси передается в запрос, а пул соединений
+            к нему ведет общий коннектор
+        """
+        if _is_socks(proxy_url) and SOCKS_AVAILABLE:
+            return self.session(profile, socks_proxy=proxy_url), None
+        return fallback or self.session(profile), proxy_url
+
+    def drop_proxy(self, proxy_url: str) -> None:
+        """Закрыть пул неработающего прокси"""
+        connector = self._connectors.pop(proxy_url, None)
+        sessions = [key for key in self._sessions if key[1] == proxy_url]
+        closing = [self._sessions.pop(key) for key in sessions]
+        if connector is None and not closing:
+            return
+
+        async def close():
+            manager = get_session_manager()
+            for session in closing:
+                manager.unregister_session(session)
+                await session.close()
+            if connector is not None:
+                await connector.close()
+
+        try:
+            asyncio.get_running_loop().create_task(close())
+        except RuntimeError:
+            pass
+        self.stats["proxy_pools_dropped"] += 1
+
+    def httpx_client(self, timeout: float = 30, **limits) -> httpx.AsyncClient:
+        """Общий httpx клиент (HTTP/2 если установлен h2)"""
+        self._bind_loop()
+        if self._httpx is None or self._httpx.is_closed:
+            self._httpx = httpx.AsyncClient(
+                timeout=timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_keepalive_connections=limits.get("max_keepalive_connections", 10),
+                    max_connections=limits.get("max_connections", 20),
+                    keepalive_expiry=self.keepalive_timeout,
+                ),
+                http2=self.http2,
+            )
+            if not self.http2:
+                logger.debug("HTTP/2 not available (h2 package not installed), using HTTP/1.1")
+        return self._httpx
+
+    async def close_all(self) -> None:
+        """Закрыть все сессии, коннекторы и httpx клиент (shutdown)"""
+        manager = get_session_manager()
+        for session in self._sessions.values():
+            manager.unregister_session(session)
+            if not session.closed:
+                await session.close()
+        for connector in self._connectors.values():
+            if not connector.closed:
+                await connector.close()
+        if self._httpx is not None:
+            await self._httpx.aclose()
+        self._sessions.clear()
+        self._connectors.clear()
+        self._httpx = None
+        logger.info("HTTP registry closed")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Сессии, пулы и доля переиспользованных соединений"""
+        created = self.stats["connections_created"]
+        reused = self.stats["connections_reused"]
+        return {
+            "sessions": len(self._sessions),
+            "pools": len(self._connectors),
+            "connections_created": created,
+            "connections_reused": reused,
+            "reuse_ratio": reused / (created + reused) if created + reused else 0.0,
+            "dns_cache_hits": self.stats["dns_cache_hits"],
+            "dns_cache_misses": self.stats["dns_cache_misses"],
+            "proxy_pools_dropped": self.stats["proxy_pools_dropped"],
+            "http2": self.http2,
+            "socks_pools": SOCKS_AVAILABLE,
+        }
+
+
+# Глобальный экземпляр
+_http_registry: Optional[HttpClientRegistry] = None
+
+
+def get_http_registry() -> HttpClientRegistry:
+    """Получить глобальный реестр HTTP клиентов"""
+    global _http_registry
+    if _http_registry is None:
+        _http_registry = HttpClientRegistry()
+    return _http_registry
@@ -0,0 +1,254 @@
+# services/http_response_cache.py
+"""
+HTTP Response Cache - кэш страниц товаров под HTTPClient.fetch_text и scraper
+
+Одну и ту же карточку за несколько минут запрашивают мониторинг цен,
+чистильщик распроданных, валидатор и скрапер. Кэш:
+- хранит сжатое (zlib) тело ответа по нормализованному URL, LRU по байтам
+- свежесть задает вызывающий (max_age), свежий ответ не идет в сеть
+- устаревшая запись с ETag/Last-Modified перепроверяется условным запросом,
+  304 продлевает запись без скачивания тела
+- одновременные запросы одного URL объединяются в один сетевой запрос
+"""
+
+import asyncio
+import logging
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Параметры, не влияющие на содержимое страницы
+TRACKING_PARAMS = {"yclid", "gclid", "fbclid", "_openstat", "ymclid"}
+
+# fetch(conditional_headers) -> (status, text, response_headers, final_url) или None
+FetchFn = Callable[[Dict[str, str]], Awaitable[Optional[Tuple[int, Optional[str], Mapping[str, str], str]]]]
+
+
+def normalize_url(url: str) -> str:
+    """Ключ кэша: схема/хост в нижнем регистре, без фрагмента и трекинг-параметров"""
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.startswith("utm_") and k not in TRACKING_PARAMS
+    )
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), "")
+    )
+
+
+@dataclass
+class CachedResponse:
+    """Ответ в кэше (тело сжато)"""
+
+    url: str  # URL после редиректов
+    status: int
+    body: bytes
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+    @classmethod
+    def build(cls, url: str, status: int, text: str, headers: Mapping[str, str]) -> "CachedResponse":
+        raw = text.encode("utf-8")
+        return cls(
+            url=url,
+            status=status,
+            body=zlib.compress(raw, 6),
+            size=len(raw),
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+        )
+
+    @property
+    def text(self) -> str:
+        return zlib.decompress(self.body).decode("utf-8")
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def validators(self) -> Dict[str, str]:
+        """Заголовки условного запроса"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpResponseCache:
+    """LRU кэш ответов с перепроверкой и объединением одновременных запросов"""
+
+    def __init__(self, max_bytes: int = None, default_max_age: float = None, enabled: bool = None):
+        self.max_bytes = max_bytes or getattr(config, "HTTP_CACHE_MAX_MB", 64) * 1024 * 1024
+        self.default_max_age = (
+            default_max_age if default_max_age is not None
+            else getattr(config, "HTTP_CACHE_DEFAULT_TTL", 300)
+        )
+        self.enabled = getattr(config, "HTTP_CACHE_ENABLED", True) if enabled is None else enabled
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = defaultdict(int)
+
+    def get(self, url: str, max_age: Optional[float] = None) -> Optional[CachedResponse]:
+        """Свежая запись или None"""
+        entry = self._entries.get(normalize_url(url))
+        if entry is None:
+            return None
+        limit = self.default_max_age if max_age is None else max_age
+        return entry if entry.age <= limit else None
+
+    def store(self, url: str, response: CachedResponse) -> None:
+        key = normalize_url(url)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+        if len(response.body) > self.max_bytes:
+            return
+        self._entries[key] = response
+        self._bytes += len(response.body)
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self.stats["evicted"] += 1
+
+    def invalidate(self, url: str) -> bool:
+        entry = self._entries.pop(normalize_url(url), None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+        return entry is not None
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+        return count
+
+    async def get_or_fetch(
+        self, url: str, fetch: FetchFn, max_age: Optional[float] = None
+    ) -> Optional[CachedResponse]:
+        """
+        Ответ из кэша или из сети
+
+        Args:
+            url: URL страницы
+            fetch: Сетевой запрос, принимает заголовки условного запроса
+            max_age: Допустимый возраст ответа, сек (None - HTTP_CACHE_DEFAULT_TTL)
+
+        Returns:
+            CachedResponse (в кэш попадают только ответы 200) или None при ошибке
+        """
+        key = normalize_url(url)
+        fresh = self.get(url, max_age)
+        if fresh is not None:
+            fresh.hits += 1
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return fresh
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._fetch(key, url, fetch)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # ошибка уже у вызывающего, не логировать как забытую
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _fetch(self, key: str, url: str, fetch: FetchFn) -> Optional[CachedResponse]:
+        stale = self._entries.get(key)
+        validators = stale.validators() if stale is not None else {}
+        self.stats["misses"] += 1
+        self.stats["network"] += 1
+        if validators:
+            self.stats["revalidations"] += 1
+
+        result = await fetch(validators)
+        if result is None:
+            return None
+        status, text, headers, final_url = result
+
+        if status == 304 and stale is not None:
+            stale.fetched_at = time.time()
+            stale.etag = headers.get("ETag", stale.etag)
+            stale.last_modified = headers.get("Last-Modified", stale.last_modified)
+            self._entries.move_to_end(key)
+            self.stats["not_modified"] += 1
+            return stale
+
+        if text is None:
+            return None
+        response = CachedResponse.build(final_url or url, status, text, headers)
+        if status == 200:
+            self.store(url, response)
+        return response
+
+    def entries(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Самые используемые записи (для админ-команды)"""
+        ordered = sorted(self._entries.items(), key=lambda item: item[1].hits, reverse=True)
+        return [
+            {
+                "url": key,
+                "hits": entry.hits,
+                "age_s": entry.age,
+                "size": entry.size,
+                "compressed": len(entry.body),
+                "validator": "etag" if entry.etag else ("last-modified" if entry.last_modified else None),
+            }
+            for key, entry in ordered[:limit]
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        raw = sum(entry.size for entry in self._entries.values())
+        lookups = self.stats["hits"] + self.stats["coalesced"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "raw_bytes": raw,
+            "compression_ratio": raw / self._bytes if self._bytes else 0.0,
+            "hits": self.stats["hits"],
+            "coalesced": self.stats["coalesced"],
+            "misses": self.stats["misses"],
+            "network": self.stats["network"],
+            "revalidations": self.stats["revalidations"],
+            "not_modified": self.stats["not_modified"],
+            "evicted": self.stats["evicted"],
+            "hit_ratio": (self.stats["hits"] + self.stats["coalesced"]) / lookups if lookups else 0.0,
+        }
+
+
+# Глобальный экземпляр
+_response_cache: Optional[HttpResponseCache] = None
+
+
+def get_response_cache() -> HttpResponseCache:
+    """Получить глобальный кэш HTTP ответов"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = HttpResponseCache()
+    return _response_cache
@@ -0,0 +1,286 @@
+"""
+Image Dedup Service - дедупликация по перцептивному хэшу картинки
+
+md5 ловит только побайтно одинаковые файлы; та же фотография товара,
+пережатая другим CDN продавца, проходит. Здесь:
+- dHash 64 бит (8x8 разностей яркости соседних пикселей); JPEG декодируется
+  в draft-режиме сразу в 1/8 размера, для пачки с NumPy хэши считаются векторно
+- BK-tree по расстоянию Хэмминга: поиск похожих без перебора всей истории
+- индекс прогревается из history.image_phash и проверяет товары пачкой
+  (внутри пачки тоже)
+"""
+
+import logging
+import time
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from PIL import Image
+
+import config
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # 8x8 = 64 бита
+
+ImageSource = Union[bytes, Image.Image]
+
+
+def _thumbnail(source: ImageSource) -> Image.Image:
+    """Серое изображение (HASH_SIZE + 1) x HASH_SIZE"""
+    img = Image.open(BytesIO(source)) if isinstance(source, (bytes, bytearray)) else source
+    # JPEG: DCT-масштабирование при декодировании, полный кадр не собирается
+    img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+    return img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+
+
+def _dhash_bits(pixels: bytes) -> int:
+    value = 0
+    width = HASH_SIZE + 1
+    for row in range(HASH_SIZE):
+        offset = row * width
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col + 1] > pixels[offset + col])
+    return value
+
+
+def image_hash(source: ImageSource) -> Optional[int]:
+    """
+    dHash картинки (64-битное целое)
+
+    Returns:
+        Хэш или None, если картинку не удалось декодировать
+    """
+    try:
+        return _dhash_bits(_thumbnail(source).tobytes())
+    except Exception as e:
+        logger.debug(f"image_hash failed: {e}")
+        return None
+
+
+def image_hash_many(sources: Iterable[ImageSource]) -> List[Optional[int]]:
+    """dHash для пачки картинок (с NumPy - сравнение и упаковка битов векторно)"""
+    thumbs: List[Optional[Image.Image]] = []
+    for source in sources:
+        try:
+            thumbs.append(_thumbnail(source))
+        except Exception as e:
+            logger.debug(f"image_hash failed: {e}")
+            thumbs.append(None)
+
+    valid = [t for t in thumbs if t is not None]
+    if not NUMPY_AVAILABLE or not valid:
+        return [_dhash_bits(t.tobytes()) if t is not None else None for t in thumbs]
+
+    pixels = np.stack([np.asarray(t, dtype=np.int16) for t in valid])
+    bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(valid), -1)
+    packed = np.packbits(bits, axis=1)
+    hashes = iter(int.from_bytes(row.tobytes(), "big") for row in packed)
+    return [next(hashes) if t is not None else None for t in thumbs]
+
+
+def format_hash(value: int) -> str:
+    """Хэш для хранения в БД (SQLite INTEGER знаковый, 64 бита не влезают)"""
+    return f"{value:016x}"
+
+
+def parse_hash(value: str) -> Optional[int]:
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree по расстоянию Хэмминга: узел -> {расстояние: потомок}"""
+
+    def __init__(self):
+        self.root: Optional[list] = None  # [hash, values, children]
+        self.size = 0
+
+    def add(self, value: int, item: str) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """Все элементы на расстоянии <= max_distance, ближайшие первыми"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            # Неравенство треугольника: потомки вне [d - r, d + r] не подходят
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class ImageDedupIndex:
+    """
+    Индекс перцептивных хэшей опубликованных картинок
+
+    Источник истины - history.image_phash; дерево в памяти периодически
+    пересобирается (другие процессы тоже публикуют).
+    """
+
+    REBUILD_INTERVAL = 3600
+
+    def __init__(self, db=None, max_distance: int = None):
+        self.db = db
+        self.max_distance = (
+            max_distance if max_distance is not None
+            else getattr(config, 'IMAGE_DEDUP_MAX_DISTANCE', 6)
+        )
+        self.tree: Optional[BKTree] = None
+        self._warmed_at = 0.0
+        self.metrics = {
+            'checked': 0,
+            'duplicates': 0,
+            'batch_duplicates': 0,
+            'unhashable': 0,
+        }
+
+    def needs_refresh(self) -> bool:
+        """Пора пересобрать дерево (для прогрева снаружи, см. load)"""
+        return self.tree is None or time.time() - self._warmed_at >= self.REBUILD_INTERVAL
+
+    def load(self, rows: Iterable[Tuple[str, str]]) -> None:
+        """Пересобрать дерево из (image_phash, url)"""
+        tree = BKTree()
+        for phash, url in rows:
+            value = parse_hash(phash)
+            if value is not None:
+                tree.add(value, url)
+        self.tree = tree
+        self._warmed_at = time.time()
+        logger.debug(f"Image dedup index warmed: {len(tree)} hashes")
+
+    def _ensure_warm(self) -> None:
+        if self.tree is not None and (self.db is None or not self.needs_refresh()):
+            return
+        rows: Iterable[Tuple[str, str]] = ()
+        if self.db is not None:
+            try:
+                rows = self.db.get_image_phashes()
+            except Exception as e:
+                logger.warning(f"Failed to warm image dedup index from DB: {e}")
+        self.load(rows)
+
+    def find_duplicates(self, hashes: List[Optional[int]]) -> List[Optional[str]]:
+        """
+        Найти похожие картинки для пачки хэшей
+
+        Returns:
+            Для каждого хэша: URL опубликованного товара с похожей картинкой,
+            "batch:<i>" для повтора более раннего элемента пачки, иначе None
+        """
+        self._ensure_warm()
+        batch = BKTree()
+        result: List[Optional[str]] = []
+        for index, value in enumerate(hashes):
+            if value is None:
+                result.append(None)
+                continue
+            self.metrics['checked'] += 1
+            matches = self.tree.search(value, self.max_distance)
+            if matches:
+                self.metrics['duplicates'] += 1
+                result.append(matches[0][1])
+                continue
+            batch_matches = batch.search(value, self.max_distance)
+            if batch_matches:
+                self.metrics['batch_duplicates'] += 1
+                result.append(batch_matches[0][1])
+                continue
+            batch.add(value, f"batch:{index}")
+            result.append(None)
+        return result
+
+    def find_duplicate(self, value: Optional[int]) -> Optional[str]:
+        """URL опубликованного товара с похожей картинкой или None"""
+        return self.find_duplicates([value])[0]
+
+    def filter_new(self, products: List[Dict]) -> List[Dict]:
+        """
+        Отбросить товары, чья картинка похожа на опубликованную или на
+        картинку более раннего товара пачки. Хэш берется из 'image_phash'
+        или считается по 'image_bytes' (и сохраняется в 'image_phash');
+        товары без картинки проходят.
+        """
+        hashes: List[Optional[int]] = [None] * len(products)
+        to_hash = []
+        for i, product in enumerate(products):
+            if product.get('image_phash'):
+                hashes[i] = parse_hash(product['image_phash'])
+            elif product.get('image_bytes'):
+                to_hash.append(i)
+        if to_hash:
+            computed = image_hash_many(products[i]['image_bytes'] for i in to_hash)
+            for i, value in zip(to_hash, computed):
+                hashes[i] = value
+                if value is None:
+                    self.metrics['unhashable'] += 1
+                else:
+                    products[i]['image_phash'] = format_hash(value)
+
+        duplicates = self.find_duplicates(hashes)
+        return [product for product, duplicate in zip(products, duplicates) if duplicate is None]
+
+    def add(self, value: int, url: str) -> None:
+        """Добавить картинку опубликованного товара"""
+        self._ensure_warm()
+        self.tree.add(value, url)
+
+    def get_metrics(self) -> Dict:
+        """Метрики для мониторинга"""
+        return {
+            **self.metrics,
+            'indexed': len(self.tree) if self.tree else 0,
+            'numpy': NUMPY_AVAILABLE,
+        }
+
+
+# Глобальный экземпляр
+_image_dedup_index = None
+
+
+def get_image_dedup_index() -> ImageDedupIndex:
+    """Get global image dedup index"""
+    global _image_dedup_index
+    if _image_dedup_index is None:
+        from database import get_db_instance
+
+        _image_dedup_index = ImageDedupIndex(db=get_db_instance())
+    return _image_dedup_index
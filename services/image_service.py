@@ -1,7 +1,16 @@
 # services/image_service.py
-"""Сервис для работы с изображениями"""
-import os
-from PIL import Image, ImageDraw, ImageFont
+"""
+Сервис для работы с изображениями
+
+Обработка поста идет через ImagePipeline: изображение декодируется один раз
+(JPEG сразу в уменьшенном draft-режиме), уменьшается до лимита Telegram до
+дорогих фильтров, все операции выполняются над одним PIL.Image, кодирование
+в JPEG - один раз в конце. Шрифты и слои водяного знака кэшируются.
+"""
+import asyncio
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
 from io import BytesIO
 import logging
 
@@ -50,335 +59,317 @@ def check_image_quality(image_bytes: bytes) -> tuple[bool, str]:
         return False, f"Ошибка проверки: {str(e)[:50]}"
 
 
-def improve_image(image_bytes: bytes) -> bytes:
-    """Улучшает качество изображения (базовые улучшения)"""
-    try:
-        img = Image.open(BytesIO(image_bytes))
+# Оптимизация размера для Telegram (макс 1024px ширина)
+TELEGRAM_MAX_WIDTH = 1024
 
-        # Конвертируем в RGB если нужно
-        if img.mode != "RGB":
-            img = img.convert("RGB")
+# Входит в ключ кэша готовых рендеров (utils.image_proc): увеличить при изменении операций
+IMAGE_PIPELINE_VERSION = 1
 
-        # Базовое улучшение контраста и яркости
-        from PIL import ImageEnhance
+# Шрифты пробуются по порядку, найденный путь запоминается
+FONT_PATHS = [
+    "arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/calibri.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+]
 
-        # Улучшаем контраст
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(1.1)  # +10% контраста
+ImageOp = Callable[[Image.Image], Image.Image]
 
-        # Улучшаем резкость
-        enhancer = ImageEnhance.Sharpness(img)
-        img = enhancer.enhance(1.1)  # +10% резкости
 
-        # Сохраняем
-        output = BytesIO()
-        img.save(output, format="JPEG", quality=95, optimize=True)
-        return output.getvalue()
-    except Exception as e:
-        logger.warning("improve_image error: %s", e)
-        return image_bytes
+@lru_cache(maxsize=1)
+def _font_path() -> Optional[str]:
+    """Первый доступный TrueType шрифт (поиск по диску один раз за процесс)"""
+    for font_path in FONT_PATHS:
+        try:
+            ImageFont.truetype(font_path, 12)
+            return font_path
+        except Exception:
+            continue
+    return None
 
 
-def add_price_overlay(
-    image_bytes: bytes, price: str, discount_percent: float = 0, old_price: str = None
-) -> bytes:
-    """
-    Добавляет профессиональные оверлеи на изображение товара:
-    - Ценовой тег в левом нижнем углу
-    - Бейдж скидки в правом верхнем углу (если скидка > 10%)
+@lru_cache(maxsize=32)
+def get_font(size: int) -> ImageFont.ImageFont:
+    """Шрифт нужного размера (загружается один раз)"""
+    font_path = _font_path()
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default()
 
-    Args:
-        image_bytes: Исходное изображение в байтах
-        price: Текущая цена (например, "15 990 ₽")
-        discount_percent: Процент скидки (0-100)
-        old_price: Старая цена для перечеркивания (опционально)
 
-    Returns:
-        Обработанное изображение в байтах (BytesIO buffer)
-    """
-    try:
-        from PIL import ImageDraw, ImageFont
+def _text_size(text: str, font) -> Tuple[int, int, Tuple[int, int, int, int]]:
+    bbox = font.getbbox(text)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1], bbox
 
-        # Открываем изображение
-        img = Image.open(BytesIO(image_bytes))
 
-        # Конвертируем в RGB если нужно
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-
-        # Оптимизация размера для Telegram (макс 1024px ширина)
-        max_width = 1024
-        if img.width > max_width:
-            ratio = max_width / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-            logger.debug(
-                f"Resized image from {img.width}x{img.height} to {max_width}x{new_height}"
-            )
+def _blend(img: Image.Image, layer: Image.Image, position: Tuple[int, int]) -> None:
+    """Наложить RGBA слой на RGB изображение по альфа-каналу (без RGBA копии всего кадра)"""
+    img.paste(layer, position, layer)
 
-        width, height = img.size
 
-        # Создаем объект для рисования
-        draw = ImageDraw.Draw(img)
+def decode_image(image_bytes: bytes, max_width: Optional[int] = TELEGRAM_MAX_WIDTH) -> Image.Image:
+    """
+    Декодировать изображение в RGB
 
-        # Загружаем шрифты (пробуем разные варианты)
-        try:
-            # Пробуем системные шрифты
-            font_large = ImageFont.truetype("arial.ttf", 36)
-            font_medium = ImageFont.truetype("arial.ttf", 28)
-            font_small = ImageFont.truetype("arial.ttf", 20)
-        except:
-            try:
-                # Windows fallback
-                font_large = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 36)
-                font_medium = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 28)
-                font_small = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 20)
-            except:
-                # Default font
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-
-        # 1. Ценовой тег в левом нижнем углу
-        if price:
-            # Подготовка текста цены
-            price_text = str(price).strip()
-            if not price_text.endswith("₽"):
-                price_text += " ₽"
-
-            # Размеры текста
-            bbox = draw.textbbox((0, 0), price_text, font=font_large)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-
-            # Отступы от краев
-            padding = 15
-            tag_padding = 12
-
-            # Позиция тега (левый нижний угол)
-            tag_x = padding
-            tag_y = height - padding - text_height - tag_padding * 2
-
-            # Рисуем полупрозрачный фон для цены
-            tag_width = text_width + tag_padding * 2
-            tag_height = text_height + tag_padding * 2
-
-            # Создаем полупрозрачный слой
-            overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-
-            # Черный фон с прозрачностью 80%
-            overlay_draw.rectangle(
-                [tag_x, tag_y, tag_x + tag_width, tag_y + tag_height],
-                fill=(0, 0, 0, 204),  # 80% прозрачности
-                outline=(255, 255, 255, 255),
-                width=2,
-            )
+    JPEG декодируется сразу с уменьшением (draft), если он шире max_width.
+    """
+    img = Image.open(BytesIO(image_bytes))
+    if max_width and img.format == "JPEG" and img.width > max_width:
+        target_height = max(1, img.height * max_width // img.width)
+        img.draft("RGB", (max_width, target_height))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
 
-            # Объединяем слои
-            img = Image.alpha_composite(img.convert("RGBA"), overlay).convert("RGB")
-            draw = ImageDraw.Draw(img)
 
-            # Рисуем цену белым цветом
-            draw.text(
-                (tag_x + tag_padding, tag_y + tag_padding),
-                price_text,
-                fill=(255, 255, 255),
-                font=font_large,
-            )
+def encode_jpeg(img: Image.Image, quality: int = 90) -> bytes:
+    """Закодировать изображение в JPEG"""
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
 
-            # Если есть старая цена - рисуем перечеркнутую
-            if old_price:
-                old_price_text = str(old_price).strip()
-                if not old_price_text.endswith("₽"):
-                    old_price_text += " ₽"
-
-                # Старая цена выше новой, серым цветом
-                old_bbox = draw.textbbox((0, 0), old_price_text, font=font_medium)
-                old_text_width = old_bbox[2] - old_bbox[0]
-                old_text_height = old_bbox[3] - old_bbox[1]
-
-                old_x = tag_x + tag_padding
-                old_y = tag_y - old_text_height - 5
-
-                # Рисуем перечеркнутую цену
-                draw.text(
-                    (old_x, old_y),
-                    old_price_text,
-                    fill=(150, 150, 150),
-                    font=font_medium,
-                )
-
-                # Линия зачеркивания
-                line_y = old_y + old_text_height // 2
-                draw.line(
-                    [(old_x, line_y), (old_x + old_text_width, line_y)],
-                    fill=(200, 0, 0),
-                    width=2,
-                )
-
-        # 2. Бейдж скидки в правом верхнем углу (если скидка > 10%)
-        if discount_percent > 10:
-            discount_text = f"-{int(discount_percent)}%"
-
-            # Размеры текста
-            bbox = draw.textbbox((0, 0), discount_text, font=font_medium)
-            badge_width = bbox[2] - bbox[0] + 20
-            badge_height = bbox[3] - bbox[1] + 12
-
-            # Позиция бейджа (правый верхний угол)
-            badge_x = width - padding - badge_width
-            badge_y = padding
-
-            # Создаем красный бейдж
-            overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-
-            # Красный фон с белой рамкой
-            overlay_draw.ellipse(
-                [badge_x, badge_y, badge_x + badge_width, badge_y + badge_height],
-                fill=(220, 20, 60, 240),  # Красный цвет
-                outline=(255, 255, 255, 255),
-                width=2,
-            )
 
-            # Объединяем слои
-            img = Image.alpha_composite(img.convert("RGBA"), overlay).convert("RGB")
-            draw = ImageDraw.Draw(img)
+def fit_to_telegram(img: Image.Image, max_width: int = TELEGRAM_MAX_WIDTH) -> Image.Image:
+    """Уменьшить до лимита Telegram (до дорогих фильтров)"""
+    if img.width <= max_width:
+        return img
+    new_height = int(img.height * max_width / img.width)
+    logger.debug(f"Resized image from {img.width}x{img.height} to {max_width}x{new_height}")
+    return img.resize((max_width, new_height), Image.Resampling.LANCZOS)
 
-            # Рисуем текст скидки белым цветом
-            text_x = badge_x + (badge_width - (bbox[2] - bbox[0])) // 2
-            text_y = badge_y + (badge_height - (bbox[3] - bbox[1])) // 2
-            draw.text(
-                (text_x, text_y), discount_text, fill=(255, 255, 255), font=font_medium
-            )
 
-        # Сохраняем в буфер
-        output = BytesIO()
-        img.save(output, format="JPEG", quality=90, optimize=True)
-        output.seek(0)
+def enhance(img: Image.Image) -> Image.Image:
+    """Базовое улучшение: +10% контраста, +10% резкости"""
+    img = ImageEnhance.Contrast(img).enhance(1.1)
+    return ImageEnhance.Sharpness(img).enhance(1.1)
 
-        logger.info(f"Added price overlay: {price}, discount: {discount_percent}%")
-        return output.getvalue()
 
-    except Exception as e:
-        logger.exception(f"Error adding price overlay: {e}")
-        # В случае ошибки возвращаем оригинальное изображение
-        return image_bytes
+def _price_text(price) -> str:
+    text = str(price).strip()
+    if not text.endswith("₽"):
+        text += " ₽"
+    return text
 
 
-def add_watermark(image_bytes: bytes, watermark_text: str = None) -> bytes:
+def draw_price_overlay(
+    img: Image.Image, price: str, discount_percent: float = 0, old_price: str = None
+) -> Image.Image:
     """
-    Добавляет водяной знак на изображение.
-
-    Args:
-        image_bytes: Исходное изображение в байтах
-        watermark_text: Текст водяного знака (если None, берется из config.CHANNEL_ID)
+    Профессиональные оверлеи на изображении товара:
+    - Ценовой тег в левом нижнем углу
+    - Бейдж скидки в правом верхнем углу (если скидка > 10%)
+    """
+    width, height = img.size
+    font_large = get_font(36)
+    font_medium = get_font(28)
+    draw = ImageDraw.Draw(img)
+
+    # Отступы от краев
+    padding = 15
+    tag_padding = 12
+
+    # 1. Ценовой тег в левом нижнем углу
+    if price:
+        price_text = _price_text(price)
+        text_width, text_height, _ = _text_size(price_text, font_large)
+
+        tag_x = padding
+        tag_y = height - padding - text_height - tag_padding * 2
+        tag_width = text_width + tag_padding * 2
+        tag_height = text_height + tag_padding * 2
+
+        # Черный фон с прозрачностью 80% и белой рамкой
+        tag = Image.new("RGBA", (tag_width + 1, tag_height + 1), (0, 0, 0, 0))
+        ImageDraw.Draw(tag).rectangle(
+            [0, 0, tag_width, tag_height],
+            fill=(0, 0, 0, 204),
+            outline=(255, 255, 255, 255),
+            width=2,
+        )
+        _blend(img, tag, (tag_x, tag_y))
+
+        # Рисуем цену белым цветом
+        draw.text(
+            (tag_x + tag_padding, tag_y + tag_padding),
+            price_text,
+            fill=(255, 255, 255),
+            font=font_large,
+        )
+
+        # Если есть старая цена - рисуем перечеркнутую выше новой, серым цветом
+        if old_price:
+            old_price_text = _price_text(old_price)
+            old_text_width, old_text_height, _ = _text_size(old_price_text, font_medium)
+
+            old_x = tag_x + tag_padding
+            old_y = tag_y - old_text_height - 5
+            draw.text((old_x, old_y), old_price_text, fill=(150, 150, 150), font=font_medium)
+
+            # Линия зачеркивания
+            line_y = old_y + old_text_height // 2
+            draw.line(
+                [(old_x, line_y), (old_x + old_text_width, line_y)],
+                fill=(200, 0, 0),
+                width=2,
+            )
 
-    Returns:
-        Изображение с водяным знаком в байтах
+    # 2. Бейдж скидки в правом верхнем углу (если скидка > 10%)
+    if discount_percent > 10:
+        discount_text = f"-{int(discount_percent)}%"
+        text_width, text_height, _ = _text_size(discount_text, font_medium)
+        badge_width = text_width + 20
+        badge_height = text_height + 12
+
+        badge_x = width - padding - badge_width
+        badge_y = padding
+
+        # Красный бейдж с белой рамкой
+        badge = Image.new("RGBA", (badge_width + 1, badge_height + 1), (0, 0, 0, 0))
+        ImageDraw.Draw(badge).ellipse(
+            [0, 0, badge_width, badge_height],
+            fill=(220, 20, 60, 240),
+            outline=(255, 255, 255, 255),
+            width=2,
+        )
+        _blend(img, badge, (badge_x, badge_y))
+
+        text_x = badge_x + (badge_width - text_width) // 2
+        text_y = badge_y + (badge_height - text_height) // 2
+        draw.text((text_x, text_y), discount_text, fill=(255, 255, 255), font=font_medium)
+
+    return img
+
+
+def default_watermark_text() -> str:
+    """Текст водяного знака из config.CHANNEL_ID"""
+    import config
+
+    watermark_text = config.CHANNEL_ID or "@marketi_tochka"
+    # Убираем @ если есть, так как мы добавим его сами
+    return f"@{watermark_text.lstrip('@')}"
+
+
+@lru_cache(maxsize=64)
+def _watermark_layer(watermark_text: str, font_size: int) -> Image.Image:
+    """Готовый RGBA слой с текстом (белый, 50% прозрачности) по размеру текста"""
+    font = get_font(font_size)
+    left, top, right, bottom = font.getbbox(watermark_text)
+    layer = Image.new("RGBA", (right, bottom), (0, 0, 0, 0))
+    ImageDraw.Draw(layer).text(
+        (0, 0), watermark_text, fill=(255, 255, 255, 128), font=font
+    )
+    return layer
+
+
+def draw_watermark(img: Image.Image, watermark_text: str = None) -> Image.Image:
+    """Водяной знак в правом нижнем углу с отступом 10px"""
+    if watermark_text is None:
+        watermark_text = default_watermark_text()
+
+    width, height = img.size
+    font_size = max(24, min(width, height) // 20)  # Адаптивный размер шрифта
+    layer = _watermark_layer(watermark_text, font_size)
+    left, top, right, bottom = get_font(font_size).getbbox(watermark_text)
+
+    padding = 10
+    # Позиция как у draw.text: правый нижний угол bbox текста с отступом
+    x = width - (right - left) - padding
+    y = height - (bottom - top) - padding
+    _blend(img, layer, (x, y))
+    return img
+
+
+class ImagePipeline:
     """
-    try:
-        import config
+    Цепочка операций над одним декодированным изображением
 
-        # Получаем текст водяного знака
-        if watermark_text is None:
-            watermark_text = config.CHANNEL_ID or "@marketi_tochka"
-            # Убираем @ если есть, так как мы добавим его сами
-            if watermark_text.startswith("@"):
-                watermark_text = watermark_text[1:]
-            watermark_text = f"@{watermark_text}"
+    Пример:
+        ImagePipeline().add(enhance).add(draw_watermark).run(image_bytes)
 
-        # Открываем изображение
-        img = Image.open(BytesIO(image_bytes))
+    Ошибка в операции пропускает только ее (как раньше при отдельных функциях),
+    ошибка декодирования возвращает исходные байты.
+    """
 
-        # Конвертируем в RGBA для поддержки прозрачности
-        if img.mode != "RGBA":
-            img = img.convert("RGBA")
+    def __init__(self, max_width: Optional[int] = TELEGRAM_MAX_WIDTH, quality: int = 90):
+        """
+        Args:
+            max_width: Уменьшать до этой ширины перед операциями (None - не уменьшать)
+            quality: Качество JPEG на выходе
+        """
+        self.max_width = max_width
+        self.quality = quality
+        self.ops: List[Tuple[str, ImageOp]] = []
+
+    def add(self, op: Callable[..., Image.Image], *args, **kwargs) -> "ImagePipeline":
+        """Добавить операцию op(img, *args, **kwargs) -> img"""
+        self.ops.append((op.__name__, lambda img: op(img, *args, **kwargs)))
+        return self
+
+    def apply(self, img: Image.Image) -> Image.Image:
+        """Выполнить операции над уже декодированным изображением"""
+        if self.max_width:
+            img = fit_to_telegram(img, self.max_width)
+        for name, op in self.ops:
+            try:
+                img = op(img)
+            except Exception as e:
+                logger.warning(f"Image op {name} failed: {e}")
+        return img
 
-        width, height = img.size
+    def run(self, image_bytes: bytes) -> bytes:
+        """Декодировать, выполнить операции, закодировать"""
+        try:
+            img = decode_image(image_bytes, self.max_width)
+        except Exception as e:
+            logger.warning(f"Image decode failed: {e}")
+            return image_bytes
+        return encode_jpeg(self.apply(img), self.quality)
 
-        # Создаем объект для рисования
-        draw = ImageDraw.Draw(img)
 
-        # Загружаем шрифт (пробуем разные варианты)
-        font_size = max(24, min(width, height) // 20)  # Адаптивный размер шрифта
-        font = None
+def improve_image(image_bytes: bytes) -> bytes:
+    """Улучшает качество изображения (базовые улучшения)"""
+    return ImagePipeline(max_width=None, quality=95).add(enhance).run(image_bytes)
 
-        # Пробуем загрузить системные шрифты
-        font_paths = [
-            "arial.ttf",
-            "C:/Windows/Fonts/arial.ttf",
-            "C:/Windows/Fonts/calibri.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-            "/System/Library/Fonts/Helvetica.ttc",
-        ]
 
-        for font_path in font_paths:
-            try:
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, font_size)
-                    break
-            except Exception:
-                continue
-
-        # Если не удалось загрузить шрифт, используем default
-        if font is None:
-            try:
-                # Пробуем использовать default font с увеличенным размером
-                font = ImageFont.load_default()
-            except Exception:
-                font = None
-
-        # Вычисляем размер текста
-        if font:
-            bbox = draw.textbbox((0, 0), watermark_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        else:
-            # Примерная оценка размера для default font
-            text_width = len(watermark_text) * 8
-            text_height = 20
-
-        # Позиция водяного знака: правый нижний угол с отступом 10px
-        padding = 10
-        x = width - text_width - padding
-        y = height - text_height - padding
-
-        # Создаем полупрозрачный слой для водяного знака
-        overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
-
-        # Рисуем текст белым цветом с 50% прозрачностью (alpha=128 из 255)
-        if font:
-            overlay_draw.text(
-                (x, y),
-                watermark_text,
-                fill=(255, 255, 255, 128),  # Белый с 50% прозрачностью
-                font=font,
-            )
-        else:
-            overlay_draw.text((x, y), watermark_text, fill=(255, 255, 255, 128))
+def add_price_overlay(
+    image_bytes: bytes, price: str, discount_percent: float = 0, old_price: str = None
+) -> bytes:
+    """
+    Добавляет профессиональные оверлеи на изображение товара:
+    - Ценовой тег в левом нижнем углу
+    - Бейдж скидки в правом верхнем углу (если скидка > 10%)
 
-        # Объединяем слои
-        img = Image.alpha_composite(img, overlay)
+    Args:
+        image_bytes: Исходное изображение в байтах
+        price: Текущая цена (например, "15 990 ₽")
+        discount_percent: Процент скидки (0-100)
+        old_price: Старая цена для перечеркивания (опционально)
 
-        # Конвертируем обратно в RGB для сохранения
-        if img.mode != "RGB":
-            img = img.convert("RGB")
+    Returns:
+        Обработанное изображение в байтах
+    """
+    result = (
+        ImagePipeline()
+        .add(draw_price_overlay, price, discount_percent, old_price)
+        .run(image_bytes)
+    )
+    logger.info(f"Added price overlay: {price}, discount: {discount_percent}%")
+    return result
 
-        # Сохраняем в буфер
-        output = BytesIO()
-        img.save(output, format="JPEG", quality=90, optimize=True)
-        output.seek(0)
 
-        logger.debug(f"Added watermark: {watermark_text}")
-        return output.getvalue()
+def add_watermark(image_bytes: bytes, watermark_text: str = None) -> bytes:
+    """
+    Добавляет водяной знак на изображение.
 
-    except Exception as e:
-        logger.warning(f"Error adding watermark: {e}")
-        # В случае ошибки возвращаем оригинальное изображение
-        return image_bytes
+    Args:
+        image_bytes: Исходное изображение в байтах
+        watermark_text: Текст водяного знака (если None, берется из config.CHANNEL_ID)
+
+    Returns:
+        Изображение с водяным знаком в байтах
+    """
+    return ImagePipeline(max_width=None).add(draw_watermark, watermark_text).run(image_bytes)
 
 
 def process_image(image_bytes: bytes, watermark_text: str = None) -> bytes:
@@ -393,18 +384,24 @@ def process_image(image_bytes: bytes, watermark_text: str = None) -> bytes:
     Returns:
         Обработанное изображение в байтах
     """
-    try:
-        # Шаг 1: Улучшение изображения
-        improved = improve_image(image_bytes)
-
-        # Шаг 2: Добавление водяного знака
-        final = add_watermark(improved, watermark_text)
-
-        return final
-    except Exception as e:
-        logger.exception(f"Error processing image: {e}")
-        # В случае ошибки возвращаем оригинальное изображение
-        return image_bytes
+    return (
+        ImagePipeline()
+        .add(enhance)
+        .add(draw_watermark, watermark_text)
+        .run(image_bytes)
+    )
+
+
+def product_image_pipeline(
+    price: str, discount_percent: float = 0, old_price: str = None
+) -> ImagePipeline:
+    """Пайплайн поста: уменьшение -> улучшение -> оверлеи -> водяной знак"""
+    return (
+        ImagePipeline()
+        .add(enhance)
+        .add(draw_price_overlay, price, discount_percent, old_price)
+        .add(draw_watermark)
+    )
 
 
 async def process_product_image(
@@ -412,6 +409,8 @@ async def process_product_image(
 ) -> bytes:
     """
     Полная обработка изображения товара: улучшение + оверлеи + водяной знак.
+    Выполняется в потоке (PIL отпускает GIL), не блокируя event loop.
+    Готовый рендер кэшируется по (исходник, цена, скидка, водяной знак, версия).
 
     Args:
         image_bytes: Исходное изображение
@@ -423,15 +422,43 @@ async def process_product_image(
         Обработанное изображение
     """
     try:
-        # Шаг 1: Улучшение изображения
-        improved = improve_image(image_bytes)
-
-        # Шаг 2: Добавление оверлеев (цена и скидка)
-        with_overlays = add_price_overlay(improved, price, discount_percent, old_price)
-
-        # Шаг 3: Добавление водяного знака
-        final = add_watermark(with_overlays)
-        return final
+        return await asyncio.to_thread(
+            _render_product_image, image_bytes, price, discount_percent, old_price
+        )
     except Exception as e:
         logger.exception(f"Error processing product image: {e}")
         return image_bytes
+
+
+def product_render_key(
+    image_bytes: bytes, price: str, discount_percent: float = 0, old_price: str = None
+) -> str:
+    """Ключ готового рендера поста в кэше utils.image_proc"""
+    from utils.image_proc import md5_bytes, render_key
+
+    return render_key(
+        md5_bytes(image_bytes),
+        op="product",
+        price=str(price),
+        old_price=str(old_price) if old_price else None,
+        discount=int(discount_percent or 0),
+        watermark=default_watermark_text(),
+        version=IMAGE_PIPELINE_VERSION,
+    )
+
+
+def _render_product_image(
+    image_bytes: bytes, price: str, discount_percent: float = 0, old_price: str = None
+) -> bytes:
+    from utils.image_proc import get_processed_image_cache
+
+    cache = get_processed_image_cache()
+    key = product_render_key(image_bytes, price, discount_percent, old_price)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = product_image_pipeline(price, discount_percent, old_price).run(image_bytes)
+    if result is not image_bytes:  # не кэшируем исходник при ошибке декодирования
+        cache.put(key, result)
+    return result
@@ -0,0 +1,216 @@
+# services/leader_lease.py
+"""
+Leader Lease - аренда singleton-задач планировщика между репликами
+
+Задача с singleton=True выполняется только той репликой, которая взяла
+аренду (lease) по имени задачи. Пока задача идет, аренда продлевается;
+после завершения записывается время запуска (last_run) и аренда снимается.
+Упавшая реплика аренду не продлевает - по истечении TTL ее берет другая.
+
+Хранилища:
+- RedisLeaseStore: SET NX PX + продление/снятие Lua-скриптом (сравнение владельца)
+- SQLiteLeaseStore: таблица scheduler_jobs в файле БД бота, захват одним
+  UPSERT ... WHERE (реплики на одном хосте / общий файл)
+- MemoryLeaseStore: один процесс (тесты, без БД)
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Продлить, только если аренда все еще наша. KEYS: lease; ARGV: owner, ttl_ms
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Снять, только если аренда наша. KEYS: lease; ARGV: owner
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def default_owner() -> str:
+    """Идентификатор реплики (как worker_id очереди): host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MemoryLeaseStore:
+    """Аренды в памяти процесса"""
+
+    def __init__(self):
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._last_run: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def renew(self, name: str, owner: str, ttl: float) -> bool:
+        with self._lock:
+            holder = self._leases.get(name)
+            if not holder or holder[0] != owner:
+                return False
+            self._leases[name] = (owner, time.time() + ttl)
+            return True
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] == owner:
+                del self._leases[name]
+
+    def get_last_run(self, name: str) -> Optional[float]:
+        return self._last_run.get(name)
+
+    def set_last_run(self, name: str, ts: float) -> None:
+        self._last_run[name] = ts
+
+
+class SQLiteLeaseStore:
+    """Аренды в таблице scheduler_jobs (advisory lock через файл SQLite)"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, timeout=10, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scheduler_jobs (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    last_run REAL
+                )
+            """
+            )
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock, self.connection:
+            cursor = self.connection.execute(
+                """
+                INSERT INTO scheduler_jobs (name, owner, lease_until) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE
+                SET owner = excluded.owner, lease_until = excluded.lease_until
+                WHERE scheduler_jobs.owner IS NULL
+                   OR scheduler_jobs.owner = excluded.owner
+                   OR scheduler_jobs.lease_until < ?
+            """,
+                (name, owner, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, name: str, owner: str, ttl: float) -> bool:
+        with self._lock, self.connection:
+            cursor = self.connection.execute(
+                "UPDATE scheduler_jobs SET lease_until = ? WHERE name = ? AND owner = ?",
+                (time.time() + ttl, name, owner),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "UPDATE scheduler_jobs SET owner = NULL, lease_until = 0 WHERE name = ? AND owner = ?",
+                (name, owner),
+            )
+
+    def get_last_run(self, name: str) -> Optional[float]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT last_run FROM scheduler_jobs WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_last_run(self, name: str, ts: float) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO scheduler_jobs (name, last_run) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET last_run = excluded.last_run
+            """,
+                (name, ts),
+            )
+
+
+class RedisLeaseStore:
+    """Аренды в Redis (общие для всех реплик)"""
+
+    def __init__(self, client, prefix: str = "scheduler"):
+        self.client = client
+        self.prefix = prefix
+        self._renew_script = client.register_script(_RENEW_SCRIPT)
+        self._release_script = client.register_script(_RELEASE_SCRIPT)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:lease:{name}"
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        ttl_ms = int(ttl * 1000)
+        if self.client.set(self._key(name), owner, nx=True, px=ttl_ms):
+            return True
+        return bool(self._renew_script(keys=[self._key(name)], args=[owner, ttl_ms]))
+
+    def renew(self, name: str, owner: str, ttl: float) -> bool:
+        return bool(self._renew_script(keys=[self._key(name)], args=[owner, int(ttl * 1000)]))
+
+    def release(self, name: str, owner: str) -> None:
+        self._release_script(keys=[self._key(name)], args=[owner])
+
+    def get_last_run(self, name: str) -> Optional[float]:
+        value = self.client.hget(f"{self.prefix}:last_run", name)
+        return float(value) if value is not None else None
+
+    def set_last_run(self, name: str, ts: float) -> None:
+        self.client.hset(f"{self.prefix}:last_run", name, ts)
+
+
+def create_lease_store(backend: Optional[str] = None):
+    """
+    Хранилище аренд по SCHEDULER_LEASE_BACKEND
+
+    auto: Redis (если USE_REDIS и доступен), иначе SQLite файл БД бота,
+    иначе память процесса.
+    """
+    backend = (backend or getattr(config, "SCHEDULER_LEASE_BACKEND", "auto")).lower()
+
+    if backend in ("auto", "redis") and config.USE_REDIS:
+        try:
+            from redis_cache import get_redis_cache
+
+            redis_cache = get_redis_cache()
+            if redis_cache:
+                return RedisLeaseStore(redis_cache.client)
+        except Exception as e:
+            logger.warning(f"Redis lease store unavailable, falling back: {e}")
+
+    if backend in ("auto", "redis", "sqlite"):
+        db_file = getattr(config, "DB_FILE", None)
+        if db_file:
+            try:
+                return SQLiteLeaseStore(db_file)
+            except sqlite3.Error as e:
+                logger.warning(f"SQLite lease store unavailable, using memory: {e}")
+
+    return MemoryLeaseStore()
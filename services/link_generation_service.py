@@ -9,11 +9,19 @@ import uuid
 import logging
 import json
 import random
+import re
+import time
 from pathlib import Path
 from typing import Dict, Optional, Any, List
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
 from services.circuit_breaker import get_circuit_breaker
+from services.browser_farm import BrowserFarm
+from services.xhr_link_engine import get_xhr_link_engine
+from config.link_generation_config import (
+    BROWSER_FARM_ENABLED,
+    STORAGE_STATE_DIR as FARM_STORAGE_STATE_DIR,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -47,17 +55,33 @@ JOB_TIMEOUT = 60  # Seconds
 CLEANUP_INTERVAL = 3600  # Clean old results every hour
 RESULT_TTL = 3600  # Keep results for 1 hour
 
+# cc-ссылка и API, в ответах которых она приходит
+CC_LINK_PATTERN = re.compile(r"https?://market\.yandex\.ru/cc/[A-Za-z0-9_-]+")
+SHARE_API_MARKERS = ("market.yandex.ru/api/", "platform-api.yandex.ru", "/share")
+SHARE_BUTTON_SELECTORS = [
+    'button:has-text("Поделиться")',
+    'button[aria-label*="Поделиться"]',
+    'button[aria-label="Поделиться"]',
+    '[data-testid*="share"]',
+]
+# Storage state фермы браузеров (обновляется после успешных задач)
+FARM_STORAGE_STATE = FARM_STORAGE_STATE_DIR / "browser_farm_state.json"
+FARM_STORAGE_STATE_MIN_AGE = 300  # Не перезаписывать чаще раза в 5 минут
+
 
 class LinkGenerationService:
     """
     Service for generating Yandex Market partner links.
-    Uses asyncio.Queue + ThreadPoolExecutor to run Playwright without blocking event loop.
+    Jobs run on warmed pages of the persistent BrowserFarm; if the farm
+    cannot start, Playwright runs in a ThreadPoolExecutor (cold start per job).
     """
 
-    def __init__(self, max_workers: int = MAX_WORKERS):
+    def __init__(self, max_workers: int = MAX_WORKERS, use_browser_farm: bool = BROWSER_FARM_ENABLED):
         self.max_workers = max_workers
+        self.use_browser_farm = use_browser_farm
         self.executor: Optional[ThreadPoolExecutor] = None
-        self.worker_task: Optional[asyncio.Task] = None
+        self.farm: Optional[BrowserFarm] = None
+        self.worker_tasks: List[asyncio.Task] = []
         self.cleanup_task: Optional[asyncio.Task] = None
         self._running = False
 
@@ -68,21 +92,40 @@ class LinkGenerationService:
             return
 
         self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-        self.worker_task = asyncio.create_task(self._worker_main())
-        self.cleanup_task = asyncio.create_task(self._cleanup_loop())
         self._running = True
-        logger.info(f"✅ LinkGenerationService started with {self.max_workers} workers")
+
+        # Постоянные браузеры: по одному воркеру на прогретый контекст
+        workers = 1
+        if self.use_browser_farm:
+            try:
+                farm = BrowserFarm()
+                await farm.start()
+                self.farm = farm
+                workers = farm.capacity
+            except Exception as e:
+                logger.warning(f"⚠️ Browser farm unavailable, using cold Playwright per job: {e}")
+                self.farm = None
+
+        self.worker_tasks = [
+            asyncio.create_task(self._worker_main(f"worker-{i}")) for i in range(workers)
+        ]
+        self.cleanup_task = asyncio.create_task(self._cleanup_loop())
+        logger.info(
+            f"✅ LinkGenerationService started with {workers} workers"
+            f" ({'browser farm' if self.farm else f'{self.max_workers} executor threads'})"
+        )
 
     async def stop(self):
         """Stop the service gracefully."""
         self._running = False
 
-        if self.worker_task:
-            self.worker_task.cancel()
+        for task in self.worker_tasks:
+            task.cancel()
             try:
-                await self.worker_task
+                await task
             except asyncio.CancelledError:
                 pass
+        self.worker_tasks = []
 
         if self.cleanup_task:
             self.cleanup_task.cancel()
@@ -91,6 +134,10 @@ class LinkGenerationService:
             except asyncio.CancelledError:
                 pass
 
+        if self.farm:
+            await self.farm.stop()
+            self.farm = None
+
         if self.executor:
             self.executor.shutdown(wait=True)
 
@@ -103,6 +150,7 @@ class LinkGenerationService:
         timeout: int = JOB_TIMEOUT,
         headless: bool = True,
         debug: bool = True,
+        reuse_storage_state: Optional[str] = None,
     ) -> str:
         """
         Submit a job to generate partner link.
@@ -112,8 +160,9 @@ class LinkGenerationService:
             url: Product URL
             cookies: Optional cookies for authentication
             timeout: Job timeout in seconds
-            headless: Run browser in headless mode
+            headless: Run browser in headless mode (False forces a cold visible browser)
             debug: Enable debug artifacts
+            reuse_storage_state: Storage state for the cold-start path
 
         Returns:
             job_id: Unique job identifier
@@ -150,9 +199,63 @@ class LinkGenerationService:
         """
         return results.get(job_id)
 
-    async def _worker_main(self):
+    def get_stats(self) -> Dict[str, Any]:
+        """Service stats (browser farm load, latency, recycles)."""
+        return {
+            "queue_size": job_queue.qsize(),
+            "workers": len(self.worker_tasks),
+            "browser_farm": self.farm.get_stats() if self.farm else None,
+            "xhr_engine": get_xhr_link_engine().get_stats(),
+        }
+
+    async def _run_browser_job(self, job: Dict[str, Any]) -> str:
+        """Run one job on a warmed farm page, or cold-start Playwright in the executor."""
+        timeout = job.get("timeout", JOB_TIMEOUT)
+
+        if self.farm and self.farm.running and job.get("headless", True):
+            return await self.farm.run(
+                lambda page: _async_capture_link_on_page(
+                    page,
+                    job["id"],
+                    job["url"],
+                    job.get("cookies"),
+                    timeout,
+                    job.get("debug", True),
+                ),
+                timeout=timeout + 10,  # Extra 10s buffer
+                cookies=job.get("cookies"),  # Added to a context that is discarded after the job
+            )
+
+        # Run blocking Playwright work off the event loop
+        started = time.time()
+        link = await asyncio.wait_for(
+            asyncio.get_event_loop().run_in_executor(
+                self.executor,
+                _sync_run_playwright,
+                job["id"],
+                job["url"],
+                job.get("cookies"),
+                timeout,
+                job.get("headless", True),
+                job.get("debug", True),
+                job.get("reuse_storage_state"),
+            ),
+            timeout=timeout + 10,  # Extra 10s buffer
+        )
+
+        # _sync_run_playwright saves the captured share XHR to last_xhr.json
+        xhr_path = DEBUG_DIR / "last_xhr.json"
+        try:
+            if xhr_path.exists() and xhr_path.stat().st_mtime >= started:
+                with open(xhr_path, "r", encoding="utf-8") as f:
+                    await get_xhr_link_engine().learn(json.load(f), job["url"], job.get("cookies"))
+        except Exception as e:
+            logger.debug(f"Failed to learn XHR template: {e}")
+        return link
+
+    async def _worker_main(self, worker_name: str = "worker-0"):
         """Main worker loop - consumes jobs from queue."""
-        logger.info("🔄 Worker started")
+        logger.info(f"🔄 {worker_name} started")
 
         while self._running:
             try:
@@ -187,72 +290,16 @@ class LinkGenerationService:
                 results[job_id]["started_at"] = datetime.now().isoformat()
 
                 try:
-                    # STEP 2: Try XHR reproduction first (if XHR info was saved from previous run)
-                    # This is a fast path - try direct HTTP request before full browser
-                    xhr_reproduced = False
+                    # STEP 2: Learned XHR template first - no page rendering.
+                    # Browser only when there is no healthy template or replay fails.
+                    link = None
                     try:
-                        from utils.xhr_reproducer import (
-                            reproduce_xhr_directly,
-                            extract_short_url_from_response,
-                        )
-
-                        # Check if we have saved XHR info from previous successful capture
-                        xhr_path = DEBUG_DIR / f"last_xhr.json"
-                        if xhr_path.exists():
-                            with open(xhr_path, "r", encoding="utf-8") as f:
-                                xhr_info = json.load(f)
-
-                            # Convert cookies to dict
-                            cookies_dict = None
-                            if job.get("cookies"):
-                                cookies_dict = {
-                                    c.get("name", ""): c.get("value", "")
-                                    for c in job.get("cookies")
-                                    if c.get("name")
-                                }
-
-                            # Try to reproduce XHR
-                            response_data = await reproduce_xhr_directly(
-                                xhr_info, cookies_dict, timeout=10
-                            )
-                            if response_data:
-                                link = extract_short_url_from_response(response_data)
-                                if link:
-                                    logger.info(
-                                        f"✅ Link obtained via XHR reproduction: {link}"
-                                    )
-                                    results[job_id]["status"] = "done"
-                                    results[job_id]["result"] = link
-                                    results[job_id][
-                                        "completed_at"
-                                    ] = datetime.now().isoformat()
-
-                                    # Cache product after successful CC generation
-                                    await _cache_product_after_link_generation(
-                                        url, link
-                                    )
-
-                                    xhr_reproduced = True
+                        link = await get_xhr_link_engine().generate(url, job.get("cookies"))
                     except Exception as e:
-                        logger.debug(f"XHR reproduction attempt failed: {e}")
-
-                    if not xhr_reproduced:
-                        # Run blocking Playwright work off the event loop
-                        link = await asyncio.wait_for(
-                            asyncio.get_event_loop().run_in_executor(
-                                self.executor,
-                                _sync_run_playwright,
-                                job_id,
-                                url,
-                                job.get("cookies"),
-                                job.get("timeout", JOB_TIMEOUT),
-                                job.get("headless", True),
-                                job.get("debug", True),
-                                job.get("reuse_storage_state"),
-                            ),
-                            timeout=job.get("timeout", JOB_TIMEOUT)
-                            + 10,  # Extra 10s buffer
-                        )
+                        logger.debug(f"XHR template attempt failed: {e}")
+
+                    if not link:
+                        link = await self._run_browser_job(job)
 
                     results[job_id]["status"] = "done"
                     results[job_id]["result"] = link
@@ -290,7 +337,7 @@ class LinkGenerationService:
                     job_queue.task_done()
 
             except asyncio.CancelledError:
-                logger.info("🔄 Worker cancelled")
+                logger.info(f"🔄 {worker_name} cancelled")
                 break
             except Exception as e:
                 logger.exception(f"❌ Worker error: {e}")
@@ -401,6 +448,167 @@ async def _async_run_link_generation(
         ) from e
 
 
+def _find_cc_link(data: Any, depth: int = 0) -> Optional[str]:
+    """Find a /cc/ link in a string or (nested) JSON response."""
+    if depth > 10:
+        return None
+    if isinstance(data, str):
+        cc_match = CC_LINK_PATTERN.search(data)
+        return cc_match.group(0).split("?")[0] if cc_match else None
+    if isinstance(data, dict):
+        # Known keys first, then everything else
+        for key in ("shortUrl", "short_url", "url", "link"):
+            if isinstance(data.get(key), str) and (link := _find_cc_link(data[key])):
+                return link
+        values = data.values()
+    elif isinstance(data, list):
+        values = data
+    else:
+        return None
+    for value in values:
+        if link := _find_cc_link(value, depth + 1):
+            return link
+    return None
+
+
+async def _async_capture_link_on_page(
+    page,
+    job_id: str,
+    url: str,
+    cookies: Optional[list] = None,
+    timeout: int = JOB_TIMEOUT,
+    debug: bool = True,
+) -> str:
+    """
+    Capture partner link on an already warmed BrowserFarm page.
+    Same strategy as _sync_run_playwright (network interception, then
+    "Share" button with retries), minus the browser launch. Job cookies are
+    added by BrowserFarm.run (the context is not returned to the pool).
+
+    Returns:
+        Clean partner link (https://market.yandex.ru/cc/XXXXX)
+
+    Raises:
+        RuntimeError: If link cannot be generated
+    """
+    cc_match = re.search(r"/cc/([A-Za-z0-9_-]+)", url)
+    if cc_match:
+        return f"https://market.yandex.ru/cc/{cc_match.group(1)}"
+
+    captured: Dict[str, Any] = {"link": None, "response_data": None, "xhr_info": None}
+
+    def on_request(request):
+        """Capture XHR requests for reproduction."""
+        try:
+            if any(marker in request.url for marker in SHARE_API_MARKERS) and request.method in ("POST", "GET", "PUT"):
+                captured["xhr_info"] = {
+                    "method": request.method,
+                    "url": request.url,
+                    "headers": dict(request.headers),
+                    "body": request.post_data,
+                }
+        except Exception as e:
+            logger.debug(f"Request capture error: {e}")
+
+    async def on_response(resp):
+        """Handle network responses - PRIMARY METHOD."""
+        try:
+            if captured["link"]:
+                return
+            if "/cc/" in resp.url and (link := _find_cc_link(resp.url)):
+                captured["link"] = link
+                return
+            if any(marker in resp.url for marker in SHARE_API_MARKERS) and resp.status == 200:
+                if "application/json" in resp.headers.get("content-type", ""):
+                    data = await resp.json()
+                    captured["response_data"] = data
+                    if link := _find_cc_link(data):
+                        captured["link"] = link
+                        logger.info(f"🌐 Found shortUrl in JSON: {link}")
+                        return
+            if 300 <= resp.status < 400 and (link := _find_cc_link(resp.headers.get("location", ""))):
+                captured["link"] = link
+        except Exception as e:
+            logger.debug(f"Response handler error: {e}")
+
+    page.on("request", on_request)
+    page.on("response", on_response)
+    try:
+        logger.info(f"📄 Navigating to: {url}")
+        await page.goto(url, wait_until="domcontentloaded", timeout=timeout * 1000)
+        await page.wait_for_timeout(1000)  # Wait for initial load
+
+        if not captured["link"]:
+            share_button = None
+            for selector in SHARE_BUTTON_SELECTORS:
+                try:
+                    share_button = await page.query_selector(selector)
+                    if share_button:
+                        break
+                except Exception:
+                    continue
+            if not share_button:
+                raise RuntimeError("Share button not found")
+
+            for attempt in range(3):
+                if captured["link"]:
+                    break
+                try:
+                    await share_button.scroll_into_view_if_needed()
+                    await page.wait_for_timeout(random.randint(200, 500))
+                    try:
+                        await share_button.hover()
+                        await page.wait_for_timeout(random.randint(100, 300))
+                    except Exception:
+                        pass
+                    await share_button.click(timeout=5000)
+                    await page.wait_for_timeout(random.randint(1500, 2500))  # Wait for API response
+                except Exception as e:
+                    logger.warning(f"Click attempt {attempt + 1} failed: {e}")
+
+        if not captured["link"]:
+            raise RuntimeError("No link captured after all attempts")
+
+        # A session with job cookies must not become the storage_state of new farm contexts
+        await _save_farm_session(page.context, captured.get("xhr_info"), save_state=not cookies)
+        await get_xhr_link_engine().learn(captured.get("xhr_info"), url, cookies)
+        return captured["link"]
+
+    except Exception:
+        if debug:
+            try:
+                (DEBUG_DIR / f"{job_id}.html").write_text(await page.content(), encoding="utf-8")
+                await page.screenshot(path=str(DEBUG_DIR / f"{job_id}.png"), full_page=True)
+            except Exception as e:
+                logger.warning(f"Failed to save debug artifacts: {e}")
+        raise
+    finally:
+        page.remove_listener("request", on_request)
+        page.remove_listener("response", on_response)
+
+
+async def _save_farm_session(
+    context, xhr_info: Optional[Dict[str, Any]], save_state: bool = True
+) -> None:
+    """Persist storage state for new farm contexts and XHR info for the fast path."""
+    try:
+        stale = (
+            not FARM_STORAGE_STATE.exists()
+            or time.time() - FARM_STORAGE_STATE.stat().st_mtime > FARM_STORAGE_STATE_MIN_AGE
+        )
+        if save_state and stale:
+            await context.storage_state(path=str(FARM_STORAGE_STATE))
+    except Exception as e:
+        logger.warning(f"Failed to save storage state: {e}")
+
+    if xhr_info:
+        try:
+            with open(DEBUG_DIR / "last_xhr.json", "w", encoding="utf-8") as f:
+                json.dump(xhr_info, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"Failed to save XHR info: {e}")
+
+
 def _sync_run_playwright(
     job_id: str,
     url: str,
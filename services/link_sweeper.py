@@ -0,0 +1,344 @@
+# services/link_sweeper.py
+"""
+Link Sweeper - проверка наличия товаров из старых постов и чистка канала
+
+Используется cleanup_service (мертвые ссылки) и CleanerService (распроданные):
+- наличие определяется по структурированным данным карточки (schema.org
+  offers.availability в ld+json, флаги availability/isAvailable во встроенном
+  JSON, meta itemprop) - короткие find по странице, без regex по всему HTML;
+  фразы "нет в наличии" - только если структурированных данных нет
+- проверки идут параллельно (SWEEPER_CONCURRENCY) под общим лимитом запросов
+  карточек (get_yandex_product_limiter); ответ из кэша страниц лимит не тратит
+- результат по товару кэшируется на SWEEPER_RESULT_TTL_HOURS (один товар в
+  нескольких постах проверяется один раз)
+- удаление сообщений - пачками delete_messages (до 100 id), правки - под
+  Telegram лимитером
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+ALIVE = "alive"
+SOLD_OUT = "sold_out"
+DEAD = "dead"  # 404/410 - карточки нет
+UNKNOWN = "unknown"  # сеть/неожиданный ответ - пост не трогаем
+
+# schema.org ItemAvailability (без префикса, в нижнем регистре)
+_SCHEMA_AVAILABILITY = {
+    "instock": ALIVE,
+    "limitedavailability": ALIVE,
+    "onlineonly": ALIVE,
+    "instoreonly": ALIVE,
+    "preorder": ALIVE,
+    "presale": ALIVE,
+    "backorder": ALIVE,
+    "outofstock": SOLD_OUT,
+    "soldout": SOLD_OUT,
+    "discontinued": SOLD_OUT,
+}
+
+_LD_JSON_MARKER = "application/ld+json"
+_STATE_TOKENS = ('"isAvailable":', '"availability":', '"availabilityStatus":')
+_SOLD_OUT_PHRASES = (
+    "Нет в наличии", "нет в наличии", "Товар закончился", "товар закончился",
+    "Снят с продажи", "снят с продажи", "Распродано", "Нет в продаже",
+)
+
+TELEGRAM_DELETE_BATCH = 100  # Лимит message_ids в deleteMessages
+
+
+def _schema_status(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    name = value.rsplit("/", 1)[-1].strip().lower()
+    return _SCHEMA_AVAILABILITY.get(name)
+
+
+def _offers_status(data: Any) -> Optional[str]:
+    """Статус из offers.availability в ld+json (Product / @graph / список)"""
+    if isinstance(data, list):
+        statuses = [_offers_status(item) for item in data]
+    elif isinstance(data, dict):
+        if "@graph" in data:
+            return _offers_status(data["@graph"])
+        offers = data.get("offers")
+        if offers is None:
+            return _schema_status(data.get("availability"))
+        statuses = [_offers_status(offer) for offer in (offers if isinstance(offers, list) else [offers])]
+        if isinstance(offers, dict) and "offers" in offers:  # AggregateOffer
+            statuses.append(_offers_status(offers["offers"]))
+    else:
+        return None
+    statuses = [s for s in statuses if s]
+    if ALIVE in statuses:
+        return ALIVE
+    return statuses[0] if statuses else None
+
+
+def classify_availability(html: str) -> Tuple[str, str]:
+    """
+    Наличие товара по странице карточки
+
+    Returns:
+        (ALIVE / SOLD_OUT / UNKNOWN, источник: ld+json / state / meta / text / none)
+    """
+    if not html:
+        return UNKNOWN, "none"
+
+    # 1. schema.org в <script type="application/ld+json"> (разбирается только сам блок)
+    pos = html.find(_LD_JSON_MARKER)
+    while pos != -1:
+        start = html.find(">", pos)
+        end = html.find("</script>", start)
+        if start == -1 or end == -1:
+            break
+        try:
+            status = _offers_status(json.loads(html[start + 1:end]))
+        except ValueError:
+            status = None
+        if status:
+            return status, "ld+json"
+        pos = html.find(_LD_JSON_MARKER, end)
+
+    # 2. Флаги во встроенном JSON состояния страницы: смотрим несколько символов после ключа
+    for token in _STATE_TOKENS:
+        pos = html.find(token)
+        while pos != -1:
+            value = html[pos + len(token):pos + len(token) + 40].lstrip(' "')
+            if token == '"isAvailable":':
+                if value.startswith("false"):
+                    return SOLD_OUT, "state"
+                if value.startswith("true"):
+                    return ALIVE, "state"
+            else:
+                status = _schema_status(value.split('"', 1)[0])
+                if status:
+                    return status, "state"
+            pos = html.find(token, pos + 1)
+
+    # 3. <link/meta itemprop="availability" href/content="https://schema.org/InStock">
+    pos = html.find('itemprop="availability"')
+    if pos != -1:
+        chunk = html[max(0, pos - 120):pos + 160]
+        for name in _SCHEMA_AVAILABILITY:
+            if name in chunk.lower():
+                return _SCHEMA_AVAILABILITY[name], "meta"
+
+    # 4. Структурированных данных нет - точные фразы
+    for phrase in _SOLD_OUT_PHRASES:
+        if phrase in html:
+            return SOLD_OUT, "text"
+
+    return UNKNOWN, "none"
+
+
+@dataclass
+class AvailabilityResult:
+    """Результат проверки товара"""
+
+    status: str
+    reason: Optional[str] = None  # источник решения или HTTP статус
+    checked_at: float = field(default_factory=time.time)
+    cached: bool = False
+
+    @property
+    def is_gone(self) -> bool:
+        """Товар распродан или карточка удалена"""
+        return self.status in (SOLD_OUT, DEAD)
+
+
+class AvailabilityChecker:
+    """Параллельные проверки наличия с кэшем результатов по товару"""
+
+    def __init__(self, http_client=None, concurrency: int = None, ttl_hours: float = None, limiter=None):
+        """
+        Args:
+            http_client: HTTPClient (по умолчанию общий)
+            concurrency: Одновременных проверок (SWEEPER_CONCURRENCY)
+            ttl_hours: Время жизни результата (SWEEPER_RESULT_TTL_HOURS)
+            limiter: Лимит запросов в сеть (get_yandex_product_limiter)
+        """
+        self._http_client = http_client
+        self._limiter = limiter
+        self.concurrency = concurrency or getattr(config, "SWEEPER_CONCURRENCY", 10)
+        self.ttl = (ttl_hours if ttl_hours is not None else getattr(config, "SWEEPER_RESULT_TTL_HOURS", 6)) * 3600
+        self._results: Dict[str, AvailabilityResult] = {}
+        self.stats = {"checked": 0, "cached": 0, "network_errors": 0}
+
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            from services.http_client import get_http_client
+            self._http_client = get_http_client()
+        return self._http_client
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            from services.distributed_rate_limiter import get_yandex_product_limiter
+            self._limiter = get_yandex_product_limiter()
+        return self._limiter
+
+    @staticmethod
+    def product_key(url: str) -> str:
+        from services.price_monitor import product_id_from_url
+        return product_id_from_url(url)
+
+    def cached(self, url: str) -> Optional[AvailabilityResult]:
+        result = self._results.get(self.product_key(url))
+        if result is None or time.time() - result.checked_at > self.ttl:
+            return None
+        return result
+
+    async def check(self, url: str) -> AvailabilityResult:
+        """Проверить один товар (результат из кэша, если свежий)"""
+        cached = self.cached(url)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return AvailabilityResult(cached.status, cached.reason, cached.checked_at, cached=True)
+
+        self.stats["checked"] += 1
+        try:
+            response = await self.http_client.fetch_page(
+                url,
+                max_retries=2,
+                max_age=getattr(config, "HTTP_CACHE_AVAILABILITY_TTL", 900),
+                limiter=self.limiter,
+            )
+        except Exception as e:
+            logger.debug(f"Availability check failed for {url[:100]}: {e}")
+            response = None
+
+        if response is None:
+            self.stats["network_errors"] += 1
+            return AvailabilityResult(UNKNOWN, "network")
+        if response.status in (404, 410):
+            result = AvailabilityResult(DEAD, str(response.status))
+        elif response.status == 200:
+            status, source = classify_availability(response.text)
+            result = AvailabilityResult(status, source)
+        else:
+            return AvailabilityResult(UNKNOWN, str(response.status))
+
+        self._results[self.product_key(url)] = result
+        return result
+
+    async def check_many(self, urls: Iterable[str]) -> Dict[str, AvailabilityResult]:
+        """Проверить товары параллельно; один товар (разные URL поста) - один запрос"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        by_key: Dict[str, str] = {}
+        for url in urls:
+            by_key.setdefault(self.product_key(url), url)
+
+        async def run(url: str) -> AvailabilityResult:
+            async with semaphore:
+                return await self.check(url)
+
+        keys = list(by_key)
+        results = await asyncio.gather(*(run(by_key[key]) for key in keys))
+        checked = dict(zip(keys, results))
+        return {url: checked[self.product_key(url)] for url in urls}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "cached_products": len(self._results)}
+
+
+async def remove_channel_posts(
+    bot, posts: List[Dict[str, Any]], delete: bool = True, edit_caption: bool = False
+) -> Dict[str, int]:
+    """
+    Удалить (пачками) или пометить "РАСПРОДАНО" сообщения в канале
+
+    Args:
+        bot: aiogram Bot
+        posts: dict с chat_id, message_id (и title для правки подписи)
+        delete: Удалять сообщения
+        edit_caption: Если не delete - дописать в подпись "❌ РАСПРОДАНО"
+
+    Returns:
+        {"deleted": N, "edited": M, "errors": E}
+    """
+    from services.distributed_rate_limiter import get_telegram_api_limiter
+
+    limiter = get_telegram_api_limiter()
+    stats = {"deleted": 0, "edited": 0, "errors": 0}
+
+    async def delete_one(chat_id, message_id) -> None:
+        await limiter.acquire()
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            stats["deleted"] += 1
+        except Exception as e:
+            if _already_gone(e):
+                logger.debug(f"Message {message_id} already deleted or can't be deleted")
+                return
+            stats["errors"] += 1
+            logger.warning(f"⚠️ Failed to delete message {message_id} from {chat_id}: {e}")
+
+    if delete:
+        by_chat: Dict[Any, List[int]] = {}
+        for post in posts:
+            by_chat.setdefault(post["chat_id"], []).append(post["message_id"])
+        for chat_id, message_ids in by_chat.items():
+            for i in range(0, len(message_ids), TELEGRAM_DELETE_BATCH):
+                chunk = message_ids[i:i + TELEGRAM_DELETE_BATCH]
+                await limiter.acquire()
+                try:
+                    # Отсутствующие сообщения Telegram пропускает сам
+                    await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                    stats["deleted"] += len(chunk)
+                    logger.info(f"✅ Deleted {len(chunk)} messages from channel {chat_id}")
+                except Exception as e:
+                    logger.warning(f"Batch delete failed in {chat_id}, deleting one by one: {e}")
+                    for message_id in chunk:
+                        await delete_one(chat_id, message_id)
+        return stats
+
+    if edit_caption:
+        async def edit_one(post: Dict[str, Any]) -> None:
+            await limiter.acquire()
+            try:
+                await bot.edit_message_caption(
+                    chat_id=post["chat_id"],
+                    message_id=post["message_id"],
+                    caption=f"{post.get('title', '')}\n\n❌ <b>РАСПРОДАНО</b>",
+                    parse_mode="HTML",
+                )
+                stats["edited"] += 1
+            except Exception as e:
+                if _already_gone(e):
+                    return
+                logger.warning(f"Edit failed, trying delete: {e}")
+                await delete_one(post["chat_id"], post["message_id"])
+
+        await asyncio.gather(*(edit_one(post) for post in posts))
+    return stats
+
+
+def _already_gone(error: Exception) -> bool:
+    message = str(error).lower()
+    return (
+        "message to delete not found" in message
+        or "message not found" in message
+        or "message can't be deleted" in message
+    )
+
+
+# Глобальный экземпляр
+_availability_checker: Optional[AvailabilityChecker] = None
+
+
+def get_availability_checker() -> AvailabilityChecker:
+    """Получить общий AvailabilityChecker (кэш результатов на весь процесс)"""
+    global _availability_checker
+    if _availability_checker is None:
+        _availability_checker = AvailabilityChecker()
+    return _availability_checker
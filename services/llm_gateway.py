@@ -0,0 +1,204 @@
+"""
+LLM Gateway - очередь запросов к LLM с пакетированием и token bucket
+
+Вместо "один товар - один chat completion" и отбрасывания запросов сверх
+лимита:
+- token bucket: запрос сверх лимита ждет своей очереди, а не теряется
+- пока запрос ждет токен, в очередь подходят другие; после получения токена
+  они уходят одним пакетным запросом (до max_batch элементов). Одиночный
+  запрос при пустой очереди уходит сразу, без искусственной задержки
+- ответ пакета разбирается по элементам; элемент, который модель пропустила
+  или вернула невалидным, переспрашивается одиночным запросом
+
+Сервис передает две функции: send_single(item) -> result | None и
+send_batch(items) -> [result | None, ...] | None (None - пакет не удался целиком).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в минуту, запас burst; acquire ждет (FIFO)"""
+
+    def __init__(self, rate_per_minute: float, burst: int = None):
+        self.rate = max(float(rate_per_minute), 0.001) / 60.0  # токенов в секунду
+        self.capacity = float(burst or max(1, int(rate_per_minute) // 4 or 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Сколько секунд ждать следующий токен (0 - доступен сейчас)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> float:
+        """
+        Взять токен, дождавшись его при необходимости
+
+        Returns:
+            Время ожидания в секундах
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                delay = self.wait_time()
+                if delay <= 0:
+                    self.tokens -= 1
+                    return time.monotonic() - started
+                await asyncio.sleep(delay)
+
+
+class LlmGateway:
+    """
+    Очередь запросов к одному LLM API: token bucket + пакетирование
+    """
+
+    def __init__(
+        self,
+        send_single: Callable[[Any], Awaitable[Optional[Any]]],
+        send_batch: Optional[Callable[[List[Any]], Awaitable[Optional[List[Optional[Any]]]]]] = None,
+        rate_per_minute: float = 10,
+        burst: int = None,
+        max_batch: int = 5,
+        max_concurrent: int = 2,
+        name: str = "llm",
+    ):
+        """
+        Args:
+            send_single: Запрос по одному элементу
+            send_batch: Пакетный запрос (None - без пакетирования)
+            rate_per_minute: Лимит HTTP запросов к API в минуту
+            burst: Запас токенов (сколько запросов можно сделать подряд)
+            max_batch: Максимум элементов в одном запросе
+            max_concurrent: Одновременных запросов к API
+            name: Имя для логов
+        """
+        self.send_single = send_single
+        self.send_batch = send_batch
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.max_batch = max(1, max_batch) if send_batch else 1
+        self.max_concurrent = max(1, max_concurrent)
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.stats = {
+            "submitted": 0,
+            "requests": 0,
+            "batches": 0,
+            "batched_items": 0,
+            "batch_failures": 0,
+            "retried_single": 0,
+            "wait_ms_total": 0.0,
+        }
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._dispatcher and not self._dispatcher.done():
+            return
+        if self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        self._dispatcher = loop.create_task(self._dispatch())
+
+    async def submit(self, item: Any) -> Optional[Any]:
+        """
+        Поставить элемент в очередь и дождаться результата
+
+        Returns:
+            Результат send_single / элемент ответа send_batch, None при неудаче
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self.stats["submitted"] += 1
+        await self._queue.put((item, future, time.monotonic()))
+        return await future
+
+    async def _dispatch(self) -> None:
+        while True:
+            first = await self._queue.get()
+            await self._semaphore.acquire()
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self._semaphore.release()
+                if not first[1].done():
+                    first[1].cancel()
+                raise
+            # Пока ждали токен, очередь могла вырасти - забираем ее одним запросом
+            batch = [first]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            now = time.monotonic()
+            self.stats["wait_ms_total"] += sum(now - queued for _, _, queued in batch) * 1000
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[tuple]) -> None:
+        try:
+            items = [item for item, _, _ in batch]
+            self.stats["requests"] += 1
+            if len(batch) == 1:
+                results = [await self._call(self.send_single, items[0])]
+            else:
+                self.stats["batches"] += 1
+                self.stats["batched_items"] += len(batch)
+                results = await self._call(self.send_batch, items)
+                if results is None:
+                    self.stats["batch_failures"] += 1
+                    results = [None] * len(batch)
+                else:
+                    results = list(results)[: len(batch)] + [None] * max(0, len(batch) - len(results))
+                    missing = [i for i, result in enumerate(results) if result is None]
+                    # Модель пропустила часть товаров - переспрашиваем их по одному
+                    for i in missing:
+                        self.stats["retried_single"] += 1
+                        self.stats["requests"] += 1
+                        await self.bucket.acquire()
+                        results[i] = await self._call(self.send_single, items[i])
+        except Exception as e:
+            logger.error(f"{self.name} gateway request failed: {e}", exc_info=True)
+            results = [None] * len(batch)
+        finally:
+            self._semaphore.release()
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _call(self, func, arg):
+        try:
+            return await func(arg)
+        except Exception as e:
+            logger.warning(f"{self.name} gateway call failed: {e}")
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика очереди"""
+        requests = self.stats["requests"]
+        submitted = self.stats["submitted"]
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": (
+                self.stats["batched_items"] / self.stats["batches"] if self.stats["batches"] else 0.0
+            ),
+            "items_per_request": submitted / requests if requests else 0.0,
+            "avg_wait_ms": self.stats["wait_ms_total"] / submitted if submitted else 0.0,
+        }
@@ -0,0 +1,245 @@
+# services/log_index.py
+"""
+Log Index - чтение лога с конца и индекс смещений по часам/уровням
+
+Лог бота пишет RotatingFileHandler: bot.log, bot.log.1 ... bot.log.N
+(чем больше номер, тем старше). Формат строки:
+    [2025-01-01 12:00:00] INFO module: message
+
+- read_lines_reversed: строки файла (или диапазона байт) от конца к началу
+  блоками через seek, без чтения всего файла
+- LogIndex: sidecar JSON рядом с логом. Для каждого файла - по часам:
+  диапазон байт часа, число строк каждого уровня и смещения строк
+  WARNING/ERROR/CRITICAL. Индекс дописывается инкрементально (только новые
+  байты), файлы опознаются по началу содержимого, поэтому ротация
+  (bot.log -> bot.log.1) не требует переиндексации.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEVEL_ORDER = {"DEBUG": 0, "INFO": 1, "WARNING": 2, "ERROR": 3, "CRITICAL": 4}
+# Уровни, для которых в индексе хранятся смещения отдельных строк
+INDEXED_LEVELS = ("WARNING", "ERROR", "CRITICAL")
+
+HEADER_RE = re.compile(rb"^\[(\d{4}-\d{2}-\d{2} \d{2}):\d{2}:\d{2}[^\]]*\]\s+(\w+)\s")
+
+BLOCK_SIZE = 64 * 1024
+SIGNATURE_BYTES = 512
+
+
+def rotated_files(log_file: str) -> List[str]:
+    """Файлы лога от нового к старому: bot.log, bot.log.1, bot.log.2, ..."""
+    directory = os.path.dirname(log_file) or "."
+    base = os.path.basename(log_file)
+    numbered = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+    for name in names:
+        suffix = name[len(base) + 1:] if name.startswith(base + ".") else ""
+        if suffix.isdigit():
+            numbered.append((int(suffix), os.path.join(directory, name)))
+    files = [log_file] if os.path.exists(log_file) else []
+    return files + [path for _, path in sorted(numbered)]
+
+
+def read_lines_reversed(
+    path: str, start: int = 0, end: Optional[int] = None, block_size: int = BLOCK_SIZE
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Строки файла от конца к началу
+
+    Args:
+        path: Файл
+        start: Начало диапазона (начало строки)
+        end: Конец диапазона (None - конец файла)
+
+    Yields:
+        (смещение начала строки, строка без перевода строки); пустые строки пропускаются
+    """
+    with open(path, "rb") as f:
+        if end is None:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+        pos = end
+        tail = b""
+        while pos > start:
+            size = min(block_size, pos - start)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + tail).split(b"\n")
+            # lines[0] может быть продолжением строки из предыдущего блока
+            offsets = [pos]
+            for line in lines[:-1]:
+                offsets.append(offsets[-1] + len(line) + 1)
+            for i in range(len(lines) - 1, 0, -1):
+                if lines[i].strip():
+                    yield offsets[i], lines[i]
+            tail = lines[0]
+        if tail.strip():
+            yield start, tail
+
+
+def read_line_at(f, offset: int) -> bytes:
+    """Строка, начинающаяся со смещения offset (файл открыт в rb)"""
+    f.seek(offset)
+    return f.readline().rstrip(b"\r\n")
+
+
+def _signature(path: str) -> Optional[str]:
+    """Идентичность файла по началу содержимого (переживает переименование при ротации)"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(SIGNATURE_BYTES)
+    except OSError:
+        return None
+    if not head:
+        return None
+    return hashlib.sha1(head).hexdigest()[:16]
+
+
+class LogIndex:
+    """Sidecar индекс смещений лога по часам и уровням"""
+
+    def __init__(self, log_file: str, index_path: Optional[str] = None, max_offsets: int = 200):
+        """
+        Args:
+            log_file: Основной файл лога
+            index_path: Файл индекса (по умолчанию <log_file>.idx)
+            max_offsets: Смещений строк одного уровня за час (больше - читается весь час)
+        """
+        self.log_file = log_file
+        self.index_path = index_path or f"{log_file}.idx"
+        self.max_offsets = max_offsets
+        self._data: Dict = {"files": {}}
+        self._loaded = False
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data.get("files"), dict):
+                self._data = data
+        except (FileNotFoundError, ValueError):
+            pass
+        except OSError as e:
+            logger.debug(f"Cannot read log index {self.index_path}: {e}")
+
+    def _save(self) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.debug(f"Cannot write log index {self.index_path}: {e}")
+
+    def refresh(self) -> Dict[str, Dict]:
+        """
+        Дописать индекс новыми строками всех файлов лога
+
+        Returns:
+            path -> запись индекса файла {"size", "indexed_to", "hours": {...}}
+        """
+        self._load()
+        files = self._data["files"]
+        result = {}
+        changed = False
+        for path in rotated_files(self.log_file):
+            signature = _signature(path)
+            if signature is None:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            entry = files.get(signature)
+            if entry is None or entry.get("indexed_to", 0) > size:
+                entry = {"indexed_to": 0, "last_hour": None, "hours": {}}
+                files[signature] = entry
+            if entry["indexed_to"] < size:
+                self._index_tail(path, entry)
+                changed = True
+            result[path] = entry
+
+        # Записи удаленных при ротации файлов больше не нужны
+        alive = {_signature(path) for path in result}
+        for signature in list(files):
+            if signature not in alive:
+                del files[signature]
+                changed = True
+        if changed:
+            self._save()
+        return result
+
+    def _index_tail(self, path: str, entry: Dict) -> None:
+        """Проиндексировать полные строки после entry["indexed_to"]"""
+        hours = entry["hours"]
+        offset = entry["indexed_to"]
+        current = entry.get("last_hour")
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # строка еще дописывается
+                match = HEADER_RE.match(line)
+                if match:
+                    current = match.group(1).decode("ascii")
+                    level = match.group(2).decode("ascii", "ignore").upper()
+                else:
+                    level = "INFO"  # продолжение (traceback) читается как INFO
+                if current is not None:
+                    bucket = hours.get(current)
+                    if bucket is None:
+                        bucket = hours[current] = {"start": offset, "end": offset, "levels": {}, "offsets": {}}
+                    bucket["end"] = offset + len(line)
+                    bucket["levels"][level] = bucket["levels"].get(level, 0) + 1
+                    if level in INDEXED_LEVELS:
+                        offsets = bucket["offsets"].get(level, [])
+                        if offsets is not None and len(offsets) < self.max_offsets:
+                            offsets.append(offset)
+                        else:
+                            offsets = None  # слишком много - при чтении сканируется весь час
+                        bucket["offsets"][level] = offsets
+                offset += len(line)
+        entry["indexed_to"] = offset
+        entry["last_hour"] = current
+
+    @staticmethod
+    def plan(
+        entry: Dict, min_level: int, since_hour: Optional[str] = None
+    ) -> List[Tuple[str, object]]:
+        """
+        Что читать в файле, от новых часов к старым
+
+        Returns:
+            [("lines", [смещения...]) или ("range", (start, end)), ...]
+        """
+        steps: List[Tuple[str, object]] = []
+        for hour in sorted(entry["hours"], reverse=True):
+            if since_hour and hour < since_hour:
+                break
+            bucket = entry["hours"][hour]
+            levels = [
+                level for level, count in bucket["levels"].items()
+                if count and LEVEL_ORDER.get(level, 1) >= min_level
+            ]
+            if not levels:
+                continue
+            offsets = [bucket["offsets"].get(level) for level in levels]
+            if min_level >= LEVEL_ORDER["WARNING"] and all(o is not None for o in offsets):
+                steps.append(("lines", sorted((o for group in offsets for o in group), reverse=True)))
+            else:
+                steps.append(("range", (bucket["start"], bucket["end"])))
+        return steps
@@ -3,8 +3,10 @@
 import os
 import re
 import logging
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import Iterator, List, Dict, Optional
+from datetime import datetime, timedelta
+
+from services.log_index import LEVEL_ORDER, LogIndex, read_line_at, read_lines_reversed, rotated_files
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,7 @@ class LogService:
 
     def __init__(self, log_file: str):
         self.log_file = log_file
+        self.index = LogIndex(log_file)
 
     def get_recent_logs(
         self,
@@ -21,48 +24,58 @@ class LogService:
         min_level: str = "INFO",
         keywords: Optional[List[str]] = None,
         exclude_keywords: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
     ) -> List[Dict[str, str]]:
         """
         Получает последние логи с фильтрацией
 
+        Файлы (включая ротированные) читаются с конца блоками и только до
+        limit совпадений. Для уровня от WARNING и для since часы без
+        подходящих строк пропускаются по индексу (services/log_index).
+
         Args:
             limit: Максимальное количество логов
             min_level: Минимальный уровень (DEBUG, INFO, WARNING, ERROR, CRITICAL)
             keywords: Ключевые слова для включения
             exclude_keywords: Ключевые слова для исключения
+            since: Только записи не старше этого времени (время лога)
 
         Returns:
             Список словарей с логами: [{"level": "...", "time": "...", "message": "..."}, ...]
         """
-        if not os.path.exists(self.log_file):
+        files = rotated_files(self.log_file)
+        if not files:
             return []
 
-        level_order = {"DEBUG": 0, "INFO": 1, "WARNING": 2, "ERROR": 3, "CRITICAL": 4}
-        min_level_num = level_order.get(min_level.upper(), 1)
+        min_level_num = LEVEL_ORDER.get(min_level.upper(), 1)
 
         logs = []
         keywords_lower = [k.lower() for k in (keywords or [])]
         exclude_lower = [k.lower() for k in (exclude_keywords or [])]
+        since_str = since.strftime("%Y-%m-%d %H:%M:%S") if since else None
+        since_hour = since.strftime("%Y-%m-%d %H") if since else None
 
         try:
-            with open(self.log_file, "r", encoding="utf-8", errors="ignore") as f:
-                # Читаем файл с конца (последние строки)
-                lines = f.readlines()
-                # Берем последние N строк для анализа
-                recent_lines = lines[-1000:] if len(lines) > 1000 else lines
-
-                for line in reversed(recent_lines):
-                    if len(logs) >= limit:
-                        break
-
+            try:
+                index = self.index.refresh()
+            except Exception as e:
+                logger.debug(f"Log index unavailable, full reverse scan: {e}")
+                index = {}
+
+            for path in files:
+                for line in self._candidate_lines(path, index.get(path), min_level_num, since_hour):
                     # Парсим строку лога
-                    log_entry = self._parse_log_line(line)
+                    log_entry = self._parse_log_line(line.decode("utf-8", errors="ignore"))
                     if not log_entry:
                         continue
 
+                    # Строки идут от новых к старым: дальше только старше since
+                    if since_str and log_entry["module"] != "unknown" and log_entry["time"] < since_str:
+                        return list(reversed(logs))
+
                     # Фильтр по уровню
                     log_level = log_entry.get("level", "INFO")
-                    if level_order.get(log_level, 1) < min_level_num:
+                    if LEVEL_ORDER.get(log_level, 1) < min_level_num:
                         continue
 
                     # Фильтр по ключевым словам
@@ -77,6 +90,8 @@ class LogService:
                             continue
 
                     logs.append(log_entry)
+                    if len(logs) >= limit:
+                        return list(reversed(logs))
 
             # Возвращаем в хронологическом порядке
             return list(reversed(logs))
@@ -85,6 +100,39 @@ class LogService:
             logger.error(f"Error reading logs: {e}")
             return []
 
+    def _candidate_lines(
+        self, path: str, entry: Optional[Dict], min_level: int, since_hour: Optional[str]
+    ) -> Iterator[bytes]:
+        """Строки файла от новых к старым; с индексом - только нужные часы/строки"""
+        if entry is None:
+            for _, line in read_lines_reversed(path):
+                yield line
+            return
+
+        # Хвост, еще не попавший в индекс (последняя строка дописывается)
+        size = os.path.getsize(path)
+        if entry["indexed_to"] < size:
+            for _, line in read_lines_reversed(path, entry["indexed_to"], size):
+                yield line
+
+        for kind, target in LogIndex.plan(entry, min_level, since_hour):
+            if kind == "range":
+                start, end = target
+                for _, line in read_lines_reversed(path, start, end):
+                    yield line
+            else:
+                with open(path, "rb") as f:
+                    for offset in target:
+                        yield read_line_at(f, offset)
+
+    def get_error_logs(self, hours: int = 6, limit: int = 50) -> List[Dict[str, str]]:
+        """Ошибки (ERROR, CRITICAL) за последние hours часов"""
+        return self.get_recent_logs(
+            limit=limit,
+            min_level="ERROR",
+            since=datetime.now() - timedelta(hours=hours),
+        )
+
     def _parse_log_line(self, line: str) -> Optional[Dict[str, str]]:
         """Парсит строку лога в словарь"""
         if not line.strip():
@@ -0,0 +1,271 @@
+# services/metrics_aggregator.py
+"""
+Metrics Aggregator - write-behind счетчики кликов и показов
+
+Клик не пишет в базу/файл сразу: дельта копится в памяти (по постам, брендам
+и шаблонам) и раз в METRICS_FLUSH_INTERVAL секунд уходит одной пачкой
+(batched UPSERT в Postgres или атомарная замена JSON файла).
+
+Счетчики разбиты на шарды со своей блокировкой и своим WAL файлом: событие
+сначала дописывается строкой в WAL шарда, потом применяется к счетчику - под
+одной блокировкой, поэтому при flush ротация WAL и снятие дельт атомарны.
+Сегменты WAL удаляются только после успешного flush; при старте оставшиеся
+сегменты проигрываются заново (at-least-once: падение между записью пачки
+и удалением сегмента может посчитать эту пачку дважды).
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("clicks", "impressions")
+SCOPES = ("posts", "brands", "templates")
+
+# {"posts": {post_id: {"clicks": n, "impressions": n}}, "brands": {...}, "templates": {...}}
+Deltas = Dict[str, Dict[str, Dict[str, int]]]
+FlushFn = Callable[[Deltas], None]
+
+
+def _empty() -> Deltas:
+    return {scope: defaultdict(lambda: defaultdict(int)) for scope in SCOPES}
+
+
+def merge_deltas(target: Deltas, deltas: Deltas) -> Deltas:
+    """Сложить дельты deltas в target"""
+    for scope in SCOPES:
+        for key, counters in deltas.get(scope, {}).items():
+            for kind, value in counters.items():
+                target[scope][key][kind] += value
+    return target
+
+
+class _Shard:
+    """Часть счетчиков со своей блокировкой и WAL файлом"""
+
+    def __init__(self, wal_path: str):
+        self.lock = threading.Lock()
+        self.wal_path = wal_path
+        self.wal = None
+        self.segments: List[str] = []
+        self.deltas = _empty()
+        self.events = 0
+
+    def apply(self, kind: str, post_id: str, brand: Optional[str], template: Optional[str], n: int):
+        self.deltas["posts"][post_id][kind] += n
+        if brand:
+            self.deltas["brands"][brand][kind] += n
+        if template:
+            self.deltas["templates"][template][kind] += n
+        self.events += 1
+
+    def rotate(self, seq: int) -> None:
+        """Текущий WAL -> сегмент (удаляется после успешного flush)"""
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
+        if os.path.exists(self.wal_path):
+            segment = f"{self.wal_path}.{seq}"
+            os.replace(self.wal_path, segment)
+            self.segments.append(segment)
+
+
+class CounterAggregator:
+    """Шардированные счетчики с WAL и периодическим пакетным сбросом"""
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        wal_dir: str = None,
+        shards: int = None,
+        flush_interval: float = None,
+        name: str = "metrics",
+    ):
+        """
+        Args:
+            flush_fn: Запись пачки дельт (исключение - дельты вернутся в счетчики)
+            wal_dir: Каталог WAL (None - METRICS_WAL_DIR, "" - без WAL)
+            shards: Число шардов (METRICS_COUNTER_SHARDS)
+            flush_interval: Период сброса, сек (METRICS_FLUSH_INTERVAL)
+        """
+        self.flush_fn = flush_fn
+        self.name = name
+        self.wal_dir = getattr(config, "METRICS_WAL_DIR", "cache/metrics_wal") if wal_dir is None else wal_dir
+        self.flush_interval = flush_interval or getattr(config, "METRICS_FLUSH_INTERVAL", 5)
+        count = shards or getattr(config, "METRICS_COUNTER_SHARDS", 8)
+        if self.wal_dir:
+            os.makedirs(self.wal_dir, exist_ok=True)
+        self._shards = [
+            _Shard(os.path.join(self.wal_dir, f"{name}-{i}.wal") if self.wal_dir else "")
+            for i in range(count)
+        ]
+        self._flush_lock = threading.Lock()
+        self._seq = int(time.time() * 1000)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = defaultdict(int)
+        self._recover()
+
+    def _shard(self, post_id: str) -> _Shard:
+        return self._shards[hash(post_id) % len(self._shards)]
+
+    def record(
+        self,
+        kind: str,
+        post_id,
+        brand: Optional[str] = None,
+        template: Optional[str] = None,
+        n: int = 1,
+    ) -> None:
+        """Учесть n кликов/показов (kind: clicks / impressions)"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown counter kind: {kind}")
+        key = str(post_id)
+        shard = self._shard(key)
+        with shard.lock:
+            if shard.wal_path:
+                if shard.wal is None:
+                    shard.wal = open(shard.wal_path, "a", encoding="utf-8")
+                shard.wal.write(json.dumps([kind, key, brand, template, n], ensure_ascii=False) + "\n")
+                shard.wal.flush()
+            shard.apply(kind, key, brand, template, n)
+
+    def pending(self) -> Deltas:
+        """Еще не сброшенные дельты (копия)"""
+        result = _empty()
+        for shard in self._shards:
+            with shard.lock:
+                merge_deltas(result, shard.deltas)
+        return result
+
+    def flush(self) -> int:
+        """
+        Сбросить накопленные дельты одной пачкой
+
+        Returns:
+            Количество событий в пачке (0 - нечего сбрасывать или ошибка записи)
+        """
+        with self._flush_lock:
+            self._seq += 1
+            batch = _empty()
+            events = 0
+            taken = []
+            for shard in self._shards:
+                with shard.lock:
+                    if not shard.events and not shard.segments:
+                        continue
+                    shard.rotate(self._seq)
+                    taken.append((shard, shard.deltas, shard.events))
+                    merge_deltas(batch, shard.deltas)
+                    events += shard.events
+                    shard.deltas = _empty()
+                    shard.events = 0
+            if not taken:
+                return 0
+            if not events:
+                self._drop_segments(taken)
+                return 0
+
+            try:
+                self.flush_fn(batch)
+            except Exception as e:
+                # Дельты возвращаются в счетчики, сегменты WAL остаются до следующей попытки
+                for shard, deltas, count in taken:
+                    with shard.lock:
+                        merge_deltas(shard.deltas, deltas)
+                        shard.events += count
+                self.stats["flush_errors"] += 1
+                logger.error(f"{self.name}: flush of {events} events failed: {e}")
+                return 0
+
+            self._drop_segments(taken)
+            self.stats["flushes"] += 1
+            self.stats["flushed_events"] += events
+            self.stats["flushed_rows"] += len(batch["posts"])
+            logger.debug(f"{self.name}: flushed {events} events as {len(batch['posts'])} post rows")
+            return events
+
+    def _drop_segments(self, taken) -> None:
+        for shard, _, _ in taken:
+            with shard.lock:
+                segments, shard.segments = shard.segments, []
+            for segment in segments:
+                try:
+                    os.remove(segment)
+                except FileNotFoundError:
+                    pass
+
+    def _recover(self) -> None:
+        """Проиграть WAL, оставшийся от прошлого запуска"""
+        if not self.wal_dir:
+            return
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.wal_dir, f"{self.name}-*.wal*"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            kind, key, brand, template, n = json.loads(line)
+                        except (ValueError, TypeError):
+                            continue  # недописанная строка при падении
+                        shard = self._shard(key)
+                        shard.apply(kind, key, brand, template, n)
+                        recovered += 1
+            except OSError as e:
+                logger.warning(f"{self.name}: cannot read WAL {path}: {e}")
+                continue
+            # Файл становится сегментом шарда и удалится после успешного flush
+            self._seq += 1
+            segment = f"{path}.recovered.{self._seq}"
+            os.replace(path, segment)
+            self._shards[0].segments.append(segment)
+        if recovered:
+            self.stats["recovered_events"] = recovered
+            logger.info(f"{self.name}: recovered {recovered} events from WAL")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"{self.name}: flush loop error: {e}")
+
+    def start(self) -> None:
+        """Запустить периодический сброс в фоновом потоке"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-flush", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Остановить фоновый сброс и сбросить остаток"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+        for shard in self._shards:
+            with shard.lock:
+                if shard.wal is not None:
+                    shard.wal.close()
+                    shard.wal = None
+
+    def get_stats(self) -> Dict[str, int]:
+        pending = sum(shard.events for shard in self._shards)
+        return {
+            "pending_events": pending,
+            "flushes": self.stats["flushes"],
+            "flushed_events": self.stats["flushed_events"],
+            "flushed_rows": self.stats["flushed_rows"],
+            "flush_errors": self.stats["flush_errors"],
+            "recovered_events": self.stats["recovered_events"],
+        }
@@ -1,5 +1,8 @@
 # services/metrics_service.py - Система метрик и CTR
+import json
 import logging
+import os
+import threading
 import time
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
@@ -7,6 +10,7 @@ from urllib.parse import parse_qs, urlparse
 import config
 from database_postgres import get_postgres_db
 from redis_cache import get_redis_cache
+from services.metrics_aggregator import CounterAggregator
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +25,17 @@ class MetricsService:
         self.metrics_file = "metrics_cache.json"
         self.metrics_cache = {
             'posts': {},  # post_id -> metrics
+            'brands': {},  # brand -> clicks/impressions
+            'templates': {},  # template -> clicks/impressions
             'daily_stats': {}  # date -> stats
         }
+        self._cache_lock = threading.Lock()
         self._load_metrics_cache()
 
+        # Клики/показы копятся в памяти и сбрасываются пачкой (WAL на случай падения)
+        self.aggregator = CounterAggregator(self._flush_counters)
+        self.aggregator.start()
+
     def record_click(self, click_data: Dict) -> bool:
         """
         Записать клик по посту
@@ -41,11 +52,12 @@ class MetricsService:
                 logger.warning("No post_id in click data")
                 return False
 
-            # Используем базу данных если доступна, иначе файловый кэш
-            if self.db:
-                self.db.increment_clicks(post_id)
-            else:
-                self.record_click_file(post_id)
+            # В базу или файл уйдет пачкой при следующем сбросе агрегатора
+            self.aggregator.record(
+                'clicks', post_id,
+                brand=click_data.get('brand'),
+                template=click_data.get('template_used'),
+            )
 
             # Логируем детальную информацию о клике
             logger.info(f"Click recorded: post_id={post_id}, user={click_data.get('user_id', 'unknown')}")
@@ -72,11 +84,11 @@ class MetricsService:
                 logger.warning("No post_id in impression data")
                 return False
 
-            # Используем базу данных если доступна, иначе файловый кэш
-            if self.db:
-                self.db.increment_impressions(post_id)
-            else:
-                self.record_impression_file(post_id)
+            self.aggregator.record(
+                'impressions', post_id,
+                brand=impression_data.get('brand'),
+                template=impression_data.get('template_used'),
+            )
 
             # Логируем с пониженной частотой (не каждый показ)
             if impression_data.get('log_impression', False):
@@ -91,34 +103,44 @@ class MetricsService:
     def _load_metrics_cache(self):
         """Загрузить метрики из файла"""
         try:
-            import json
             with open(self.metrics_file, 'r', encoding='utf-8') as f:
                 self.metrics_cache = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
             self.metrics_cache = {'posts': {}, 'daily_stats': {}}
+        self.metrics_cache.setdefault('brands', {})
+        self.metrics_cache.setdefault('templates', {})
 
     def _save_metrics_cache(self):
-        """Сохранить метрики в файл"""
-        try:
-            import json
-            with open(self.metrics_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metrics_cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save metrics cache: {e}")
+        """Сохранить метрики в файл (через временный файл и rename - без полузаписанного JSON)"""
+        tmp_path = f"{self.metrics_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics_cache, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.metrics_file)
+
+    def _flush_counters(self, deltas: Dict) -> None:
+        """Сброс агрегатора: одна пачка в Postgres или одна перезапись файла"""
+        if self.db:
+            self.db.apply_metric_deltas(deltas['posts'])
+            return
+        self._apply_file_deltas(deltas)
+
+    def _apply_file_deltas(self, deltas: Dict) -> None:
+        """Сложить дельты в файловый кэш и сохранить его"""
+        with self._cache_lock:
+            for scope in ('posts', 'brands', 'templates'):
+                section = self.metrics_cache.setdefault(scope, {})
+                for key, counters in deltas.get(scope, {}).items():
+                    entry = section.setdefault(key, {'clicks': 0, 'impressions': 0})
+                    if scope == 'posts':
+                        entry.setdefault('post_id', int(key) if key.isdigit() else key)
+                    for kind, value in counters.items():
+                        entry[kind] = entry.get(kind, 0) + value
+            self._save_metrics_cache()
 
     def record_click_file(self, post_id: int) -> bool:
         """Записать клик в файловый кэш"""
         try:
-            post_key = str(post_id)
-            if post_key not in self.metrics_cache['posts']:
-                self.metrics_cache['posts'][post_key] = {
-                    'clicks': 0,
-                    'impressions': 0,
-                    'post_id': post_id
-                }
-
-            self.metrics_cache['posts'][post_key]['clicks'] += 1
-            self._save_metrics_cache()
+            self._apply_file_deltas({'posts': {str(post_id): {'clicks': 1}}})
             return True
         except Exception as e:
             logger.error(f"Failed to record click in file cache: {e}")
@@ -127,21 +149,35 @@ class MetricsService:
     def record_impression_file(self, post_id: int) -> bool:
         """Записать показ в файловый кэш"""
         try:
-            post_key = str(post_id)
-            if post_key not in self.metrics_cache['posts']:
-                self.metrics_cache['posts'][post_key] = {
-                    'clicks': 0,
-                    'impressions': 0,
-                    'post_id': post_id
-                }
-
-            self.metrics_cache['posts'][post_key]['impressions'] += 1
-            self._save_metrics_cache()
+            self._apply_file_deltas({'posts': {str(post_id): {'impressions': 1}}})
             return True
         except Exception as e:
             logger.error(f"Failed to record impression in file cache: {e}")
             return False
 
+    def flush_metrics(self) -> int:
+        """Сбросить накопленные клики/показы сейчас (количество событий)"""
+        return self.aggregator.flush()
+
+    def close(self):
+        """Остановить фоновый сброс и сохранить остаток счетчиков"""
+        self.aggregator.close()
+
+    @staticmethod
+    def _ctr_list(section: Dict, label: str) -> List[Dict]:
+        """CTR по брендам/шаблонам в формате get_metrics_summary"""
+        result = []
+        for key, counters in section.items():
+            clicks = counters.get('clicks', 0)
+            impressions = counters.get('impressions', 0)
+            result.append({
+                label: key,
+                'clicks': clicks,
+                'impressions': impressions,
+                'ctr': round((clicks / impressions * 100) if impressions > 0 else 0, 2)
+            })
+        return sorted(result, key=lambda x: x['ctr'], reverse=True)
+
     def _get_file_metrics_summary(self, days: int) -> Dict:
         """Получить сводку метрик из файлового кэша"""
         try:
@@ -154,8 +190,8 @@ class MetricsService:
                 'total_clicks': total_clicks,
                 'total_impressions': total_impressions,
                 'overall_ctr': round((total_clicks / total_impressions * 100) if total_impressions > 0 else 0, 2),
-                'brand_ctr': [],  # Не поддерживается в файловом режиме
-                'template_ctr': []  # Не поддерживается в файловом режиме
+                'brand_ctr': self._ctr_list(self.metrics_cache.get('brands', {}), 'brand'),
+                'template_ctr': self._ctr_list(self.metrics_cache.get('templates', {}), 'template')
             }
         except Exception as e:
             logger.error(f"Failed to get file metrics summary: {e}")
@@ -379,11 +379,18 @@ class PartnerLinkService:
         ai_result = None
         if raw_data:
             try:
+                import config
                 from services.ai_enrichment_service import get_ai_enrichment_service
+                from services.ai_worker import PRIORITY_INTERACTIVE, get_ai_worker
 
                 ai_service = get_ai_enrichment_service()
                 if ai_service.enabled:
-                    ai_result = await ai_service.enrich_product_safe(raw_data)
+                    # Интерактивный запрос - вперед фонового обогащения краулера
+                    ai_result = await get_ai_worker().enrich(
+                        raw_data,
+                        priority=PRIORITY_INTERACTIVE,
+                        timeout=getattr(config, "AI_INTERACTIVE_TIMEOUT", 15),
+                    )
                     if ai_result and ai_result.get("is_valid"):
                         if ai_result.get("product_url"):
                             product_url = ai_result["product_url"]
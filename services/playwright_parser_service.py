@@ -3,11 +3,11 @@ Playwright Parser Service - Fallback парсинг каталогов чере
 Используется ТОЛЬКО когда обычный HTTP парсинг вернул < 5 товаров или сработал shadow-ban detector
 """
 
-import json
 import asyncio
 import logging
 from typing import List, Dict, Optional, Any
-from bs4 import BeautifulSoup
+
+from utils.next_data_extractor import extract_next_data_items
 
 logger = logging.getLogger(__name__)
 
@@ -112,22 +112,13 @@ class PlaywrightParserService:
             Список товаров
         """
         try:
-            soup = BeautifulSoup(html, "lxml")
-
-            script = soup.find("script", id="__NEXT_DATA__")
-            if not script:
+            items = extract_next_data_items(html)
+            if items is None:
                 logger.warning("❌ __NEXT_DATA__ not found")
                 return []
 
-            data = json.loads(script.string)
-
             # ⚠️ путь может меняться, но этот сейчас рабочий
-            try:
-                items = (
-                    data["props"]["pageProps"]
-                    ["initialState"]["search"]["results"]["items"]
-                )
-            except KeyError:
+            if not items:
                 logger.warning("❌ Items path not found in JSON")
                 return []
 
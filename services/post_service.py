@@ -97,6 +97,8 @@ async def send_post_to_channel(
     chat_id: Optional[int] = None,
     correlation_id: Optional[str] = None,
     disable_notification: bool = True,
+    photo_bytes: Optional[bytes] = None,
+    photo_cache_key: Optional[str] = None,
 ) -> Tuple[bool, Optional[int]]:
     """
     Отправляет пост в канал с ретраями
@@ -109,6 +111,9 @@ async def send_post_to_channel(
         chat_id: ID чата для уведомлений об ошибках
         correlation_id: ID для корреляции логов
         disable_notification: Если False, отправляет с уведомлением (громко)
+        photo_bytes: Готовый JPEG в памяти (приоритетнее photo_path)
+        photo_cache_key: Ключ рендера в кэше картинок: если этот рендер уже
+            загружался, отправляется его Telegram file_id без upload
 
     Returns:
         Tuple (success: bool, message_id: Optional[int])
@@ -196,13 +201,27 @@ async def send_post_to_channel(
     send_success = False
     message_id = None
 
+    # Рендер уже загружался в Telegram - отправляем по file_id без upload
+    image_cache = None
+    photo_file_id = None
+    if photo_cache_key:
+        from utils.image_proc import get_processed_image_cache
+
+        image_cache = get_processed_image_cache()
+        photo_file_id = image_cache.get_file_id(photo_cache_key)
+
     for attempt in range(retry_count):
         try:
-            if photo_path and os.path.exists(photo_path):
+            if photo_bytes or (photo_path and os.path.exists(photo_path)):
                 logger.info(
                     f"Sending photo post (attempt {attempt + 1}/{retry_count}, correlation_id={correlation_id})"
                 )
-                photo = types.FSInputFile(photo_path)
+                if photo_file_id:
+                    photo = photo_file_id
+                elif photo_bytes:
+                    photo = types.BufferedInputFile(photo_bytes, filename="photo.jpg")
+                else:
+                    photo = types.FSInputFile(photo_path)
                 sent_message = await bot.send_photo(
                     chat_id=config.CHANNEL_ID,
                     photo=photo,
@@ -215,6 +234,11 @@ async def send_post_to_channel(
                 logger.info(
                     f"Photo post sent successfully (message_id: {message_id}, correlation_id={correlation_id})"
                 )
+                if image_cache and not photo_file_id:
+                    try:
+                        image_cache.set_file_id(photo_cache_key, sent_message.photo[-1].file_id)
+                    except Exception as e:
+                        logger.debug(f"Failed to remember photo file_id: {e}")
             else:
                 logger.info(
                     f"Sending text post (attempt {attempt + 1}/{retry_count}, correlation_id={correlation_id})"
@@ -278,6 +302,10 @@ async def send_post_to_channel(
             logger.warning(
                 f"Send attempt {attempt + 1}/{retry_count} failed (correlation_id={correlation_id}): {e}"
             )
+            if photo_file_id and photo_bytes:
+                # file_id мог стать недействительным - следующая попытка загрузит файл
+                image_cache.forget_file_id(photo_cache_key)
+                photo_file_id = None
             if attempt < retry_count - 1:
                 await asyncio.sleep(2**attempt)
             else:
@@ -1,14 +1,117 @@
 # services/price_monitor.py
-"""Сервис для мониторинга падения цен на товары"""
+"""Сервис для мониторинга падения цен на товары
+
+Проверки планируются по ожидаемой волатильности цены (категория, давность
+последнего изменения, размер скидки) и времени с последней проверки: за цикл
+проверяются max_checks самых "просроченных" товаров из большого пула истории.
+Проверки идут параллельно под общим распределенным rate limiter'ом, сначала
+через JSON API, затем по HTML (через кэш ответов), результаты пишутся пачкой
+в price_history.
+"""
 import asyncio
 import logging
 import re
-from typing import List, Dict, Optional, Tuple
+import time
+from dataclasses import dataclass
+from typing import Any, List, Dict, Optional, Tuple
 from datetime import datetime
 
+import config
+
 logger = logging.getLogger(__name__)
 
-from utils.scraper import scrape_yandex_market
+from utils.scraper import fetch_price_via_api, scrape_yandex_market
+
+# Множители волатильности по ключевым словам категории/названия
+CATEGORY_VOLATILITY = {
+    "смартфон": 1.5,
+    "телефон": 1.5,
+    "ноутбук": 1.5,
+    "планшет": 1.4,
+    "телевизор": 1.4,
+    "видеокарт": 1.6,
+    "наушник": 1.3,
+    "электроник": 1.3,
+    "бытов": 1.2,
+    "одежд": 0.9,
+    "обув": 0.9,
+    "книг": 0.6,
+    "продукт": 0.8,
+}
+
+# Непроверявшийся товар считается "просроченным" на столько часов
+MAX_STALENESS_HOURS = 24 * 7
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def product_id_from_url(url: str) -> str:
+    """Id товара для price_history: числовой id Маркета или URL без query"""
+    m = re.search(r"/(\d{6,})", url)
+    return m.group(1) if m else url.split("?")[0]
+
+
+def volatility_score(item: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """
+    Ожидаемая волатильность цены товара (1.0 - обычная)
+
+    Args:
+        item: Строка истории (category, title, discount, price_changed_at)
+    """
+    now = now or datetime.utcnow()
+    text = f"{item.get('category') or ''} {item.get('title') or ''}".lower()
+    score = max(
+        (factor for keyword, factor in CATEGORY_VOLATILITY.items() if keyword in text),
+        default=1.0,
+    )
+
+    changed_at = _parse_ts(item.get("price_changed_at"))
+    if changed_at is not None:
+        days = (now - changed_at).total_seconds() / 86400
+        if days < 1:
+            score *= 2.0
+        elif days < 7:
+            score *= 1.5
+        elif days > 30:
+            score *= 0.7
+
+    discount = item.get("discount") or 0
+    if discount >= 30:
+        score *= 1.5
+    elif discount >= 10:
+        score *= 1.2
+    return score
+
+
+def check_priority(item: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """Приоритет проверки: волатильность x часы с последней проверки"""
+    now = now or datetime.utcnow()
+    checked_at = _parse_ts(item.get("price_checked_at"))
+    if checked_at is None:
+        hours = MAX_STALENESS_HOURS
+    else:
+        hours = min(MAX_STALENESS_HOURS, (now - checked_at).total_seconds() / 3600)
+    return volatility_score(item, now) * hours
+
+
+@dataclass
+class PriceCheckResult:
+    """Результат проверки цены одного товара"""
+
+    item: Dict[str, Any]
+    price: Optional[float] = None
+    discount: Optional[float] = None
+    category: Optional[str] = None
+    title: Optional[str] = None
+    source: str = "none"  # api / html / error
+    error: Optional[str] = None
 
 
 def extract_price_number(price_str: str) -> Optional[float]:
@@ -38,142 +141,180 @@ def extract_price_number(price_str: str) -> Optional[float]:
 class PriceMonitorService:
     """Сервис для мониторинга падения цен"""
 
-    def __init__(self, db):
+    def __init__(self, db, concurrency: int = None, min_interval_hours: float = None):
         """
         Инициализация сервиса мониторинга цен.
 
         Args:
-            db: Экземпляр Database
+            db: Экземпляр AsyncDatabase
+            concurrency: Одновременных проверок (PRICE_MONITOR_CONCURRENCY)
+            min_interval_hours: Не проверять товар обычной волатильности чаще
+                (для волатильных пропорционально чаще)
         """
         self.db = db
         self.price_drop_threshold = 0.15  # 15% падение цены
+        self.concurrency = concurrency or getattr(config, "PRICE_MONITOR_CONCURRENCY", 5)
+        self.min_interval_hours = (
+            min_interval_hours if min_interval_hours is not None
+            else getattr(config, "PRICE_MONITOR_MIN_INTERVAL_HOURS", 12)
+        )
+        self.last_run: Dict[str, Any] = {}
+
+    def schedule(self, candidates: List[Dict[str, Any]], max_checks: int) -> List[Dict[str, Any]]:
+        """Выбрать товары для проверки: самые приоритетные из тех, кому пора"""
+        now = datetime.utcnow()
+        scored = ((check_priority(item, now), item) for item in candidates if item.get("url"))
+        due = [(priority, item) for priority, item in scored if priority >= self.min_interval_hours]
+        due.sort(key=lambda pair: pair[0], reverse=True)
+        return [item for _, item in due[:max_checks]]
+
+    async def _check_one(self, item: Dict[str, Any], semaphore: asyncio.Semaphore) -> PriceCheckResult:
+        """Проверить цену: JSON API, затем страница товара (с кэшем ответов)"""
+        from services.distributed_rate_limiter import (
+            get_yandex_api_limiter,
+            get_yandex_catalog_limiter,
+        )
+        from services.http_response_cache import get_response_cache
 
-    async def check_price_drops(self, limit: int = 50) -> List[Dict[str, any]]:
+        url = item["url"]
+        price_ttl = getattr(config, "HTTP_CACHE_PRICE_TTL", 600)
+        async with semaphore:
+            try:
+                if getattr(config, "USE_OFFICIAL_API", False):
+                    await get_yandex_api_limiter().acquire()
+                    api = await fetch_price_via_api(url)
+                    if api:
+                        return PriceCheckResult(item, price=api["price"], title=api.get("title"), source="api")
+
+                # Свежая страница из кэша не тратит лимит запросов
+                if get_response_cache().get(url, price_ttl) is None:
+                    await get_yandex_catalog_limiter().acquire()
+                product_data = await scrape_yandex_market(url, max_age=price_ttl)
+                if not product_data:
+                    return PriceCheckResult(item, source="error", error="no data")
+                discount = product_data.get("discount")
+                return PriceCheckResult(
+                    item,
+                    price=extract_price_number(str(product_data.get("price") or "")),
+                    discount=discount if isinstance(discount, (int, float)) else None,
+                    category=product_data.get("category"),
+                    title=product_data.get("title"),
+                    source="html",
+                )
+            except Exception as e:
+                logger.warning(f"❌ Ошибка при проверке цены для {url[:80]}...: {e}")
+                return PriceCheckResult(item, source="error", error=str(e))
+
+    async def check_price_drops(self, limit: int = 50, candidates: int = None) -> List[Dict[str, any]]:
         """
-        Проверяет последние товары из истории на падение цены.
+        Проверяет цены самых "просроченных" товаров из истории на падение.
 
         Args:
-            limit: Количество товаров для проверки (по умолчанию 50)
+            limit: Максимум проверок за цикл (бюджет запросов)
+            candidates: Сколько последних товаров истории рассматривать (PRICE_MONITOR_CANDIDATES)
 
         Returns:
             Список товаров с упавшей ценой, готовых к повторной публикации
         """
-        logger.info(f"🔍 Начинаем проверку цен для {limit} товаров...")
-
-        # Получаем последние товары из истории
-        with self.db.connection:
-            rows = self.db.cursor.execute(
-                """
-                SELECT id, url, title, last_price 
-                FROM history 
-                ORDER BY date_added DESC 
-                LIMIT ?
-                """,
-                (limit,),
-            ).fetchall()
-
-        if not rows:
-            logger.info("📭 История пуста, нечего проверять")
+        started = time.monotonic()
+        pool = await self.db.get_price_watch_candidates(
+            candidates or getattr(config, "PRICE_MONITOR_CANDIDATES", 2000)
+        )
+        batch = self.schedule(pool, limit)
+        logger.info(f"🔍 Проверка цен: {len(batch)} из {len(pool)} товаров (параллельно {self.concurrency})")
+        if not batch:
+            self.last_run = {"candidates": len(pool), "checked": 0}
             return []
 
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._check_one(item, semaphore) for item in batch))
+
+        now = datetime.utcnow()
         price_drops = []
-        checked_count = 0
-        error_count = 0
-
-        for row in rows:
-            url = row["url"]
-            history_id = row["id"]
-            title = row.get("title", "")
-            old_price = row.get("last_price")
-
-            # Пропускаем если нет старой цены (товар еще не проверялся)
-            if old_price is None:
-                logger.debug(f"⏭ Пропускаем {url[:80]}... (нет старой цены)")
+        checks = []
+        unchecked = []
+        for result in results:
+            item = result.item
+            if result.price is None:
+                if result.source != "error":
+                    logger.debug(f"⏭ Не удалось извлечь цену для {item['url'][:80]}...")
+                unchecked.append(item["id"])
                 continue
 
-            try:
-                # Мягкая задержка: 1 товар в 10 секунд
-                if checked_count > 0:
-                    await asyncio.sleep(10)
-
-                # Скрапим текущую цену
-                logger.debug(f"🔍 Проверяем цену для {url[:80]}...")
-                product_data = await scrape_yandex_market(url)
-
-                if not product_data:
-                    logger.warning(f"⚠️ Не удалось получить данные для {url[:80]}...")
-                    error_count += 1
-                    continue
-
-                current_price_str = product_data.get("price", "")
-                current_price = extract_price_number(current_price_str)
-
-                if current_price is None:
-                    logger.debug(
-                        f"⏭ Не удалось извлечь цену для {url[:80]}... (цена: {current_price_str})"
-                    )
-                    checked_count += 1
-                    # Обновляем last_price даже если не удалось извлечь (чтобы не проверять снова)
-                    self._update_last_price(history_id, old_price)
-                    continue
-
-                checked_count += 1
-
-                # Проверяем падение цены (>15%)
-                price_drop_ratio = (old_price - current_price) / old_price
-
-                if price_drop_ratio >= self.price_drop_threshold:
-                    # Значительное падение цены!
-                    logger.info(
-                        f"📉 Обнаружено падение цены для {url[:80]}...: "
-                        f"{old_price:.2f} ₽ → {current_price:.2f} ₽ "
-                        f"({price_drop_ratio*100:.1f}% падение)"
-                    )
-
-                    price_drops.append(
-                        {
-                            "url": url,
-                            "title": title or product_data.get("title", "Товар"),
-                            "old_price": old_price,
-                            "current_price": current_price,
-                            "price_drop_percent": price_drop_ratio * 100,
-                            "history_id": history_id,
-                        }
-                    )
-
-                # Обновляем last_price в БД
-                self._update_last_price(history_id, current_price)
-
-            except Exception as e:
-                logger.exception(f"❌ Ошибка при проверке цены для {url[:80]}...: {e}")
-                error_count += 1
+            # База для падения - цена публикации (last_price), а не прошлой проверки:
+            # иначе два падения по 10% подряд не набирают порог
+            old_price = item.get("last_price")
+            previous_price = item.get("last_checked_price") or old_price
+            checks.append({
+                "history_id": item["id"],
+                "product_id": product_id_from_url(item["url"]),
+                "url": item["url"],
+                "price": result.price,
+                "old_price": previous_price,
+                "discount_percent": result.discount,
+                "category": result.category,
+                "changed": previous_price is not None and result.price != previous_price,
+                "checked_at": now,
+            })
+
+            # Проверяем падение цены (>15%); первая проверка только запоминает цену
+            if not old_price:
                 continue
+            price_drop_ratio = (old_price - result.price) / old_price
+            if price_drop_ratio >= self.price_drop_threshold:
+                logger.info(
+                    f"📉 Обнаружено падение цены для {item['url'][:80]}...: "
+                    f"{old_price:.2f} ₽ → {result.price:.2f} ₽ "
+                    f"({price_drop_ratio*100:.1f}% падение)"
+                )
+                price_drops.append(
+                    {
+                        "url": item["url"],
+                        "title": item.get("title") or result.title or "Товар",
+                        "old_price": old_price,
+                        "current_price": result.price,
+                        "price_drop_percent": price_drop_ratio * 100,
+                        "history_id": item["id"],
+                    }
+                )
 
+        await self._save_checks(checks, unchecked, now)
+
+        sources = [r.source for r in results]
+        self.last_run = {
+            "candidates": len(pool),
+            "checked": len(checks),
+            "api": sources.count("api"),
+            "html": sources.count("html"),
+            "errors": sources.count("error"),
+            "drops": len(price_drops),
+            "duration_s": round(time.monotonic() - started, 1),
+        }
         logger.info(
-            f"✅ Проверка завершена: проверено {checked_count}, "
-            f"найдено падений {len(price_drops)}, ошибок {error_count}"
+            f"✅ Проверка завершена: проверено {len(checks)}, "
+            f"найдено падений {len(price_drops)}, ошибок {self.last_run['errors']} "
+            f"за {self.last_run['duration_s']} с"
         )
 
         return price_drops
 
-    def _update_last_price(self, history_id: int, price: float) -> None:
-        """
-        Обновляет last_price в истории.
-
-        Args:
-            history_id: ID записи в истории
-            price: Новая цена
-        """
+    async def _save_checks(self, checks: List[Dict[str, Any]], unchecked: List[int], now: datetime) -> None:
+        """Пакетная запись результатов: price_history + history (и Postgres, если включен)"""
         try:
-            with self.db.connection:
-                self.db.cursor.execute(
-                    "UPDATE history SET last_price = ? WHERE id = ?",
-                    (price, history_id),
-                )
+            await self.db.save_price_checks(checks)
+            await self.db.mark_price_checked(unchecked, now)
         except Exception as e:
-            logger.warning(
-                f"⚠️ Ошибка обновления last_price для history_id={history_id}: {e}"
-            )
+            logger.warning(f"⚠️ Ошибка записи результатов проверки цен: {e}")
+
+        if checks and getattr(config, "USE_POSTGRES", False):
+            try:
+                from database_postgres import get_postgres_db
+
+                get_postgres_db().save_price_history_batch(
+                    [dict(c, timestamp=c["checked_at"]) for c in checks]
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка записи price_history в Postgres: {e}")
 
     async def process_price_drops(self, price_drops: List[Dict[str, any]]) -> int:
         """
@@ -198,13 +339,13 @@ class PriceMonitorService:
             drop_percent = drop["price_drop_percent"]
 
             # Проверяем, не добавлен ли уже в очередь
-            if self.db.exists_url_in_queue(url, check_normalized=True):
+            if await self.db.exists_url_in_queue(url, check_normalized=True):
                 logger.debug(f"⏭ Товар {url[:80]}... уже в очереди, пропускаем")
                 continue
 
             # Добавляем в очередь с высоким приоритетом
-            queue_id = self.db.add_to_queue(
-                url, priority=10
+            queue_id = await self.db.add_to_queue(
+                url, priority=10, title=title
             )  # Высокий приоритет для падений цен
 
             if queue_id:
@@ -242,7 +383,7 @@ async def check_price_drops(db, limit: int = 50) -> List[Dict[str, any]]:
     Удобная функция для проверки падения цен.
 
     Args:
-        db: Экземпляр Database
+        db: Экземпляр AsyncDatabase
         limit: Количество товаров для проверки
 
     Returns:
@@ -11,6 +11,7 @@ from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 from urllib.parse import urlparse
 import aiohttp
+from services.http_registry import get_http_registry
 
 logger = logging.getLogger(__name__)
 
@@ -244,8 +245,19 @@ class ProxyService:
         total_attempts = proxy.success_count + proxy.failure_count
         if total_attempts >= 10 and proxy.success_rate < self.min_success_rate:
             proxy.is_active = False
+            get_http_registry().drop_proxy(proxy.get_url())
             logger.warning(f"Deactivated proxy {proxy.host}:{proxy.port} (success rate: {proxy.success_rate:.1f}%)")
 
+    def get_session(self, proxy: ProxyInfo, profile: str = "default") -> Tuple[aiohttp.ClientSession, Optional[str]]:
+        """
+        Пул соединений для прокси из общего реестра HTTP клиентов
+
+        Returns:
+            (session, proxy=) - значение proxy= передается в запрос
+            (None, если прокси уже в коннекторе сессии - SOCKS через aiohttp_socks)
+        """
+        return get_http_registry().proxy_session(proxy.get_url(), profile)
+
     async def test_proxy(self, proxy: ProxyInfo, test_url: str = "https://httpbin.org/ip") -> bool:
         """
         Протестировать прокси на работоспособность
@@ -258,18 +270,18 @@ class ProxyService:
             True если прокси работает
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                start_time = time.time()
-                async with session.get(
-                    test_url,
-                    proxy=proxy.get_url(),
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    response_time = time.time() - start_time
-                    success = response.status == 200
-
-                    self.report_proxy_result(proxy, success, response_time)
-                    return success
+            session, request_proxy = self.get_session(proxy, profile="bare")
+            start_time = time.time()
+            async with session.get(
+                test_url,
+                proxy=request_proxy,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                response_time = time.time() - start_time
+                success = response.status == 200
+
+                self.report_proxy_result(proxy, success, response_time)
+                return success
 
         except Exception as e:
             logger.debug(f"Proxy test failed for {proxy.host}:{proxy.port}: {e}")
@@ -2,6 +2,8 @@
 import asyncio
 import csv
 import logging
+import os
+import socket
 import time
 from typing import Dict, Any, List, Optional
 from datetime import datetime
@@ -142,6 +144,8 @@ class PublishService:
 
         self._running = False
         self._publish_task = None
+        # Идентификатор consumer для in-flight items в Redis (несколько publishers на одном буфере)
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}"
 
     async def start_publisher(self):
         """Запустить фоновый publisher"""
@@ -151,6 +155,14 @@ class PublishService:
 
         self._running = True
         self._publish_task = asyncio.create_task(self._publish_worker())
+        if self.redis:
+            # Зависшие у упавших publishers items возвращаются по таймеру, а не
+            # только когда буфер пуст; достаточно одной реплики
+            from services.scheduler_service import get_scheduler
+
+            get_scheduler().add_interval_task(
+                config.PUBLISH_REAP_INTERVAL, self.reap_inflight, name="publish_reaper"
+            )
         logger.info("Publisher started")
 
     async def stop_publisher(self):
@@ -159,6 +171,10 @@ class PublishService:
             return
 
         self._running = False
+        if self.redis:
+            from services.scheduler_service import get_scheduler
+
+            get_scheduler().remove_task("publish_reaper")
         if self._publish_task:
             self._publish_task.cancel()
             try:
@@ -168,6 +184,10 @@ class PublishService:
 
         logger.info("Publisher stopped")
 
+    def reap_inflight(self) -> int:
+        """Вернуть в буфер items с истекшим visibility timeout (задача планировщика)"""
+        return self.redis.reap_expired_publish_items() if self.redis else 0
+
     async def _publish_worker(self):
         """Фоновый worker для публикации"""
         logger.info("Publish worker started")
@@ -176,7 +196,11 @@ class PublishService:
             try:
                 # Извлекаем товары из очереди
                 if self.redis:
-                    items = self.redis.dequeue_publish_items(count=config.PUBLISH_BATCH_SIZE)
+                    items = self.redis.dequeue_publish_items(
+                        count=config.PUBLISH_BATCH_SIZE,
+                        consumer_id=self.consumer_id,
+                        visibility_timeout=config.PUBLISH_VISIBILITY_TIMEOUT,
+                    )
                 elif self.fallback_queue:
                     # Используем fallback очередь
                     items = []
@@ -190,18 +214,20 @@ class PublishService:
                     for item in items:
                         try:
                             await self._publish_item(item)
+                            if self.redis:
+                                self.redis.ack_publish_items([item], self.consumer_id)
                         except Exception as e:
                             logger.error(f"Failed to publish item {item.get('title', 'Unknown')}: {e}")
                             # Возвращаем item обратно в очередь при ошибке
                             if self.redis:
-                                self.redis.enqueue_publish_item(item, priority=50)
+                                self.redis.requeue_publish_item(item, self.consumer_id, priority=50)
                             elif self.fallback_queue:
                                 self.fallback_queue.appendleft(item)
 
                     # Ждём между публикациями
                     await asyncio.sleep(config.PUBLISH_INTERVAL)
                 else:
-                    # Очередь пуста, ждём подольше
+                    # Очередь пуста - ждём подольше (зависшие items возвращает publish_reaper)
                     await asyncio.sleep(30)
 
             except Exception as e:
@@ -410,6 +436,17 @@ class PublishService:
             logger.error(f"Failed to enqueue product: {e}")
             return False
 
+    def get_queue_depth(self) -> int:
+        """Количество items, ожидающих публикации (для backpressure парсеров)"""
+        try:
+            if self.redis:
+                return self.redis.get_publish_queue_size()
+            if self.fallback_queue is not None:
+                return len(self.fallback_queue)
+        except Exception as e:
+            logger.error(f"Failed to get queue depth: {e}")
+        return 0
+
     def get_queue_stats(self) -> Dict:
         """Получить статистику очереди"""
         try:
@@ -445,18 +482,14 @@ class PublishService:
 
     # Методы для работы с метриками
     def record_click(self, post_id: int):
-        """Записать клик по посту"""
-        try:
-            self.db.increment_clicks(post_id)
-        except Exception as e:
-            logger.error(f"Failed to record click for post {post_id}: {e}")
+        """Записать клик по посту (пачкой через агрегатор MetricsService)"""
+        from services.metrics_service import get_metrics_service
+        get_metrics_service().record_click({'post_id': post_id})
 
     def record_impression(self, post_id: int):
-        """Записать показ поста"""
-        try:
-            self.db.increment_impressions(post_id)
-        except Exception as e:
-            logger.error(f"Failed to record impression for post {post_id}: {e}")
+        """Записать показ поста (пачкой через агрегатор MetricsService)"""
+        from services.metrics_service import get_metrics_service
+        get_metrics_service().record_impression({'post_id': post_id})
 
     def get_metrics_summary(self, days: int = 30) -> Dict:
         """Получить сводку метрик"""
@@ -1,54 +1,428 @@
 # services/scheduler_service.py
-"""Сервис для планирования задач"""
+"""
+Сервис для планирования задач
+
+Один цикл на все периодические задачи процесса:
+- задачи лежат в куче по времени следующего запуска; цикл спит ровно до
+  ближайшего срока (или до изменения расписания), без опроса раз в минуту
+- interval: фиксированный шаг от планового времени + jitter (реплики и
+  задачи не срабатывают одновременно); отставание схлопывается в один запуск
+- daily: HH:MM по локальному времени + jitter
+- пропущенный запуск (процесс был остановлен) выполняется сразу после
+  старта: время последнего запуска хранится в хранилище аренд
+- защита от наложения: пока задача выполняется, следующий срок пропускается
+- singleton-задачи выполняет одна реплика (services/leader_lease); если
+  другая реплика уже отработала этот период, запуск пропускается
+"""
 import asyncio
-from datetime import datetime, time as dt_time, timedelta
-from typing import List, Callable, Optional
+import heapq
+import inspect
+import itertools
 import logging
+import math
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+from services.leader_lease import MemoryLeaseStore, create_lease_store, default_owner
 
 logger = logging.getLogger(__name__)
 
+MAX_SLEEP = 3600  # Перепроверка расписания хотя бы раз в час (переход часов и т.п.)
+CATCH_UP_DELAY = 60  # Просроченный запуск - не раньше чем через минуту после старта
+
+
+def next_daily(hour: int, minute: int, after: float) -> float:
+    """Ближайшее HH:MM строго после after (локальное время)"""
+    moment = datetime.fromtimestamp(after)
+    target = moment.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target.timestamp() <= after:
+        target += timedelta(days=1)
+    return target.timestamp()
+
+
+def previous_daily(hour: int, minute: int, before: float) -> float:
+    """Последнее HH:MM не позже before (локальное время)"""
+    moment = datetime.fromtimestamp(before)
+    target = moment.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target.timestamp() > before:
+        target -= timedelta(days=1)
+    return target.timestamp()
+
+
+@dataclass
+class ScheduledJob:
+    """Задача планировщика"""
+
+    name: str
+    callback: Callable[[], Any]
+    interval: Optional[float] = None  # сек для interval-задач
+    daily_at: Optional[Tuple[int, int]] = None  # (hour, minute) для daily-задач
+    jitter: float = 0.0  # сек
+    initial_delay: float = 0.0
+    singleton: bool = True
+    catch_up: bool = True
+
+    due: float = 0.0  # Плановое время без jitter
+    fire_at: float = 0.0
+    window_start: float = 0.0  # Запуск после этого момента закрывает текущий период
+    running: bool = False
+    runs: int = 0
+    skipped: int = 0
+    errors: int = 0
+    last_error: Optional[str] = None
+    last_duration: Optional[float] = None
+    version: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "daily_at": "%02d:%02d" % self.daily_at if self.daily_at else None,
+            "next_run": datetime.fromtimestamp(self.fire_at).isoformat(timespec="seconds"),
+            "running": self.running,
+            "singleton": self.singleton,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_duration": self.last_duration,
+        }
+
 
 class SchedulerService:
-    def __init__(self):
-        self.tasks = []
+    def __init__(self, store=None, owner: Optional[str] = None, lease_ttl: Optional[float] = None):
+        """
+        Args:
+            store: Хранилище аренд и last_run (по умолчанию create_lease_store())
+            owner: Идентификатор реплики (host:pid)
+            lease_ttl: TTL аренды singleton-задачи, сек (продлевается, пока задача идет)
+        """
+        self._store = store
+        self.owner = owner or default_owner()
+        self.lease_ttl = lease_ttl or getattr(config, "SCHEDULER_LEASE_TTL", 120)
+        self.jobs: Dict[str, ScheduledJob] = {}
         self.running = False
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running_tasks: set = set()
 
-    def add_daily_task(self, hour: int, minute: int, callback: Callable):
-        """Добавляет ежедневную задачу"""
-        self.tasks.append(
-            {"type": "daily", "hour": hour, "minute": minute, "callback": callback}
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = create_lease_store()
+        return self._store
+
+    # --- Регистрация задач ---
+
+    def add_interval_task(
+        self,
+        interval_seconds: float,
+        callback: Callable,
+        name: Optional[str] = None,
+        jitter: Optional[float] = None,
+        initial_delay: float = 0.0,
+        singleton: bool = True,
+        catch_up: bool = True,
+    ) -> ScheduledJob:
+        """
+        Добавляет задачу с интервалом
+
+        Args:
+            interval_seconds: Шаг между запусками
+            callback: Корутинная функция (или обычная) без аргументов
+            name: Имя задачи (ключ аренды и last_run), по умолчанию имя функции
+            jitter: Разброс запуска, сек (по умолчанию доля SCHEDULER_JITTER_RATIO
+                от интервала, не больше SCHEDULER_MAX_JITTER)
+            initial_delay: Задержка первого запуска (если задача еще ни разу не выполнялась)
+            singleton: Выполнять только на одной реплике
+            catch_up: Просроченный за время простоя запуск выполнить сразу
+        """
+        if jitter is None:
+            jitter = min(
+                interval_seconds * getattr(config, "SCHEDULER_JITTER_RATIO", 0.1),
+                getattr(config, "SCHEDULER_MAX_JITTER", 300),
+            )
+        job = ScheduledJob(
+            name=name or getattr(callback, "__qualname__", repr(callback)),
+            callback=callback,
+            interval=float(interval_seconds),
+            jitter=jitter,
+            initial_delay=initial_delay,
+            singleton=singleton,
+            catch_up=catch_up,
         )
+        return self._add(job)
+
+    def add_daily_task(
+        self,
+        hour: int,
+        minute: int,
+        callback: Callable,
+        name: Optional[str] = None,
+        jitter: Optional[float] = None,
+        singleton: bool = True,
+        catch_up: bool = True,
+    ) -> ScheduledJob:
+        """Добавляет ежедневную задачу (HH:MM локального времени)"""
+        job = ScheduledJob(
+            name=name or getattr(callback, "__qualname__", repr(callback)),
+            callback=callback,
+            daily_at=(hour, minute),
+            jitter=getattr(config, "SCHEDULER_MAX_JITTER", 300) if jitter is None else jitter,
+            singleton=singleton,
+            catch_up=catch_up,
+        )
+        return self._add(job)
+
+    def remove_task(self, name: str) -> bool:
+        """Удаляет задачу (уже запущенное выполнение не прерывается)"""
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return False
+        job.version += 1  # Запись в куче станет недействительной
+        return True
 
-    def add_interval_task(self, interval_seconds: int, callback: Callable):
-        """Добавляет задачу с интервалом"""
-        self.tasks.append(
-            {"type": "interval", "interval": interval_seconds, "callback": callback}
+    def reschedule(self, name: str, interval_seconds: float, jitter: Optional[float] = None) -> bool:
+        """Меняет интервал задачи; следующий запуск - через новый интервал"""
+        job = self.jobs.get(name)
+        if job is None or job.interval is None:
+            return False
+        job.interval = float(interval_seconds)
+        job.jitter = jitter if jitter is not None else min(
+            job.interval * getattr(config, "SCHEDULER_JITTER_RATIO", 0.1),
+            getattr(config, "SCHEDULER_MAX_JITTER", 300),
         )
+        job.due = time.time() + job.interval
+        job.window_start = job.due - job.interval / 2
+        self._push(job)
+        return True
+
+    def postpone(self, name: str, seconds: float) -> bool:
+        """Сдвигает следующий запуск задачи на seconds от текущего момента"""
+        job = self.jobs.get(name)
+        if job is None:
+            return False
+        job.due = max(job.due, time.time() + seconds)
+        if job.interval:
+            job.window_start = job.due - job.interval / 2
+        self._push(job)
+        return True
+
+    def get_job(self, name: str) -> Optional[ScheduledJob]:
+        return self.jobs.get(name)
+
+    def get_jobs(self) -> List[Dict[str, Any]]:
+        """Состояние задач (для статуса/диагностики)"""
+        return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda j: j.fire_at)]
+
+    def _add(self, job: ScheduledJob) -> ScheduledJob:
+        previous = self.jobs.get(job.name)
+        if previous is not None:
+            job.version = previous.version + 1
+        self.jobs[job.name] = job
+        if self.running:
+            last = self._store_call("get_last_run", job.name) if job.singleton else None
+            self._plan_first(job, time.time(), last)
+        return job
+
+    # --- Расчет сроков ---
+
+    def _store_call(self, method: str, *args, default=None):
+        """Вызов хранилища аренд; при его отказе задача выполняется локально"""
+        try:
+            return getattr(self.store, method)(*args)
+        except Exception as e:
+            logger.warning(f"Scheduler lease store error ({method}): {e}")
+            return default
+
+    async def _astore_call(self, method: str, *args, default=None):
+        """_store_call из цикла событий: SQLite/Redis-хранилища блокируют, уходят в поток"""
+        if isinstance(self._store, MemoryLeaseStore):
+            return self._store_call(method, *args, default=default)
+        return await asyncio.to_thread(self._store_call, method, *args, default=default)
+
+    def _plan_first(self, job: ScheduledJob, now: float, last: Optional[float]) -> None:
+        """Первый срок: с учетом последнего запуска (catch-up) и initial_delay"""
+        if job.interval is not None:
+            if last is None:
+                job.due = now + job.initial_delay
+            else:
+                # initial_delay - только для самого первого запуска
+                job.due = last + job.interval
+                if job.due < now and not job.catch_up:
+                    job.due = last + math.ceil((now - last) / job.interval) * job.interval
+                job.due = max(job.due, now + min(job.initial_delay, CATCH_UP_DELAY))
+            job.window_start = job.due - job.interval / 2
+        else:
+            hour, minute = job.daily_at
+            slot = previous_daily(hour, minute, now)
+            if job.catch_up and last is not None and last < slot:
+                job.due, job.window_start = now + min(job.initial_delay, CATCH_UP_DELAY), slot
+                logger.info(f"⏰ Scheduler: missed daily run of '{job.name}', catching up")
+            else:
+                job.due = job.window_start = next_daily(hour, minute, now)
+        self._push(job)
+
+    def _advance(self, job: ScheduledJob, now: float) -> None:
+        """Следующий срок после срабатывания (пропущенные шаги схлопываются)"""
+        if job.interval is not None:
+            job.due += job.interval
+            if job.due < now:
+                job.due = now
+            job.window_start = job.due - job.interval / 2
+        else:
+            job.due = job.window_start = next_daily(*job.daily_at, max(now, job.due))
+        self._push(job)
+
+    def _push(self, job: ScheduledJob) -> None:
+        job.version += 1
+        if job.interval is not None:
+            offset = random.uniform(-job.jitter / 2, job.jitter / 2)
+        else:
+            offset = random.uniform(0, job.jitter)
+        job.fire_at = job.due + offset
+        heapq.heappush(self._heap, (job.fire_at, next(self._seq), job.version, job.name))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_entry(self) -> Optional[Tuple[float, int, int, str]]:
+        """Ближайшая действительная запись кучи (устаревшие выбрасываются)"""
+        while self._heap:
+            fire_at, _, version, name = self._heap[0]
+            job = self.jobs.get(name)
+            if job is not None and job.version == version:
+                return self._heap[0]
+            heapq.heappop(self._heap)
+        return None
+
+    # --- Выполнение ---
 
     async def start(self):
-        """Запускает планировщик"""
+        """Запускает планировщик (цикл работает в фоне до stop())"""
+        if self.running:
+            return
         self.running = True
-        while self.running:
-            now = datetime.now()
-
-            for task in self.tasks:
-                if task["type"] == "daily":
-                    target_time = datetime.combine(
-                        now.date(), dt_time(task["hour"], task["minute"])
-                    )
-                    if target_time < now:
-                        target_time += timedelta(days=1)
-
-                    if (
-                        abs((target_time - now).total_seconds()) < 60
-                    ):  # В пределах минуты
-                        try:
-                            await task["callback"]()
-                        except Exception as e:
-                            logger.exception("Scheduled task error: %s", e)
-
-            await asyncio.sleep(60)  # Проверяем каждую минуту
-
-    def stop(self):
-        """Останавливает планировщик"""
+        self._wakeup = asyncio.Event()
+        now = time.time()
+        for job in list(self.jobs.values()):
+            last = await self._astore_call("get_last_run", job.name) if job.singleton else None
+            self._plan_first(job, now, last)
+        self._loop_task = asyncio.create_task(self._run_loop())
+        logger.info(f"⏰ Scheduler started ({len(self.jobs)} jobs, owner={self.owner})")
+
+    async def stop(self):
+        """Останавливает планировщик и отменяет выполняющиеся задачи"""
         self.running = False
+        tasks = list(self._running_tasks)
+        if self._loop_task is not None:
+            tasks.append(self._loop_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._heap.clear()
+        logger.info("⏰ Scheduler stopped")
+
+    async def _run_loop(self):
+        while self.running:
+            self._wakeup.clear()
+            entry = self._next_entry()
+            delay = MAX_SLEEP if entry is None else entry[0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            job = self.jobs[entry[3]]
+            now = time.time()
+            window_start = job.window_start
+            self._advance(job, now)
+
+            if job.running:
+                job.skipped += 1
+                logger.warning(f"⏰ Scheduler: '{job.name}' is still running, skipping this run")
+                continue
+
+            task = asyncio.create_task(self._execute(job, window_start))
+            self._running_tasks.add(task)
+            task.add_done_callback(self._running_tasks.discard)
+
+    async def run_job(self, name: str) -> bool:
+        """Выполнить задачу сейчас (с арендой и защитой от наложения)"""
+        job = self.jobs.get(name)
+        if job is None or job.running:
+            return False
+        return await self._execute(job, None)
+
+    async def _execute(self, job: ScheduledJob, window_start: Optional[float]) -> bool:
+        """Выполнить задачу; False - пропущена (аренда у другой реплики или период уже отработан)"""
+        if job.singleton:
+            acquired = await self._astore_call("try_acquire", job.name, self.owner, self.lease_ttl, default=True)
+            if not acquired:
+                job.skipped += 1
+                logger.debug(f"⏰ Scheduler: '{job.name}' is leased by another replica")
+                return False
+            last = await self._astore_call("get_last_run", job.name)
+            if window_start is not None and last is not None and last >= window_start:
+                # Другая реплика уже выполнила задачу в этом периоде - выравниваемся по ней
+                await self._astore_call("release", job.name, self.owner)
+                job.skipped += 1
+                if job.interval is not None and last + job.interval > job.due:
+                    job.due = last + job.interval
+                    job.window_start = job.due - job.interval / 2
+                    self._push(job)
+                logger.debug(f"⏰ Scheduler: '{job.name}' already ran on another replica")
+                return False
+
+        job.running = True
+        started = time.time()
+        keeper = asyncio.create_task(self._keep_lease(job)) if job.singleton else None
+        try:
+            result = job.callback()
+            if inspect.isawaitable(result):
+                await result
+            job.runs += 1
+            job.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.errors += 1
+            job.last_error = str(e)[:200]
+            logger.exception(f"Scheduled task '{job.name}' error: {e}")
+        finally:
+            job.running = False
+            job.last_duration = round(time.time() - started, 3)
+            if keeper is not None:
+                keeper.cancel()
+                # Период закрыт и при ошибке: реплики не повторяют падающую задачу подряд
+                await self._astore_call("set_last_run", job.name, started)
+                await self._astore_call("release", job.name, self.owner)
+        return True
+
+    async def _keep_lease(self, job: ScheduledJob) -> None:
+        """Продлевать аренду, пока задача выполняется"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            if not await self._astore_call("renew", job.name, self.owner, self.lease_ttl, default=True):
+                logger.warning(f"⏰ Scheduler: lost lease of '{job.name}' while running")
+
+
+# Глобальный экземпляр
+_scheduler: Optional[SchedulerService] = None
+
+
+def get_scheduler() -> SchedulerService:
+    """Получить общий планировщик процесса"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SchedulerService()
+    return _scheduler
@@ -1,17 +1,22 @@
 # services/smart_search_service.py - Умный автопоиск с offset per keyword
 import asyncio
+import hashlib
 import json
 import os
 import logging
 import random
 import re
+import time
 from typing import List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse, quote_plus
-import aiohttp
 import config
 from utils.scraper import scrape_product_data, fetch_with_backoff
 from database_postgres import get_postgres_db
 from redis_cache import get_redis_cache
+from services.crawl_pipeline import CrawlPipeline, CrawlPage, PipelineMetrics
+from services.http_registry import get_http_registry
+from utils.parse_executor import get_parse_executor
+from utils.next_data_extractor import extract_next_data_items, extract_window_state_items
 
 # Playwright for anti-bot bypass (fallback only)
 try:
@@ -24,6 +29,11 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def _stable_title_id(title: str) -> int:
+    """Стабильный между запусками id по названию (hash() зависит от PYTHONHASHSEED)"""
+    return int(hashlib.md5(title.encode()).hexdigest()[:8], 16) % 10000
+
+
 class SimpleSmartSearch:
     """Простая версия умного поиска с сохранением offsets"""
 
@@ -50,288 +60,15 @@ class SimpleSmartSearch:
             json.dump(self.offsets, f)
         return results
 
-class SmartSearchService:
-    """Сервис умного автопоиска по каталогам (основной источник)"""
-
-    # Каталоги и бренды - основной источник товаров
-    # UPDATED: Using referral_products URLs as main source
-    CATALOG_URLS = [
-        # Главная страница referral products (основной источник)
-        "https://market.yandex.ru/page/referral_products?generalContext=t%3DcprPage%3Bcpk%3Dreferral_products%3B&rs=eJwzEv7EKMDBKLDwEKsEg8bqk6waq46wAgA7hQYe",
-        # Категория продукты (hid=91307)
-        "https://market.yandex.ru/search?generalContext=t%3DcprPage%3Bcpk%3Dreferral_products%3B&searchContext=referral_products_ctx&rs=eJwzEv7EKMDBKLDwEKsEg8bqk6waq46wAgA7hQYe&clicked-on-nav-tree=1&page-key=referral_products&hid=91307",
-        # Товары для дома (hid=90666)
-        "https://market.yandex.ru/search?generalContext=t%3DcprPage%3Bcpk%3Dreferral_products%3B&searchContext=referral_products_ctx&rs=eJwzEv7EKMDBKLDwEKsEg8bqk6waq46wAgA7hQYe&clicked-on-nav-tree=1&page-key=referral_products&hid=90666",
-        # Дополнительные источники для разнообразия
-        "https://market.yandex.ru/catalog--naushniki/",
-        "https://market.yandex.ru/catalog--smartfony/",
-    ]
-
-    # Playwright settings for anti-bot bypass
-    PLAYWRIGHT_HEADERS = {
-        "Accept-Language": "ru-RU,ru;q=0.9",
-    }
-    PLAYWRIGHT_USER_AGENT = (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/120.0.0.0 Safari/537.36"
-    )
-
-    def __init__(self):
-        self.db = get_postgres_db() if config.USE_POSTGRES else None
-        self.redis = get_redis_cache() if config.USE_REDIS else None
-        self._session = None
-        self._last_catalog_parse = self._load_parse_cache()  # Персистентный кэш
-        self._semaphore = asyncio.Semaphore(3)  # Ограничение concurrency до 3
-        self._playwright_daily_count = 0  # Счетчик Playwright использований за день
-        # Метрики для мониторинга
-        self.metrics = {
-            'catalog_requests': 0,
-            'catalog_errors': 0,
-            'products_parsed': 0,
-            'playwright_fallback_used': 0,
-            'shadow_ban_detected': 0
-        }
-
-    def _load_parse_cache(self) -> Dict:
-        """Загрузка кэша времени парсинга из файла"""
-        cache_file = "catalog_parse_cache.json"
-        try:
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.warning(f"Failed to load parse cache: {e}")
-        return {}
-
-    def _save_parse_cache(self):
-        """Сохранение кэша времени парсинга в файл"""
-        cache_file = "catalog_parse_cache.json"
-        try:
-            with open(cache_file, 'w') as f:
-                json.dump(self._last_catalog_parse, f, indent=2)
-        except Exception as e:
-            logger.warning(f"Failed to save parse cache: {e}")
-
-    def _can_use_playwright_fallback(self) -> bool:
-        """Проверка лимита на Playwright fallback (max 5 per day)"""
-        return self._playwright_daily_count < 5
-
-    def get_metrics(self) -> Dict:
-        """Получить метрики для мониторинга"""
-        return {
-            **self.metrics,
-            'playwright_daily_count': self._playwright_daily_count,
-            'cache_size': len(self._last_catalog_parse)
-        }
-
-    async def get_session(self):
-        """Получить HTTP сессию"""
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=30),
-                headers={
-                    "User-Agent": config.USER_AGENT or "Mozilla/5.0 (compatible; MarketBot/1.0)",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                    "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
-                    "Accept-Encoding": "gzip, deflate, br",
-                }
-            )
-        return self._session
-
-    async def close_session(self):
-        """
-        Закрыть HTTP сессию и сохранить кэш.
-        FIXED: Added proper session cleanup to prevent connection leaks.
-        """
-        if self._session and not self._session.closed:
-            await self._session.close()
-            # Wait for connections to close gracefully
-            await asyncio.sleep(0.25)
-            self._session = None
-            logger.info("SmartSearchService HTTP session closed")
-
-        # Сохраняем кэш при shutdown
-        self._save_parse_cache()
-
-    async def crawl_catalogs(self, max_catalogs: int = 5) -> Tuple[int, int]:
-        """
-        Парсинг каталогов и брендов (основной источник товаров)
-
-        Args:
-            max_catalogs: Максимальное количество каталогов для обработки
-
-        Returns:
-            Tuple[int, int]: (added_products, skipped_products)
-        """
-        added = 0
-        skipped = 0
-
-        try:
-            # Выбираем случайные каталоги для разнообразия
-            selected_catalogs = random.sample(self.CATALOG_URLS, min(max_catalogs, len(self.CATALOG_URLS)))
-
-            for catalog_url in selected_catalogs:
-                try:
-                    # Проверяем кэш времени последнего парсинга (минимум 30 минут)
-                    import time
-                    cache_key = catalog_url
-                    now = time.time()
-                    last_parse = self._last_catalog_parse.get(cache_key, 0)
-
-                    if now - last_parse < 1800:  # 30 minutes
-                        logger.debug(f"Skipping {catalog_url}, parsed recently")
-                        continue
-
-                    logger.info(f"Processing catalog: {catalog_url}")
-
-                    # Проверяем shadow-ban паузу перед парсингом каталога
-                    from services.shadow_ban_service import get_shadow_ban_service
-                    shadow_ban_service = get_shadow_ban_service()
-                    if not shadow_ban_service.can_continue_parsing():
-                        logger.warning(f"Shadow-ban pause active, skipping catalog: {catalog_url}")
-                        continue
-
-                    # Получаем HTML страницы каталога
-                    self.metrics['catalog_requests'] += 1
-                    html = await self._fetch_catalog_page(catalog_url)
-                    if not html:
-                        self.metrics['catalog_errors'] += 1
-                        logger.warning(f"Failed to fetch catalog: {catalog_url}")
-                        continue
-
-                    # Парсим товары (ограничиваем до 50 на каталог для оптимизации)
-                    products = await self._parse_catalog_products(html, catalog_url)
-                    
-                    # Проверяем shadow-ban после парсинга (отключаем для referral_products)
-                    if 'referral_products' not in catalog_url:
-                        shadow_banned = shadow_ban_service.is_shadow_banned(len(products), len(html))
-                        if shadow_banned:
-                            shadow_ban_service.record_shadow_ban(
-                                catalog_url=catalog_url,
-                                products_count=len(products),
-                                html_size=len(html)
-                            )
-                            self.metrics['shadow_ban_detected'] += 1
-                            logger.warning(f"Shadow-ban detected for {catalog_url}, pausing")
-                            continue  # Пропускаем этот каталог
-                    
-                    logger.info(f"Parsed {len(products)} products from {catalog_url.split('/')[-2]}")
-
-                    # Обрабатываем найденные товары
-                    catalog_added, catalog_skipped = await self._process_found_products(products, catalog_url)
-                    added += catalog_added
-                    skipped += catalog_skipped
-
-                    # Обновляем кэш времени парсинга
-                    import time
-                    self._last_catalog_parse[cache_key] = time.time()
-
-                    # КРИТИЧНАЯ ПАУЗА: имитация человеческого поведения
-                    await asyncio.sleep(random.uniform(3.5, 7.5))
-
-                except Exception as e:
-                    logger.error(f"Error processing catalog {catalog_url}: {e}")
-                    continue
-
-        except Exception as e:
-            logger.error(f"Error in crawl_catalogs: {e}")
-
-        return added, skipped
-
-    async def _process_found_products(self, products: List[Dict], source_url: str) -> Tuple[int, int]:
-        """Обработка найденных товаров с валидацией и atomic dedup"""
-        added = skipped = 0
-
-        for p in products[:50]:  # Safety cap
-            try:
-                # Валидация продукта
-                ok, reasons = await self._validate_product_for_queue(p)
-                if not ok:
-                    logger.info(f"Skip {p.get('market_id', 'unknown')} reasons={reasons}")
-                    skipped += 1
-                    continue
-
-                # Atomic dedup check (race condition safe)
-                market_id = p.get('market_id')
-                if not market_id or not await self._mark_product_seen(market_id):
-                    logger.info(f"Already seen or invalid: {market_id}")
-                    skipped += 1
-                    continue
-
-                # Добавляем в очередь
-                await self._enqueue_product(p, source_url)
-                added += 1
-                logger.debug(f"Enqueued {market_id}")
-
-            except Exception as e:
-                logger.warning(f"Error processing product {p.get('market_id', 'unknown')}: {e}")
-                skipped += 1
-
-        return added, skipped
-
-    async def _mark_product_seen(self, market_id: str) -> bool:
-        """Atomic проверка и маркировка товара как увиденного (race condition safe)"""
-        if self.db and hasattr(self.db, 'mark_seen'):
-            # Используем atomic операцию в БД
-            return self.db.mark_seen(market_id)
-        elif self.redis:
-            # Используем Redis SET для дедупликации
-            key = f"seen_products:{market_id}"
-            return bool(self.redis.set(key, "1", ex=604800, nx=True))  # 7 дней, only if not exists
-        else:
-            # Fallback в памяти (не надежно при перезапуске)
-            return True  # Всегда считаем новым
-
-    async def _validate_product_for_queue(self, product: Dict) -> Tuple[bool, List[str]]:
-        """Валидация продукта перед добавлением в очередь"""
-        from services.post_service import is_product_valid
-        return is_product_valid(product)
-
-    async def _enqueue_product(self, product: Dict, source_url: str):
-        """Добавление продукта в очередь публикации с ERID логированием"""
-        try:
-            from services.publish_service import get_publish_service
-            from services.affiliate_service import get_affiliate_link
-
-            # Генерируем affiliate ссылку с ERID
-            from utils.correlation_id import get_correlation_id
-            correlation_id = get_correlation_id() or "unknown"
-            affiliate_url, erid = get_affiliate_link(product.get('url', ''), correlation_id=correlation_id)
-
-            # Логируем ERID для отладки
-            market_id = product.get('market_id')
-            logger.info(f"Product {market_id} -> ERID {erid}, affiliate: {affiliate_url[:50]}...")
-
-            publish_item = {
-                'market_id': market_id,
-                'title': product.get('title', ''),
-                'url': affiliate_url,  # Affiliate ссылка с ERID
-                'price': product.get('price'),
-                'old_price': product.get('old_price'),
-                'discount_percent': product.get('discount_percent', 0),
-                'vendor': product.get('vendor'),
-                'rating': product.get('rating'),
-                'reviews_count': product.get('reviews_count', 0),
-                'has_images': product.get('has_images', True),
-                'source': 'catalog_search',
-                'priority': 100,
-                'erid': erid  # Сохраняем ERID для логов
-            }
-
-            publish_service = get_publish_service()
-            success = publish_service.enqueue_product(publish_item)
-
-            if success:
-                logger.info(f"Successfully enqueued {market_id}")
-            else:
-                logger.warning(f"Failed to enqueue {market_id}")
+class SmartSearchParser:
+    """
+    Парсеры HTML Яндекс.Маркета без состояния сервиса.
 
-        except Exception as e:
-            market_id = product.get('market_id', 'unknown')
-            logger.error(f"Failed to enqueue product {market_id}: {e}")
+    Не трогают сеть, БД и метрики, поэтому выполняются в воркерах
+    ParseExecutor (см. parse_catalog_html / parse_search_html ниже).
+    """
 
-    async def _parse_catalog_products(self, html: str, url: str = "") -> List[Dict]:
+    def _parse_catalog_html(self, html: str, url: str = "") -> List[Dict]:
         """Парсинг товаров из __NEXT_DATA__ в HTML каталога с упрощенной логикой"""
         # Проверка размера HTML для оптимизации
         if len(html) > 5_000_000:  # 5MB limit
@@ -339,27 +76,17 @@ class SmartSearchService:
             return []
 
         try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html, 'lxml')
-
-            # Пытаемся __NEXT_DATA__ сначала
-            next_data_script = soup.find('script', id='__NEXT_DATA__')
-            if next_data_script:
-                try:
-                    data = json.loads(next_data_script.string)
-                    items = self._extract_items_from_next_data(data)
-
-                    products = []
-                    for item in items:
-                        if product := self._convert_item_to_product(item):
-                            products.append(product)
-
-                    if products:
-                        logger.debug(f"Parsed {len(products)} products from __NEXT_DATA__")
-                        return products
+            # Пытаемся __NEXT_DATA__ сначала (без построения DOM всей страницы)
+            items = extract_next_data_items(html)
+            if items:
+                products = []
+                for item in items:
+                    if product := self._convert_item_to_product(item):
+                        products.append(product)
 
-                except (json.JSONDecodeError, KeyError) as e:
-                    logger.debug(f"__NEXT_DATA__ parsing failed: {e}")
+                if products:
+                    logger.debug(f"Parsed {len(products)} products from __NEXT_DATA__")
+                    return products
 
             # Fallback к CSS парсингу
             logger.debug("Falling back to CSS parsing")
@@ -535,204 +262,34 @@ class SmartSearchService:
             logger.warning(f"Error parsing product card: {e}")
             return None
 
-    async def _fetch_catalog_page(self, url: str) -> Optional[str]:
-        """
-        Получить HTML страницы каталога с оптимизированными headers и semaphore.
-        FIXED: Added distributed rate limiting to prevent IP bans.
-        """
-        async with self._semaphore:  # Ограничение concurrency
-            try:
-                # FIXED: Apply rate limiting before request
-                from services.distributed_rate_limiter import get_yandex_catalog_limiter
-                limiter = get_yandex_catalog_limiter()
-                await limiter.acquire()
-                
-                session = await self.get_session()
-                html = await fetch_with_backoff(url, session, max_attempts=3, headers=self.PLAYWRIGHT_HEADERS)
-
-                if not html:
-                    logger.warning(f"HTTP fetch failed for {url}")
-                    return None
-
-                if getattr(config, 'DEBUG_MODE', False):
-                    logger.debug(f"Fetched {len(html)} chars from {url}")
-
-                return html
-
-            except Exception as e:
-                logger.error(f"Error fetching {url}: {e}")
-                return None
-
-    async def _run_smart_search(self, key_text: str, start_page: int = 1, max_pages: int = 10) -> Tuple[int, int]:
+    def _parse_search_html(self, html: str) -> List[Dict]:
         """
-        Выполнить умный поиск по ключевому слову
-
+        Извлечь товары из HTML страницы поиска (без проверки shadow-ban)
+        
         Args:
-            key_text: Ключевое слово для поиска
-            start_page: Стартовая страница
-            max_pages: Максимум страниц для обработки
-
-        Returns:
-            Tuple (added, skipped)
-        """
-        added = 0
-        skipped = 0
-
-        logger.info(f"Starting smart search for '{key_text}' from page {start_page}")
-
-        try:
-            # Обрабатываем несколько страниц
-            for page_num in range(start_page, start_page + max_pages):
-                page_added, page_skipped = await self._process_search_page(key_text, page_num)
-                added += page_added
-                skipped += page_skipped
-
-                # Обновляем состояние поиска
-                if self.db:
-                    self.db.update_search_key(key_text, last_page=page_num)
-
-                # Небольшая пауза между страницами
-                await asyncio.sleep(random.uniform(1, 3))
-
-                # Если на странице не найдено товаров, возможно конец поиска
-                if page_added == 0 and page_num > start_page + 1:
-                    logger.info(f"No products found on page {page_num} for '{key_text}', stopping search")
-                    break
-
-            logger.info(f"Smart search for '{key_text}' completed: added={added}, skipped={skipped}")
-            return added, skipped
-
-        except Exception as e:
-            logger.error(f"Failed smart search for '{key_text}': {e}")
-            return 0, 0
-
-    async def _process_search_page(self, key_text: str, page_num: int) -> Tuple[int, int]:
+            html: HTML содержимое страницы
         """
-        Обработать одну страницу поиска
-
-        Args:
-            key_text: Ключевое слово
-            page_num: Номер страницы
+        products = []
 
-        Returns:
-            Tuple[int, int]: (added_products, skipped_products)
-        """
         try:
-            # Формируем URL страницы поиска
-            search_url = self._build_search_url(key_text, page_num)
-
-            # Используем fetch_with_backoff для надежных запросов
-            from utils.scraper import fetch_with_backoff
-            session = await self.get_session()
-            html = await fetch_with_backoff(search_url, session, max_attempts=3)
-
-            if not html:
-                logger.warning(f"Failed to fetch search page {page_num} for '{key_text}' after retries")
-                return 0, 0
+            if getattr(config, 'DEBUG_MODE', False):
+                logger.info(f"HTML length: {len(html)} chars")
 
-            # Проверяем что HTML не пустой
-            if len(html.strip()) < 100:
-                logger.warning(f"HTML too short ({len(html)} chars) for page {page_num}")
-                return 0, 0
+            # Используем BeautifulSoup для парсинга современной структуры Yandex.Market
+            try:
+                from bs4 import BeautifulSoup
+                soup = BeautifulSoup(html, 'lxml')
+            except ImportError:
+                logger.warning("BeautifulSoup not available, falling back to regex")
+                return self._extract_products_fallback(html)
 
-            products = self._extract_products_from_search(html, search_url)
+            # Ищем элементы с data-zone-name="productSnippet"
+            product_snippets = soup.find_all(attrs={'data-zone-name': 'productSnippet'})
 
             if getattr(config, 'DEBUG_MODE', False):
-                logger.info(f"Downloaded HTML: {len(html)} chars, parsed products: {len(products)}")
-
-            added = 0
-            skipped = 0
+                logger.info(f"Found {len(product_snippets)} productSnippet elements")
 
-            for product in products:
-                try:
-                    # Проверяем дедупликацию
-                    product_key = self._generate_product_key(product)
-                    if self.redis and self.redis.is_product_seen_recently(product_key):
-                        skipped += 1
-                        continue
-
-                    # Сохраняем товар в базу
-                    await self._save_product_to_database(product)
-
-                    # Помечаем как увиденный
-                    if self.redis:
-                        self.redis.mark_product_seen(product_key)
-
-                    # Добавляем в очередь публикации
-                    await self._enqueue_for_publishing(product)
-
-                    added += 1
-
-                except Exception as e:
-                    logger.error(f"Failed to process product {product.get('title', 'Unknown')}: {e}")
-                    skipped += 1
-
-                if getattr(config, 'DEBUG_MODE', False):
-                    logger.info(f"Processed page {page_num} for '{key_text}': found={len(products)}, added={added}, skipped={skipped}")
-                else:
-                    logger.debug(f"Processed page {page_num} for '{key_text}': found={len(products)}, added={added}, skipped={skipped}")
-                return added, skipped
-
-        except Exception as e:
-            logger.error(f"Failed to process search page {page_num} for '{key_text}': {e}")
-            return 0, 0
-
-    def _build_search_url(self, key_text: str, page_num: int) -> str:
-        """Построить URL страницы поиска"""
-        base_url = "https://market.yandex.ru/search"
-
-        # Убираем двойное кодирование - используем обычный UTF-8
-        params = {
-            "text": key_text,  # Не кодируем, aiohttp сделает это правильно
-        }
-
-        # Упрощаем для тестирования - убираем дополнительные параметры
-        # которые могут вызывать 400 ошибку
-        # if page_num == 1:
-        #     params.update({
-        #         "delivery-interval": "1",  # Доставка в день заказа
-        #         "onstock": "1",  # В наличии
-        #     })
-
-        query_string = urlencode(params, doseq=True)
-        final_url = f"{base_url}?{query_string}"
-
-        if getattr(config, 'DEBUG_MODE', False):
-            logger.info(f"Generated search URL: {final_url}")
-        else:
-            logger.debug(f"Generated search URL: {final_url}")
-
-        return final_url
-
-    def _extract_products_from_search(self, html: str, url: str = "") -> List[Dict]:
-        """
-        Извлечь товары из HTML страницы поиска
-        
-        Args:
-            html: HTML содержимое страницы
-            url: URL страницы (для логирования shadow-ban)
-        """
-        products = []
-
-        try:
-            if getattr(config, 'DEBUG_MODE', False):
-                logger.info(f"HTML length: {len(html)} chars")
-
-            # Используем BeautifulSoup для парсинга современной структуры Yandex.Market
-            try:
-                from bs4 import BeautifulSoup
-                soup = BeautifulSoup(html, 'lxml')
-            except ImportError:
-                logger.warning("BeautifulSoup not available, falling back to regex")
-                return self._extract_products_fallback(html)
-
-            # Ищем элементы с data-zone-name="productSnippet"
-            product_snippets = soup.find_all(attrs={'data-zone-name': 'productSnippet'})
-
-            if getattr(config, 'DEBUG_MODE', False):
-                logger.info(f"Found {len(product_snippets)} productSnippet elements")
-
-            for snippet in product_snippets:
+            for snippet in product_snippets:
                 try:
                     product_data = self._parse_product_snippet(snippet)
                     if product_data:
@@ -763,39 +320,8 @@ class SmartSearchService:
                 fallback_products = self._extract_products_fallback(html)
                 products.extend(fallback_products)
 
-            # КРИТИЧНАЯ ПРОВЕРКА: детектор shadow-ban с auto-pause
-            from services.shadow_ban_service import get_shadow_ban_service
-            shadow_ban_service = get_shadow_ban_service()
-            
-            # Проверяем, можно ли продолжать (не активна ли пауза)
-            if not shadow_ban_service.can_continue_parsing():
-                logger.warning("Shadow-ban pause active, skipping parsing")
-                return []
-            
-            shadow_banned = shadow_ban_service.is_shadow_banned(len(products), len(html))
-            too_few_products = len(products) < 5
-
-            if shadow_banned:
-                # Записываем shadow-ban и устанавливаем паузу
-                shadow_ban_service.record_shadow_ban(
-                    catalog_url=url or "unknown",
-                    products_count=len(products),
-                    html_size=len(html)
-                )
-                self.metrics['shadow_ban_detected'] += 1
-                logger.warning("Shadow-ban detected, pausing parsing for several hours")
-                return []  # Прекращаем парсинг, пауза установлена
-            
-            if too_few_products:
-                # Мало товаров - Playwright fallback обрабатывается на уровне crawl_catalogs
-                logger.warning(f"Only {len(products)} products found, Playwright fallback needed")
-                return []
-
-            if getattr(config, 'DEBUG_MODE', False):
-                logger.info(f"Extracted {len(products)} products total")
-
         except Exception as e:
-            logger.error(f"Failed to extract products from search HTML: {e}")
+            logger.error(f"Failed to parse search HTML: {e}")
             return []
 
         return products
@@ -844,8 +370,8 @@ class SmartSearchService:
             url = url_elem['href'] if url_elem else ''
 
             return {
-                'id': f'parsed_{hash(title) % 10000}',
-                'market_id': f'parsed_{hash(title) % 10000}',
+                'id': f'parsed_{_stable_title_id(title)}',
+                'market_id': f'parsed_{_stable_title_id(title)}',
                 'title': title,
                 'price': price,
                 'url': url if url.startswith('http') else f'https://market.yandex.ru{url}',
@@ -880,8 +406,8 @@ class SmartSearchService:
                         for item in data:
                             if isinstance(item, dict) and item.get('@type') == 'Product':
                                 product = {
-                                    'id': f'jsonld_{hash(item.get("name", "")) % 10000}',
-                                    'market_id': f'jsonld_{hash(item.get("name", "")) % 10000}',
+                                    'id': f'jsonld_{_stable_title_id(item.get("name", ""))}',
+                                    'market_id': f'jsonld_{_stable_title_id(item.get("name", ""))}',
                                     'title': item.get('name', 'Без названия'),
                                     'price': 0,  # JSON-LD может не содержать цены
                                     'url': item.get('url', ''),
@@ -893,127 +419,730 @@ class SmartSearchService:
                                 }
                                 products.append(product)
 
-                except (json.JSONDecodeError, AttributeError):
-                    continue
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+
+        except Exception as e:
+            logger.warning(f"Failed to extract products from JSON-LD: {e}")
+
+        return products
+
+    def _extract_products_fallback(self, html: str) -> List[Dict]:
+        """Fallback парсер на основе регулярных выражений"""
+        products = []
+
+        try:
+            # Простой поиск по заголовкам товаров
+            title_pattern = r'<h3[^>]*class="[^"]*title[^"]*"[^>]*>([^<]*)</h3>'
+            titles = re.findall(title_pattern, html, re.IGNORECASE)
+
+            # В ПРОДАКШЕНЕ mock товары ЗАПРЕЩЕНЫ!
+            # Они могут привести к публикации несуществующих товаров
+            if not titles:
+                logger.warning("No real products found in HTML fallback - possible shadow-ban or parsing error")
+                # НЕ создаем mock товары в продакшене
+
+            # Если нашли заголовки, создаем товары
+            for i, title in enumerate(titles[:10]):
+                products.append({
+                    'id': f'extracted_{i}',
+                    'market_id': f'extracted_{i}',
+                    'title': title.strip(),
+                    'price': 1000,
+                    'url': f'https://market.yandex.ru/search?title={title.strip()}',
+                    'vendor': 'Unknown',
+                    'rating': 4.0,
+                    'reviews_count': 10,
+                    'has_images': False,
+                    'discount_percent': 0
+                })
+
+        except Exception as e:
+            logger.error(f"Fallback extraction failed: {e}")
+
+        return products
+
+    def _parse_product_block(self, product_id: str, html_block: str) -> Optional[Dict]:
+        """Распарсить блок товара"""
+        try:
+            product_data = {
+                'id': product_id,
+                'market_id': product_id,
+            }
+
+            # Извлекаем название
+            title_match = re.search(r'<h3[^>]*>([^<]*)</h3>', html_block, re.IGNORECASE)
+            if title_match:
+                product_data['title'] = title_match.group(1).strip()
+
+            # Извлекаем URL
+            url_match = re.search(r'href="([^"]*?product[^"]*?)"', html_block)
+            if url_match:
+                product_data['url'] = f"https://market.yandex.ru{url_match.group(1)}"
+
+            # Извлекаем цену
+            price_match = re.search(r'(\d[\d\s]*?)₽', html_block)
+            if price_match:
+                price_str = price_match.group(1).replace(' ', '')
+                try:
+                    product_data['price'] = float(price_str)
+                except ValueError:
+                    pass
+
+            # Извлекаем старую цену и скидку
+            old_price_match = re.search(r'<s[^>]*>(\d[\d\s]*?)₽</s>', html_block)
+            if old_price_match:
+                old_price_str = old_price_match.group(1).replace(' ', '')
+                try:
+                    product_data['old_price'] = float(old_price_str)
+                    if 'price' in product_data and product_data['old_price'] > product_data['price']:
+                        discount = (product_data['old_price'] - product_data['price']) / product_data['old_price'] * 100
+                        product_data['discount_percent'] = round(discount, 1)
+                except ValueError:
+                    pass
+
+            # Извлекаем рейтинг
+            rating_match = re.search(r'rating[^>]*>(\d\.\d)', html_block)
+            if rating_match:
+                try:
+                    product_data['rating'] = float(rating_match.group(1))
+                except ValueError:
+                    pass
+
+            # Извлекаем количество отзывов
+            reviews_match = re.search(r'(\d+)\s*отзыв', html_block)
+            if reviews_match:
+                try:
+                    product_data['reviews_count'] = int(reviews_match.group(1))
+                except ValueError:
+                    pass
+
+            # Извлекаем бренд/производителя
+            vendor_match = re.search(r'<span[^>]*class="[^"]*brand[^"]*"[^>]*>([^<]*)</span>', html_block, re.IGNORECASE)
+            if vendor_match:
+                product_data['vendor'] = vendor_match.group(1).strip()
+
+            # Извлекаем offerid из URL
+            if 'url' in product_data:
+                parsed_url = urlparse(product_data['url'])
+                query_params = parse_qs(parsed_url.query)
+                if 'offerid' in query_params:
+                    product_data['offerid'] = query_params['offerid'][0]
+
+            # Проверяем наличие картинок
+            if '<img' in html_block:
+                product_data['has_images'] = True
+            else:
+                product_data['has_images'] = False
+
+            return product_data
+
+        except Exception as e:
+            logger.error(f"Failed to parse product block {product_id}: {e}")
+            return None
+
+    def _parse_window_state(self, html: str) -> List[Dict]:
+        """Парсинг товаров из window.__STATE__"""
+        products = []
+
+        try:
+            # Ищем window.__STATE__ в HTML и разбираем только search.results.items
+            items = extract_window_state_items(html)
+            if not items:
+                return products
+
+            for item in items:
+                try:
+                    product = self._convert_item_to_product(item)
+                    if product:
+                        products.append(product)
+                except Exception as e:
+                    logger.warning(f"Failed to convert window.__STATE__ item: {e}")
+
+        except Exception as e:
+            logger.warning(f"Failed to parse window.__STATE__: {e}")
+
+        return products
+
+    def _parse_next_data_products(self, html: str) -> List[Dict]:
+        """Парсер __NEXT_DATA__ из HTML (улучшенная версия)"""
+        try:
+            items = extract_next_data_items(html)
+            if items is None:
+                logger.warning("__NEXT_DATA__ script not found")
+                return []
+
+            # Путь к товарам (может меняться, но этот сейчас рабочий)
+            if not items:
+                logger.warning("Items path not found in __NEXT_DATA__")
+                return []
+
+            products = []
+            for item in items:
+                try:
+                    # Адаптируем под реальную структуру данных Yandex
+                    market_id = str(item.get("id", ""))
+                    if not market_id:
+                        continue
+
+                    # Разные варианты получения данных
+                    title = item.get("titles", {}).get("raw") or item.get("title", "")
+                    if not title:
+                        continue
+
+                    prices = item.get("prices", {})
+                    price = prices.get("value")
+                    if not price:
+                        continue
+
+                    product = {
+                        'market_id': market_id,
+                        'title': title,
+                        'price': int(price),
+                        'old_price': prices.get("oldValue"),
+                        'rating': item.get('rating'),
+                        'reviews_count': item.get('reviewsCount', 0),
+                        'vendor': item.get('vendor'),
+                        'url': f"https://market.yandex.ru/product--{item.get('slug', '')}/{market_id}",
+                        'discount_percent': item.get('discount', 0),
+                        'has_images': True,
+                        'source': 'playwright_fallback'
+                    }
+                    products.append(product)
+
+                except Exception as e:
+                    logger.warning(f"Failed to parse Playwright item: {e}")
+                    continue
+
+            logger.info(f"Playwright parsed {len(products)} products from __NEXT_DATA__")
+            return products
+
+        except Exception as e:
+            logger.error(f"Failed to parse __NEXT_DATA__: {e}")
+            return []
+
+
+# Экземпляр без состояния для воркеров ParseExecutor
+_html_parser = SmartSearchParser()
+
+
+def parse_catalog_html(html: str, url: str = "") -> List[Dict]:
+    """Точка входа ParseExecutor для страниц каталога"""
+    return _html_parser._parse_catalog_html(html, url)
+
+
+def parse_search_html(html: str, url: str = "") -> List[Dict]:
+    """Точка входа ParseExecutor для страниц поиска"""
+    return _html_parser._parse_search_html(html)
+
+
+class SmartSearchService(SmartSearchParser):
+    """Сервис умного автопоиска по каталогам (основной источник)"""
+
+    # Каталоги и бренды - основной источник товаров
+    # UPDATED: Using referral_products URLs as main source
+    CATALOG_URLS = [
+        # Главная страница referral products (основной источник)
+        "https://market.yandex.ru/page/referral_products?generalContext=t%3DcprPage%3Bcpk%3Dreferral_products%3B&rs=eJwzEv7EKMDBKLDwEKsEg8bqk6waq46wAgA7hQYe",
+        # Категория продукты (hid=91307)
+        "https://market.yandex.ru/search?generalContext=t%3DcprPage%3Bcpk%3Dreferral_products%3B&searchContext=referral_products_ctx&rs=eJwzEv7EKMDBKLDwEKsEg8bqk6waq46wAgA7hQYe&clicked-on-nav-tree=1&page-key=referral_products&hid=91307",
+        # Товары для дома (hid=90666)
+        "https://market.yandex.ru/search?generalContext=t%3DcprPage%3Bcpk%3Dreferral_products%3B&searchContext=referral_products_ctx&rs=eJwzEv7EKMDBKLDwEKsEg8bqk6waq46wAgA7hQYe&clicked-on-nav-tree=1&page-key=referral_products&hid=90666",
+        # Дополнительные источники для разнообразия
+        "https://market.yandex.ru/catalog--naushniki/",
+        "https://market.yandex.ru/catalog--smartfony/",
+    ]
+
+    # Playwright settings for anti-bot bypass
+    PLAYWRIGHT_HEADERS = {
+        "Accept-Language": "ru-RU,ru;q=0.9",
+    }
+    PLAYWRIGHT_USER_AGENT = (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    )
+
+    def __init__(self):
+        self.db = get_postgres_db() if config.USE_POSTGRES else None
+        self.redis = get_redis_cache() if config.USE_REDIS else None
+        self._session = None
+        self._last_catalog_parse = self._load_parse_cache()  # Персистентный кэш
+        # Накопительные метрики стадий конвейеров (per-host concurrency - в CrawlPipeline)
+        self._pipeline_metrics = {'catalog': PipelineMetrics(), 'search': PipelineMetrics()}
+        self._playwright_daily_count = 0  # Счетчик Playwright использований за день
+        # Метрики для мониторинга
+        self.metrics = {
+            'catalog_requests': 0,
+            'catalog_errors': 0,
+            'products_parsed': 0,
+            'playwright_fallback_used': 0,
+            'shadow_ban_detected': 0
+        }
+
+    def _load_parse_cache(self) -> Dict:
+        """Загрузка кэша времени парсинга из файла"""
+        cache_file = "catalog_parse_cache.json"
+        try:
+            if os.path.exists(cache_file):
+                with open(cache_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load parse cache: {e}")
+        return {}
+
+    def _save_parse_cache(self):
+        """Сохранение кэша времени парсинга в файл"""
+        cache_file = "catalog_parse_cache.json"
+        try:
+            with open(cache_file, 'w') as f:
+                json.dump(self._last_catalog_parse, f, indent=2)
+        except Exception as e:
+            logger.warning(f"Failed to save parse cache: {e}")
+
+    def _can_use_playwright_fallback(self) -> bool:
+        """Проверка лимита на Playwright fallback (max 5 per day)"""
+        return self._playwright_daily_count < 5
+
+    def get_metrics(self) -> Dict:
+        """Получить метрики для мониторинга"""
+        return {
+            **self.metrics,
+            'playwright_daily_count': self._playwright_daily_count,
+            'cache_size': len(self._last_catalog_parse),
+            'pipeline': {name: m.as_dict() for name, m in self._pipeline_metrics.items()},
+            'parse_executor': get_parse_executor().get_stats(),
+        }
+
+    async def get_session(self):
+        """Получить HTTP сессию (профиль catalog общего реестра)"""
+        # Реестр сам кэширует сессию и пересоздает ее в новом event loop
+        self._session = get_http_registry().session("catalog")
+        return self._session
+
+    async def close_session(self):
+        """
+        Отпустить HTTP сессию и сохранить кэш.
+        Соединения принадлежат реестру и закрываются в get_http_registry().close_all().
+        """
+        if self._session is not None:
+            self._session = None
+            logger.info("SmartSearchService HTTP session released")
+
+        # Сохраняем кэш при shutdown
+        self._save_parse_cache()
+
+    async def crawl_catalogs(self, max_catalogs: int = 5) -> Tuple[int, int]:
+        """
+        Парсинг каталогов и брендов (основной источник товаров)
+
+        Каталоги проходят через потоковый конвейер fetch -> parse -> validate ->
+        dedup -> enqueue, поэтому парсинг одного каталога идет во время
+        загрузки следующего.
+
+        Args:
+            max_catalogs: Максимальное количество каталогов для обработки
+
+        Returns:
+            Tuple[int, int]: (added_products, skipped_products)
+        """
+        try:
+            # Выбираем случайные каталоги для разнообразия
+            selected_catalogs = random.sample(self.CATALOG_URLS, min(max_catalogs, len(self.CATALOG_URLS)))
+
+            # Проверяем кэш времени последнего парсинга (минимум 30 минут)
+            now = time.time()
+            catalog_urls = []
+            for catalog_url in selected_catalogs:
+                if now - self._last_catalog_parse.get(catalog_url, 0) < 1800:  # 30 minutes
+                    logger.debug(f"Skipping {catalog_url}, parsed recently")
+                    continue
+                catalog_urls.append(catalog_url)
+
+            pipeline = CrawlPipeline(
+                fetch=self._fetch_catalog_for_pipeline,
+                parse=self._parse_catalog_for_pipeline,
+                validate=self._is_product_valid_for_queue,
+                dedup=self._claim_new_products,
+                enqueue=lambda page, product: self._enqueue_product(product, page.url),
+                on_page=self._on_catalog_page_done,
+                backlog_depth=self._get_publish_backlog,
+                metrics=self._pipeline_metrics['catalog'],
+            )
+            result = await pipeline.run(catalog_urls)
+            self._save_parse_cache()
+            return result['added'], result['skipped']
+
+        except Exception as e:
+            logger.error(f"Error in crawl_catalogs: {e}")
+            return 0, 0
+
+    async def _fetch_catalog_for_pipeline(self, catalog_url: str) -> Optional[str]:
+        """Стадия fetch конвейера каталогов"""
+        # Проверяем shadow-ban паузу перед парсингом каталога
+        from services.shadow_ban_service import get_shadow_ban_service
+        if not get_shadow_ban_service().can_continue_parsing():
+            logger.warning(f"Shadow-ban pause active, skipping catalog: {catalog_url}")
+            return None
+
+        logger.info(f"Processing catalog: {catalog_url}")
+        self.metrics['catalog_requests'] += 1
+        html = await self._fetch_catalog_page(catalog_url)
+        if not html:
+            self.metrics['catalog_errors'] += 1
+            logger.warning(f"Failed to fetch catalog: {catalog_url}")
+            return None
+
+        # КРИТИЧНАЯ ПАУЗА: имитация человеческого поведения (слот хоста держим,
+        # а загруженная страница тем временем уже парсится)
+        await asyncio.sleep(random.uniform(3.5, 7.5))
+        return html
+
+    async def _parse_catalog_for_pipeline(self, page: CrawlPage) -> List[Dict]:
+        """Стадия parse конвейера каталогов с проверкой shadow-ban"""
+        products = await self._parse_catalog_products(page.html, page.url)
+        self.metrics['products_parsed'] += len(products)
+
+        # Проверяем shadow-ban после парсинга (отключаем для referral_products)
+        if 'referral_products' not in page.url:
+            from services.shadow_ban_service import get_shadow_ban_service
+            shadow_ban_service = get_shadow_ban_service()
+            if shadow_ban_service.is_shadow_banned(len(products), len(page.html)):
+                shadow_ban_service.record_shadow_ban(
+                    catalog_url=page.url,
+                    products_count=len(products),
+                    html_size=len(page.html)
+                )
+                self.metrics['shadow_ban_detected'] += 1
+                logger.warning(f"Shadow-ban detected for {page.url}, pausing")
+                page.extra['shadow_banned'] = True
+                return []  # Пропускаем этот каталог
+
+        logger.info(f"Parsed {len(products)} products from {page.url.split('/')[-2]}")
+        return products[:50]  # Safety cap
+
+    def _on_catalog_page_done(self, page: CrawlPage):
+        """Каталог обработан: обновляем кэш времени парсинга"""
+        if not page.extra.get('shadow_banned'):
+            self._last_catalog_parse[page.url] = time.time()
+
+    def _get_publish_backlog(self) -> int:
+        """Глубина буфера публикации для backpressure конвейера"""
+        from services.publish_service import get_publish_service
+        return get_publish_service().get_queue_depth()
+
+    async def _process_found_products(self, products: List[Dict], source_url: str) -> Tuple[int, int]:
+        """Обработка найденных товаров с валидацией и пакетной atomic dedup (без конвейера)"""
+        added = skipped = 0
+        valid = []
+
+        for p in products[:50]:  # Safety cap
+            if await self._is_product_valid_for_queue(p):
+                valid.append(p)
+            else:
+                skipped += 1
+
+        # Дедупликация всей пачки: Bloom-фильтр + точная проверка только для срабатываний
+        new_products = await self._claim_new_products(valid)
+        skipped += len(valid) - len(new_products)
+        if len(new_products) < len(valid):
+            logger.info(f"Already seen: {len(valid) - len(new_products)} of {len(valid)} products")
+
+        for p in new_products:
+            try:
+                # Добавляем в очередь
+                await self._enqueue_product(p, source_url)
+                added += 1
+                logger.debug(f"Enqueued {p.get('market_id')}")
+            except Exception as e:
+                logger.warning(f"Error processing product {p.get('market_id', 'unknown')}: {e}")
+                skipped += 1
+
+        return added, skipped
+
+    async def _is_product_valid_for_queue(self, product: Dict) -> bool:
+        """Стадия validate: правила качества + наличие market_id"""
+        try:
+            ok, reasons = await self._validate_product_for_queue(product)
+        except Exception as e:
+            logger.warning(f"Error validating product {product.get('market_id', 'unknown')}: {e}")
+            return False
+        if not ok:
+            logger.info(f"Skip {product.get('market_id', 'unknown')} reasons={reasons}")
+            return False
+        if not product.get('market_id'):
+            logger.info("Skip product without market_id")
+            return False
+        return True
+
+    async def _claim_new_products(self, products: List[Dict]) -> List[Dict]:
+        """Пакетная atomic проверка и маркировка товаров как увиденных (race condition safe)"""
+        if not products:
+            return []
+        try:
+            from services.dedup_service import get_dedup_service
+            return await (await get_dedup_service()).claim_new(products)
+        except Exception as e:
+            # Не публикуем пачку, если не можем гарантировать отсутствие дублей
+            logger.warning(f"Dedup failed for {len(products)} products: {e}")
+            return []
+
+    async def _validate_product_for_queue(self, product: Dict) -> Tuple[bool, List[str]]:
+        """Валидация продукта перед добавлением в очередь"""
+        from services.post_service import is_product_valid
+        return is_product_valid(product)
+
+    async def _enqueue_product(self, product: Dict, source_url: str):
+        """Добавление продукта в очередь публикации с ERID логированием"""
+        try:
+            from services.publish_service import get_publish_service
+            from services.affiliate_service import get_affiliate_link
+
+            # Генерируем affiliate ссылку с ERID
+            from utils.correlation_id import get_correlation_id
+            correlation_id = get_correlation_id() or "unknown"
+            affiliate_url, erid = get_affiliate_link(product.get('url', ''), correlation_id=correlation_id)
+
+            # Логируем ERID для отладки
+            market_id = product.get('market_id')
+            logger.info(f"Product {market_id} -> ERID {erid}, affiliate: {affiliate_url[:50]}...")
+
+            publish_item = {
+                'market_id': market_id,
+                'title': product.get('title', ''),
+                'url': affiliate_url,  # Affiliate ссылка с ERID
+                'price': product.get('price'),
+                'old_price': product.get('old_price'),
+                'discount_percent': product.get('discount_percent', 0),
+                'vendor': product.get('vendor'),
+                'rating': product.get('rating'),
+                'reviews_count': product.get('reviews_count', 0),
+                'has_images': product.get('has_images', True),
+                'source': 'catalog_search',
+                'priority': 100,
+                'erid': erid  # Сохраняем ERID для логов
+            }
+
+            publish_service = get_publish_service()
+            success = publish_service.enqueue_product(publish_item)
+
+            if success:
+                logger.info(f"Successfully enqueued {market_id}")
+            else:
+                logger.warning(f"Failed to enqueue {market_id}")
+
+        except Exception as e:
+            market_id = product.get('market_id', 'unknown')
+            logger.error(f"Failed to enqueue product {market_id}: {e}")
+
+    async def _parse_catalog_products(self, html: str, url: str = "") -> List[Dict]:
+        """Парсинг товаров каталога в пуле процессов, чтобы не блокировать event loop на время BeautifulSoup"""
+        return await get_parse_executor().parse('catalog', html, url)
+
+    async def _fetch_catalog_page(self, url: str) -> Optional[str]:
+        """
+        Получить HTML страницы каталога с оптимизированными headers.
+        FIXED: Added distributed rate limiting to prevent IP bans.
+        Concurrency по хосту ограничивает CrawlPipeline (CRAWL_HOST_CONCURRENCY).
+        """
+        try:
+            # FIXED: Apply rate limiting before request
+            from services.distributed_rate_limiter import get_yandex_catalog_limiter
+            limiter = get_yandex_catalog_limiter()
+            await limiter.acquire()
+
+            session = await self.get_session()
+            html = await fetch_with_backoff(url, session, max_attempts=3, headers=self.PLAYWRIGHT_HEADERS)
+
+            if not html:
+                logger.warning(f"HTTP fetch failed for {url}")
+                return None
+
+            if getattr(config, 'DEBUG_MODE', False):
+                logger.debug(f"Fetched {len(html)} chars from {url}")
+
+            return html
+
+        except Exception as e:
+            logger.error(f"Error fetching {url}: {e}")
+            return None
+
+    async def _run_smart_search(self, key_text: str, start_page: int = 1, max_pages: int = 10) -> Tuple[int, int]:
+        """
+        Выполнить умный поиск по ключевому слову через конвейер страниц поиска
+
+        Args:
+            key_text: Ключевое слово для поиска
+            start_page: Стартовая страница
+            max_pages: Максимум страниц для обработки
+
+        Returns:
+            Tuple (added, skipped)
+        """
+        logger.info(f"Starting smart search for '{key_text}' from page {start_page}")
+
+        page_numbers = {
+            self._build_search_url(key_text, page_num): page_num
+            for page_num in range(start_page, start_page + max_pages)
+        }
+        pipeline = None
+        last_page = start_page - 1
+
+        def on_page_done(page: CrawlPage):
+            nonlocal last_page
+            page_num = page_numbers[page.url]
+            # Обновляем состояние поиска (страницы завершаются не по порядку)
+            if self.db and page_num > last_page:
+                last_page = page_num
+                self.db.update_search_key(key_text, last_page=page_num)
+
+            if getattr(config, 'DEBUG_MODE', False):
+                logger.info(f"Processed page {page_num} for '{key_text}': found={page.parsed_count}, added={page.added}, skipped={page.skipped}")
+            else:
+                logger.debug(f"Processed page {page_num} for '{key_text}': found={page.parsed_count}, added={page.added}, skipped={page.skipped}")
+
+            # Если на странице не найдено товаров, возможно конец поиска
+            if page.parsed_count == 0 and page_num > start_page + 1:
+                logger.info(f"No products found on page {page_num} for '{key_text}', stopping search")
+                pipeline.stop()
+
+        try:
+            pipeline = CrawlPipeline(
+                fetch=self._fetch_search_page,
+                parse=self._parse_search_page,
+                dedup=self._claim_new_products,
+                enqueue=self._enqueue_search_product,
+                on_page=on_page_done,
+                backlog_depth=self._get_publish_backlog,
+                metrics=self._pipeline_metrics['search'],
+            )
+            result = await pipeline.run(list(page_numbers))
+
+            logger.info(f"Smart search for '{key_text}' completed: added={result['added']}, skipped={result['skipped']}")
+            return result['added'], result['skipped']
 
         except Exception as e:
-            logger.warning(f"Failed to extract products from JSON-LD: {e}")
+            logger.error(f"Failed smart search for '{key_text}': {e}")
+            return 0, 0
 
-        return products
+    async def _fetch_search_page(self, search_url: str) -> Optional[str]:
+        """Стадия fetch конвейера страниц поиска"""
+        from services.distributed_rate_limiter import get_yandex_catalog_limiter
+        await get_yandex_catalog_limiter().acquire()
 
-    def _extract_products_fallback(self, html: str) -> List[Dict]:
-        """Fallback парсер на основе регулярных выражений"""
-        products = []
+        # Используем fetch_with_backoff для надежных запросов
+        session = await self.get_session()
+        html = await fetch_with_backoff(search_url, session, max_attempts=3)
 
-        try:
-            # Простой поиск по заголовкам товаров
-            title_pattern = r'<h3[^>]*class="[^"]*title[^"]*"[^>]*>([^<]*)</h3>'
-            titles = re.findall(title_pattern, html, re.IGNORECASE)
+        # Небольшая пауза между страницами
+        await asyncio.sleep(random.uniform(1, 3))
 
-            # В ПРОДАКШЕНЕ mock товары ЗАПРЕЩЕНЫ!
-            # Они могут привести к публикации несуществующих товаров
-            if not titles:
-                logger.warning("No real products found in HTML fallback - possible shadow-ban or parsing error")
-                # НЕ создаем mock товары в продакшене
+        if not html:
+            logger.warning(f"Failed to fetch search page {search_url} after retries")
+            return None
 
-            # Если нашли заголовки, создаем товары
-            for i, title in enumerate(titles[:10]):
-                products.append({
-                    'id': f'extracted_{i}',
-                    'market_id': f'extracted_{i}',
-                    'title': title.strip(),
-                    'price': 1000,
-                    'url': f'https://market.yandex.ru/search?title={title.strip()}',
-                    'vendor': 'Unknown',
-                    'rating': 4.0,
-                    'reviews_count': 10,
-                    'has_images': False,
-                    'discount_percent': 0
-                })
+        # Проверяем что HTML не пустой
+        if len(html.strip()) < 100:
+            logger.warning(f"HTML too short ({len(html)} chars) for {search_url}")
+            return None
 
-        except Exception as e:
-            logger.error(f"Fallback extraction failed: {e}")
+        return html
 
-        return products
+    async def _parse_search_page(self, page: CrawlPage) -> List[Dict]:
+        """Стадия parse конвейера страниц поиска (в пуле процессов)"""
+        products = await get_parse_executor().parse('search', page.html, page.url)
 
-    def _parse_product_block(self, product_id: str, html_block: str) -> Optional[Dict]:
-        """Распарсить блок товара"""
-        try:
-            product_data = {
-                'id': product_id,
-                'market_id': product_id,
-            }
+        if getattr(config, 'DEBUG_MODE', False):
+            logger.info(f"Downloaded HTML: {len(page.html)} chars, parsed products: {len(products)}")
 
-            # Извлекаем название
-            title_match = re.search(r'<h3[^>]*>([^<]*)</h3>', html_block, re.IGNORECASE)
-            if title_match:
-                product_data['title'] = title_match.group(1).strip()
+        return self._check_search_shadow_ban(products, len(page.html), page.url)
 
-            # Извлекаем URL
-            url_match = re.search(r'href="([^"]*?product[^"]*?)"', html_block)
-            if url_match:
-                product_data['url'] = f"https://market.yandex.ru{url_match.group(1)}"
+    async def _enqueue_search_product(self, page: CrawlPage, product: Dict):
+        """Стадия enqueue конвейера страниц поиска"""
+        # Сохраняем товар в базу
+        await self._save_product_to_database(product)
 
-            # Извлекаем цену
-            price_match = re.search(r'(\d[\d\s]*?)₽', html_block)
-            if price_match:
-                price_str = price_match.group(1).replace(' ', '')
-                try:
-                    product_data['price'] = float(price_str)
-                except ValueError:
-                    pass
+        # Добавляем в очередь публикации
+        await self._enqueue_for_publishing(product)
 
-            # Извлекаем старую цену и скидку
-            old_price_match = re.search(r'<s[^>]*>(\d[\d\s]*?)₽</s>', html_block)
-            if old_price_match:
-                old_price_str = old_price_match.group(1).replace(' ', '')
-                try:
-                    product_data['old_price'] = float(old_price_str)
-                    if 'price' in product_data and product_data['old_price'] > product_data['price']:
-                        discount = (product_data['old_price'] - product_data['price']) / product_data['old_price'] * 100
-                        product_data['discount_percent'] = round(discount, 1)
-                except ValueError:
-                    pass
+    def _build_search_url(self, key_text: str, page_num: int) -> str:
+        """Построить URL страницы поиска"""
+        base_url = "https://market.yandex.ru/search"
 
-            # Извлекаем рейтинг
-            rating_match = re.search(r'rating[^>]*>(\d\.\d)', html_block)
-            if rating_match:
-                try:
-                    product_data['rating'] = float(rating_match.group(1))
-                except ValueError:
-                    pass
+        # Убираем двойное кодирование - используем обычный UTF-8
+        params = {
+            "text": key_text,  # Не кодируем, aiohttp сделает это правильно
+        }
+        if page_num > 1:
+            params["page"] = page_num
 
-            # Извлекаем количество отзывов
-            reviews_match = re.search(r'(\d+)\s*отзыв', html_block)
-            if reviews_match:
-                try:
-                    product_data['reviews_count'] = int(reviews_match.group(1))
-                except ValueError:
-                    pass
+        # Упрощаем для тестирования - убираем дополнительные параметры
+        # которые могут вызывать 400 ошибку
+        # if page_num == 1:
+        #     params.update({
+        #         "delivery-interval": "1",  # Доставка в день заказа
+        #         "onstock": "1",  # В наличии
+        #     })
 
-            # Извлекаем бренд/производителя
-            vendor_match = re.search(r'<span[^>]*class="[^"]*brand[^"]*"[^>]*>([^<]*)</span>', html_block, re.IGNORECASE)
-            if vendor_match:
-                product_data['vendor'] = vendor_match.group(1).strip()
+        query_string = urlencode(params, doseq=True)
+        final_url = f"{base_url}?{query_string}"
 
-            # Извлекаем offerid из URL
-            if 'url' in product_data:
-                parsed_url = urlparse(product_data['url'])
-                query_params = parse_qs(parsed_url.query)
-                if 'offerid' in query_params:
-                    product_data['offerid'] = query_params['offerid'][0]
+        if getattr(config, 'DEBUG_MODE', False):
+            logger.info(f"Generated search URL: {final_url}")
+        else:
+            logger.debug(f"Generated search URL: {final_url}")
 
-            # Проверяем наличие картинок
-            if '<img' in html_block:
-                product_data['has_images'] = True
-            else:
-                product_data['has_images'] = False
+        return final_url
 
-            return product_data
+    def _extract_products_from_search(self, html: str, url: str = "") -> List[Dict]:
+        """
+        Извлечь товары из HTML страницы поиска (синхронно, в текущем процессе)
+
+        Args:
+            html: HTML содержимое страницы
+            url: URL страницы (для логирования shadow-ban)
+        """
+        return self._check_search_shadow_ban(self._parse_search_html(html), len(html), url)
+
+    def _check_search_shadow_ban(self, products: List[Dict], html_size: int, url: str = "") -> List[Dict]:
+        """Детектор shadow-ban с auto-pause для распарсенной страницы поиска"""
+        try:
+            # КРИТИЧНАЯ ПРОВЕРКА: детектор shadow-ban с auto-pause
+            from services.shadow_ban_service import get_shadow_ban_service
+            shadow_ban_service = get_shadow_ban_service()
+            
+            # Проверяем, можно ли продолжать (не активна ли пауза)
+            if not shadow_ban_service.can_continue_parsing():
+                logger.warning("Shadow-ban pause active, skipping parsing")
+                return []
+            
+            shadow_banned = shadow_ban_service.is_shadow_banned(len(products), html_size)
+            too_few_products = len(products) < 5
+
+            if shadow_banned:
+                # Записываем shadow-ban и устанавливаем паузу
+                shadow_ban_service.record_shadow_ban(
+                    catalog_url=url or "unknown",
+                    products_count=len(products),
+                    html_size=html_size
+                )
+                self.metrics['shadow_ban_detected'] += 1
+                logger.warning("Shadow-ban detected, pausing parsing for several hours")
+                return []  # Прекращаем парсинг, пауза установлена
+            
+            if too_few_products:
+                # Мало товаров - Playwright fallback обрабатывается на уровне crawl_catalogs
+                logger.warning(f"Only {len(products)} products found, Playwright fallback needed")
+                return []
+
+            if getattr(config, 'DEBUG_MODE', False):
+                logger.info(f"Extracted {len(products)} products total")
 
         except Exception as e:
-            logger.error(f"Failed to parse product block {product_id}: {e}")
-            return None
+            logger.error(f"Failed to extract products from search HTML: {e}")
+            return []
+
+        return products
 
     def _generate_product_key(self, product: Dict) -> str:
         """
@@ -1074,21 +1203,14 @@ class SmartSearchService:
             raise
 
     async def _enqueue_for_publishing(self, product: Dict):
-        """Добавить товар в очередь публикации с дедупликацией"""
+        """Добавить товар в очередь публикации (товар уже прошел дедупликацию)"""
         try:
             market_id = product.get('market_id')
             if not market_id:
                 logger.warning("Cannot enqueue product without market_id")
                 return
 
-            # Дедупликация: проверяем, не видели ли мы этот товар недавно
-            if self.redis:
-                if self.redis.is_product_seen_recently(market_id, ttl_seconds=86400):  # 24 часа
-                    logger.debug(f"Skipping duplicate product (seen recently): {market_id}")
-                    return
-
-                # Помечаем товар как увиденный
-                self.redis.mark_product_seen(market_id, ttl_seconds=86400)
+            # Дедупликация выполнена заранее пачкой в _claim_new_products
 
             # Определяем приоритет
             priority = 100  # Обычный приоритет
@@ -1177,38 +1299,6 @@ class SmartSearchService:
             logger.error(f"Failed to get search stats: {e}")
             return {}
 
-    def _parse_window_state(self, html: str) -> List[Dict]:
-        """Парсинг товаров из window.__STATE__"""
-        products = []
-
-        try:
-            # Ищем window.__STATE__ в HTML
-            import re
-            state_match = re.search(r'window\.__STATE__\s*=\s*({.+?});', html, re.DOTALL)
-            if not state_match:
-                return products
-
-            import json
-            state_data = json.loads(state_match.group(1))
-
-            # Ищем товары в разных возможных местах
-            search_data = state_data.get('search', {})
-            results = search_data.get('results', {})
-            items = results.get('items', [])
-
-            for item in items:
-                try:
-                    product = self._convert_item_to_product(item)
-                    if product:
-                        products.append(product)
-                except Exception as e:
-                    logger.warning(f"Failed to convert window.__STATE__ item: {e}")
-
-        except Exception as e:
-            logger.warning(f"Failed to parse window.__STATE__: {e}")
-
-        return products
-
     def _is_shadow_banned(self, products_count: int, html_size: int) -> bool:
         """
         Детектор shadow-ban от Yandex (использует ShadowBanService)
@@ -1267,73 +1357,6 @@ class SmartSearchService:
             logger.error(f"Playwright fallback failed for {url}: {e}")
             return []
 
-    def _parse_next_data_products(self, html: str) -> List[Dict]:
-        """Парсер __NEXT_DATA__ из HTML (улучшенная версия)"""
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html, 'lxml')
-
-            script = soup.find("script", id="__NEXT_DATA__")
-            if not script:
-                logger.warning("__NEXT_DATA__ script not found")
-                return []
-
-            data = json.loads(script.string)
-
-            # Путь к товарам (может меняться, но этот сейчас рабочий)
-            try:
-                items = (
-                    data["props"]["pageProps"]
-                    ["initialState"]["search"]["results"]["items"]
-                )
-            except KeyError:
-                logger.warning("Items path not found in __NEXT_DATA__")
-                return []
-
-            products = []
-            for item in items:
-                try:
-                    # Адаптируем под реальную структуру данных Yandex
-                    market_id = str(item.get("id", ""))
-                    if not market_id:
-                        continue
-
-                    # Разные варианты получения данных
-                    title = item.get("titles", {}).get("raw") or item.get("title", "")
-                    if not title:
-                        continue
-
-                    prices = item.get("prices", {})
-                    price = prices.get("value")
-                    if not price:
-                        continue
-
-                    product = {
-                        'market_id': market_id,
-                        'title': title,
-                        'price': int(price),
-                        'old_price': prices.get("oldValue"),
-                        'rating': item.get('rating'),
-                        'reviews_count': item.get('reviewsCount', 0),
-                        'vendor': item.get('vendor'),
-                        'url': f"https://market.yandex.ru/product--{item.get('slug', '')}/{market_id}",
-                        'discount_percent': item.get('discount', 0),
-                        'has_images': True,
-                        'source': 'playwright_fallback'
-                    }
-                    products.append(product)
-
-                except Exception as e:
-                    logger.warning(f"Failed to parse Playwright item: {e}")
-                    continue
-
-            logger.info(f"Playwright parsed {len(products)} products from __NEXT_DATA__")
-            return products
-
-        except Exception as e:
-            logger.error(f"Failed to parse __NEXT_DATA__: {e}")
-            return []
-
 
 # Глобальный экземпляр
 _smart_search_service = None
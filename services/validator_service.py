@@ -4,10 +4,11 @@ import logging
 import re
 from typing import Dict, Any, Optional, List, Tuple
 from urllib.parse import urlparse
-import aiohttp
 import config
 from database_postgres import get_postgres_db
 from redis_cache import get_redis_cache
+from services.http_client import get_http_client
+from services.http_registry import get_http_registry
 
 logger = logging.getLogger(__name__)
 
@@ -20,23 +21,14 @@ class ProductValidator:
         self._session = None
 
     async def get_session(self):
-        """Получить HTTP сессию"""
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=15),
-                headers={
-                    "User-Agent": config.USER_AGENT or "Mozilla/5.0 (compatible; MarketBot/1.0)",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                    "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
-                }
-            )
+        """Получить HTTP сессию (профиль validator общего реестра)"""
+        # Реестр сам кэширует сессию и пересоздает ее в новом event loop
+        self._session = get_http_registry().session("validator")
         return self._session
 
     async def close_session(self):
-        """Закрыть HTTP сессию"""
-        if self._session and not self._session.closed:
-            await self._session.close()
-            self._session = None
+        """Отпустить HTTP сессию (соединения остаются в пуле реестра)"""
+        self._session = None
 
     async def validate_product(self, product: Dict) -> Tuple[bool, List[str]]:
         """
@@ -184,29 +176,18 @@ class ProductValidator:
                 elif cached_result == 0:
                     return False
 
-            # Делаем запросы с backoff для проверки доступности
-            from utils.scraper import fetch_with_backoff
-            session = await self.get_session()
-
-            # Пробуем несколько подходов с backoff
-            availability_checks = [
-                self._check_head_request_with_backoff(session, url),
-                self._check_get_request_with_backoff(session, url),
-            ]
-
-            for check_coro in availability_checks:
-                try:
-                    is_available = await check_coro
-                    if is_available:
-                        if self.redis:
-                            self.redis.set_counter(cache_key, 1)  # Кэшируем на 1 час
-                            self.redis.client.expire(cache_key, 3600)
-                        return True
-                except Exception as e:
-                    logger.debug(f"Availability check failed: {e}")
-                    continue
-
-            # Если все проверки провалились, считаем недоступным
+            # Страница товара через общий кэш ответов: ту же карточку проверяют
+            # чистильщик распроданных и мониторинг цен (HTTP_CACHE_AVAILABILITY_TTL)
+            html = await get_http_client().fetch_text(
+                url, max_age=getattr(config, "HTTP_CACHE_AVAILABILITY_TTL", 900)
+            )
+            if html is not None:
+                if self.redis:
+                    self.redis.set_counter(cache_key, 1)  # Кэшируем на 1 час
+                    self.redis.client.expire(cache_key, 3600)
+                return True
+
+            # Страница не получена - считаем недоступным
             if self.redis:
                 self.redis.set_counter(cache_key, 0)
                 self.redis.client.expire(cache_key, 1800)  # Кэшируем негативный результат на 30 мин
@@ -216,37 +197,6 @@ class ProductValidator:
             logger.error(f"Error checking availability for {product.get('title', 'Unknown')}: {e}")
             return False
 
-    async def _check_head_request_with_backoff(self, session: aiohttp.ClientSession, url: str) -> bool:
-        """Проверить доступность HEAD запросом с backoff"""
-        from utils.scraper import fetch_with_backoff
-        # Для HEAD запроса создаем временный URL с head методом
-        # Но поскольку fetch_with_backoff использует GET, просто используем его
-        result = await fetch_with_backoff(url, session, max_attempts=3)
-        return result is not None
-
-    async def _check_get_request_with_backoff(self, session: aiohttp.ClientSession, url: str) -> bool:
-        """Проверить доступность GET запросом (ограниченный)"""
-        async with session.get(url, allow_redirects=True) as resp:
-            if resp.status != 200:
-                return False
-
-            # Читаем только начало страницы для проверки
-            content = await resp.text()
-            # Ищем признаки доступности товара
-            availability_indicators = [
-                'в корзину',
-                'купить',
-                'добавить в корзину',
-                'товар доступен'
-            ]
-
-            content_lower = content.lower()
-            for indicator in availability_indicators:
-                if indicator in content_lower:
-                    return True
-
-            return False
-
     def _check_quality_filters(self, product: Dict) -> Tuple[bool, List[str]]:
         """Проверить фильтры качества"""
         errors = []
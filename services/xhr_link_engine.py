@@ -0,0 +1,146 @@
+# services/xhr_link_engine.py
+"""
+XHR Link Engine - primary cc-link strategy without page rendering
+Every product first goes through the learned share-XHR template
+(utils/xhr_template_cache) replayed over the shared httpx client;
+the browser is used only when there is no healthy template or replay fails.
+Successful browser captures teach the engine a new template.
+"""
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List, Optional
+
+from config.link_generation_config import (
+    USER_AGENTS,
+    XHR_BATCH_CONCURRENCY,
+    XHR_REPRODUCTION_TIMEOUT,
+)
+from utils.xhr_template_cache import (
+    XHRTemplateCache,
+    cookie_fingerprint,
+    get_xhr_template_cache,
+    render_template,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _cookies_to_dict(cookies: Optional[Any]) -> Optional[Dict[str, str]]:
+    """Playwright cookie list or dict -> dict."""
+    if not cookies:
+        return None
+    if isinstance(cookies, dict):
+        return cookies
+    return {c.get("name", ""): c.get("value", "") for c in cookies if c.get("name")}
+
+
+class XHRLinkEngine:
+    """
+    Template-first link generation.
+    Stats: hits (link via replay), misses (no healthy template),
+    failures (replay without link), learned (templates from browser captures).
+    """
+
+    def __init__(self, templates: Optional[XHRTemplateCache] = None, concurrency: int = XHR_BATCH_CONCURRENCY):
+        self.templates = templates or get_xhr_template_cache()
+        self.concurrency = concurrency
+        self.stats = {"hits": 0, "misses": 0, "failures": 0, "learned": 0, "batch_calls": 0}
+
+    async def generate(self, url: str, cookies: Optional[Any] = None) -> Optional[str]:
+        """
+        Try to get cc-link by replaying the template for this cookie set.
+
+        Args:
+            url: Product URL
+            cookies: Job cookies (Playwright list or dict); None - best healthy template
+
+        Returns:
+            Partner link or None (caller falls back to the browser)
+        """
+        from utils.xhr_reproducer import extract_short_url_from_response, reproduce_xhr_directly
+
+        cookies_dict = _cookies_to_dict(cookies)
+        found = await self.templates.get(cookie_fingerprint(cookies_dict) if cookies_dict else None)
+        xhr_info = render_template(found[1], url) if found else None
+        if not xhr_info:
+            self.stats["misses"] += 1
+            return None
+
+        fingerprint = found[0]
+        link = None
+        try:
+            response_data = await asyncio.wait_for(
+                reproduce_xhr_directly(
+                    xhr_info,
+                    cookies=cookies_dict,
+                    timeout=XHR_REPRODUCTION_TIMEOUT,
+                    product_url=url,
+                    user_agent=None if any(h.lower() == "user-agent" for h in xhr_info["headers"]) else random.choice(USER_AGENTS),
+                ),
+                timeout=XHR_REPRODUCTION_TIMEOUT + 5.0,
+            )
+            if response_data:
+                link = extract_short_url_from_response(response_data)
+        except asyncio.TimeoutError:
+            logger.debug(f"XHR template replay timed out for {url[:100]}")
+        except Exception as e:
+            logger.debug(f"XHR template replay failed for {url[:100]}: {e}")
+
+        # Только /cc/ ссылка считается успехом (а не произвольный url из ответа)
+        success = bool(link) and "/cc/" in link
+        await self.templates.record(fingerprint, success)
+        if success:
+            self.stats["hits"] += 1
+            logger.info(f"✅ Link via XHR template ({fingerprint}): {link}")
+            return link
+        self.stats["failures"] += 1
+        return None
+
+    async def generate_many(self, urls: List[str], cookies: Optional[Any] = None) -> Dict[str, Optional[str]]:
+        """
+        Replay template for many products concurrently.
+        Requests share one httpx client (one HTTP/2 connection when h2 is installed).
+
+        Returns:
+            {url: link or None}
+        """
+        self.stats["batch_calls"] += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(url: str) -> Optional[str]:
+            async with semaphore:
+                return await self.generate(url, cookies)
+
+        links = await asyncio.gather(*(one(url) for url in urls))
+        return dict(zip(urls, links))
+
+    async def learn(self, xhr_info: Optional[Dict[str, Any]], url: str, cookies: Optional[Any] = None) -> bool:
+        """Learn template from XHR captured during a successful browser run."""
+        if not xhr_info:
+            return False
+        fingerprint = await self.templates.learn(xhr_info, url, _cookies_to_dict(cookies))
+        if fingerprint:
+            self.stats["learned"] += 1
+        return fingerprint is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Engine stats plus template health per cookie set."""
+        attempts = self.stats["hits"] + self.stats["misses"] + self.stats["failures"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / attempts, 3) if attempts else 0.0,
+            "templates": self.templates.get_stats(),
+        }
+
+
+# Global engine instance
+_xhr_link_engine: Optional[XHRLinkEngine] = None
+
+
+def get_xhr_link_engine() -> XHRLinkEngine:
+    """Get or create global XHR link engine."""
+    global _xhr_link_engine
+    if _xhr_link_engine is None:
+        _xhr_link_engine = XHRLinkEngine()
+    return _xhr_link_engine
@@ -59,7 +59,7 @@ async def test_process_found_products():
 
     # Mock methods
     service._validate_product_for_queue = AsyncMock(return_value=(True, []))
-    service._mark_product_seen = AsyncMock(return_value=True)
+    service._claim_new_products = AsyncMock(side_effect=lambda products: products)
     service._enqueue_product = AsyncMock()
 
     test_products = [
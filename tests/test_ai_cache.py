@@ -0,0 +1,194 @@
+# tests/test_ai_cache.py
+"""Тесты для services/ai_cache.py"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from services.ai_cache import AiCache, SqliteAiCacheStore
+from services.ai_enrichment_service import AiEnrichmentService
+from services.ai_metrics import AiMetrics
+
+URL = "https://market.yandex.ru/product--phone/123456789"
+RESULT = {"product_url": URL, "ref_link": None, "price": 159, "title": "Телефон", "is_valid": True}
+
+
+class TestAiCacheL1(unittest.TestCase):
+    """L1: LRU с лимитами"""
+
+    def test_lru_eviction_by_entries(self):
+        """При превышении лимита вытесняется давно не использованная запись"""
+        cache = AiCache(max_entries=2, l2_store=None, metrics=AiMetrics())
+        cache.set("https://a", {"n": 1})
+        cache.set("https://b", {"n": 2})
+        self.assertEqual(cache.get("https://a"), {"n": 1})  # a становится свежее b
+        cache.set("https://c", {"n": 3})
+
+        self.assertIsNone(cache.get("https://b"))
+        self.assertEqual(cache.get("https://a"), {"n": 1})
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_eviction_by_bytes(self):
+        """Лимит по размеру JSON результатов"""
+        cache = AiCache(max_bytes=100, l2_store=None, metrics=AiMetrics())
+        cache.set("https://a", {"text": "x" * 60})
+        cache.set("https://b", {"text": "y" * 60})
+
+        self.assertIsNone(cache.get("https://a"))
+        self.assertLessEqual(cache.get_stats()["bytes"], 100)
+
+
+class TestAiCacheL2(unittest.TestCase):
+    """L2 в SQLite переживает перезапуск процесса"""
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.store = SqliteAiCacheStore(self.db_file)
+
+    def tearDown(self):
+        self.store.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра видна другому (через L2) и поднимается в L1"""
+        metrics = AiMetrics()
+        AiCache(l2_store=self.store, metrics=metrics).set(URL, RESULT, product_id="42", cost=0.02)
+
+        other = AiCache(l2_store=self.store, metrics=metrics)
+        self.assertEqual(other.get(URL, product_id="42"), RESULT)
+        self.assertEqual(other.get(URL, product_id="42"), RESULT)
+
+        stats = other.get_stats()
+        self.assertEqual((stats["l2_hits"], stats["l1_hits"]), (1, 1))
+        self.assertAlmostEqual(metrics.get_stats()["cache_cost_saved"], 0.04)
+
+
+class TestGetOrCompute(unittest.TestCase):
+    """Объединение промахов и stale-while-revalidate"""
+
+    def setUp(self):
+        self.metrics = AiMetrics()
+        self.cache = AiCache(cache_ttl_hours=1, stale_ttl_hours=1, l2_store=None, metrics=self.metrics)
+        self.calls = 0
+
+    async def compute(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {**RESULT, "call": self.calls}, 0.01
+
+    def test_concurrent_misses_coalesced(self):
+        """10 одновременных промахов - один вызов AI"""
+        async def scenario():
+            return await asyncio.gather(*(self.cache.get_or_compute(URL, self.compute) for _ in range(10)))
+
+        results = asyncio.run(scenario())
+
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result == {**RESULT, "call": 1} for result, _ in results))
+        self.assertEqual(sorted(source for _, source in results), ["coalesced"] * 9 + ["computed"])
+        stats = self.metrics.get_stats()
+        self.assertEqual((stats["cache_misses"], stats["cache_coalesced"]), (1, 9))
+
+    def test_stale_served_while_revalidating(self):
+        """Устаревший результат отдается сразу, обновление идет в фоне"""
+        async def scenario():
+            await self.cache.get_or_compute(URL, self.compute)
+            entry = self.cache._cache[self.cache._generate_key(URL)]
+            entry["cached_at"] = time.time() - 1.5 * 3600  # за TTL, но в stale-окне
+
+            stale = await self.cache.get_or_compute(URL, self.compute)
+            again = await self.cache.get_or_compute(URL, self.compute)  # refresh еще идет
+            await asyncio.gather(*self.cache._refresh_tasks)
+            fresh = await self.cache.get_or_compute(URL, self.compute)
+            return stale, again, fresh
+
+        stale, again, fresh = asyncio.run(scenario())
+
+        self.assertEqual(stale, ({**RESULT, "call": 1}, "stale"))
+        self.assertEqual(again[1], "stale")
+        self.assertEqual(fresh, ({**RESULT, "call": 2}, "l1"))
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.get_stats()["refreshes"], 1)
+
+    def test_failed_compute_not_cached(self):
+        """None от compute не кэшируется"""
+        async def failing():
+            return None
+
+        async def scenario():
+            first = await self.cache.get_or_compute(URL, failing)
+            second = await self.cache.get_or_compute(URL, self.compute)
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(first, (None, "computed"))
+        self.assertEqual(second[1], "computed")
+
+
+class TestEnrichProductCache(unittest.TestCase):
+    """enrich_product идет через двухуровневый кэш"""
+
+    CARD_URL = "https://market.yandex.ru/card/phone/123456789"
+    RAW = {"url": CARD_URL, "product_id": "42", "raw_price": "159 ₽", "raw_title": "Телефон"}
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.store = SqliteAiCacheStore(self.db_file)
+        self.metrics = AiMetrics()
+        self.service = AiEnrichmentService(api_key="test-key")
+        self.service.metrics = self.metrics
+        self.service.cache = AiCache(l2_store=self.store, metrics=self.metrics)
+        self.calls = 0
+
+        async def request_ai(raw_data):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return {**RESULT, "product_url": self.CARD_URL}, 0.01
+
+        self.service._request_ai = request_ai
+
+    def tearDown(self):
+        self.store.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_concurrent_calls_share_one_request(self):
+        """Одновременные enrich_product по одному товару - один запрос к AI"""
+        async def scenario():
+            return await asyncio.gather(*(self.service.enrich_product(dict(self.RAW)) for _ in range(5)))
+
+        results = asyncio.run(scenario())
+
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result and result.price == 159 for result in results))
+
+    def test_l2_hit_from_fresh_instance(self):
+        """Результат из L2 переживает новый L1 и помечается как cache"""
+        first = asyncio.run(self.service.enrich_product(dict(self.RAW)))
+        self.service.cache = AiCache(l2_store=self.store, metrics=self.metrics)
+        second = asyncio.run(self.service.enrich_product(dict(self.RAW)))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.source, "ai")
+        self.assertEqual(second.source, "cache")
+        self.assertEqual(self.service.cache.get_stats()["l2_hits"], 1)
+
+    def test_guards_skip_cache_and_request(self):
+        """Выключенный сервис и лимит стоимости не трогают кэш и AI"""
+        self.service.enabled = False
+        self.assertIsNone(asyncio.run(self.service.enrich_product(dict(self.RAW))))
+
+        self.service.enabled = True
+        self.metrics.should_disable_ai = lambda: True
+        self.assertIsNone(asyncio.run(self.service.enrich_product(dict(self.RAW))))
+        self.assertEqual(self.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
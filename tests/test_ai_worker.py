@@ -0,0 +1,102 @@
+# tests/test_ai_worker.py
+"""Тесты для services/ai_worker.py"""
+import asyncio
+import unittest
+from collections import defaultdict
+from unittest.mock import MagicMock, patch
+
+from services.ai_worker import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, AiWorker
+
+
+class FakeAiService:
+    """enrich_product_safe с задержкой; 429 отмечается в счетчиках метрик"""
+
+    def __init__(self, delay=0.02, throttle=False):
+        self.enabled = True
+        self.delay = delay
+        self.throttle = throttle
+        self.metrics = MagicMock(counters=defaultdict(int))
+        self.started = []
+
+    async def enrich_product_safe(self, raw_data):
+        self.started.append(raw_data["id"])
+        await asyncio.sleep(self.delay)
+        if self.throttle:
+            self.metrics.counters["ai_error_http_429"] += 1
+            return None
+        return {"id": raw_data["id"]}
+
+
+def make_worker(service, **kwargs):
+    with patch("services.ai_worker.get_ai_enrichment_service", return_value=service):
+        return AiWorker(**kwargs)
+
+
+class TestAiWorker(unittest.TestCase):
+    """Приоритеты, дедлайны, адаптивная параллельность"""
+
+    def test_interactive_overtakes_background(self):
+        """Интерактивная задача не ждет очередь фоновых"""
+        service = FakeAiService()
+        worker = make_worker(service, max_concurrent=1)
+
+        async def scenario():
+            await worker.start()
+            for i in range(6):
+                await worker.add_task({"id": f"bg{i}"}, priority=PRIORITY_BACKGROUND)
+            await asyncio.sleep(0.005)
+            result = await worker.enrich({"id": "admin"}, priority=PRIORITY_INTERACTIVE)
+            await worker.stop()
+            return result
+
+        self.assertEqual(asyncio.run(scenario()), {"id": "admin"})
+        self.assertLessEqual(service.started.index("admin"), 2)
+        self.assertIn("interactive", worker.get_stats())
+
+    def test_expired_task_dropped(self):
+        """Задача с истекшим дедлайном не отправляется в AI, callback получает None"""
+        service = FakeAiService(delay=0.05)
+        worker = make_worker(service, max_concurrent=1)
+        results = {}
+
+        async def callback(result, task_id):
+            results[task_id] = result
+
+        async def scenario():
+            await worker.start()
+            await worker.add_task({"id": "slow"}, callback, task_id="slow")
+            await worker.add_task({"id": "late"}, callback, task_id="late", timeout=0.01)
+            await worker.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(results, {"slow": {"id": "slow"}, "late": None})
+        self.assertNotIn("late", service.started)
+        self.assertEqual(worker.get_stats()["dropped_expired"], 1)
+
+    def test_aimd_limit(self):
+        """Быстрые ответы поднимают лимит, 429 снижает его вдвое"""
+        service = FakeAiService(delay=0.001)
+        worker = make_worker(service, max_concurrent=6, min_concurrent=1, latency_target_ms=1000)
+
+        async def burst(n):
+            for i in range(n):
+                await worker.add_task({"id": i})
+            await worker.queue.join()
+
+        async def scenario():
+            await worker.start()
+            await burst(40)
+            raised = worker.limit
+            service.throttle = True
+            await burst(3)
+            await worker.stop()
+            return raised
+
+        raised = asyncio.run(scenario())
+        self.assertGreater(raised, 3)
+        self.assertLessEqual(worker.limit, raised / 2)
+        self.assertEqual(worker.get_stats()["limit_decreases"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+# tests/test_analytics_rollups.py
+"""Тесты для history_rollups (database.py, database_async.py) и AnalyticsService поверх них"""
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+
+from database import Database
+from database_async import AsyncDatabase
+from services.analytics_service import AnalyticsService
+
+
+class TestHistoryRollups(unittest.TestCase):
+    """Инкрементальные корзины совпадают с прямым подсчетом по history"""
+
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix=".db")
+        self.temp_db.close()
+        self.db = Database(db_file=self.temp_db.name)
+
+    def tearDown(self):
+        self.db.connection.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.temp_db.name + suffix):
+                os.unlink(self.temp_db.name + suffix)
+
+    def add(self, n, price=None, template=None, brand=None):
+        self.db.add_post_to_history(
+            f"https://market.yandex.ru/product/{n}", f"hash{n}", price=price,
+            template_type=template, brand=brand,
+        )
+
+    def test_counted_on_insert_and_by_compactor(self):
+        self.add(1, price=500, template="professional", brand="Apple")
+        self.add(2, price=7000, template="professional", brand="Apple")
+        self.add(3, template="emoji_heavy", brand="Xiaomi")
+        self.assertEqual(self.db.refresh_history_rollups(), 0)  # уже учтены при вставке
+
+        # Запись в обход add_post_to_history догоняет компактор
+        with self.db.connection:
+            self.db.cursor.execute(
+                "INSERT INTO history (url, normalized_url, date_added, last_price) VALUES (?, ?, ?, ?)",
+                ("https://market.yandex.ru/product/4", "market.yandex.ru/product/4",
+                 datetime.datetime.utcnow(), 25000),
+            )
+        self.assertEqual(self.db.refresh_history_rollups(), 1)
+        self.assertEqual(self.db.refresh_history_rollups(), 0)
+
+        today = datetime.datetime.utcnow().strftime("%Y-%m-%d")
+        self.assertEqual(self.db.get_history_rollups("all", since=today)[0]["posts"], 4)
+        bands = {row["value"]: row["posts"] for row in self.db.get_history_rollups("price_band")}
+        self.assertEqual(bands, {"До 1000 ₽": 1, "5000-9999 ₽": 1, "20000+ ₽": 1})
+        brands = {row["value"]: row["posts"] for row in self.db.get_history_rollups("brand")}
+        self.assertEqual(brands, {"Apple": 2, "Xiaomi": 1, "": 1})
+
+    def test_deleted_posts_leave_category_stats(self):
+        self.add(1, template="professional")
+        self.add(2, template="professional")
+        self.db.refresh_history_rollups()
+        history_id = self.db.cursor.execute(
+            "SELECT id FROM history ORDER BY id LIMIT 1"
+        ).fetchone()["id"]
+        self.assertTrue(self.db.mark_history_as_deleted(history_id))
+        self.assertTrue(self.db.mark_history_as_deleted(history_id))  # повторно не вычитается
+
+        (row,) = self.db.get_history_rollups("template")
+        self.assertEqual((row["posts"], row["deleted"]), (2, 1))
+
+        # Полный пересчет с нуля дает те же корзины
+        before = self.db.get_history_rollups("template")
+        with self.db.connection:
+            self.db.cursor.execute("DELETE FROM history_rollups")
+            self.db.cursor.execute("DELETE FROM bot_settings WHERE key = 'history_rollup_last_id'")
+        self.db.refresh_history_rollups()
+        self.assertEqual(self.db.get_history_rollups("template"), before)
+
+
+class TestAnalyticsService(unittest.TestCase):
+    """AnalyticsService читает корзины через AsyncDatabase"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, "test.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_with_db(self, coro_fn):
+        async def runner():
+            async with AsyncDatabase(self.db_file, readers=2) as db:
+                await coro_fn(db, AnalyticsService(db))
+
+        asyncio.run(runner())
+
+    @staticmethod
+    async def add(db, n, price=None, template=None, brand=None):
+        await db.add_post_to_history(
+            f"https://market.yandex.ru/product/{n}", f"hash{n}", price=price,
+            template_type=template, brand=brand,
+        )
+
+    def test_stats_from_rollups(self):
+        async def scenario(db, analytics):
+            await self.add(db, 1, price=500, template="professional", brand="Apple")
+            await self.add(db, 2, price=7000, template="professional", brand="Apple")
+            await self.add(db, 3, template="emoji_heavy", brand="Xiaomi")
+            today = datetime.datetime.utcnow().strftime("%Y-%m-%d")
+            self.assertEqual((await analytics.get_daily_stats(days=3))[today], 3)
+
+            # Новый пост учитывается при вставке, чтения ничего не пишут
+            await self.add(db, 4, price=25000)
+            self.assertEqual((await analytics.get_daily_stats(days=3))[today], 4)
+            self.assertEqual(await db.refresh_history_rollups(), 0)
+            self.assertEqual(await analytics.get_brand_stats(), {"Apple": 2, "Xiaomi": 1})
+
+            self.assertEqual(
+                await analytics.get_price_range_stats(),
+                {"До 1000 ₽": 1, "5000-9999 ₽": 1, "20000+ ₽": 1},
+            )
+            self.assertEqual(
+                await analytics.get_category_stats(),
+                {"professional": 2, "emoji_heavy": 1, "Без шаблона": 1},
+            )
+            hour = datetime.datetime.utcnow().strftime("%H")
+            self.assertEqual((await analytics.get_time_distribution(days=1))[hour], 4)
+
+        self.run_with_db(scenario)
+
+    def test_deleted_posts_leave_category_stats(self):
+        async def scenario(db, analytics):
+            await self.add(db, 1, template="professional")
+            await self.add(db, 2, template="professional")
+            await db.refresh_history_rollups()
+            history_id = (await db._fetchone("SELECT id FROM history ORDER BY id LIMIT 1"))["id"]
+            self.assertTrue(await db.mark_history_as_deleted(history_id))
+            self.assertTrue(await db.mark_history_as_deleted(history_id))
+
+            self.assertEqual(await analytics.get_category_stats(), {"professional": 1})
+            today = datetime.datetime.utcnow().strftime("%Y-%m-%d")
+            self.assertEqual((await analytics.get_daily_stats(days=1))[today], 2)
+
+        self.run_with_db(scenario)
+
+    def test_errors_and_top_products(self):
+        async def scenario(db, analytics):
+            await db.add_to_error_queue("https://market.yandex.ru/product/1", "timeout")
+            self.assertEqual(
+                await analytics.get_error_stats(), {"total_errors": 1, "recent_errors": 1}
+            )
+
+            await self.add(db, 1, price=500)
+            await self.add(db, 2)
+            top = await analytics.get_top_products(limit=5)
+            self.assertEqual(len(top), 2)
+            self.assertEqual(top[0]["views"], 0)
+            self.assertIn("/product/", top[0]["url"])
+
+            summary = await analytics.get_summary_text()
+            self.assertIn("Всего опубликовано:</b> 2", summary)
+
+        self.run_with_db(scenario)
+
+
+if __name__ == "__main__":
+    unittest.main()
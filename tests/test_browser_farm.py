@@ -0,0 +1,228 @@
+# tests/test_browser_farm.py
+"""Тесты для services/browser_farm.py"""
+import asyncio
+import unittest
+
+from services.browser_farm import BrowserFarm
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.visited = []
+
+    async def goto(self, url, **kwargs):
+        self.visited.append(url)
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+        self.cookies = []
+
+    async def add_init_script(self, script):
+        pass
+
+    async def add_cookies(self, cookies):
+        self.cookies.extend(cookies)
+
+    async def new_page(self):
+        return FakePage(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, launcher):
+        self.launcher = launcher
+        self.contexts = []
+        self.closed = False
+        self.fail_new_context = False
+
+    async def new_context(self, **kwargs):
+        if self.fail_new_context:
+            raise RuntimeError("browser crashed")
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChromium:
+    def __init__(self):
+        self.browsers = []
+        self.fail_launch = False
+
+    async def launch(self, **kwargs):
+        if self.fail_launch:
+            raise RuntimeError("launch failed")
+        browser = FakeBrowser(self)
+        self.browsers.append(browser)
+        return browser
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = FakeChromium()
+
+
+class TestBrowserFarm(unittest.TestCase):
+    """Тесты фермы постоянных браузеров"""
+
+    def make_farm(self, **kwargs):
+        self.playwright = FakePlaywright()
+        options = {"size": 2, "contexts_per_browser": 2, "recycle_jobs": 0, "max_memory_mb": 0}
+        options.update(kwargs)
+        return BrowserFarm(playwright=self.playwright, storage_state_path="missing.json", **options)
+
+    def test_reuses_warm_contexts_least_loaded(self):
+        """Задачи распределяются по браузерам, контексты не создаются заново"""
+        farm = self.make_farm()
+        used = []
+
+        async def job(page):
+            used.append(page.context.browser)
+            await asyncio.sleep(0.01)
+            return page.context
+
+        async def scenario():
+            await farm.start()
+            contexts = await asyncio.gather(*(farm.run(job) for _ in range(8)))
+            await farm.stop()
+            return contexts
+
+        contexts = asyncio.run(scenario())
+
+        browsers = self.playwright.chromium.browsers
+        self.assertEqual(len(browsers), 2)
+        self.assertEqual(farm.stats["contexts_created"], 4)
+        self.assertEqual(len({id(c) for c in contexts}), 4)
+        self.assertEqual(used.count(browsers[0]), 4)
+        self.assertEqual(used.count(browsers[1]), 4)
+        self.assertTrue(all(b.closed for b in browsers))
+
+    def test_failed_job_recreates_context(self):
+        """После ошибки контекст закрывается и заменяется новым"""
+        farm = self.make_farm(size=1, contexts_per_browser=1)
+
+        async def failing(page):
+            raise RuntimeError("boom")
+
+        async def scenario():
+            await farm.start()
+            with self.assertRaises(RuntimeError):
+                await farm.run(failing)
+            context = await farm.run(lambda page: asyncio.sleep(0, result=page.context))
+            await farm.stop()
+            return context
+
+        context = asyncio.run(scenario())
+        first = self.playwright.chromium.browsers[0].contexts[0]
+        self.assertTrue(first.closed)
+        self.assertIsNot(context, first)
+        self.assertEqual(farm.stats["errors"], 1)
+
+    def test_recycle_after_jobs(self):
+        """Браузер пересоздается после recycle_jobs задач"""
+        farm = self.make_farm(size=1, contexts_per_browser=1, recycle_jobs=3)
+
+        async def job(page):
+            return page.context.browser
+
+        async def scenario():
+            await farm.start()
+            seen = []
+            for _ in range(5):
+                seen.append(await farm.run(job))
+                await asyncio.sleep(0)
+            await farm.stop()
+            return seen
+
+        seen = asyncio.run(scenario())
+        browsers = self.playwright.chromium.browsers
+        self.assertEqual(len(browsers), 2)
+        self.assertEqual(seen, [browsers[0]] * 3 + [browsers[1]] * 2)
+        self.assertTrue(browsers[0].closed)
+        self.assertEqual(farm.stats["recycles"], 1)
+
+    def test_cookie_job_context_not_reused(self):
+        """Контекст с cookies задачи закрывается, следующая задача получает чистый"""
+        farm = self.make_farm(size=1, contexts_per_browser=1)
+        cookies = [{"name": "session", "value": "secret", "domain": ".yandex.ru", "path": "/"}]
+
+        async def scenario():
+            await farm.start()
+            first = await farm.run(lambda page: asyncio.sleep(0, result=page.context), cookies=cookies)
+            second = await farm.run(lambda page: asyncio.sleep(0, result=page.context))
+            await farm.stop()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(first.cookies, cookies)
+        self.assertTrue(first.closed)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.cookies, [])
+        self.assertEqual(farm.stats["errors"], 0)
+
+    def test_dead_slot_leaves_rotation(self):
+        """Браузер без контекстов, который не удалось заменить, выводится из ротации"""
+        farm = self.make_farm(size=2, contexts_per_browser=1)
+
+        async def failing(page):
+            raise RuntimeError("boom")
+
+        async def scenario():
+            await farm.start()
+            broken = farm.slots[0]
+            broken.browser.fail_new_context = True
+            self.playwright.chromium.fail_launch = True
+            # Задача на слоте 0 падает, его контекст не пересоздается, замена не стартует
+            with self.assertRaises(RuntimeError):
+                await farm.run(failing)
+            # Ожидающие задачи просыпаются и уходят на живой браузер
+            browsers = await asyncio.wait_for(
+                asyncio.gather(*(farm.run(lambda page: asyncio.sleep(0.01, result=page.context.browser))
+                                 for _ in range(3))),
+                timeout=2,
+            )
+            capacity = farm.capacity
+            await farm.stop()
+            return broken, browsers, capacity
+
+        broken, browsers, capacity = asyncio.run(scenario())
+        alive = self.playwright.chromium.browsers[1]
+        self.assertEqual(browsers, [alive] * 3)
+        self.assertEqual(capacity, 1)
+        self.assertEqual(farm.stats["dead_slots"], 1)
+        self.assertIsNone(broken.browser)
+
+    def test_waiters_fail_when_no_browsers_left(self):
+        """Без живых браузеров ожидающая задача получает ошибку, а не висит"""
+        farm = self.make_farm(size=1, contexts_per_browser=1)
+
+        async def failing(page):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        async def scenario():
+            await farm.start()
+            farm.slots[0].browser.fail_new_context = True
+            self.playwright.chromium.fail_launch = True
+            results = await asyncio.wait_for(
+                asyncio.gather(farm.run(failing), farm.run(failing), return_exceptions=True),
+                timeout=2,
+            )
+            await farm.stop()
+            return results
+
+        first, waiter = asyncio.run(scenario())
+        self.assertEqual(str(first), "boom")
+        self.assertIn("no live browsers", str(waiter))
+
+
+if __name__ == "__main__":
+    unittest.main()
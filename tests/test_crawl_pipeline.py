@@ -0,0 +1,100 @@
+# tests/test_crawl_pipeline.py
+"""Тесты для services/crawl_pipeline.py"""
+import asyncio
+import unittest
+
+from services.crawl_pipeline import CrawlPipeline, PipelineMetrics
+
+
+class TestCrawlPipeline(unittest.TestCase):
+    """Тесты потокового конвейера fetch -> parse -> validate -> dedup -> enqueue"""
+
+    def test_stages_and_metrics(self):
+        """Товары проходят все стадии, отсев учитывается в skipped"""
+        enqueued = []
+        done_pages = []
+
+        async def fetch(url):
+            await asyncio.sleep(0.01)
+            return None if url.endswith("/bad") else f"<html>{url}</html>"
+
+        async def parse(page):
+            return [{"market_id": f"{page.url}#{i}", "ok": i % 2 == 0} for i in range(4)]
+
+        async def validate(product):
+            return product["ok"]
+
+        async def dedup(products):
+            return products[:1]
+
+        async def enqueue(page, product):
+            enqueued.append(product["market_id"])
+
+        metrics = PipelineMetrics()
+        pipeline = CrawlPipeline(
+            fetch=fetch, parse=parse, validate=validate, dedup=dedup, enqueue=enqueue,
+            on_page=done_pages.append, metrics=metrics,
+        )
+        urls = ["https://a.test/1", "https://a.test/2", "https://b.test/1", "https://b.test/bad"]
+        result = asyncio.run(pipeline.run(urls))
+
+        self.assertEqual(result, {"added": 3, "skipped": 9})
+        self.assertEqual(len(enqueued), 3)
+        self.assertEqual(len(done_pages), 3)
+        stats = metrics.as_dict()
+        self.assertEqual(stats["stages"]["fetch"]["errors"], 1)
+        self.assertEqual(stats["stages"]["parse"]["items"], 12)
+        self.assertEqual(stats["stages"]["validate"]["items"], 6)
+        self.assertEqual(stats["added"], 3)
+
+    def test_per_host_concurrency(self):
+        """Одновременных fetch к одному хосту не больше host_concurrency"""
+        active = {"now": 0, "max": 0}
+
+        async def fetch(url):
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            return "<html></html>"
+
+        async def parse(page):
+            return []
+
+        async def enqueue(page, product):
+            pass
+
+        pipeline = CrawlPipeline(fetch=fetch, parse=parse, enqueue=enqueue, host_concurrency=2)
+        asyncio.run(pipeline.run([f"https://a.test/{i}" for i in range(8)]))
+        self.assertEqual(active["max"], 2)
+
+    def test_backpressure_and_stop(self):
+        """Fetch ждет разгрузки буфера публикации; stop() прекращает выдачу URL"""
+        depth = iter([10, 10, 0, 0, 0, 0])
+        fetched = []
+
+        async def fetch(url):
+            fetched.append(url)
+            await asyncio.sleep(0.01)
+            return "<html></html>"
+
+        async def parse(page):
+            return []
+
+        async def enqueue(page, product):
+            pass
+
+        pipeline = CrawlPipeline(
+            fetch=fetch, parse=parse, enqueue=enqueue, host_concurrency=1,
+            backlog_depth=lambda: next(depth), max_backlog=5,
+            on_page=lambda page: pipeline.stop(),
+        )
+        pipeline.BACKPRESSURE_INTERVAL = 0.01
+        asyncio.run(pipeline.run([f"https://a.test/{i}" for i in range(5)]))
+
+        self.assertEqual(pipeline.metrics.backpressure_waits, 1)
+        self.assertLess(len(fetched), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -57,12 +57,59 @@ class TestDatabase(unittest.TestCase):
         self.db.add_to_queue(url1, priority=1)
         self.db.add_to_queue(url2, priority=2)
 
-        # Должен вернуться товар с большим приоритетом
-        task = self.db.get_next_from_queue()
+        # Должен вернуться товар с большим приоритетом (метод устарел - без аренды)
+        with self.assertWarns(DeprecationWarning):
+            task = self.db.get_next_from_queue()
         self.assertIsNotNone(task)
         task_id, url = task
         self.assertEqual(url, url2)
 
+    def test_claim_batch(self):
+        """Тест атомарной аренды задач из очереди"""
+        self.db.add_to_queue("https://market.yandex.ru/product/111111", priority=1)
+        self.db.add_to_queue("https://market.yandex.ru/product/222222", priority=2)
+        self.db.add_to_queue("https://market.yandex.ru/product/333333", priority=0)
+
+        claimed = self.db.claim_batch(2, "worker-a", lease_seconds=60)
+        self.assertEqual(
+            [url for _, url in claimed],
+            [
+                "https://market.yandex.ru/product/222222",
+                "https://market.yandex.ru/product/111111",
+            ],
+        )
+
+        # Второй воркер не получает уже арендованные задачи
+        other = self.db.claim_batch(5, "worker-b", lease_seconds=60)
+        self.assertEqual(
+            [url for _, url in other], ["https://market.yandex.ru/product/333333"]
+        )
+        self.assertEqual(self.db.get_queue_count(), 0)
+
+        entry = self.db.get_publishing_entry(claimed[0][0])
+        self.assertEqual(entry["state"], "processing")
+
+        # Чужую аренду вернуть нельзя, свою — можно
+        self.assertFalse(self.db.release_claim(claimed[0][0], "worker-b"))
+        self.assertTrue(self.db.release_claim(claimed[0][0], "worker-a"))
+        self.assertEqual(self.db.get_queue_count(), 1)
+        self.assertEqual(self.db.get_publishing_entry(claimed[0][0])["state"], "queued")
+
+    def test_claim_batch_reclaims_expired_leases(self):
+        """Тест возврата просроченной аренды в очередь"""
+        url = "https://market.yandex.ru/product/123456"
+        self.db.add_to_queue(url)
+
+        claimed = self.db.claim_batch(1, "worker-a", lease_seconds=-1)
+        self.assertEqual(len(claimed), 1)
+
+        # Аренда уже истекла — задача снова доступна другому воркеру
+        reclaimed = self.db.claim_batch(1, "worker-b", lease_seconds=60)
+        self.assertEqual(reclaimed, claimed)
+
+        self.db.mark_as_done(reclaimed[0][0])
+        self.assertEqual(self.db.claim_batch(1, "worker-c"), [])
+
     def test_history(self):
         """Тест истории публикаций"""
         url = "https://market.yandex.ru/product/123456"
@@ -0,0 +1,137 @@
+# tests/test_database_async.py
+"""Тесты для database_async.py"""
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+
+from database_async import AsyncDatabase
+
+
+class TestAsyncDatabase(unittest.TestCase):
+    """Тесты для класса AsyncDatabase в режиме пула соединений"""
+
+    def setUp(self):
+        """Создание временной БД для тестов"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, "test.db")
+
+    def tearDown(self):
+        """Удаление временной БД"""
+        self.temp_dir.cleanup()
+
+    def run_with_db(self, coro_fn, readers: int = 2):
+        async def runner():
+            async with AsyncDatabase(self.db_file, readers=readers) as db:
+                await coro_fn(db)
+
+        asyncio.run(runner())
+
+    def test_queue_and_claim(self):
+        """Тест очереди и атомарной аренды задач"""
+
+        async def scenario(db):
+            await db.add_to_queue("https://market.yandex.ru/product/111111", priority=1)
+            await db.add_to_queue("https://market.yandex.ru/product/222222", priority=2)
+            self.assertEqual(await db.get_queue_count(), 2)
+
+            claimed = await db.claim_batch(5, "worker-a", lease_seconds=60)
+            self.assertEqual(
+                [url for _, url in claimed],
+                [
+                    "https://market.yandex.ru/product/222222",
+                    "https://market.yandex.ru/product/111111",
+                ],
+            )
+            entry = await db.get_publishing_entry(claimed[0][0])
+            self.assertEqual(entry["state"], "processing")
+            self.assertEqual(await db.claim_batch(5, "worker-b"), [])
+
+            self.assertTrue(await db.release_claim(claimed[0][0], "worker-a"))
+            entry = await db.get_publishing_entry(claimed[0][0])
+            self.assertEqual(entry["state"], "queued")
+
+        self.run_with_db(scenario)
+
+    def test_parity_methods(self):
+        """Тест черного списка, настроек, пользователей и дедупликации"""
+
+        async def scenario(db):
+            url = "https://market.yandex.ru/product/123456"
+
+            self.assertTrue(await db.add_to_blacklist(url, "test"))
+            self.assertFalse(await db.add_to_blacklist(url, "test"))
+            self.assertTrue(await db.is_blacklisted(url))
+            self.assertEqual((await db.get_blacklist())[0]["reason"], "test")
+
+            await db.set_setting("auto_publish", "True")
+            self.assertEqual(await db.get_setting("auto_publish"), "True")
+            self.assertEqual(await db.get_setting("missing", "x"), "x")
+
+            await db.add_user(1, username="user")
+            self.assertEqual((await db.get_user_stats(1))["username"], "user")
+
+            self.assertFalse(await db.has_been_posted_recently("key"))
+            self.assertTrue(await db.add_posted_product("key", url))
+            self.assertTrue(await db.has_been_posted_recently("key"))
+
+            await db.set_cached_data(url, {"title": "Test", "image_bytes": b"x"})
+            self.assertEqual(await db.get_cached_data(url), {"title": "Test"})
+
+        self.run_with_db(scenario)
+
+    def test_dedup_and_price_methods(self):
+        """Тест пакетной дедупликации и записи проверок цен"""
+
+        async def scenario(db):
+            posted = "https://market.yandex.ru/product/111111"
+            queued = "https://market.yandex.ru/product/222222"
+            await db.add_post_to_history(posted, img_hash="h", price=1000, img_phash="00ff")
+            self.assertTrue(await db.add_queue_item_with_key(queued, "t", "key-q"))
+            self.assertTrue(await db.queue_contains_product_key("key-q"))
+            await db.add_posted_product("key-p", posted)
+
+            found = await db.find_existing_normalized_urls(
+                [db.normalize_url(posted), db.normalize_url(queued), "other"]
+            )
+            self.assertEqual(found, {db.normalize_url(posted), db.normalize_url(queued)})
+            self.assertEqual(await db.find_recent_product_keys(["key-p", "key-x"]), {"key-p"})
+            self.assertTrue({"key-p", db.normalize_url(queued)} <= set(await db.get_dedup_keys()))
+            self.assertEqual(await db.get_image_phashes(), [("00ff", posted)])
+
+            item = (await db.get_price_watch_candidates())[0]
+            now = datetime.datetime.utcnow()
+            await db.save_price_checks([{
+                "history_id": item["id"], "product_id": "111111", "url": posted,
+                "price": 800.0, "old_price": 1000.0, "discount_percent": 20.0,
+                "category": "Электроника", "changed": True, "checked_at": now,
+            }])
+            item = (await db.get_price_watch_candidates())[0]
+            self.assertEqual((item["last_price"], item["last_checked_price"]), (1000.0, 800.0))
+            self.assertEqual(item["category"], "Электроника")
+            self.assertIsNotNone(item["price_changed_at"])
+
+        self.run_with_db(scenario)
+
+    def test_concurrent_reads_during_writes(self):
+        """Тест параллельных чтений и записей через пул"""
+
+        async def scenario(db):
+            urls = [f"https://market.yandex.ru/product/{i}" for i in range(20)]
+
+            async def writer(url):
+                await db.add_post_to_history(url, img_hash=url, title="t")
+
+            await asyncio.gather(
+                *(writer(url) for url in urls),
+                *(db.get_history_count() for _ in range(20)),
+            )
+            self.assertEqual(await db.get_history_count(), 20)
+            self.assertTrue(await db.exists_url(urls[0]))
+
+        self.run_with_db(scenario)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# tests/test_dedup_service.py
+"""Тесты для services/dedup_service.py"""
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database_async import AsyncDatabase
+from services.dedup_service import BloomFilter, DedupService
+
+
+def make_product(market_id: str) -> dict:
+    return {
+        "market_id": market_id,
+        "title": f"Product {market_id}",
+        "url": f"https://market.yandex.ru/product--item/{market_id}",
+    }
+
+
+class TestBloomFilter(unittest.TestCase):
+    """Тесты Bloom-фильтра"""
+
+    def test_membership_and_snapshot(self):
+        """Добавленные ключи всегда находятся, снимок восстанавливается"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        bloom.update(f"id:{i}" for i in range(1000))
+        self.assertTrue(all(f"id:{i}" in bloom for i in range(1000)))
+
+        false_positives = sum(f"other:{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+        restored = BloomFilter.loads(bloom.dumps())
+        self.assertEqual(restored.bits, bloom.bits)
+        self.assertEqual(restored.count, 1000)
+
+
+class TestDedupService(unittest.TestCase):
+    """Тесты пакетной дедупликации"""
+
+    def setUp(self):
+        """Создание временной БД для тестов"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, "test.db")
+
+    def tearDown(self):
+        """Удаление временной БД"""
+        self.temp_dir.cleanup()
+
+    def run_with_db(self, coro_fn):
+        async def runner():
+            async with AsyncDatabase(self.db_file, readers=2) as db:
+                await coro_fn(db)
+
+        asyncio.run(runner())
+
+    def test_filter_new_against_sqlite(self):
+        """Товары из истории, очереди и posted_products отсекаются пачкой"""
+        products = [make_product(str(100000 + i)) for i in range(6)]
+
+        async def scenario(db):
+            await db.add_post_to_history(products[0]["url"], img_hash="h", title="t")
+            await db.add_to_queue(products[1]["url"])
+            service = DedupService(db=db, capacity=1000)
+            await db.add_posted_product(service.product_keys(products[2])[1])
+
+            db.find_existing_normalized_urls = AsyncMock(
+                wraps=db.find_existing_normalized_urls
+            )
+            result = await service.filter_new(products + [dict(products[3])])
+
+            self.assertEqual(result, products[3:])
+            self.assertEqual(service.metrics["batch_duplicates"], 1)
+            # Точная проверка одним запросом и только для срабатываний фильтра
+            db.find_existing_normalized_urls.assert_awaited_once()
+            checked = db.find_existing_normalized_urls.call_args[0][0]
+            self.assertLessEqual(len(checked), 3 + service.metrics["false_positives"])
+
+        self.run_with_db(scenario)
+
+    def test_claim_uses_redis_set_nx(self):
+        """claim_new оставляет только товары, захваченные через SET NX"""
+        redis = MagicMock()
+        redis.load_dedup_snapshot.return_value = None
+        redis.find_seen_products.return_value = []
+        redis.claim_seen_products.side_effect = lambda keys, ttl: [True, False, True][: len(keys)]
+        products = [make_product(str(200000 + i)) for i in range(3)]
+
+        async def scenario(db):
+            service = DedupService(db=db, redis=redis, capacity=1000)
+            claimed = await service.claim_new(products)
+
+            self.assertEqual(claimed, [products[0], products[2]])
+            self.assertEqual(service.metrics["claim_conflicts"], 1)
+            redis.save_dedup_snapshot.assert_called_once()
+
+            # Повторная пачка: все ключи уже в фильтре, подтверждение через Redis
+            redis.find_seen_products.return_value = [
+                service.product_keys(p)[1] for p in products
+            ]
+            self.assertEqual(await service.filter_new(products), [])
+            self.assertEqual(service.metrics["confirmed_duplicates"], 3)
+
+        self.run_with_db(scenario)
+
+    def test_direct_writes_remembered(self):
+        """add_to_queue и add_post_to_history в обход claim попадают в фильтр"""
+        products = [make_product(str(300000 + i)) for i in range(3)]
+
+        async def scenario(db):
+            service = DedupService(db=db, capacity=1000)
+            await service.filter_new([])  # прогрев
+            with patch("services.dedup_service._dedup_service", service):
+                await db.add_to_queue(products[0]["url"])
+                await db.add_post_to_history(products[1]["url"], img_hash="h")
+            for product in products:
+                nurl, _ = service.product_keys(product)
+                self.assertEqual(nurl in service.bloom, product is not products[2])
+
+        self.run_with_db(scenario)
+
+
+if __name__ == "__main__":
+    unittest.main()
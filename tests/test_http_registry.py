@@ -0,0 +1,87 @@
+# tests/test_http_registry.py
+"""Тесты для services/http_registry.py"""
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from services.http_registry import HttpClientRegistry
+
+
+async def ok(request):
+    return web.Response(text="ok")
+
+
+async def start_server():
+    """Локальный HTTP сервер с keep-alive"""
+    app = web.Application()
+    app.router.add_get("/", ok)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+class TestHttpClientRegistry(unittest.TestCase):
+    """Общий пул: сессии профилей делят соединения, borrow не закрывает сессию"""
+
+    def test_connections_reused_across_profiles(self):
+        registry = HttpClientRegistry()
+
+        async def scenario():
+            runner, url = await start_server()
+            try:
+                for profile in ("default", "catalog", "validator", "default"):
+                    async with registry.borrow(profile) as session:
+                        async with session.get(url) as resp:
+                            self.assertEqual(await resp.text(), "ok")
+                closed = registry.session("default").closed
+            finally:
+                await registry.close_all()
+                await runner.cleanup()
+            return closed
+
+        self.assertFalse(asyncio.run(scenario()))
+        stats = registry.get_stats()
+        self.assertEqual(stats["connections_created"], 1)
+        self.assertEqual(stats["connections_reused"], 3)
+        self.assertAlmostEqual(stats["reuse_ratio"], 0.75)
+        self.assertEqual(stats["sessions"], 0)  # close_all
+
+    def test_new_event_loop_rebuilds_pool(self):
+        """Сессия прошлого event loop не переиспользуется в новом"""
+        registry = HttpClientRegistry()
+
+        async def take():
+            return registry.session("catalog")
+
+        first = asyncio.run(take())
+        second = asyncio.run(take())
+        self.assertIsNot(first, second)
+        self.assertEqual(registry.get_stats()["sessions"], 1)
+        asyncio.run(registry.close_all())
+
+    def test_proxy_session(self):
+        """HTTP прокси - в запрос, SOCKS без aiohttp_socks - тоже в запрос"""
+        registry = HttpClientRegistry()
+
+        async def scenario():
+            shared = registry.session("default")
+            http_session, http_proxy = registry.proxy_session("http://10.0.0.1:3128")
+            with patch("services.http_registry.SOCKS_AVAILABLE", False):
+                socks_session, socks_proxy = registry.proxy_session("socks5://10.0.0.2:1080")
+            await registry.close_all()
+            return shared, http_session, http_proxy, socks_session, socks_proxy
+
+        shared, http_session, http_proxy, socks_session, socks_proxy = asyncio.run(scenario())
+        self.assertIs(http_session, shared)
+        self.assertEqual(http_proxy, "http://10.0.0.1:3128")
+        self.assertIs(socks_session, shared)
+        self.assertEqual(socks_proxy, "socks5://10.0.0.2:1080")
+
+
+if __name__ == "__main__":
+    unittest.main()
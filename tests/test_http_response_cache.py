@@ -0,0 +1,134 @@
+# tests/test_http_response_cache.py
+"""Тесты для services/http_response_cache.py"""
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from services.http_client import HTTPClient
+from services.http_registry import get_http_registry
+from services.http_response_cache import CachedResponse, HttpResponseCache, normalize_url
+
+PAGE = "<html><body>Смартфон — 32 990 ₽, в корзину</body></html>"
+
+
+class TestNormalizeUrl(unittest.TestCase):
+    def test_tracking_params_and_fragment_dropped(self):
+        self.assertEqual(
+            normalize_url("HTTPS://Market.Yandex.RU/card/x/1?utm_source=tg&sku=2&b=1#reviews"),
+            "https://market.yandex.ru/card/x/1?b=1&sku=2",
+        )
+
+
+class TestHttpResponseCache(unittest.TestCase):
+    """Свежесть, перепроверка, объединение запросов, LRU"""
+
+    def setUp(self):
+        self.cache = HttpResponseCache(max_bytes=1024 * 1024, default_max_age=60)
+        self.calls = []
+
+    def fetcher(self, status=200, etag='"v1"', delay=0.0):
+        async def fetch(validators):
+            self.calls.append(validators)
+            await asyncio.sleep(delay)
+            return status, PAGE, {"ETag": etag}, "https://market.yandex.ru/card/x/1"
+
+        return fetch
+
+    def test_fresh_entry_served_from_cache(self):
+        async def scenario():
+            first = await self.cache.get_or_fetch("https://market.yandex.ru/card/x/1", self.fetcher())
+            second = await self.cache.get_or_fetch("https://market.yandex.ru/card/x/1#top", self.fetcher())
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(second.text, PAGE)
+        self.assertIs(first, second)
+        self.assertEqual(len(self.calls), 1)
+        self.assertLess(len(first.body), first.size * 2)
+
+    def test_stale_entry_revalidated_with_etag(self):
+        """Устаревшая запись перепроверяется, 304 продлевает ее без тела"""
+        url = "https://market.yandex.ru/card/x/1"
+
+        async def scenario():
+            await self.cache.get_or_fetch(url, self.fetcher())
+            return await self.cache.get_or_fetch(url, self.fetcher(status=304), max_age=0)
+
+        response = asyncio.run(scenario())
+        self.assertEqual(self.calls[1], {"If-None-Match": '"v1"'})
+        self.assertEqual(response.text, PAGE)
+        self.assertLess(response.age, 1)
+        self.assertEqual(self.cache.get_stats()["not_modified"], 1)
+
+    def test_concurrent_fetches_coalesced(self):
+        url = "https://market.yandex.ru/card/x/1"
+
+        async def scenario():
+            return await asyncio.gather(
+                *(self.cache.get_or_fetch(url, self.fetcher(delay=0.02)) for _ in range(5))
+            )
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(r.text == PAGE for r in results))
+        self.assertEqual(self.cache.get_stats()["coalesced"], 4)
+
+    def test_errors_not_cached_and_lru_bounded(self):
+        async def scenario():
+            missing = await self.cache.get_or_fetch("https://a/404", self.fetcher(status=404))
+            return missing
+
+        self.assertEqual(asyncio.run(scenario()).status, 404)
+        self.assertEqual(self.cache.get_stats()["entries"], 0)
+
+        small = HttpResponseCache(max_bytes=300, default_max_age=60)
+        for i in range(10):
+            small.store(f"https://a/{i}", CachedResponse.build(f"https://a/{i}", 200, os.urandom(100).hex(), {}))
+        self.assertLessEqual(small.get_stats()["bytes"], 300)
+        self.assertIsNotNone(small.get("https://a/9"))
+        self.assertIsNone(small.get("https://a/0"))
+
+
+class TestFetchTextCache(unittest.TestCase):
+    """HTTPClient.fetch_text: повтор из кэша, перепроверка по ETag"""
+
+    def test_fetch_text_revalidates(self):
+        requests = []
+
+        async def page(request):
+            requests.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return web.Response(status=304, headers={"ETag": '"v1"'})
+            return web.Response(text=PAGE, content_type="text/html", headers={"ETag": '"v1"'})
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_get("/card", page)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/card"
+            try:
+                client = HTTPClient()
+                first = await client.fetch_text(url)
+                cached = await client.fetch_text(url, max_age=60)
+                revalidated = await client.fetch_text(url, max_age=0)
+            finally:
+                await get_http_registry().close_all()
+                await runner.cleanup()
+            return first, cached, revalidated
+
+        with patch("services.http_client.get_response_cache", return_value=HttpResponseCache()), \
+                patch.object(HTTPClient, "_instance", None):
+            results = asyncio.run(scenario())
+
+        self.assertEqual(results, (PAGE, PAGE, PAGE))
+        self.assertEqual(requests, [None, '"v1"'])
+
+
+if __name__ == "__main__":
+    unittest.main()
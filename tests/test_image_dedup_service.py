@@ -0,0 +1,140 @@
+# tests/test_image_dedup_service.py
+"""Тесты для services/image_dedup_service.py"""
+import asyncio
+import random
+import unittest
+from io import BytesIO
+from unittest.mock import AsyncMock, MagicMock
+
+from PIL import Image, ImageDraw
+
+from services.dedup_service import DedupService
+from services.image_dedup_service import (
+    BKTree,
+    ImageDedupIndex,
+    format_hash,
+    hamming,
+    image_hash,
+    image_hash_many,
+)
+
+
+def product_photo(seed: int, size=(800, 800)) -> Image.Image:
+    """Синтетическое "фото товара": фигуры случайных цветов на градиенте"""
+    rng = random.Random(seed)
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(40, 200)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+    return img
+
+
+def to_jpeg(img: Image.Image, quality: int = 90) -> bytes:
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+class TestImageHash(unittest.TestCase):
+    """dHash устойчив к пережатию и масштабу"""
+
+    def test_reencoded_and_resized_is_near(self):
+        """Та же фотография в другом размере и качестве - близкий хэш, другая - далекий"""
+        photo = product_photo(1)
+        original = image_hash(to_jpeg(photo, 95))
+        recompressed = image_hash(to_jpeg(photo.resize((500, 500)), 60))
+        other = image_hash(to_jpeg(product_photo(2), 95))
+
+        self.assertLessEqual(hamming(original, recompressed), 6)
+        self.assertGreater(hamming(original, other), 12)
+
+    def test_batch_matches_single(self):
+        """Пакетный расчет совпадает с поштучным, битые байты -> None"""
+        sources = [to_jpeg(product_photo(i)) for i in range(3)] + [b"not an image"]
+        self.assertEqual(image_hash_many(sources), [image_hash(s) for s in sources])
+        self.assertIsNone(image_hash_many(sources)[-1])
+
+
+class TestBKTree(unittest.TestCase):
+    """Поиск по расстоянию Хэмминга совпадает с полным перебором"""
+
+    def test_search_matches_linear_scan(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for i, value in enumerate(values):
+            tree.add(value, str(i))
+
+        query = values[42] ^ 0b1011  # 3 бита отличаются
+        expected = sorted(
+            (hamming(query, v), str(i)) for i, v in enumerate(values) if hamming(query, v) <= 8
+        )
+        self.assertEqual(tree.search(query, 8), expected)
+        self.assertEqual(tree.search(query, 8)[0], (3, "42"))
+        self.assertEqual(len(tree), 500)
+
+
+class TestImageDedupIndex(unittest.TestCase):
+    """Пакетная проверка товаров по истории и внутри пачки"""
+
+    def setUp(self):
+        self.published = to_jpeg(product_photo(10))
+        self.db = MagicMock()
+        self.db.get_image_phashes.return_value = [
+            (format_hash(image_hash(self.published)), "https://market.yandex.ru/product/1"),
+        ]
+
+    def test_filter_new_drops_near_duplicates(self):
+        """Пережатая опубликованная картинка и повтор внутри пачки отбрасываются"""
+        fresh = product_photo(11)
+        products = [
+            {"url": "a", "image_bytes": to_jpeg(product_photo(10).resize((600, 600)), 70)},
+            {"url": "b", "image_bytes": to_jpeg(fresh)},
+            {"url": "c", "image_bytes": to_jpeg(fresh, 60)},
+            {"url": "d"},
+        ]
+        index = ImageDedupIndex(db=self.db, max_distance=6)
+        kept = index.filter_new(products)
+
+        self.assertEqual([p["url"] for p in kept], ["b", "d"])
+        self.assertIn("image_phash", kept[0])
+        self.assertEqual(index.get_metrics()["duplicates"], 1)
+        self.assertEqual(index.get_metrics()["batch_duplicates"], 1)
+        self.db.get_image_phashes.assert_called_once()
+
+    def test_added_hash_found(self):
+        """Картинка, добавленная после публикации, находится без перечитывания БД"""
+        index = ImageDedupIndex(db=self.db, max_distance=6)
+        photo = product_photo(12)
+        index.add(image_hash(to_jpeg(photo)), "https://market.yandex.ru/product/2")
+
+        self.assertEqual(
+            index.find_duplicate(image_hash(to_jpeg(photo, 50))),
+            "https://market.yandex.ru/product/2",
+        )
+        self.db.get_image_phashes.assert_called_once()
+
+    def test_dedup_service_uses_image_index(self):
+        """DedupService отбрасывает товар с похожей картинкой, хотя URL новый"""
+        async_db = MagicMock(
+            get_dedup_keys=AsyncMock(return_value=[]),
+            get_image_phashes=AsyncMock(return_value=self.db.get_image_phashes.return_value),
+        )
+        service = DedupService(db=async_db)
+        products = [
+            {"url": "https://market.yandex.ru/product/3", "title": "A",
+             "image_phash": format_hash(image_hash(self.published))},
+            {"url": "https://market.yandex.ru/product/4", "title": "B"},
+        ]
+
+        kept = asyncio.run(service.filter_new(products))
+        self.assertEqual([p["title"] for p in kept], ["B"])
+        self.assertEqual(service.get_metrics()["image_duplicates"], 1)
+        async_db.get_image_phashes.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+# tests/test_image_proc.py
+"""Тесты для utils/image_proc.py"""
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from PIL import Image
+
+from utils import image_proc
+from services.post_service import send_post_to_channel
+from utils.image_proc import ProcessedImageCache, encode_jpeg_to_size, prepare_image, prepare_image_cached
+
+
+def noisy_image(size: int) -> Image.Image:
+    """Шум плохо сжимается - худший случай для лимита размера"""
+    channels = [Image.effect_noise((size, size), 60 + 10 * i) for i in range(3)]
+    return Image.merge("RGB", channels)
+
+
+def to_jpeg(img: Image.Image) -> bytes:
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+class TestEncodeToSize(unittest.TestCase):
+    """JPEG под лимит без цикла перекодирования"""
+
+    def test_fits_limit_with_few_encodes(self):
+        """Шумная картинка влезает в лимит, полных кодирований не больше двух"""
+        img = noisy_image(1200)
+        full_encodes = []
+        real_encode = image_proc._encode
+
+        def counting_encode(image, quality):
+            if image.width >= 1000:
+                full_encodes.append(quality)
+            return real_encode(image, quality)
+
+        with patch("utils.image_proc._encode", side_effect=counting_encode):
+            data = encode_jpeg_to_size(img, 400 * 1024)
+
+        self.assertLessEqual(len(data), 400 * 1024)
+        self.assertLessEqual(len(full_encodes), 2)
+        self.assertGreater(len(data), 200 * 1024)  # качество не занижено без нужды
+
+    def test_resizes_when_min_quality_too_big(self):
+        """Если даже минимальное качество не влезает - уменьшаются размеры"""
+        data = encode_jpeg_to_size(noisy_image(1200), 60 * 1024)
+        self.assertLessEqual(len(data), 60 * 1024)
+        self.assertLess(Image.open(BytesIO(data)).width, 1200)
+
+    def test_small_image_single_encode(self):
+        """Маленькая картинка кодируется сразу с максимальным качеством"""
+        with patch("utils.image_proc._encode", wraps=image_proc._encode) as encode:
+            encode_jpeg_to_size(Image.new("RGB", (100, 100), "red"), 5 * 1024 * 1024)
+        encode.assert_called_once()
+        self.assertEqual(encode.call_args[0][1], 95)
+
+
+class TestProcessedImageCache(unittest.TestCase):
+    """Кэш готовых картинок по md5 исходника"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ProcessedImageCache(self.cache_dir, max_bytes=100_000)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_repost_skips_processing(self):
+        """Повторная подготовка той же картинки не декодирует ее"""
+        source = to_jpeg(noisy_image(300))
+        with patch("utils.image_proc.get_processed_image_cache", return_value=self.cache):
+            first, md5_first = prepare_image(source, max_mb=1, enhance=True)
+            with patch("services.image_service.decode_image") as decode:
+                second, md5_second = prepare_image(source, max_mb=1, enhance=True)
+
+        decode.assert_not_called()
+        self.assertEqual((first, md5_first), (second, md5_second))
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+
+    def test_eviction_keeps_size_bounded(self):
+        """Суммарный размер ограничен, вытесняются давно не использованные"""
+        for i in range(5):
+            self.cache.put(f"key{i}", os.urandom(30_000))
+            os.utime(self.cache._path(f"key{i}"), (1000 + i, 1000 + i))
+
+        self.assertLessEqual(self.cache.get_stats()["bytes"], 100_000)
+        self.assertIsNone(self.cache.get("key0"))
+        self.assertIsNotNone(self.cache.get("key4"))
+
+
+class TestFileIdReuse(unittest.TestCase):
+    """Повторная отправка того же рендера - по Telegram file_id, без upload"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ProcessedImageCache(self.cache_dir)
+        patcher = patch("utils.image_proc.get_processed_image_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def send(self, bot, prepared):
+        data = {"title": "Телефон", "price": "990", "url": "https://market.yandex.ru/product/1"}
+        return asyncio.run(send_post_to_channel(
+            bot, data, retry_count=2, photo_bytes=prepared.data, photo_cache_key=prepared.key,
+        ))
+
+    def make_bot(self, fail_file_id=False):
+        bot = MagicMock()
+        sent = MagicMock(message_id=7)
+        sent.photo = [MagicMock(file_id="small"), MagicMock(file_id="AgACfile")]
+
+        async def send_photo(**kwargs):
+            if fail_file_id and isinstance(kwargs["photo"], str):
+                raise RuntimeError("wrong file identifier")
+            return sent
+
+        bot.send_photo = AsyncMock(side_effect=send_photo)
+        return bot
+
+    def test_second_send_uses_file_id(self):
+        """Первая отправка загружает файл и запоминает file_id, вторая - без загрузки"""
+        prepared = prepare_image_cached(to_jpeg(noisy_image(200)), max_mb=1)
+        bot = self.make_bot()
+
+        with patch("services.post_service.asyncio.sleep", new=AsyncMock()):
+            self.assertEqual(self.send(bot, prepared), (True, 7))
+            self.assertEqual(self.send(bot, prepared), (True, 7))
+
+        first, second = [c.kwargs["photo"] for c in bot.send_photo.call_args_list]
+        self.assertNotIsInstance(first, str)
+        self.assertEqual(second, "AgACfile")
+
+    def test_stale_file_id_falls_back_to_upload(self):
+        """Недействительный file_id забывается, следующая попытка загружает файл"""
+        prepared = prepare_image_cached(to_jpeg(noisy_image(200)), max_mb=1)
+        self.cache.set_file_id(prepared.key, "expired")
+        bot = self.make_bot(fail_file_id=True)
+
+        with patch("services.post_service.asyncio.sleep", new=AsyncMock()):
+            self.assertEqual(self.send(bot, prepared), (True, 7))
+
+        photos = [c.kwargs["photo"] for c in bot.send_photo.call_args_list]
+        self.assertEqual(photos[0], "expired")
+        self.assertNotIsInstance(photos[1], str)
+        self.assertEqual(self.cache.get_file_id(prepared.key), "AgACfile")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# tests/test_image_service.py
+"""Тесты для services/image_service.py"""
+import asyncio
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from services import image_service
+from services.image_service import ImagePipeline, draw_watermark, enhance, process_product_image
+from utils.image_proc import ProcessedImageCache
+
+
+def make_jpeg(width: int, height: int, color=(40, 120, 200)) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (width, height), color).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def open_image(data: bytes) -> Image.Image:
+    return Image.open(BytesIO(data))
+
+
+class TestImagePipeline(unittest.TestCase):
+    """Один decode, операции над одним изображением, один encode"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ProcessedImageCache(self.cache_dir)
+        patcher = patch("utils.image_proc.get_processed_image_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_product_image_decoded_once(self):
+        """Полная обработка поста открывает байты один раз и уменьшает до лимита Telegram"""
+        real_open = Image.open
+        with patch("services.image_service.Image.open", side_effect=real_open) as opened:
+            result = asyncio.run(process_product_image(make_jpeg(2400, 1800), "15 990", 35, "24 990"))
+
+        self.assertEqual(opened.call_count, 1)
+        img = open_image(result)
+        self.assertEqual((img.format, img.size), ("JPEG", (1024, 768)))
+
+    def test_render_cached_by_parameters(self):
+        """Тот же исходник и параметры - из кэша; другая цена - новый рендер"""
+        source = make_jpeg(800, 600)
+        first = asyncio.run(process_product_image(source, "990", 20))
+        with patch("services.image_service.decode_image") as decode:
+            again = asyncio.run(process_product_image(source, "990", 20))
+        decode.assert_not_called()
+        self.assertEqual(first, again)
+
+        other_price = asyncio.run(process_product_image(source, "890", 20))
+        self.assertNotEqual(first, other_price)
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+
+    def test_overlays_drawn(self):
+        """Ценовой тег, бейдж скидки и водяной знак меняют свои углы"""
+        source = make_jpeg(800, 600, color=(40, 120, 200))
+        result = open_image(
+            image_service.product_image_pipeline("990", 50).run(source)
+        ).convert("RGB")
+
+        center = result.getpixel((400, 300))
+        self.assertNotEqual(result.getpixel((30, 560)), center)  # тег цены
+        self.assertNotEqual(result.getpixel((740, 30)), center)  # бейдж скидки
+
+    def test_fonts_loaded_once(self):
+        """Шрифты и слой водяного знака берутся из кэша"""
+        image_service.get_font.cache_clear()
+        image_service._watermark_layer.cache_clear()
+        pipeline = ImagePipeline().add(enhance).add(draw_watermark, "@channel")
+        for _ in range(3):
+            pipeline.run(make_jpeg(640, 480))
+
+        self.assertEqual(image_service.get_font.cache_info().misses, 1)
+        self.assertEqual(image_service._watermark_layer.cache_info().misses, 1)
+
+    def test_failed_op_is_skipped(self):
+        """Ошибка одной операции не отменяет остальные; битые байты возвращаются как есть"""
+        def broken(img):
+            raise ValueError("boom")
+
+        result = ImagePipeline().add(broken).add(draw_watermark, "@channel").run(make_jpeg(300, 300))
+        self.assertEqual(open_image(result).size, (300, 300))
+        self.assertEqual(ImagePipeline().add(enhance).run(b"not an image"), b"not an image")
+
+
+if __name__ == "__main__":
+    unittest.main()
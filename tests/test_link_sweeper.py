@@ -0,0 +1,118 @@
+# tests/test_link_sweeper.py
+"""Тесты для services/link_sweeper.py"""
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.http_response_cache import CachedResponse
+from services.link_sweeper import (
+    ALIVE,
+    DEAD,
+    SOLD_OUT,
+    UNKNOWN,
+    AvailabilityChecker,
+    classify_availability,
+    remove_channel_posts,
+)
+
+
+def product_page(availability: str) -> str:
+    data = {"@type": "Product", "name": "Phone", "offers": {"@type": "Offer", "availability": availability}}
+    # "нет в наличии" у соседних товаров не должно влиять на решение по ld+json
+    return (
+        f'<html><script type="application/ld+json">{json.dumps(data)}</script>'
+        f"<div>Похожие: нет в наличии</div></html>"
+    )
+
+
+class TestClassifyAvailability(unittest.TestCase):
+    def test_structured_data(self):
+        self.assertEqual(classify_availability(product_page("https://schema.org/InStock")), (ALIVE, "ld+json"))
+        self.assertEqual(classify_availability(product_page("http://schema.org/OutOfStock")), (SOLD_OUT, "ld+json"))
+        self.assertEqual(
+            classify_availability('<script>window.state={"offer":{"isAvailable":false,"price":1}}</script>'),
+            (SOLD_OUT, "state"),
+        )
+        self.assertEqual(
+            classify_availability('<link itemprop="availability" href="https://schema.org/InStock"/>'),
+            (ALIVE, "meta"),
+        )
+
+    def test_text_fallback(self):
+        self.assertEqual(classify_availability("<p>Товар закончился</p>"), (SOLD_OUT, "text"))
+        self.assertEqual(classify_availability("<p>Купить</p>"), (UNKNOWN, "none"))
+
+
+class TestAvailabilityChecker(unittest.TestCase):
+    def make_client(self, pages):
+        client = MagicMock()
+
+        async def fetch_page(url, **kwargs):
+            await asyncio.sleep(0.01)
+            page = pages[url]
+            if page is None:
+                return None
+            status, text = page
+            return CachedResponse.build(url, status, text, {})
+
+        client.fetch_page = AsyncMock(side_effect=fetch_page)
+        return client
+
+    def test_concurrent_checks_cached_per_product(self):
+        pages = {
+            "https://market.yandex.ru/product/1": (200, product_page("InStock")),
+            "https://market.yandex.ru/product/1?sku=9": (200, product_page("InStock")),
+            "https://market.yandex.ru/product/2": (200, product_page("SoldOut")),
+            "https://market.yandex.ru/product/3": (404, ""),
+            "https://market.yandex.ru/product/4": None,
+        }
+        client = self.make_client(pages)
+        checker = AvailabilityChecker(http_client=client, concurrency=4, ttl_hours=1, limiter=MagicMock())
+
+        with patch("services.price_monitor.product_id_from_url", side_effect=lambda u: u.split("?")[0]):
+            results = asyncio.run(checker.check_many(list(pages)))
+            self.assertEqual(client.fetch_page.await_count, 4)  # /product/1 с ?sku - тот же товар
+            self.assertEqual(results["https://market.yandex.ru/product/1?sku=9"].status, ALIVE)
+            self.assertEqual(results["https://market.yandex.ru/product/2"].status, SOLD_OUT)
+            self.assertEqual(results["https://market.yandex.ru/product/3"].status, DEAD)
+            self.assertEqual(results["https://market.yandex.ru/product/4"].status, UNKNOWN)
+            self.assertFalse(results["https://market.yandex.ru/product/4"].is_gone)
+
+            # Повторный прогон: определенные результаты из кэша, сетевую ошибку проверяем снова
+            again = asyncio.run(checker.check_many(list(pages)))
+        self.assertEqual(client.fetch_page.await_count, 5)
+        self.assertTrue(again["https://market.yandex.ru/product/2"].cached)
+
+
+class TestRemoveChannelPosts(unittest.TestCase):
+    def test_batched_delete(self):
+        bot = MagicMock()
+        bot.delete_messages = AsyncMock()
+        bot.delete_message = AsyncMock()
+        posts = [{"chat_id": "@chan", "message_id": i} for i in range(150)]
+        posts.append({"chat_id": "@other", "message_id": 1})
+
+        limiter = MagicMock()
+        limiter.acquire = AsyncMock()
+        with patch("services.distributed_rate_limiter.get_telegram_api_limiter", return_value=limiter):
+            stats = asyncio.run(remove_channel_posts(bot, posts))
+
+        self.assertEqual(stats, {"deleted": 151, "edited": 0, "errors": 0})
+        self.assertEqual(bot.delete_messages.await_count, 3)  # 100 + 50 + 1
+        bot.delete_message.assert_not_awaited()
+
+    def test_batch_failure_falls_back_to_single_deletes(self):
+        bot = MagicMock()
+        bot.delete_messages = AsyncMock(side_effect=RuntimeError("not supported"))
+        bot.delete_message = AsyncMock(side_effect=[None, Exception("Bad Request: message to delete not found")])
+
+        limiter = MagicMock()
+        limiter.acquire = AsyncMock()
+        with patch("services.distributed_rate_limiter.get_telegram_api_limiter", return_value=limiter):
+            stats = asyncio.run(remove_channel_posts(bot, [{"chat_id": 1, "message_id": 1}, {"chat_id": 1, "message_id": 2}]))
+        self.assertEqual(stats, {"deleted": 1, "edited": 0, "errors": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
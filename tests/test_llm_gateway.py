@@ -0,0 +1,109 @@
+# tests/test_llm_gateway.py
+"""Тесты для services/llm_gateway.py"""
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.ai_enrichment_service import AiEnrichmentService
+from services.llm_gateway import LlmGateway, TokenBucket
+
+
+def run_burst(gateway: LlmGateway, items):
+    async def burst():
+        return await asyncio.gather(*(gateway.submit(item) for item in items))
+
+    return asyncio.run(burst())
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Запрос сверх лимита ждет токен"""
+
+    def test_acquire_waits_instead_of_failing(self):
+        bucket = TokenBucket(rate_per_minute=1200, burst=1)  # 20 в секунду
+
+        async def take(n):
+            return [await bucket.acquire() for _ in range(n)]
+
+        waits = asyncio.run(take(3))
+        self.assertLess(waits[0], 0.01)
+        self.assertGreater(waits[2], 0.03)
+
+
+class TestLlmGateway(unittest.TestCase):
+    """Очередь, пакетирование и разбор ответа по элементам"""
+
+    def test_burst_packed_into_batches(self):
+        """Всплеск уходит пакетами, каждый элемент получает свой результат"""
+        single = AsyncMock(side_effect=lambda item: f"one:{item}")
+        batch = AsyncMock(side_effect=lambda items: [f"many:{item}" for item in items])
+        gateway = LlmGateway(single, batch, rate_per_minute=600, burst=1, max_batch=5)
+
+        results = run_burst(gateway, range(7))
+
+        self.assertEqual(len(results), 7)
+        self.assertTrue(all(r.endswith(f":{i}") for i, r in enumerate(results)))
+        self.assertLessEqual(gateway.get_stats()["requests"], 3)
+        self.assertEqual(gateway.get_stats()["submitted"], 7)
+
+    def test_lone_request_not_batched(self):
+        """Одиночный запрос при пустой очереди уходит сразу, без пакета"""
+        single = AsyncMock(return_value="ok")
+        batch = AsyncMock()
+        gateway = LlmGateway(single, batch, rate_per_minute=600)
+
+        self.assertEqual(run_burst(gateway, ["a"]), ["ok"])
+        batch.assert_not_called()
+
+    def test_missing_items_retried_single(self):
+        """Пропущенный в ответе пакета элемент переспрашивается отдельным запросом"""
+        single = AsyncMock(side_effect=lambda item: f"one:{item}")
+        batch = AsyncMock(side_effect=lambda items: [f"many:{items[0]}", None])
+        gateway = LlmGateway(single, batch, rate_per_minute=6000, burst=1, max_batch=2)
+
+        results = run_burst(gateway, ["a", "b", "c"])
+
+        self.assertNotIn(None, results)
+        self.assertEqual(gateway.get_stats()["retried_single"], 1)
+        single.assert_any_await("c")
+
+
+class TestEnrichmentBatch(unittest.TestCase):
+    """Пакетный ответ ChatGPT делится по товарам и валидируется"""
+
+    def setUp(self):
+        patcher = patch("services.ai_enrichment_service.get_ai_cache", return_value=MagicMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = AiEnrichmentService(api_key="test")
+
+    def test_split_and_validate(self):
+        items = [
+            {"url": "https://market.yandex.ru/card/phone/1", "raw_title": "Телефон"},
+            {"url": "https://market.yandex.ru/card/tv/2", "raw_title": "Телевизор"},
+            {"url": "https://market.yandex.ru/card/kettle/3", "raw_title": "Чайник"},
+        ]
+        response = {"items": [
+            {"index": 2, "product_url": "https://market.yandex.ru/card/tv/2", "ref_link": None,
+             "price": 30990, "title": "Телевизор", "is_valid": True},
+            {"index": 1, "product_url": "https://market.yandex.ru/card/phone/1", "ref_link": None,
+             "price": "15 990", "title": "Телефон", "is_valid": True},
+            # ref_link не встречается в исходных данных - отклоняется валидатором
+            {"index": 3, "product_url": "https://market.yandex.ru/card/kettle/3",
+             "ref_link": "https://market.yandex.ru/cc/FAKE", "price": 990, "title": "Чайник",
+             "is_valid": True},
+        ]}
+        self.service._chat = AsyncMock(return_value=(response, 900))
+
+        results = asyncio.run(self.service._send_batch(items))
+
+        self.assertEqual(results[0][0]["title"], "Телефон")
+        self.assertEqual(results[1][0]["price"], 30990)
+        self.assertAlmostEqual(results[1][1], 0.003)
+        self.assertIsNone(results[2])
+        prompt = self.service._chat.call_args[0][0]
+        self.assertEqual(prompt.count("Задача:"), 1)
+        self.assertIn("### Товар 3", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# tests/test_log_service.py
+"""Тесты для services/log_service.py и services/log_index.py"""
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.log_index import LogIndex, read_lines_reversed, rotated_files
+from services.log_service import LogService
+
+
+def log_line(ts: datetime, level: str, message: str) -> str:
+    return f"[{ts:%Y-%m-%d %H:%M:%S}] {level} bot: {message}\n"
+
+
+class TestReverseReader(unittest.TestCase):
+    def test_lines_reversed_across_blocks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bot.log")
+            lines = [f"line {i} " + "x" * (i % 7) for i in range(200)]
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+            result = list(read_lines_reversed(path, block_size=16))
+            self.assertEqual([line.decode() for _, line in result], lines[::-1])
+            with open(path, "rb") as f:
+                data = f.read()
+            for offset, line in result[:20]:
+                self.assertTrue(data[offset:].startswith(line))
+
+
+class TestLogService(unittest.TestCase):
+    """Чтение с конца, ротированные файлы, переход к ошибкам по индексу"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp.name, "bot.log")
+        self.now = datetime.now().replace(microsecond=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, lines):
+        with open(path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def test_recent_logs_span_rotated_files(self):
+        old = self.now - timedelta(hours=30)
+        self.write(self.log_file + ".1", [log_line(old, "INFO", f"old {i}") for i in range(5)])
+        self.write(self.log_file, [log_line(self.now, "INFO", f"new {i}") for i in range(3)])
+        self.assertEqual(rotated_files(self.log_file), [self.log_file, self.log_file + ".1"])
+
+        logs = LogService(self.log_file).get_recent_logs(limit=5)
+        self.assertEqual(
+            [log["message"] for log in logs],
+            ["old 3", "old 4", "new 0", "new 1", "new 2"],
+        )
+
+    def test_errors_read_via_index(self):
+        lines = []
+        for hour in range(10, 0, -1):
+            ts = self.now - timedelta(hours=hour)
+            lines += [log_line(ts, "INFO", f"noise {hour}-{i}") for i in range(50)]
+            if hour in (8, 2):
+                lines.append(log_line(ts, "ERROR", f"failed at -{hour}h"))
+        self.write(self.log_file, lines)
+
+        service = LogService(self.log_file)
+        with patch("services.log_service.read_lines_reversed", wraps=read_lines_reversed) as scan:
+            errors = service.get_recent_logs(limit=10, min_level="ERROR")
+            recent = service.get_error_logs(hours=6)
+        self.assertEqual([e["message"] for e in errors], ["failed at -8h", "failed at -2h"])
+        self.assertEqual([e["message"] for e in recent], ["failed at -2h"])
+        scan.assert_not_called()  # ошибки прочитаны по смещениям из индекса
+
+        with open(self.log_file + ".idx", encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["files"]), 1)
+
+    def test_index_appends_new_lines(self):
+        self.write(self.log_file, [log_line(self.now, "WARNING", "first")])
+        index = LogIndex(self.log_file)
+        entry = index.refresh()[self.log_file]
+        indexed_to = entry["indexed_to"]
+
+        self.write(self.log_file, [log_line(self.now, "ERROR", "second")])
+        entry = LogIndex(self.log_file).refresh()[self.log_file]
+        self.assertGreater(entry["indexed_to"], indexed_to)
+        bucket = entry["hours"][f"{self.now:%Y-%m-%d %H}"]
+        self.assertEqual(bucket["levels"], {"WARNING": 1, "ERROR": 1})
+        self.assertEqual(bucket["offsets"]["ERROR"], [indexed_to])
+
+        logs = LogService(self.log_file).get_recent_logs(limit=5, min_level="WARNING")
+        self.assertEqual([log["message"] for log in logs], ["first", "second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
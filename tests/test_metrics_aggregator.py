@@ -0,0 +1,152 @@
+# tests/test_metrics_aggregator.py
+"""Тесты для services/metrics_aggregator.py"""
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from services.metrics_aggregator import CounterAggregator
+
+
+class TestCounterAggregator(unittest.TestCase):
+    """Пакетный сброс, восстановление из WAL, повтор при ошибке"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.wal_dir = os.path.join(self.tmp.name, "wal")
+        self.batches = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def sink(self, deltas):
+        self.batches.append({scope: {k: dict(v) for k, v in rows.items()} for scope, rows in deltas.items()})
+
+    def test_burst_flushed_as_one_batch(self):
+        agg = CounterAggregator(self.sink, wal_dir=self.wal_dir, shards=4)
+        for _ in range(100):
+            agg.record("clicks", 7, brand="Apple", template="short")
+        agg.record("impressions", 8)
+
+        self.assertEqual(agg.flush(), 101)
+        self.assertEqual(len(self.batches), 1)
+        batch = self.batches[0]
+        self.assertEqual(batch["posts"]["7"], {"clicks": 100})
+        self.assertEqual(batch["posts"]["8"], {"impressions": 1})
+        self.assertEqual(batch["brands"]["Apple"], {"clicks": 100})
+        self.assertEqual(batch["templates"]["short"], {"clicks": 100})
+        self.assertEqual(os.listdir(self.wal_dir), [])
+        self.assertEqual(agg.flush(), 0)
+        agg.close()
+
+    def test_unflushed_events_recovered_from_wal(self):
+        """События, не дошедшие до flush (падение процесса), проигрываются при старте"""
+        crashed = CounterAggregator(self.sink, wal_dir=self.wal_dir, shards=2)
+        for _ in range(3):
+            crashed.record("clicks", 1, brand="Xiaomi")
+        crashed.record("impressions", 2)
+        # Процесс "упал": ни flush, ни close
+
+        restarted = CounterAggregator(self.sink, wal_dir=self.wal_dir, shards=2)
+        self.assertEqual(restarted.get_stats()["recovered_events"], 4)
+        self.assertEqual(restarted.flush(), 4)
+        self.assertEqual(self.batches[0]["posts"]["1"], {"clicks": 3})
+        self.assertEqual(self.batches[0]["brands"]["Xiaomi"], {"clicks": 3})
+        self.assertEqual(os.listdir(self.wal_dir), [])
+        restarted.close()
+
+    def test_failed_flush_keeps_deltas_and_wal(self):
+        calls = []
+
+        def flaky(deltas):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("db down")
+            self.sink(deltas)
+
+        agg = CounterAggregator(flaky, wal_dir=self.wal_dir, shards=2)
+        agg.record("clicks", 5)
+        self.assertEqual(agg.flush(), 0)
+        self.assertEqual(agg.get_stats()["flush_errors"], 1)
+        self.assertTrue(os.listdir(self.wal_dir))
+
+        agg.record("clicks", 5)
+        self.assertEqual(agg.flush(), 2)
+        self.assertEqual(self.batches, [{"posts": {"5": {"clicks": 2}}, "brands": {}, "templates": {}}])
+        self.assertEqual(os.listdir(self.wal_dir), [])
+        agg.close()
+
+
+class TestMetricsServiceFileMode(unittest.TestCase):
+    """MetricsService без Postgres: файл пишется только при сбросе, атомарно"""
+
+    def test_clicks_written_on_flush(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("config.USE_POSTGRES", False), patch("config.USE_REDIS", False), \
+                patch("config.METRICS_WAL_DIR", os.path.join(tmp, "wal")), \
+                patch("config.METRICS_FLUSH_INTERVAL", 3600):
+            from services.metrics_service import MetricsService
+
+            service = MetricsService()
+            service.metrics_file = os.path.join(tmp, "metrics_cache.json")
+            service.metrics_cache = {'posts': {}, 'brands': {}, 'templates': {}, 'daily_stats': {}}
+            for _ in range(50):
+                service.record_click({'post_id': 3, 'brand': 'Samsung', 'template_used': 'long'})
+                service.record_impression({'post_id': 3, 'brand': 'Samsung'})
+            self.assertFalse(os.path.exists(service.metrics_file))
+
+            self.assertEqual(service.flush_metrics(), 100)
+            with open(service.metrics_file, encoding='utf-8') as f:
+                saved = json.load(f)
+            self.assertEqual(saved['posts']['3']['clicks'], 50)
+            self.assertEqual(saved['posts']['3']['impressions'], 50)
+            self.assertFalse(os.path.exists(service.metrics_file + ".tmp"))
+
+            summary = service._get_file_metrics_summary(days=7)
+            self.assertEqual(summary['brand_ctr'][0]['brand'], 'Samsung')
+            self.assertEqual(summary['brand_ctr'][0]['ctr'], 100.0)
+            self.assertEqual(summary['template_ctr'][0]['clicks'], 50)
+            service.close()
+
+    def test_non_numeric_post_id_skipped_at_flush(self):
+        """Нечисловой post_id принимается, но в пачку Postgres не попадает"""
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("config.USE_POSTGRES", False), patch("config.USE_REDIS", False), \
+                patch("config.METRICS_WAL_DIR", os.path.join(tmp, "wal")), \
+                patch("config.METRICS_FLUSH_INTERVAL", 3600):
+            from services.metrics_service import MetricsService
+
+            service = MetricsService()
+            service.metrics_file = os.path.join(tmp, "metrics_cache.json")
+            self.assertTrue(service.record_click({'post_id': 'abc'}))
+            self.assertTrue(service.record_impression({'post_id': '1; drop'}))
+            self.assertTrue(service.record_click({'post_id': '12'}))
+            self.assertEqual(service.aggregator.get_stats()["pending_events"], 3)
+
+            from database_postgres import metric_delta_rows
+
+            service.db = MagicMock()
+            self.assertEqual(service.aggregator.flush(), 3)
+            deltas = service.db.apply_metric_deltas.call_args.args[0]
+            self.assertEqual(metric_delta_rows(deltas), [(12, 1, 0)])
+            service.close()
+
+
+class TestMetricDeltaRows(unittest.TestCase):
+    """Пачка для Postgres: плохой ключ пропускается, остальные пишутся"""
+
+    def test_poison_key_skipped(self):
+        from database_postgres import metric_delta_rows
+
+        rows = metric_delta_rows({
+            "7": {"clicks": 3},
+            "abc": {"clicks": 1},
+            "8": {"impressions": 2},
+            "9": {"clicks": "x"},
+        })
+        self.assertEqual(rows, [(7, 3, 0), (8, 0, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
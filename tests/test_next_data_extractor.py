@@ -0,0 +1,101 @@
+# tests/test_next_data_extractor.py
+"""Тесты для utils/next_data_extractor.py"""
+import json
+import unittest
+
+from services.smart_search_service import SmartSearchParser
+from utils import next_data_extractor
+from utils.next_data_extractor import extract_next_data_items, extract_window_state_items
+
+
+def make_items(count: int) -> list:
+    return [
+        {
+            "id": 100000 + i,
+            "slug": f"item-{i}",
+            "titles": {"raw": f"Товар {i}"},
+            "prices": {"value": 1000 + i, "oldValue": 1500 + i},
+        }
+        for i in range(count)
+    ]
+
+
+def make_page(initial_state: dict) -> str:
+    data = {"props": {"pageProps": {"initialState": initial_state}}}
+    return (
+        "<html><body><div>разметка</div>"
+        f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data, ensure_ascii=False, separators=(",", ":"))}</script>'
+        "</body></html>"
+    )
+
+
+class TestNextDataExtractor(unittest.TestCase):
+    """Тесты быстрого извлечения встроенного JSON"""
+
+    def test_next_data_subtree(self):
+        """Товары извлекаются из str и bytes без полного разбора"""
+        items = make_items(3)
+        html = make_page({"cms": {"widgets": [1, 2]}, "search": {"results": {"items": items}}})
+        full_parses = next_data_extractor.stats["full_parses"]
+
+        self.assertEqual(extract_next_data_items(html), items)
+        self.assertEqual(extract_next_data_items(html.encode("utf-8")), items)
+        self.assertEqual(next_data_extractor.stats["full_parses"], full_parses)
+
+    def test_nested_same_keys_skipped(self):
+        """Одноименные ключи на другом уровне не совпадают, полного разбора нет"""
+        items = make_items(2)
+        html = make_page({
+            "filters": {"search": {"results": {"items": ["not-a-product"]}}},
+            "recent": {"results": {"items": [{"id": "r"}]}},
+            "search": {"results": {"filters": {"items": [{"id": "f1", "name": "Brand"}]}, "items": items}},
+        })
+        full_parses = next_data_extractor.stats["full_parses"]
+
+        self.assertEqual(extract_next_data_items(html), items)
+        self.assertEqual(next_data_extractor.stats["full_parses"], full_parses)
+
+    def test_pretty_printed_json(self):
+        """Пробелы и переносы в JSON не мешают быстрому пути"""
+        items = make_items(2)
+        data = {"search": {"results": {"total": 2, "items": items}}}
+        html = f"<script>window.__STATE__ = {json.dumps(data, indent=2)};</script>"
+        full_parses = next_data_extractor.stats["full_parses"]
+
+        self.assertEqual(extract_window_state_items(html), items)
+        self.assertEqual(next_data_extractor.stats["full_parses"], full_parses)
+
+    def test_fallback_to_full_parse(self):
+        """По пути не товары - полный разбор и обход по пути"""
+        html = make_page({"search": {"results": {"items": [{"name": "Brand"}]}}})
+        full_parses = next_data_extractor.stats["full_parses"]
+
+        self.assertEqual(extract_next_data_items(html), [{"name": "Brand"}])
+        self.assertEqual(next_data_extractor.stats["full_parses"], full_parses + 1)
+
+    def test_missing_and_empty(self):
+        """Нет тега - None, нет пути - пустой список"""
+        self.assertIsNone(extract_next_data_items("<html><body></body></html>"))
+        self.assertEqual(extract_next_data_items(make_page({"user": {}})), [])
+
+    def test_window_state_with_trailing_code(self):
+        """window.__STATE__ разбирается до конца объекта, хвост скрипта игнорируется"""
+        items = make_items(2)
+        state = json.dumps({"search": {"results": {"items": items}}, "x": "};"})
+        html = f"<script>window.__STATE__ = {state}; window.other = 1;</script>"
+        self.assertEqual(extract_window_state_items(html), items)
+
+    def test_parser_uses_extractor(self):
+        """SmartSearchParser получает те же товары, что и раньше через BeautifulSoup"""
+        html = make_page({"search": {"results": {"items": make_items(3)}}})
+        parser = SmartSearchParser()
+
+        catalog = parser._parse_catalog_html(html)
+        playwright = parser._parse_next_data_products(html)
+
+        self.assertEqual([p["market_id"] for p in catalog], ["100000", "100001", "100002"])
+        self.assertEqual([p["price"] for p in playwright], [1000, 1001, 1002])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# tests/test_parse_executor.py
+"""Тесты для utils/parse_executor.py"""
+import asyncio
+import json
+import unittest
+
+from utils.parse_executor import ParseExecutor
+
+
+def make_catalog_html(count: int) -> str:
+    items = [
+        {
+            "id": 100000 + i,
+            "slug": f"item-{i}",
+            "title": f"Товар {i}",
+            "prices": {"value": 1000 + i, "oldValue": 1500 + i},
+        }
+        for i in range(count)
+    ]
+    data = {"props": {"pageProps": {"initialState": {"search": {"results": {"items": items}}}}}}
+    return (
+        "<html><body>"
+        f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script>'
+        "</body></html>"
+    )
+
+
+class TestParseExecutor(unittest.TestCase):
+    """Тесты пула процессов парсинга"""
+
+    def test_pool_matches_sync_fallback(self):
+        """Пул процессов и синхронный fallback возвращают одинаковые товары"""
+        html = make_catalog_html(3)
+
+        async def scenario():
+            pool = ParseExecutor(max_workers=1)
+            fallback = ParseExecutor(max_workers=0)
+            try:
+                pooled = await pool.parse("catalog", html.encode("utf-8"), "https://market.yandex.ru/catalog")
+                inline = await fallback.parse("catalog", html)
+            finally:
+                pool.shutdown()
+            return pool, fallback, pooled, inline
+
+        pool, fallback, pooled, inline = asyncio.run(scenario())
+
+        self.assertEqual(pooled, inline)
+        self.assertEqual([p["market_id"] for p in pooled], ["100000", "100001", "100002"])
+        self.assertEqual(pool.stats["pool_tasks"], 1)
+        self.assertEqual(fallback.stats["fallback_tasks"], 1)
+        self.assertEqual(fallback.parse_sync("catalog", html), inline)
+
+    def test_unknown_parser(self):
+        """Неизвестный парсер - ValueError"""
+        executor = ParseExecutor(max_workers=0)
+        with self.assertRaises(ValueError):
+            asyncio.run(executor.parse("missing", "<html></html>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
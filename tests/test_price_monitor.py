@@ -0,0 +1,145 @@
+# tests/test_price_monitor.py
+"""Тесты для services/price_monitor.py"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database_async import AsyncDatabase
+from services.price_monitor import PriceMonitorService, check_priority, volatility_score
+
+
+def fast_limiter():
+    return MagicMock(acquire=AsyncMock(return_value=True))
+
+
+class TestScheduling(unittest.TestCase):
+    """Волатильные и давно не проверявшиеся товары идут первыми"""
+
+    def test_volatility(self):
+        now = datetime.utcnow()
+        phone = {"title": "Смартфон X", "discount": 35, "price_changed_at": now - timedelta(hours=5)}
+        book = {"title": "Книга", "discount": 0, "price_changed_at": now - timedelta(days=60)}
+        self.assertGreater(volatility_score(phone, now), 4)
+        self.assertLess(volatility_score(book, now), 0.5)
+
+    def test_schedule_skips_recently_checked(self):
+        now = datetime.utcnow()
+        monitor = PriceMonitorService(db=None, min_interval_hours=12)
+        items = [
+            {"id": 1, "url": "u1", "title": "Книга", "price_checked_at": now - timedelta(hours=2)},
+            {"id": 2, "url": "u2", "title": "Чайник", "price_checked_at": now - timedelta(hours=20)},
+            {"id": 3, "url": "u3", "title": "Смартфон", "price_checked_at": now - timedelta(hours=20)},
+            {"id": 4, "url": "u4", "title": "Чайник"},  # еще не проверялся
+        ]
+        self.assertEqual([i["id"] for i in monitor.schedule(items, 10)], [4, 3, 2])
+        self.assertEqual([i["id"] for i in monitor.schedule(items, 2)], [4, 3])
+        self.assertGreater(check_priority(items[3], now), check_priority(items[2], now))
+
+
+class TestCheckPriceDrops(unittest.TestCase):
+    """Параллельные проверки и пакетная запись в price_history"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, "test.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_with_db(self, coro_fn):
+        async def runner():
+            async with AsyncDatabase(self.db_file, readers=2) as db:
+                for i, price in enumerate([1000.0, 2000.0, None, 500.0], start=1):
+                    await db.add_post_to_history(
+                        f"https://market.yandex.ru/product/10000{i}", f"hash{i}",
+                        title=f"Товар {i}", price=price,
+                    )
+                await coro_fn(db)
+
+        asyncio.run(runner())
+
+    def test_concurrent_checks_and_bulk_write(self):
+        prices = {"100001": "790 ₽", "100002": "1 990 ₽", "100003": "300 ₽", "100004": "Цена уточняется"}
+
+        async def scrape(url, max_age=None):
+            await asyncio.sleep(0.1)
+            return {"price": prices[url[-6:]], "discount": 21.0, "category": "Электроника"}
+
+        async def scenario(db):
+            monitor = PriceMonitorService(db, concurrency=4, min_interval_hours=1)
+            with patch("services.price_monitor.scrape_yandex_market", side_effect=scrape), \
+                    patch("services.distributed_rate_limiter.get_yandex_catalog_limiter", fast_limiter):
+                started = time.monotonic()
+                drops = await monitor.check_price_drops(limit=10)
+                elapsed = time.monotonic() - started
+
+            self.assertLess(elapsed, 0.35)  # не 4 x 0.1 с последовательно
+            self.assertEqual([d["url"][-6:] for d in drops], ["100001"])
+            self.assertAlmostEqual(drops[0]["price_drop_percent"], 21.0)
+
+            rows = await db._fetchall(
+                "SELECT product_id, price, old_price FROM price_history ORDER BY product_id"
+            )
+            self.assertEqual([tuple(r) for r in rows], [
+                ("100001", 790.0, 1000.0), ("100002", 1990.0, 2000.0), ("100003", 300.0, None),
+            ])
+            history = {r["url"][-6:]: r for r in await db.get_price_watch_candidates()}
+            self.assertEqual(history["100003"]["last_price"], 300.0)
+            self.assertIsNotNone(history["100004"]["price_checked_at"])  # без цены - тоже отмечен
+            self.assertIsNotNone(history["100001"]["price_changed_at"])
+            self.assertIsNone(history["100003"]["price_changed_at"])
+            self.assertEqual(history["100002"]["category"], "Электроника")
+            self.assertEqual(monitor.last_run["html"], 4)
+
+            # Сразу после проверки товары не проверяются повторно
+            self.assertEqual(monitor.schedule(await db.get_price_watch_candidates(), 10), [])
+
+        self.run_with_db(scenario)
+
+    def test_cumulative_drop_against_posted_price(self):
+        """Падения 10% и 11% подряд считаются от цены публикации (-19.9%)"""
+        prices = iter(["900 ₽", "801 ₽"])
+
+        async def scrape(url, max_age=None):
+            return {"price": next(prices)}
+
+        async def scenario(db):
+            monitor = PriceMonitorService(db, min_interval_hours=0)
+            monitor.schedule = lambda pool, limit: [i for i in pool if i["url"].endswith("100001")]
+            with patch("services.price_monitor.scrape_yandex_market", side_effect=scrape), \
+                    patch("services.distributed_rate_limiter.get_yandex_catalog_limiter", fast_limiter):
+                self.assertEqual(await monitor.check_price_drops(limit=10), [])
+                drops = await monitor.check_price_drops(limit=10)
+
+            self.assertEqual(len(drops), 1)
+            self.assertEqual(drops[0]["old_price"], 1000.0)
+            self.assertAlmostEqual(drops[0]["price_drop_percent"], 19.9)
+            item = next(
+                i for i in await db.get_price_watch_candidates() if i["url"].endswith("100001")
+            )
+            self.assertEqual((item["last_price"], item["last_checked_price"]), (1000.0, 801.0))
+
+        self.run_with_db(scenario)
+
+    def test_price_drop_requeued(self):
+        drops = [{
+            "url": "https://market.yandex.ru/product/100001", "title": "Товар 1",
+            "old_price": 1000.0, "current_price": 790.0, "price_drop_percent": 21.0,
+        }]
+
+        async def scenario(db):
+            monitor = PriceMonitorService(db)
+            with patch("bot.store_price_drop_info", create=True):
+                self.assertEqual(await monitor.process_price_drops(drops), 1)
+                self.assertEqual(await monitor.process_price_drops(drops), 0)  # уже в очереди
+            self.assertEqual(await db.get_queue_count(), 1)
+
+        self.run_with_db(scenario)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# tests/test_prompt_budget.py
+"""Тесты компактного контекста товара и бюджета токенов (utils/prompt_generator)"""
+import unittest
+from unittest.mock import MagicMock, patch
+
+from services.ai_enrichment_service import AiEnrichmentService
+from services.ai_metrics import AiMetrics
+from utils.prompt_generator import (
+    compact_product_context,
+    estimate_tokens,
+    fit_sections,
+    top_review_sentences,
+    truncate_to_tokens,
+)
+
+
+def card_html(filler_blocks: int) -> str:
+    """Карточка товара: цена, характеристики, /cc/ ссылка и много постороннего"""
+    filler = "".join(
+        f"<div class='reco'><script>window.state{i} = {{'a': {i}}}</script>"
+        f"<p>Похожий товар номер {i} с длинным описанием для рекомендаций</p></div>"
+        for i in range(filler_blocks)
+    )
+    return (
+        "<html><body><h1>Смартфон Galaxy A55 8/256 ГБ</h1>"
+        "<div data-auto='snippet-price-current'><span>32 990 ₽</span> <s>41 990 ₽</s></div>"
+        "<dl><dt>Диагональ</dt><dd>6.6\"</dd><dt>Память</dt><dd>256 ГБ</dd></dl>"
+        "<a href='https://market.yandex.ru/cc/7Xk2Lm'>поделиться</a>"
+        f"{filler}</body></html>"
+    )
+
+
+class TestCompaction(unittest.TestCase):
+    """Из HTML извлекаются только нужные поля"""
+
+    def test_fields_extracted(self):
+        context = compact_product_context({"raw_html": card_html(3)})
+
+        self.assertEqual(context["title"], "Смартфон Galaxy A55 8/256 ГБ")
+        self.assertEqual(context["prices"], ["32 990", "41 990"])
+        self.assertEqual(context["specs"], ['Диагональ: 6.6"', "Память: 256 ГБ"])
+        self.assertEqual(context["cc_links"], ["https://market.yandex.ru/cc/7Xk2Lm"])
+        self.assertNotIn("window.state", context["text"])
+
+    def test_review_sentences_deduplicated(self):
+        """Повторяющиеся мысли из разных отзывов - одна строка, частые первыми"""
+        reviews = [
+            "Экран яркий, но бликует. Батарея держит два дня!",
+            "Батарея держит два дня. Камера ночью шумит.",
+            "батарея держит два дня... Отлично.",
+        ]
+        sentences = top_review_sentences(reviews, limit=3)
+
+        self.assertEqual(sentences[0], "Батарея держит два дня!")
+        self.assertEqual(len(sentences), 3)
+        self.assertNotIn("Отлично.", sentences)
+
+
+class TestTokenBudget(unittest.TestCase):
+    """Промпт ограничен бюджетом независимо от размера страницы"""
+
+    def setUp(self):
+        patcher = patch("services.ai_enrichment_service.get_ai_cache", return_value=MagicMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = AiEnrichmentService(api_key="test")
+
+    def test_prompt_size_independent_of_page_size(self):
+        small = self.service._build_prompt({"url": "https://market.yandex.ru/card/a/1", "raw_html": card_html(2)})
+        huge = self.service._build_prompt({"url": "https://market.yandex.ru/card/a/1", "raw_html": card_html(3000)})
+        fixed = estimate_tokens(self.service._build_prompt({"url": "https://market.yandex.ru/card/a/1"}))
+
+        self.assertLessEqual(estimate_tokens(huge), fixed + self.service.prompt_max_tokens)
+        self.assertEqual(small, huge)  # посторонний HTML в промпт не попадает
+        self.assertIn("https://market.yandex.ru/cc/7Xk2Lm", huge)
+
+    def test_sections_trimmed_by_importance(self):
+        sections = [("Цены", "32 990"), ("Отзывы", "очень длинный отзыв " * 200)]
+        fitted = fit_sections(sections, 60)
+
+        self.assertEqual(fitted[0], ("Цены", "32 990"))
+        self.assertTrue(fitted[1][1].endswith("…"))
+        total = sum(estimate_tokens(t) + estimate_tokens(x) + 2 for t, x in fitted)
+        self.assertLessEqual(total, 60)
+        self.assertEqual(truncate_to_tokens("коротко", 10), "коротко")
+
+
+class TestTokenMetrics(unittest.TestCase):
+    """AiMetrics хранит токены промпта/ответа по вызовам"""
+
+    def test_record_llm_call(self):
+        metrics = AiMetrics()
+        for prompt in (400, 420, 380, 900):
+            metrics.record_llm_call(prompt, 90, estimated_prompt_tokens=int(prompt * 1.1))
+
+        stats = metrics.get_stats()
+        self.assertEqual(stats["llm_calls"], 4)
+        self.assertEqual(stats["prompt_tokens"], 2100)
+        self.assertEqual(stats["prompt_tokens_p95"], 900)
+        self.assertEqual(stats["completion_tokens_avg"], 90)
+        self.assertAlmostEqual(stats["token_estimate_error_pct"], 10, delta=0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
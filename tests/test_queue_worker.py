@@ -1,17 +1,22 @@
 # tests/test_queue_worker.py
 """Тесты для queue_worker"""
+import os
+import tempfile
 import unittest
 from unittest.mock import AsyncMock, MagicMock, patch, call
 import asyncio
 from datetime import datetime
 
+from database_async import AsyncDatabase
+
 
 class TestQueueWorker(unittest.TestCase):
     """Тесты для queue_worker"""
 
     def setUp(self):
         """Настройка перед каждым тестом"""
-        self.db_mock = MagicMock()
+        # queue_worker работает с AsyncDatabase: все методы БД - корутины
+        self.db_mock = AsyncMock()
         self.bot_mock = MagicMock()
         self.global_settings_mock = MagicMock()
 
@@ -44,7 +49,7 @@ class TestQueueWorker(unittest.TestCase):
 
                         # Запускаем worker и останавливаем его
                         try:
-                            await asyncio.wait_for(queue_worker(), timeout=0.2)
+                            await asyncio.wait_for(queue_worker(db=self.db_mock), timeout=0.2)
                         except (asyncio.TimeoutError, KeyboardInterrupt):
                             pass
 
@@ -64,7 +69,7 @@ class TestQueueWorker(unittest.TestCase):
                     with patch(
                         "bot.process_and_publish", new_callable=AsyncMock
                     ) as mock_publish:
-                        with patch("bot.config", MagicMock(ADMIN_ID=123)):
+                        with patch("bot.settings.ADMIN_ID", 123):
                             # Настраиваем моки
                             self.global_settings_mock.get_auto_publish_enabled.return_value = (
                                 True
@@ -77,34 +82,36 @@ class TestQueueWorker(unittest.TestCase):
                             # Мокируем очередь: первый вызов возвращает задачу, второй - None
                             call_count = [0]
 
-                            def get_next_side_effect():
+                            def claim_batch_side_effect(*args, **kwargs):
                                 call_count[0] += 1
                                 if call_count[0] == 1:
-                                    return (
-                                        1,
-                                        "https://market.yandex.ru/product/123456",
-                                    )
-                                return None
-
-                            self.db_mock.get_next_from_queue.side_effect = (
-                                get_next_side_effect
+                                    return [
+                                        (
+                                            1,
+                                            "https://market.yandex.ru/product/123456",
+                                        )
+                                    ]
+                                return []
+
+                            self.db_mock.claim_batch.side_effect = (
+                                claim_batch_side_effect
                             )
-                            self.db_mock.mark_as_done = MagicMock()
-                            mock_publish.return_value = True
+                            self.db_mock.mark_as_done = AsyncMock()
+                            mock_publish.return_value = (True, 555)
 
                             # Импортируем queue_worker
                             from bot import queue_worker
 
                             # Запускаем worker на короткое время
                             try:
-                                await asyncio.wait_for(queue_worker(), timeout=0.5)
+                                await asyncio.wait_for(queue_worker(db=self.db_mock), timeout=0.5)
                             except (asyncio.TimeoutError, KeyboardInterrupt):
                                 pass
 
                             # Проверяем что process_and_publish был вызван
                             self.assertTrue(mock_publish.called)
                             # Проверяем что задача была помечена как выполненная
-                            self.db_mock.mark_as_done.assert_called_once_with(1)
+                            self.db_mock.mark_as_done.assert_awaited_once_with(1)
 
         asyncio.run(run_test())
 
@@ -119,7 +126,7 @@ class TestQueueWorker(unittest.TestCase):
                     with patch(
                         "bot.process_and_publish", new_callable=AsyncMock
                     ) as mock_publish:
-                        with patch("bot.config", MagicMock(ADMIN_ID=123)):
+                        with patch("bot.settings.ADMIN_ID", 123):
                             # Настраиваем моки
                             self.global_settings_mock.get_auto_publish_enabled.return_value = (
                                 True
@@ -132,32 +139,34 @@ class TestQueueWorker(unittest.TestCase):
                             # Мокируем очередь
                             call_count = [0]
 
-                            def get_next_side_effect():
+                            def claim_batch_side_effect(*args, **kwargs):
                                 call_count[0] += 1
                                 if call_count[0] == 1:
-                                    return (
-                                        1,
-                                        "https://market.yandex.ru/product/123456",
-                                    )
-                                return None
-
-                            self.db_mock.get_next_from_queue.side_effect = (
-                                get_next_side_effect
+                                    return [
+                                        (
+                                            1,
+                                            "https://market.yandex.ru/product/123456",
+                                        )
+                                    ]
+                                return []
+
+                            self.db_mock.claim_batch.side_effect = (
+                                claim_batch_side_effect
                             )
-                            self.db_mock.mark_as_error = MagicMock()
-                            mock_publish.return_value = False  # Публикация не удалась
+                            self.db_mock.mark_as_error = AsyncMock()
+                            mock_publish.return_value = (False, None)  # Публикация не удалась
 
                             # Импортируем queue_worker
                             from bot import queue_worker
 
                             # Запускаем worker на короткое время
                             try:
-                                await asyncio.wait_for(queue_worker(), timeout=0.5)
+                                await asyncio.wait_for(queue_worker(db=self.db_mock), timeout=0.5)
                             except (asyncio.TimeoutError, KeyboardInterrupt):
                                 pass
 
                             # Проверяем что задача была помечена как ошибка
-                            self.db_mock.mark_as_error.assert_called_once_with(1)
+                            self.db_mock.mark_as_error.assert_awaited_once_with(1)
 
         asyncio.run(run_test())
 
@@ -172,7 +181,7 @@ class TestQueueWorker(unittest.TestCase):
                     with patch(
                         "bot.process_and_publish", new_callable=AsyncMock
                     ) as mock_publish:
-                        with patch("bot.config", MagicMock(ADMIN_ID=123)):
+                        with patch("bot.settings.ADMIN_ID", 123):
                             # Настраиваем моки
                             self.global_settings_mock.get_auto_publish_enabled.return_value = (
                                 True
@@ -185,19 +194,21 @@ class TestQueueWorker(unittest.TestCase):
                             # Мокируем очередь
                             call_count = [0]
 
-                            def get_next_side_effect():
+                            def claim_batch_side_effect(*args, **kwargs):
                                 call_count[0] += 1
                                 if call_count[0] == 1:
-                                    return (
-                                        1,
-                                        "https://market.yandex.ru/product/123456",
-                                    )
-                                return None
-
-                            self.db_mock.get_next_from_queue.side_effect = (
-                                get_next_side_effect
+                                    return [
+                                        (
+                                            1,
+                                            "https://market.yandex.ru/product/123456",
+                                        )
+                                    ]
+                                return []
+
+                            self.db_mock.claim_batch.side_effect = (
+                                claim_batch_side_effect
                             )
-                            self.db_mock.mark_as_error = MagicMock()
+                            self.db_mock.mark_as_error = AsyncMock()
                             mock_publish.side_effect = Exception("Test error")
 
                             # Импортируем queue_worker
@@ -205,12 +216,12 @@ class TestQueueWorker(unittest.TestCase):
 
                             # Запускаем worker на короткое время
                             try:
-                                await asyncio.wait_for(queue_worker(), timeout=0.5)
+                                await asyncio.wait_for(queue_worker(db=self.db_mock), timeout=0.5)
                             except (asyncio.TimeoutError, KeyboardInterrupt):
                                 pass
 
                             # Проверяем что задача была помечена как ошибка
-                            self.db_mock.mark_as_error.assert_called_once_with(1)
+                            self.db_mock.mark_as_error.assert_awaited_once_with(1)
 
         asyncio.run(run_test())
 
@@ -241,14 +252,14 @@ class TestQueueWorker(unittest.TestCase):
                             "interval": 1,
                         }
 
-                        self.db_mock.get_next_from_queue.return_value = None
+                        self.db_mock.claim_batch.return_value = []
 
                         # Импортируем queue_worker
                         from bot import queue_worker
 
                         # Запускаем worker на короткое время
                         try:
-                            await asyncio.wait_for(queue_worker(), timeout=0.2)
+                            await asyncio.wait_for(queue_worker(db=self.db_mock), timeout=0.2)
                         except (asyncio.TimeoutError, KeyboardInterrupt):
                             pass
 
@@ -258,5 +269,101 @@ class TestQueueWorker(unittest.TestCase):
         asyncio.run(run_test())
 
 
+class TestQueueWorkerAsyncDatabase(unittest.TestCase):
+    """queue_worker поверх настоящего AsyncDatabase: аренда, состояние публикации, done"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, "test.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_publish_path(self):
+        global_settings = MagicMock()
+        global_settings.get_auto_publish_enabled.return_value = True
+        global_settings.get_schedule_settings.return_value = {"enabled": False, "interval": 1}
+
+        async def run_test():
+            async with AsyncDatabase(self.db_file, readers=2) as db:
+                queue_id = await db.add_to_queue("https://market.yandex.ru/product/123456")
+
+                with patch("bot.get_global_settings", return_value=global_settings), \
+                        patch("bot.process_and_publish", new_callable=AsyncMock) as mock_publish:
+                    mock_publish.return_value = (True, 555)
+                    from bot import queue_worker
+
+                    try:
+                        await asyncio.wait_for(queue_worker(db=db), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        pass
+
+                mock_publish.assert_awaited_once()
+                self.assertEqual(mock_publish.await_args.kwargs["queue_id"], queue_id)
+                stats = await db.get_queue_stats()
+                self.assertEqual(stats["published"], 1)
+                entry = await db.get_publishing_entry(queue_id)
+                self.assertEqual(entry["state"], "posted")
+                self.assertEqual(entry["message_id"], 555)
+
+        asyncio.run(run_test())
+
+    def test_force_post_leases_task(self):
+        """Срочный пост арендует товар: при неудаче он возвращается в очередь"""
+
+        async def run_test():
+            async with AsyncDatabase(self.db_file, readers=2) as db:
+                queue_id = await db.add_to_queue("https://market.yandex.ru/product/123456")
+
+                async def publish(url, chat_id=None, queue_id=None):
+                    # Пока товар публикуется, воркер не может его взять
+                    self.assertEqual(await db.claim_batch(1, "queue-worker"), [])
+                    return False, None
+
+                with patch("bot.get_async_db", AsyncMock(return_value=db)), \
+                        patch("bot.process_and_publish", side_effect=publish):
+                    from bot import publish_next_from_queue
+
+                    url, success = await publish_next_from_queue(123)
+                    self.assertEqual((url[-6:], success), ("123456", False))
+                    self.assertEqual(await db.get_queue_count(), 1)
+
+                    publish_mock = AsyncMock(return_value=(True, 555))
+                    with patch("bot.process_and_publish", publish_mock):
+                        url, success = await publish_next_from_queue(123)
+                    self.assertTrue(success)
+                    self.assertEqual(publish_mock.await_args.kwargs["queue_id"], queue_id)
+                    self.assertEqual(await db.get_queue_count(), 0)
+                    self.assertEqual(await publish_next_from_queue(123), (None, False))
+
+        asyncio.run(run_test())
+
+    def test_worker_wakes_on_add_to_queue(self):
+        """Пустая очередь: воркер ждет сигнала add_to_queue, а не опрашивает раз в минуту"""
+        global_settings = MagicMock()
+        global_settings.get_auto_publish_enabled.return_value = True
+        global_settings.get_schedule_settings.return_value = {"enabled": False, "interval": 60}
+
+        async def run_test():
+            async with AsyncDatabase(self.db_file, readers=2) as db:
+                with patch("bot.get_global_settings", return_value=global_settings), \
+                        patch("bot.process_and_publish", new_callable=AsyncMock) as mock_publish:
+                    mock_publish.return_value = (True, 555)
+                    from bot import queue_worker
+
+                    worker = asyncio.create_task(queue_worker(db=db))
+                    await asyncio.sleep(0.2)
+                    mock_publish.assert_not_awaited()
+                    queue_id = await db.add_to_queue("https://market.yandex.ru/product/123456")
+                    await asyncio.sleep(0.3)
+                    worker.cancel()
+                    await asyncio.gather(worker, return_exceptions=True)
+
+                mock_publish.assert_awaited_once()
+                self.assertEqual(mock_publish.await_args.kwargs["queue_id"], queue_id)
+
+        asyncio.run(run_test())
+
+
 if __name__ == "__main__":
     unittest.main()
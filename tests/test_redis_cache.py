@@ -0,0 +1,142 @@
+# tests/test_redis_cache.py
+"""Тесты буфера публикации и seen_products в redis_cache.py (fakeredis)"""
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+import fakeredis
+
+from redis_cache import PUBLISH_BUFFER_KEY, PUBLISH_CONSUMERS_KEY, RedisCache, _inflight_keys
+from services.dedup_service import DedupService
+
+
+def make_cache(server: fakeredis.FakeServer) -> RedisCache:
+    """RedisCache поверх fakeredis (общий server - как несколько процессов на одном Redis)"""
+    def fake_redis(**kwargs):
+        return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    with patch("config.USE_REDIS", True), patch("redis.Redis", fake_redis):
+        return RedisCache()
+
+
+class TestPublishBuffer(unittest.TestCase):
+    """enqueue / dequeue с in-flight / ack / reaper"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.cache = make_cache(self.server)
+
+    def test_priority_and_ack(self):
+        """Items выдаются по приоритету, ack убирает их из in-flight"""
+        self.cache.enqueue_publish_item({"title": "low"}, priority=10)
+        self.cache.enqueue_publish_item({"title": "high"}, priority=500)
+
+        items = self.cache.dequeue_publish_items(count=1, consumer_id="c1")
+        self.assertEqual([item["title"] for item in items], ["high"])
+        self.assertEqual(self.cache.get_inflight_count(), 1)
+        self.assertEqual(self.cache.get_publish_queue_size(), 1)
+
+        self.assertEqual(self.cache.ack_publish_items(items, "c1"), 1)
+        self.assertEqual(self.cache.get_inflight_count(), 0)
+
+    def test_claims_do_not_overlap(self):
+        """Два consumer не получают один и тот же item"""
+        other = make_cache(self.server)
+        for i in range(4):
+            self.cache.enqueue_publish_item({"title": f"item-{i}"})
+
+        first = self.cache.dequeue_publish_items(count=2, consumer_id="c1")
+        second = other.dequeue_publish_items(count=3, consumer_id="c2")
+
+        titles = [item["title"] for item in first + second]
+        self.assertEqual(len(titles), 4)
+        self.assertEqual(len(set(titles)), 4)
+        self.assertEqual(self.cache.dequeue_publish_items(count=1, consumer_id="c1"), [])
+
+    def test_expired_items_reaped_with_original_priority(self):
+        """Неподтвержденный item возвращается в буфер с исходным score"""
+        self.cache.enqueue_publish_item({"title": "stuck"}, priority=500)
+        score = self.cache.client.zscore(PUBLISH_BUFFER_KEY, '{"title": "stuck"}')
+        self.cache.dequeue_publish_items(count=1, consumer_id="dead", visibility_timeout=-1)
+        self.cache.enqueue_publish_item({"title": "fresh"}, priority=10)
+
+        self.assertEqual(self.cache.reap_expired_publish_items(), 1)
+
+        self.assertEqual(self.cache.client.zscore(PUBLISH_BUFFER_KEY, '{"title": "stuck"}'), score)
+        self.assertEqual(self.cache.peek_publish_queue(1)[0]["title"], "stuck")
+        # Опустевший consumer убран из множества
+        self.assertFalse(self.cache.client.sismember(PUBLISH_CONSUMERS_KEY, "dead"))
+
+    def test_reaper_keeps_consumer_with_live_items(self):
+        """Consumer с неистекшими items остается в множестве, его items не трогаются"""
+        self.cache.enqueue_publish_item({"title": "busy"})
+        self.cache.dequeue_publish_items(count=1, consumer_id="c1", visibility_timeout=300)
+
+        self.assertEqual(self.cache.reap_expired_publish_items(), 0)
+        self.assertTrue(self.cache.client.sismember(PUBLISH_CONSUMERS_KEY, "c1"))
+        self.assertEqual(self.cache.client.zcard(_inflight_keys("c1")[0]), 1)
+
+    def test_reap_script_drops_only_empty_consumer(self):
+        """Проверка пустоты in-flight и SREM выполняются в скрипте атомарно"""
+        inflight_key, scores_key = _inflight_keys("c1")
+        self.cache.client.sadd(PUBLISH_CONSUMERS_KEY, "c1")
+        self.cache.client.zadd(inflight_key, {"item": time.time() + 300})
+
+        keys = [PUBLISH_BUFFER_KEY, inflight_key, scores_key, PUBLISH_CONSUMERS_KEY]
+        self.assertEqual(self.cache._reap_script(keys=keys, args=[time.time(), "c1"]), 0)
+        self.assertTrue(self.cache.client.sismember(PUBLISH_CONSUMERS_KEY, "c1"))
+
+        self.cache.client.zrem(inflight_key, "item")
+        self.cache._reap_script(keys=keys, args=[time.time(), "c1"])
+        self.assertFalse(self.cache.client.sismember(PUBLISH_CONSUMERS_KEY, "c1"))
+
+    def test_requeue_moves_item_back(self):
+        """requeue убирает item из in-flight и кладет в буфер"""
+        self.cache.enqueue_publish_item({"title": "retry"})
+        item = self.cache.dequeue_publish_items(count=1, consumer_id="c1")[0]
+
+        self.assertTrue(self.cache.requeue_publish_item(item, "c1", priority=50))
+        self.assertEqual(self.cache.get_inflight_count(), 0)
+        self.assertEqual(self.cache.get_publish_queue_size(), 1)
+
+
+class TestSeenProductsDedup(unittest.TestCase):
+    """DedupService (Bloom + SET NX) поверх настоящих команд Redis"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def test_claim_is_exclusive_between_processes(self):
+        products = [
+            {"market_id": str(300000 + i), "title": f"Product {i}",
+             "url": f"https://market.yandex.ru/product--item/{300000 + i}"}
+            for i in range(3)
+        ]
+        first = DedupService(redis=make_cache(self.server), capacity=1000)
+        second = DedupService(redis=make_cache(self.server), capacity=1000)
+
+        # Оба процесса видят товары новыми, первый успевает захватить два из них
+        candidates = asyncio.run(second.filter_new(products))
+        self.assertEqual(asyncio.run(first.claim_new(products[:2])), products[:2])
+        self.assertEqual(asyncio.run(second.claim(candidates)), [products[2]])
+        self.assertEqual(second.metrics["claim_conflicts"], 2)
+
+        # Свои товары первый процесс отсекает фильтром (Redis подтверждает),
+        # захваченный вторым - отклоняет SET NX
+        self.assertEqual(asyncio.run(first.filter_new(products[:2])), [])
+        self.assertEqual(first.metrics["confirmed_duplicates"], 2)
+        self.assertEqual(asyncio.run(first.claim_new([products[2]])), [])
+
+    def test_snapshot_restores_filter(self):
+        cache = make_cache(self.server)
+        product = {"market_id": "400000", "title": "P", "url": "https://market.yandex.ru/product--p/400000"}
+        asyncio.run(DedupService(redis=cache, capacity=1000).claim_new([product]))
+
+        restored = DedupService(redis=make_cache(self.server), capacity=1000)
+        self.assertEqual(asyncio.run(restored.filter_new([product])), [])
+        self.assertEqual(restored.metrics["bloom_hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+# tests/test_scheduler_service.py
+"""Тесты для services/scheduler_service.py и services/leader_lease.py"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from services.leader_lease import MemoryLeaseStore, SQLiteLeaseStore
+from services.scheduler_service import SchedulerService
+
+
+class TestSchedulerService(unittest.TestCase):
+    """Точные срабатывания, защита от наложения, одна реплика на singleton-задачу"""
+
+    def test_interval_runs_and_overlap_protection(self):
+        runs = []
+        active = []
+
+        async def slow():
+            active.append(1)
+            self.assertEqual(len(active), 1)  # выполнения не накладываются
+            runs.append(time.monotonic())
+            await asyncio.sleep(0.25)
+            active.pop()
+
+        async def scenario():
+            scheduler = SchedulerService(store=MemoryLeaseStore(), owner="a")
+            job = scheduler.add_interval_task(0.1, slow, name="slow", jitter=0)
+            await scheduler.start()
+            await asyncio.sleep(0.6)
+            await scheduler.stop()
+            return job
+
+        job = asyncio.run(scenario())
+        self.assertGreaterEqual(len(runs), 2)
+        self.assertGreater(job.skipped, 0)
+
+    def test_singleton_job_runs_on_one_replica(self):
+        calls = {"a": 0, "b": 0}
+
+        def make(owner):
+            async def tick():
+                calls[owner] += 1
+                await asyncio.sleep(0.02)
+            return tick
+
+        async def scenario():
+            store = MemoryLeaseStore()
+            replicas = []
+            for owner in ("a", "b"):
+                scheduler = SchedulerService(store=store, owner=owner)
+                scheduler.add_interval_task(0.3, make(owner), name="report", jitter=0.05)
+                replicas.append(scheduler)
+            for scheduler in replicas:
+                await scheduler.start()
+            await asyncio.sleep(1.0)
+            for scheduler in replicas:
+                await scheduler.stop()
+
+        asyncio.run(scenario())
+        total = calls["a"] + calls["b"]
+        # Периоды: 0, 0.3, 0.6, 0.9 - без аренды было бы вдвое больше запусков
+        self.assertGreaterEqual(total, 3)
+        self.assertLessEqual(total, 5)
+
+    def test_missed_runs_caught_up_on_start(self):
+        store = MemoryLeaseStore()
+        now = time.time()
+        store.set_last_run("backup", now - 2 * 86400)  # процесс стоял двое суток
+        store.set_last_run("fresh", now - 60)
+        earlier = datetime.now() - timedelta(hours=1)
+        store.set_last_run("daily", now - 86400 - 7200)  # вчерашний запуск, сегодняшний пропущен
+        calls = []
+
+        def record(name):
+            return lambda: calls.append(name)
+
+        async def scenario():
+            scheduler = SchedulerService(store=store, owner="a")
+            scheduler.add_interval_task(86400, record("backup"), name="backup", initial_delay=0.05, jitter=0)
+            scheduler.add_interval_task(3600, record("fresh"), name="fresh")
+            scheduler.add_daily_task(earlier.hour, earlier.minute, record("daily"), name="daily", jitter=0)
+            await scheduler.start()
+            await asyncio.sleep(0.2)
+            jobs = {job["name"]: job for job in scheduler.get_jobs()}
+            await scheduler.stop()
+            return jobs
+
+        jobs = asyncio.run(scenario())
+        self.assertEqual(sorted(calls), ["backup", "daily"])  # пропущенная копия - одна, не две
+        self.assertGreater(store.get_last_run("backup"), now)
+        # Следующий запуск - через полный интервал после догоняющего
+        next_backup = datetime.fromisoformat(jobs["backup"]["next_run"]).timestamp()
+        self.assertGreater(next_backup, now + 86400 - 400)
+
+
+class TestSQLiteLeaseStore(unittest.TestCase):
+    def test_lease_exclusive_until_expired(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "bot.db")
+            a, b = SQLiteLeaseStore(db_file), SQLiteLeaseStore(db_file)
+
+            self.assertTrue(a.try_acquire("backup", "host:1", ttl=60))
+            self.assertFalse(b.try_acquire("backup", "host:2", ttl=60))
+            self.assertTrue(a.renew("backup", "host:1", ttl=60))
+            self.assertFalse(b.renew("backup", "host:2", ttl=60))
+
+            a.set_last_run("backup", 123.0)
+            a.release("backup", "host:1")
+            self.assertTrue(b.try_acquire("backup", "host:2", ttl=0.01))
+            time.sleep(0.02)
+            self.assertTrue(a.try_acquire("backup", "host:1", ttl=60))  # аренда упавшей реплики истекла
+            self.assertEqual(b.get_last_run("backup"), 123.0)
+            a.connection.close()
+            b.connection.close()
+
+    def test_scheduler_calls_store_off_event_loop(self):
+        """Блокирующие запросы SQLite не выполняются в потоке цикла событий"""
+        threads = set()
+
+        class RecordingStore(SQLiteLeaseStore):
+            def try_acquire(self, *args):
+                threads.add(threading.get_ident())
+                return super().try_acquire(*args)
+
+            def get_last_run(self, *args):
+                threads.add(threading.get_ident())
+                return super().get_last_run(*args)
+
+        async def scenario():
+            scheduler = SchedulerService(store=store, owner="a")
+            scheduler.add_interval_task(60, lambda: None, name="tick", jitter=0)
+            await scheduler.start()
+            self.assertTrue(await scheduler.run_job("tick"))
+            await scheduler.stop()
+            return threading.get_ident()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = RecordingStore(os.path.join(tmp, "bot.db"))
+            loop_thread = asyncio.run(scenario())
+            self.assertTrue(threads)
+            self.assertNotIn(loop_thread, threads)
+            self.assertIsNotNone(store.get_last_run("tick"))
+            store.connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# tests/test_smart_search_service.py
+"""Тесты для services/smart_search_service.py"""
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+from bs4 import BeautifulSoup
+
+from services.smart_search_service import SmartSearchService
+
+
+class TestSmartSearchPages(unittest.TestCase):
+    """Страницы поиска проходят через конвейер каждая по своему URL"""
+
+    def setUp(self):
+        self.service = SmartSearchService()
+        self.service.db = MagicMock()
+
+    def test_build_search_url_page_param(self):
+        first = parse_qs(urlparse(self.service._build_search_url("наушники", 1)).query)
+        third = parse_qs(urlparse(self.service._build_search_url("наушники", 3)).query)
+        self.assertEqual(first, {"text": ["наушники"]})
+        self.assertEqual(third, {"text": ["наушники"], "page": ["3"]})
+
+    def test_every_page_fetched_and_last_page_saved(self):
+        fetched = []
+
+        async def fetch(url):
+            fetched.append(url)
+            return "<html></html>"
+
+        async def parse(page):
+            return [{"market_id": page.url}]
+
+        async def claim(products):
+            return []
+
+        with patch.object(self.service, "_fetch_search_page", side_effect=fetch), \
+                patch.object(self.service, "_parse_search_page", side_effect=parse), \
+                patch.object(self.service, "_claim_new_products", side_effect=claim), \
+                patch.object(self.service, "_get_publish_backlog", return_value=0):
+            added, skipped = asyncio.run(
+                self.service._run_smart_search("наушники", start_page=2, max_pages=3)
+            )
+
+        self.assertEqual((added, skipped), (0, 3))
+        pages = sorted(int(parse_qs(urlparse(url).query)["page"][0]) for url in fetched)
+        self.assertEqual(pages, [2, 3, 4])
+        last_pages = [c.kwargs["last_page"] for c in self.service.db.update_search_key.call_args_list]
+        self.assertEqual(max(last_pages), 4)
+        self.assertEqual(len(last_pages), len(set(last_pages)))
+
+
+class TestParsedProductIds(unittest.TestCase):
+    """id товаров без marketId не зависят от PYTHONHASHSEED"""
+
+    def setUp(self):
+        self.service = SmartSearchService()
+
+    def test_snippet_and_json_ld_ids_stable(self):
+        snippet = BeautifulSoup(
+            '<div><h3 class="snippet-title">Чайник Bosch</h3><a href="/product/1">x</a></div>',
+            "html.parser",
+        ).div
+        product = self.service._parse_product_snippet(snippet)
+        self.assertEqual((product["id"], product["market_id"]), ("parsed_5827", "parsed_5827"))
+
+        soup = BeautifulSoup(
+            '<script type="application/ld+json">[{"@type": "Product", "name": "Чайник Bosch"}]</script>',
+            "html.parser",
+        )
+        products = self.service._extract_products_from_json_ld(soup)
+        self.assertEqual([p["id"] for p in products], ["jsonld_5827"])
+
+
+if __name__ == "__main__":
+    unittest.main()
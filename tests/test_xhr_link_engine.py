@@ -0,0 +1,143 @@
+# tests/test_xhr_link_engine.py
+"""Тесты для services/xhr_link_engine.py и utils/xhr_template_cache.py"""
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from services.xhr_link_engine import XHRLinkEngine
+from utils.xhr_template_cache import XHRTemplateCache, build_template, render_template
+
+PRODUCT_A = "https://market.yandex.ru/product--phone/123456789"
+PRODUCT_B = "https://market.yandex.ru/product--laptop/987654321"
+
+CAPTURED_XHR = {
+    "method": "POST",
+    "url": "https://market.yandex.ru/api/share?productId=123456789",
+    "headers": {"cookie": "yandexuid=42; _ym_d=1", "user-agent": "UA", "referer": PRODUCT_A},
+    "body": json.dumps({"productId": "123456789", "url": PRODUCT_A}),
+}
+
+
+class TestXHRTemplate(unittest.TestCase):
+    """Обобщение захваченного XHR по товару"""
+
+    def test_build_and_render(self):
+        """Шаблон подставляет id и URL другого товара"""
+        template = build_template(CAPTURED_XHR, PRODUCT_A)
+        self.assertNotIn("123456789", json.dumps(template))
+        self.assertNotIn("referer", template["headers"])
+
+        rendered = render_template(template, PRODUCT_B)
+        self.assertEqual(rendered["url"], "https://market.yandex.ru/api/share?productId=987654321")
+        self.assertEqual(json.loads(rendered["body"]), {"productId": "987654321", "url": PRODUCT_B})
+
+    def test_unrelated_xhr_is_not_template(self):
+        """XHR без id товара нельзя переиспользовать"""
+        xhr = {"method": "GET", "url": "https://market.yandex.ru/api/user", "headers": {}, "body": None}
+        self.assertIsNone(build_template(xhr, PRODUCT_A))
+
+
+class TestXHRLinkEngine(unittest.TestCase):
+    """Шаблон-first генерация ссылок"""
+
+    def setUp(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.remove(path)
+        self.cache_file = Path(path)
+        self.engine = XHRLinkEngine(templates=XHRTemplateCache(cache_file=self.cache_file), concurrency=4)
+
+    def tearDown(self):
+        if self.cache_file.exists():
+            self.cache_file.unlink()
+
+    def test_replay_for_new_products(self):
+        """После обучения ссылки для других товаров получаются без браузера"""
+        replayed = []
+
+        async def fake_reproduce(xhr_info, cookies=None, timeout=None, product_url=None, user_agent=None):
+            replayed.append(xhr_info["url"])
+            product_id = xhr_info["url"].rsplit("=", 1)[1]
+            return {"shortUrl": f"https://market.yandex.ru/cc/{product_id[-4:]}"}
+
+        async def scenario():
+            self.assertIsNone(await self.engine.generate(PRODUCT_B))
+            self.assertTrue(await self.engine.learn(CAPTURED_XHR, PRODUCT_A))
+            with patch("utils.xhr_reproducer.reproduce_xhr_directly", fake_reproduce):
+                return await self.engine.generate_many([PRODUCT_A, PRODUCT_B])
+
+        links = asyncio.run(scenario())
+
+        self.assertEqual(links, {
+            PRODUCT_A: "https://market.yandex.ru/cc/6789",
+            PRODUCT_B: "https://market.yandex.ru/cc/4321",
+        })
+        self.assertEqual(len(replayed), 2)
+        stats = self.engine.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertTrue(all(t["healthy"] for t in stats["templates"].values()))
+
+    def test_failing_template_is_benched(self):
+        """После серии неудач шаблон не используется, запросы идут в браузер"""
+        calls = []
+
+        async def failing_reproduce(xhr_info, **kwargs):
+            calls.append(xhr_info["url"])
+            return None
+
+        async def scenario():
+            await self.engine.learn(CAPTURED_XHR, PRODUCT_A)
+            with patch("utils.xhr_reproducer.reproduce_xhr_directly", failing_reproduce):
+                return [await self.engine.generate(PRODUCT_B) for _ in range(5)]
+
+        links = asyncio.run(scenario())
+
+        self.assertEqual(links, [None] * 5)
+        self.assertEqual(len(calls), 3)  # XHR_TEMPLATE_MAX_FAILURES
+        stats = self.engine.get_stats()
+        self.assertEqual((stats["failures"], stats["misses"]), (3, 2))
+        self.assertFalse(any(t["healthy"] for t in stats["templates"].values()))
+
+
+class TestYandexMarketLinkGenFastPath(unittest.TestCase):
+    """YandexMarketLinkGen.generate берет ссылку из шаблона, не открывая браузер"""
+
+    def setUp(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.remove(path)
+        self.cache_file = Path(path)
+        self.engine = XHRLinkEngine(templates=XHRTemplateCache(cache_file=self.cache_file))
+
+    def tearDown(self):
+        if self.cache_file.exists():
+            self.cache_file.unlink()
+
+    def test_template_link_returned_before_browser(self):
+        from utils.yandex_market_link_gen import YandexMarketLinkGen
+
+        async def fake_reproduce(xhr_info, **kwargs):
+            return {"shortUrl": "https://market.yandex.ru/cc/ABCDEF"}
+
+        def no_browser():
+            raise AssertionError("browser must not be started")
+
+        async def scenario():
+            await self.engine.learn(CAPTURED_XHR, PRODUCT_A)
+            gen = YandexMarketLinkGen(headless=True)
+            with patch("services.xhr_link_engine.get_xhr_link_engine", return_value=self.engine), \
+                    patch("utils.xhr_reproducer.reproduce_xhr_directly", fake_reproduce), \
+                    patch("playwright.async_api.async_playwright", no_browser), \
+                    patch.object(gen, "_try_distribution_method", AsyncMock(return_value=None)):
+                return await gen.generate(PRODUCT_B)
+
+        self.assertEqual(asyncio.run(scenario()), "https://market.yandex.ru/cc/ABCDEF")
+        self.assertEqual(self.engine.get_stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# utils/history_rollups.py
+"""
+Корзины history_rollups - общие для database.py и database_async.py
+
+Пост попадает в почасовую и дневную корзину каждого среза: all, category,
+brand, template (template_type) и price_band (цена на момент публикации).
+Корзины дописываются при вставке в history (add_post_to_history) и
+периодическим компактором (refresh_history_rollups), чтения их только читают.
+"""
+from typing import List, Optional, Tuple
+
+# Ценовые диапазоны для аналитики (верхняя граница не включается)
+PRICE_BANDS = (
+    (1000, "До 1000 ₽"),
+    (5000, "1000-4999 ₽"),
+    (10000, "5000-9999 ₽"),
+    (20000, "10000-19999 ₽"),
+    (None, "20000+ ₽"),
+)
+
+# Срезы history_rollups: all (все посты), category, brand, template (template_type), price_band
+ROLLUP_DIMENSIONS = ("all", "category", "brand", "template", "price_band")
+# Колонки history, нужные history_rollup_keys
+ROLLUP_HISTORY_COLUMNS = (
+    "id, date_added, category, brand, template_type, last_price, COALESCE(deleted, 0) AS deleted"
+)
+# Последний history.id, учтенный в history_rollups (bot_settings)
+ROLLUP_WATERMARK_KEY = "history_rollup_last_id"
+
+
+def price_band(price: Optional[float]) -> Optional[str]:
+    """Название ценового диапазона (None - цена не указана)"""
+    if price is None:
+        return None
+    for upper, label in PRICE_BANDS:
+        if upper is None or price < upper:
+            return label
+    return None
+
+
+def history_rollup_keys(row) -> List[Tuple[str, str, str, str]]:
+    """Корзины (granularity, dimension, bucket, value), в которые попадает пост"""
+    date_added = str(row["date_added"] or "")
+    if len(date_added) < 13:
+        return []
+    buckets = (("day", date_added[:10]), ("hour", f"{date_added[:10]} {date_added[11:13]}"))
+    values = [
+        ("all", ""),
+        ("category", row["category"] or ""),
+        ("brand", row["brand"] or ""),
+        ("template", row["template_type"] or ""),
+    ]
+    band = price_band(row["last_price"])
+    if band:
+        values.append(("price_band", band))
+    return [
+        (granularity, dimension, bucket, value)
+        for granularity, bucket in buckets
+        for dimension, value in values
+    ]
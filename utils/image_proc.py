@@ -1,49 +1,322 @@
 # utils/image_proc.py
+"""
+Подготовка картинки к отправке в Telegram
+
+JPEG кодируется в памяти сразу под лимит размера: качество (и при
+необходимости размеры) подбираются заранее бинарным поиском на прокси из
+полноразмерных фрагментов, полное кодирование обычно одно.
+
+Готовые рендеры лежат в ограниченном дисковом кэше по ключу (md5 исходника,
+параметры рендера, версия пайплайна), так что повторная публикация той же
+картинки обработку пропускает. Рядом хранится Telegram file_id первой
+загрузки - повторная отправка того же рендера идет без upload.
+"""
 import os
 import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Optional
 from PIL import Image
 from io import BytesIO
 import logging
 
+import config
+
 logger = logging.getLogger(__name__)
 
+# Прокси для оценки размера: сетка TILES x TILES фрагментов TILE_SIZE px без
+# уменьшения (уменьшенная копия завышает байт/пиксель и занижала бы качество)
+PROXY_TILES = 3
+PROXY_TILE_SIZE = 128
+
+# Запас на погрешность оценки
+SIZE_SAFETY = 0.9
+
+# Качество при уменьшении размеров (как в прежнем fallback)
+RESIZE_QUALITY = 85
+
 
 def md5_bytes(b: bytes) -> str:
     return hashlib.md5(b).hexdigest()
 
 
-def process_image(image_bytes: bytes, max_mb: int = 5) -> tuple[str, str]:
+def render_key(source_md5: str, **params) -> str:
+    """
+    Ключ рендера: md5 исходника + параметры (цена, скидка, водяной знак, версия пайплайна...)
+    """
+    payload = json.dumps([source_md5, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()
+
+
+def _encode(img: Image.Image, quality: int) -> bytes:
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _size_proxy(img: Image.Image) -> Image.Image:
+    """Полноразмерные фрагменты по сетке, склеенные в одну картинку"""
+    width, height = img.size
+    tile_w = min(PROXY_TILE_SIZE, width // PROXY_TILES or width)
+    tile_h = min(PROXY_TILE_SIZE, height // PROXY_TILES or height)
+    proxy = Image.new("RGB", (tile_w * PROXY_TILES, tile_h * PROXY_TILES))
+    for row in range(PROXY_TILES):
+        for col in range(PROXY_TILES):
+            # Центр фрагмента - в центре своей ячейки сетки
+            x = (2 * col + 1) * width // (2 * PROXY_TILES) - tile_w // 2
+            y = (2 * row + 1) * height // (2 * PROXY_TILES) - tile_h // 2
+            tile = img.crop((x, y, x + tile_w, y + tile_h))
+            proxy.paste(tile, (col * tile_w, row * tile_h))
+    return proxy
+
+
+def _pick_quality(
+    img: Image.Image, budget: float, max_quality: int, min_quality: int
+) -> tuple[int, float]:
+    """
+    Бинарный поиск максимального качества, при котором оценка влезает в budget
+
+    Returns:
+        (качество, множитель площади; < 1.0 - нужно уменьшить изображение)
+    """
+    proxy = _size_proxy(img)
+    area_ratio = (img.width * img.height) / (proxy.width * proxy.height)
+
+    def estimate(quality: int) -> float:
+        return len(_encode(proxy, quality)) * area_ratio
+
+    if estimate(max_quality) <= budget:
+        return max_quality, 1.0
+    if estimate(min_quality) > budget:
+        # Даже минимальное качество не влезает - уменьшаем площадь
+        return RESIZE_QUALITY, budget / estimate(RESIZE_QUALITY)
+
+    low, high = min_quality, max_quality
+    while high - low > 1:
+        mid = (low + high) // 2
+        if estimate(mid) <= budget:
+            low = mid
+        else:
+            high = mid
+    return low, 1.0
+
+
+def encode_jpeg_to_size(
+    img: Image.Image, max_bytes: int, max_quality: int = 95, min_quality: int = 20
+) -> bytes:
+    """
+    Закодировать изображение в JPEG не больше max_bytes
+
+    Args:
+        img: RGB изображение
+        max_bytes: Лимит размера
+        max_quality: Качество, если лимит позволяет
+        min_quality: Ниже этого качества уменьшаются размеры
+
+    Returns:
+        JPEG байты
+    """
+    # Несжатый RGB не больше лимита - JPEG гарантированно влезет, оценка не нужна
+    if img.width * img.height * 3 <= max_bytes:
+        return _encode(img, max_quality)
+
+    quality, area_scale = _pick_quality(img, max_bytes * SIZE_SAFETY, max_quality, min_quality)
+    data = None
+    # Оценка почти всегда точна; если нет - пропорционально уменьшаем и кодируем снова
+    for _ in range(3):
+        if area_scale < 1.0:
+            side_scale = area_scale ** 0.5
+            new_size = (max(1, int(img.width * side_scale)), max(1, int(img.height * side_scale)))
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        data = _encode(img, quality)
+        if len(data) <= max_bytes:
+            return data
+        area_scale = max_bytes * SIZE_SAFETY / len(data)
+    return data
+
+
+class ProcessedImageCache:
+    """
+    Дисковый кэш готовых JPEG по ключу рендера (render_key) и их Telegram file_id
+    Ограничен по суммарному размеру, вытесняются давно не использованные (mtime)
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or config.IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes or config.IMAGE_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "file_id_hits": 0, "file_id_misses": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total = sum(size for _, _, size in self._entries())
+
+    def _path(self, key: str, ext: str = "jpg") -> str:
+        return os.path.join(self.cache_dir, f"{key}.{ext}")
+
+    def _entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith((".jpg", ".fid")):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # отметка использования для LRU
+            return data
+        except OSError:
+            return None
+
+    def _write(self, path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Image cache write failed for %s: %s", path, e)
+            return
+        with self._lock:
+            self._total += len(data) - old_size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._read(self._path(key))
+        self.stats["hits" if data is not None else "misses"] += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._write(self._path(key), data)
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """Telegram file_id ранее загруженного рендера"""
+        data = self._read(self._path(key, "fid"))
+        self.stats["file_id_hits" if data else "file_id_misses"] += 1
+        return data.decode("utf-8") if data else None
+
+    def set_file_id(self, key: str, file_id: str) -> None:
+        self._write(self._path(key, "fid"), file_id.encode("utf-8"))
+
+    def forget_file_id(self, key: str) -> None:
+        """Убрать file_id, который Telegram больше не принимает"""
+        path = self._path(key, "fid")
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._total -= size
+
+    def _evict(self) -> None:
+        """Удалить самые старые файлы до 90% лимита"""
+        entries = sorted(self._entries())
+        self._total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self._total -= size
+                self.stats["evictions"] += 1
+            except OSError:
+                continue
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "bytes": self._total, "dir": self.cache_dir}
+
+
+# Глобальный кэш готовых картинок
+_processed_image_cache: Optional[ProcessedImageCache] = None
+
+
+def get_processed_image_cache() -> ProcessedImageCache:
+    """Получить глобальный кэш готовых картинок"""
+    global _processed_image_cache
+    if _processed_image_cache is None:
+        _processed_image_cache = ProcessedImageCache()
+    return _processed_image_cache
+
+
+@dataclass
+class PreparedImage:
+    """Готовый к отправке JPEG"""
+
+    data: bytes
+    source_md5: str
+    key: str  # ключ рендера в ProcessedImageCache (для file_id)
+
+
+def prepare_image_cached(
+    image_bytes: bytes, max_mb: int = 5, enhance: bool = False
+) -> PreparedImage:
     """
-    Save to /tmp/<md5>.jpg, compress if needed, return (path, md5).
+    Готовый JPEG для отправки: из кэша или одно декодирование + кодирование под лимит.
+    EXIF не переносится (PIL не сохраняет его без явного exif=).
+
+    Args:
+        image_bytes: Исходные байты картинки
+        max_mb: Лимит размера результата
+        enhance: Применить базовое улучшение (контраст/резкость)
+
+    Returns:
+        PreparedImage
     """
+    from services.image_service import IMAGE_PIPELINE_VERSION, decode_image, enhance as enhance_image
+
     md5_hash = md5_bytes(image_bytes)
-    temp_dir = "/tmp"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_filename = os.path.join(temp_dir, f"{md5_hash}.jpg")
+    key = render_key(
+        md5_hash, op="post", max_mb=max_mb, enhance=enhance, version=IMAGE_PIPELINE_VERSION
+    )
+    cache = get_processed_image_cache()
+
+    cached = cache.get(key)
+    if cached is not None:
+        logger.debug("Processed image cache hit %s", key)
+        return PreparedImage(cached, md5_hash, key)
+
+    img = decode_image(image_bytes, max_width=None)
+    if enhance:
+        img = enhance_image(img)
+    data = encode_jpeg_to_size(img, max_mb * 1024 * 1024)
+    cache.put(key, data)
+
+    logger.info("Prepared image %s size=%d bytes", key, len(data))
+    return PreparedImage(data, md5_hash, key)
 
-    img = Image.open(BytesIO(image_bytes))
-    if img.mode != "RGB":
-        img = img.convert("RGB")
 
-    quality = 95
-    img.save(temp_filename, "JPEG", quality=quality, optimize=True)
+def prepare_image(
+    image_bytes: bytes, max_mb: int = 5, enhance: bool = False
+) -> tuple[bytes, str]:
+    """
+    То же, что prepare_image_cached
+
+    Returns:
+        (JPEG байты, md5 исходника)
+    """
+    prepared = prepare_image_cached(image_bytes, max_mb, enhance)
+    return prepared.data, prepared.source_md5
 
-    # compress loop
-    while os.path.getsize(temp_filename) > max_mb * 1024 * 1024 and quality > 20:
-        quality -= 10
-        img.save(temp_filename, "JPEG", quality=quality, optimize=True)
 
-    # final fallback: resize
-    if os.path.getsize(temp_filename) > max_mb * 1024 * 1024:
-        w, h = img.size
-        new_w = int(w * 0.8)
-        new_h = int(h * 0.8)
-        img = img.resize((new_w, new_h), Image.LANCZOS)
-        img.save(temp_filename, "JPEG", quality=85, optimize=True)
+def process_image(image_bytes: bytes, max_mb: int = 5) -> tuple[str, str]:
+    """
+    Save to /tmp/<md5>.jpg (prepared via prepare_image), return (path, md5).
+    """
+    data, md5_hash = prepare_image(image_bytes, max_mb)
+    temp_dir = "/tmp"
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_filename = os.path.join(temp_dir, f"{md5_hash}.jpg")
+    with open(temp_filename, "wb") as f:
+        f.write(data)
 
     logger.info(
         "Saved processed image %s size=%d bytes",
         temp_filename,
-        os.path.getsize(temp_filename),
+        len(data),
     )
     return temp_filename, md5_hash
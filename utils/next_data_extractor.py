@@ -0,0 +1,247 @@
+# utils/next_data_extractor.py
+"""
+Быстрое извлечение товаров из встроенного JSON страниц Яндекс.Маркета
+
+Вместо BeautifulSoup по всему документу (DOM из десятков тысяч узлов ради
+одного <script>) и широких регулярок:
+  1. тег __NEXT_DATA__ / window.__STATE__ ищется простым find по str/bytes;
+  2. из документа берутся только границы JSON (html целиком не копируется);
+  3. по ключам пути (с учетом вложенности) находится начало списка
+     товаров, и разбирается только он (JSONDecoder.raw_decode
+     останавливается на конце значения).
+
+Если быстрый путь не сработал (по пути не список товаров, битый JSON),
+blob разбирается целиком - через orjson, если он установлен.
+
+Бенчмарк против пути через BeautifulSoup: scripts/benchmark_next_data.py
+"""
+import json
+import logging
+from json.decoder import scanstring
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+Html = Union[str, bytes]
+
+# Путь к товарам в __NEXT_DATA__ (может меняться, но этот сейчас рабочий)
+NEXT_DATA_ITEMS_PATH: Tuple[str, ...] = ("props", "pageProps", "initialState", "search", "results", "items")
+# В window.__STATE__ тот же подграф лежит без обертки Next.js
+WINDOW_STATE_ITEMS_PATH: Tuple[str, ...] = ("search", "results", "items")
+
+_NEXT_DATA_MARKERS = ('id="__NEXT_DATA__"', "id='__NEXT_DATA__'", "id=__NEXT_DATA__")
+_WINDOW_STATE_MARKER = "window.__STATE__"
+_SCRIPT_END = "</script>"
+_WHITESPACE = " \t\r\n"
+
+_decoder = json.JSONDecoder()
+
+# Счетчики для бенчмарка и мониторинга (свои в каждом процессе ParseExecutor)
+stats = {"subtree_hits": 0, "full_parses": 0, "not_found": 0, "errors": 0}
+
+
+def _find(html: Html, needle: str, start: int = 0) -> int:
+    if isinstance(html, bytes):
+        return html.find(needle.encode("ascii"), start)
+    return html.find(needle, start)
+
+
+def _decode(chunk: Html) -> str:
+    if isinstance(chunk, (bytes, memoryview)):
+        return bytes(chunk).decode("utf-8", errors="replace")
+    return chunk
+
+
+def locate_next_data(html: Html) -> Optional[Tuple[int, int]]:
+    """
+    Найти границы JSON внутри <script id="__NEXT_DATA__">
+
+    Returns:
+        (start, end) - срез html с JSON или None
+    """
+    for marker in _NEXT_DATA_MARKERS:
+        pos = _find(html, marker)
+        if pos != -1:
+            break
+    else:
+        return None
+
+    start = _find(html, ">", pos)
+    if start == -1:
+        return None
+    start += 1
+    end = _find(html, _SCRIPT_END, start)
+    if end == -1:
+        return None
+    return start, end
+
+
+def locate_window_state(html: Html) -> Optional[Tuple[int, int]]:
+    """
+    Найти границы объекта window.__STATE__ = {...}
+
+    Конец берется по </script>: хвост после объекта (";", другой код)
+    отбрасывает raw_decode, а не нежадная регулярка по "};".
+    """
+    pos = _find(html, _WINDOW_STATE_MARKER)
+    if pos == -1:
+        return None
+    start = _find(html, "{", pos + len(_WINDOW_STATE_MARKER))
+    if start == -1:
+        return None
+    end = _find(html, _SCRIPT_END, start)
+    if end == -1:
+        end = len(html)
+    return start, end
+
+
+def _skip_whitespace(payload: str, pos: int) -> int:
+    while pos < len(payload) and payload[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _find_member(payload: str, pos: int, key: str) -> int:
+    """
+    Позиция значения ключа key среди ключей объекта, начинающегося в pos (или -1)
+
+    Смотрятся только ключи этого уровня: значения соседних ключей
+    пропускаются целиком через raw_decode, вложенные ключи с тем же именем
+    не совпадают. Ключи после найденного не разбираются.
+    """
+    pos = _skip_whitespace(payload, pos + 1)
+    while pos < len(payload) and payload[pos] == '"':
+        name, pos = scanstring(payload, pos + 1)
+        pos = _skip_whitespace(payload, pos)
+        if pos >= len(payload) or payload[pos] != ":":
+            return -1
+        pos = _skip_whitespace(payload, pos + 1)
+        if name == key:
+            return pos
+        _, pos = _decoder.raw_decode(payload, pos)
+        pos = _skip_whitespace(payload, pos)
+        if pos >= len(payload) or payload[pos] != ",":
+            return -1
+        pos = _skip_whitespace(payload, pos + 1)
+    return -1
+
+
+def _locate_subtree(payload: str, path: Sequence[str]) -> int:
+    """
+    Позиция значения по пути ключей (или -1)
+
+    Путь проходится по уровням вложенности: каждый ключ ищется только на
+    верхнем уровне объекта, найденного по предыдущему ключу.
+    """
+    pos = _skip_whitespace(payload, 0)
+    for key in path:
+        if pos >= len(payload) or payload[pos] != "{":
+            return -1
+        pos = _find_member(payload, pos, key)
+        if pos == -1:
+            return -1
+    return pos
+
+
+def _loads(payload: str) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _walk(data: Any, path: Sequence[str]) -> Any:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _is_product(item: Any) -> bool:
+    return isinstance(item, dict) and ("id" in item or "prices" in item)
+
+
+def load_subtree(payload: str, path: Sequence[str], full: bool = True) -> Any:
+    """
+    Разобрать только значение по пути path из JSON-строки payload
+
+    Args:
+        payload: JSON (может содержать хвост после объекта)
+        path: Ключи до нужного значения
+        full: Разрешить полный разбор, если быстрый поиск не сработал
+
+    Returns:
+        Значение или None
+    """
+    try:
+        pos = _locate_subtree(payload, path)
+    except ValueError as e:
+        logger.debug(f"Subtree scan failed: {e}")
+        pos = -1
+    if pos != -1 and pos < len(payload) and payload[pos] == "[":
+        try:
+            value, _ = _decoder.raw_decode(payload, pos)
+            if all(_is_product(item) for item in value):
+                stats["subtree_hits"] += 1
+                return value
+        except ValueError as e:
+            logger.debug(f"Subtree decode failed at {pos}: {e}")
+
+    if not full:
+        return None
+
+    stats["full_parses"] += 1
+    try:
+        data = _loads(payload)
+    except ValueError:
+        # Хвост после объекта (window.__STATE__ = {...}; ...)
+        data, _ = _decoder.raw_decode(payload)
+    return _walk(data, path)
+
+
+def extract_next_data(html: Html) -> Optional[Dict[str, Any]]:
+    """Полный объект __NEXT_DATA__ (для путей, отличных от списка товаров)"""
+    bounds = locate_next_data(html)
+    if not bounds:
+        return None
+    try:
+        return _loads(_decode(html[bounds[0]:bounds[1]]))
+    except ValueError as e:
+        logger.debug(f"Failed to decode __NEXT_DATA__: {e}")
+        stats["errors"] += 1
+        return None
+
+
+def _extract_items(html: Html, bounds: Optional[Tuple[int, int]], path: Sequence[str]) -> Optional[List[Dict]]:
+    if not bounds:
+        stats["not_found"] += 1
+        return None
+    try:
+        items = load_subtree(_decode(html[bounds[0]:bounds[1]]), path)
+    except ValueError as e:
+        logger.debug(f"Failed to decode embedded JSON: {e}")
+        stats["errors"] += 1
+        return None
+    return items if isinstance(items, list) else []
+
+
+def extract_next_data_items(html: Html, path: Sequence[str] = NEXT_DATA_ITEMS_PATH) -> Optional[List[Dict]]:
+    """
+    Список товаров из __NEXT_DATA__
+
+    Returns:
+        None - тега нет или JSON битый; [] - тег есть, но товаров по пути нет
+    """
+    return _extract_items(html, locate_next_data(html), path)
+
+
+def extract_window_state_items(html: Html, path: Sequence[str] = WINDOW_STATE_ITEMS_PATH) -> Optional[List[Dict]]:
+    """Список товаров из window.__STATE__ (семантика как у extract_next_data_items)"""
+    return _extract_items(html, locate_window_state(html), path)
@@ -0,0 +1,184 @@
+# utils/parse_executor.py
+"""
+Пул процессов для CPU-тяжелого парсинга HTML
+
+BeautifulSoup и регулярки по многомегабайтному HTML Яндекс.Маркета
+блокируют event loop (и обработку команд Telegram) на сотни миллисекунд.
+ParseExecutor отправляет сырые байты HTML в прогретые процессы и получает
+обратно компактные dict товаров. Парсер задается именем из PARSERS, поэтому
+в воркер передаются только bytes и строки - без pickle сервисов.
+
+При PARSE_POOL_SIZE=0 или сломанном пуле парсинг выполняется в текущем
+процессе в потоке (event loop все равно не блокируется).
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Union
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Имя парсера -> "module:function"; функция принимает (html: str, url: str)
+PARSERS: Dict[str, str] = {
+    "catalog": "services.smart_search_service:parse_catalog_html",
+    "search": "services.smart_search_service:parse_search_html",
+    "product": "parsers.yandex_market_parser_core:parse_yandex_market_core",
+}
+
+# Кэш разрешенных функций (свой в каждом процессе)
+_resolved: Dict[str, Callable[..., Any]] = {}
+
+
+def _resolve(name: str) -> Callable[..., Any]:
+    func = _resolved.get(name)
+    if func is None:
+        module_name, func_name = PARSERS[name].split(":")
+        func = getattr(importlib.import_module(module_name), func_name)
+        _resolved[name] = func
+    return func
+
+
+def _warm_worker(names):
+    """Initializer воркера: заранее импортируем bs4/lxml и модули парсеров"""
+    for name in names:
+        try:
+            _resolve(name)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Parse worker failed to preload {name}: {e}")
+
+
+def _ping() -> bool:
+    return True
+
+
+def _run_parser(name: str, payload: Union[bytes, str], url: str) -> Any:
+    """Выполняется в воркере: декодирует HTML и вызывает парсер"""
+    html = payload.decode("utf-8", errors="replace") if isinstance(payload, bytes) else payload
+    return _resolve(name)(html, url)
+
+
+class ParseExecutor:
+    """Пул процессов парсинга с синхронным fallback"""
+
+    def __init__(self, max_workers: int = None, start_method: str = None):
+        self.max_workers = getattr(config, "PARSE_POOL_SIZE", 2) if max_workers is None else max_workers
+        self.start_method = start_method if start_method is not None else getattr(config, "PARSE_POOL_START_METHOD", "")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._disabled = self.max_workers <= 0
+        self.stats = {
+            "pool_tasks": 0,
+            "fallback_tasks": 0,
+            "errors": 0,
+            "pool_failures": 0,
+            "total_seconds": 0.0,
+        }
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self._disabled:
+            return None
+        if self._pool is None:
+            try:
+                context = multiprocessing.get_context(self.start_method or None)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_warm_worker,
+                    initargs=(tuple(PARSERS),),
+                )
+                # Прогрев: поднимаем все воркеры сразу, а не на первом каталоге
+                for _ in range(self.max_workers):
+                    self._pool.submit(_ping)
+                logger.info(f"Parse executor started: {self.max_workers} workers ({context.get_start_method()})")
+            except Exception as e:
+                logger.warning(f"Failed to start parse pool, using in-process parsing: {e}")
+                self._disabled = True
+                return None
+        return self._pool
+
+    def parse_sync(self, name: str, html: Union[bytes, str], url: str = "") -> Any:
+        """Синхронный парсинг в текущем процессе"""
+        return _run_parser(name, html, url)
+
+    async def parse(self, name: str, html: Union[bytes, str], url: str = "") -> Any:
+        """
+        Распарсить HTML парсером name в пуле процессов
+
+        Args:
+            name: Ключ из PARSERS
+            html: Сырой HTML (bytes или str)
+            url: URL страницы (для парсеров, которым он нужен)
+
+        Returns:
+            Результат парсера (список/словарь товаров)
+        """
+        if name not in PARSERS:
+            raise ValueError(f"Unknown parser: {name}")
+
+        payload = html.encode("utf-8") if isinstance(html, str) else html
+        started = time.monotonic()
+        try:
+            pool = self._get_pool()
+            if pool is not None:
+                try:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(pool, _run_parser, name, payload, url)
+                    self.stats["pool_tasks"] += 1
+                    return result
+                except BrokenProcessPool as e:
+                    # Воркер упал (OOM/kill) - переходим на парсинг в процессе
+                    logger.error(f"Parse pool broken, falling back to in-process parsing: {e}")
+                    self.stats["pool_failures"] += 1
+                    self._shutdown_pool(wait=False)
+                    self._disabled = True
+
+            self.stats["fallback_tasks"] += 1
+            return await asyncio.to_thread(_run_parser, name, payload, url)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["total_seconds"] += time.monotonic() - started
+
+    def _shutdown_pool(self, wait: bool):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    def shutdown(self, wait: bool = True):
+        """Остановить воркеры (при завершении бота)"""
+        self._shutdown_pool(wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для мониторинга"""
+        tasks = self.stats["pool_tasks"] + self.stats["fallback_tasks"]
+        return {
+            **self.stats,
+            "workers": 0 if self._disabled else self.max_workers,
+            "avg_ms": round(self.stats["total_seconds"] / tasks * 1000, 1) if tasks else 0.0,
+        }
+
+
+# Глобальный экземпляр
+_parse_executor: Optional[ParseExecutor] = None
+
+
+def get_parse_executor() -> ParseExecutor:
+    """Получить глобальный пул парсинга"""
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ParseExecutor()
+    return _parse_executor
+
+
+def shutdown_parse_executor(wait: bool = True):
+    """Остановить глобальный пул парсинга, если он был запущен"""
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait)
+        _parse_executor = None
@@ -1,10 +1,24 @@
 """
-Prompt Generator - генерация промптов для авто-дебага и авто-рефакторинга
+Prompt Generator - генерация промптов для авто-дебага и авто-рефакторинга,
+компактный контекст товара и бюджет токенов для промптов обогащения
 """
 
-from typing import Optional, Literal
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Literal, Sequence, Tuple
 from enum import Enum
 
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
 
 class PromptMode(Enum):
     """Режимы генерации промптов"""
@@ -287,3 +301,214 @@ def generate_prompt_from_diff(
         Сгенерированный промпт
     """
     return PromptGenerator.generate_from_diff(diff, mode, context)
+
+
+# ---------------------------------------------------------------------------
+# Бюджет токенов
+# ---------------------------------------------------------------------------
+
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+@lru_cache(maxsize=1)
+def _tiktoken_encoding():
+    """Кодировка tiktoken (None - пакет не установлен или словарь недоступен)"""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.debug(f"tiktoken encoding unavailable, using estimate: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценка числа токенов текста
+
+    С tiktoken - точный подсчет, иначе эвристика: латиница ~4 символа на
+    токен, кириллица и прочее ~2.5 (BPE-словари дробят ее сильнее),
+    знаки препинания - по токену.
+    """
+    if not text:
+        return 0
+    encoding = _tiktoken_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    tokens = 0
+    for piece in _TOKEN_PIECE_RE.findall(text):
+        chars_per_token = 4.0 if piece.isascii() else 2.5
+        tokens += max(1, math.ceil(len(piece) / chars_per_token))
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезать текст до max_tokens (по границе слова, с многоточием)"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Бинарный поиск по длине: оценка монотонна по префиксу; длинный текст
+    # сначала грубо обрезаем, чтобы не оценивать мегабайты
+    text = text[: max_tokens * 12]
+    if estimate_tokens(text) + 1 <= max_tokens:
+        return text.rstrip() + "…"
+    low, high = 0, len(text)
+    while high - low > 1:
+        mid = (low + high) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid
+    cut = text[:low]
+    space = cut.rfind(" ")
+    if space > low * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def fit_sections(sections: Sequence[Tuple[str, str]], max_tokens: int) -> List[Tuple[str, str]]:
+    """
+    Уложить секции промпта в бюджет
+
+    Args:
+        sections: (заголовок, текст) в порядке важности - первые сохраняются целиком
+        max_tokens: Бюджет на все секции
+
+    Returns:
+        Секции, где хвостовые обрезаны или отброшены
+    """
+    fitted = []
+    remaining = max_tokens
+    for title, text in sections:
+        if not text:
+            continue
+        cost = estimate_tokens(title) + 2
+        if remaining - cost <= 0:
+            break
+        text = truncate_to_tokens(text, remaining - cost)
+        if not text:
+            break
+        fitted.append((title, text))
+        remaining -= cost + estimate_tokens(text)
+    return fitted
+
+
+# ---------------------------------------------------------------------------
+# Компактный контекст товара
+# ---------------------------------------------------------------------------
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+_PRICE_RE = re.compile(r"(\d[\d\s]{0,12})\s*(?:₽|руб)")
+_CC_LINK_RE = re.compile(r"https?://market\.yandex\.ru/cc/[A-Za-z0-9_-]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _clean(text: str) -> str:
+    return _SPACES_RE.sub(" ", text or "").strip()
+
+
+def top_review_sentences(reviews: Sequence[str], limit: int = 5, max_len: int = 220) -> List[str]:
+    """
+    Самые частые (затем - самые ранние) предложения отзывов без повторов
+
+    Args:
+        reviews: Тексты отзывов
+        limit: Сколько предложений вернуть
+        max_len: Длиннее - обрезается
+
+    Returns:
+        Список предложений
+    """
+    counts: Dict[str, int] = {}
+    first: Dict[str, Tuple[int, str]] = {}
+    for review in reviews or []:
+        if not isinstance(review, str):
+            continue
+        for sentence in _SENTENCE_RE.split(review):
+            sentence = _clean(sentence)
+            if len(sentence) < 12:  # "Отлично!" и подобное ничего не добавляет
+                continue
+            key = re.sub(r"[^\w ]", "", sentence.lower())
+            counts[key] = counts.get(key, 0) + 1
+            if key not in first:
+                first[key] = (len(first), sentence[:max_len])
+    ranked = sorted(first, key=lambda key: (-counts[key], first[key][0]))
+    return [first[key][1] for key in ranked[:limit]]
+
+
+def _extract_from_html(raw_html: str, max_specs: int) -> Dict[str, Any]:
+    """Заголовок, цены, характеристики и /cc/ ссылки из HTML карточки"""
+    result: Dict[str, Any] = {"title": "", "prices": [], "specs": [], "cc_links": [], "text": ""}
+    if not raw_html:
+        return result
+
+    result["cc_links"] = list(dict.fromkeys(_CC_LINK_RE.findall(raw_html)))[:3]
+    try:
+        from lxml import html as lxml_html
+
+        tree = lxml_html.fromstring(raw_html)
+    except Exception:
+        text = _clean(re.sub(r"<[^>]+>", " ", raw_html))
+        result["text"] = text
+        result["prices"] = [_clean(p) for p in _PRICE_RE.findall(text)][:3]
+        return result
+
+    for bad in tree.xpath("//script|//style|//noscript|//svg"):
+        bad.drop_tree()
+
+    title = tree.xpath("string(//h1)") or tree.xpath("string(//meta[@property='og:title']/@content)")
+    result["title"] = _clean(title)
+
+    price_nodes = tree.xpath("//*[contains(@data-auto, 'price')]")
+    price_text = " ".join(_clean(node.text_content()) for node in price_nodes[:4])
+    text = _clean(" ".join(tree.itertext()))
+    result["prices"] = list(dict.fromkeys(_clean(p) for p in _PRICE_RE.findall(price_text or text)))[:3]
+
+    specs = []
+    for dt in tree.xpath("//dt"):
+        dd = dt.getnext()
+        if dd is not None and dd.tag == "dd":
+            specs.append(f"{_clean(dt.text_content())}: {_clean(dd.text_content())}")
+    if not specs:
+        for row in tree.xpath("//tr[count(td|th)=2]"):
+            cells = [_clean(cell.text_content()) for cell in row.xpath("td|th")]
+            if all(cells):
+                specs.append(f"{cells[0]}: {cells[1]}")
+    result["specs"] = [spec for spec in specs if len(spec) < 160][:max_specs]
+    result["text"] = text
+    return result
+
+
+def compact_product_context(
+    raw_data: Dict[str, Any], max_reviews: int = 5, max_specs: int = 12
+) -> Dict[str, Any]:
+    """
+    Только нужные для промпта поля товара вместо сырого HTML и всех отзывов
+
+    Args:
+        raw_data: Сырые данные (raw_html, raw_title, raw_price, reviews, specs, ...)
+        max_reviews: Сколько предложений отзывов оставить
+        max_specs: Сколько характеристик оставить
+
+    Returns:
+        {"title", "price", "prices", "specs", "reviews", "cc_links", "text"};
+        text - очищенный текст страницы (запасной вариант, если ничего не извлечено)
+    """
+    extracted = _extract_from_html(raw_data.get("raw_html") or "", max_specs)
+
+    specs = raw_data.get("specs")
+    if isinstance(specs, dict):
+        specs = [f"{key}: {value}" for key, value in specs.items()]
+    elif isinstance(specs, str):
+        specs = [line.strip() for line in specs.splitlines() if line.strip()]
+
+    return {
+        "title": _clean(raw_data.get("raw_title") or raw_data.get("title") or "") or extracted["title"],
+        "price": _clean(str(raw_data.get("raw_price") or raw_data.get("price") or "")),
+        "prices": extracted["prices"],
+        "specs": (specs or extracted["specs"])[:max_specs],
+        "reviews": top_review_sentences(raw_data.get("reviews") or [], max_reviews),
+        "cc_links": extracted["cc_links"],
+        "text": extracted["text"],
+    }
@@ -0,0 +1,48 @@
+# utils/queue_signal.py
+"""
+Сигнал "в очереди появился товар" для queue_worker
+
+Воркер на пустой очереди ждет этот сигнал вместо опроса раз в минуту.
+Ставится при записи в очередь (add_to_queue в database.py и database_async.py,
+возврат аренды release_claim) - в том числе из задач планировщика.
+"""
+import asyncio
+from typing import Optional
+
+_event: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def notify_queue_item() -> None:
+    """Разбудить ждущий воркер (можно вызывать из любого потока)"""
+    event, loop = _event, _loop
+    if event is None or loop is None or loop.is_closed():
+        return  # Воркер еще не ждал - он сам проверит очередь
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        event.set()
+    else:
+        loop.call_soon_threadsafe(event.set)
+
+
+async def wait_for_queue_item(timeout: float) -> bool:
+    """
+    Ждать сигнала не дольше timeout секунд
+
+    Returns:
+        True - разбужен сигналом, False - истек timeout
+    """
+    global _event, _loop
+    loop = asyncio.get_running_loop()
+    if _event is None or _loop is not loop:
+        _event, _loop = asyncio.Event(), loop
+    try:
+        await asyncio.wait_for(_event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        _event.clear()
@@ -12,6 +12,8 @@ from bs4 import BeautifulSoup
 
 import config
 from utils.rate_limiter import get_rate_limiter
+from services.http_registry import get_http_registry
+from services.http_response_cache import get_response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -49,8 +51,12 @@ async def fetch_with_backoff(url: str, session: aiohttp.ClientSession, max_attem
         try:
             await rate_limiter.acquire()  # Rate limiting
 
+            # SOCKS прокси идут через свой пул соединений из реестра
+            req_session, req_proxy = get_http_registry().proxy_session(
+                proxy.get('http') if proxy else None, fallback=session
+            )
             start_time = time.time()
-            async with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, proxy=proxy.get('http') if proxy else None) as resp:
+            async with req_session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, proxy=req_proxy) as resp:
                 response_time = time.time() - start_time
 
                 # Сообщаем результат прокси сервису
@@ -187,7 +193,7 @@ async def resolve_final_url(url: str, max_redirects: int = 10) -> Optional[str]:
         current_url = url
         redirect_count = 0
 
-        async with aiohttp.ClientSession() as session:
+        async with get_http_registry().borrow("bare") as session:
             while redirect_count < max_redirects:
                 async with session.get(
                     current_url,
@@ -301,7 +307,7 @@ async def fetch_via_api(product_url: str):
     if not token or not config.USE_OFFICIAL_API:
         return {"_debug": "api_skipped"}
 
-    async with aiohttp.ClientSession() as session:
+    async with get_http_registry().borrow("bare") as session:
         # resolve final url quickly
         try:
             async with session.get(
@@ -423,8 +429,57 @@ async def fetch_via_api(product_url: str):
         return {"_debug": "api_failed", "final_url": final_url}
 
 
+async def fetch_price_via_api(product_url: str) -> Optional[Dict[str, Any]]:
+    """
+    Легкая проверка цены через JSON API (без HTML, картинок и партнерской ссылки)
+
+    Returns:
+        {"price": float, "old_price": float|None, "title": str|None} или None,
+        если API не настроен, в URL нет id товара или ответ без цены
+    """
+    token = getattr(config, "YANDEX_OAUTH_TOKEN", None)
+    if not token or not config.USE_OFFICIAL_API:
+        return None
+    m = re.search(r"/(\d{6,})", product_url)
+    if not m:
+        return None
+
+    api_base = os.getenv("YANDEX_API_BASE", "https://api.partner.market.yandex.ru")
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "User-Agent": USER_AGENT,
+        "Accept": "application/json",
+    }
+    try:
+        async with get_http_registry().borrow("bare") as session:
+            async with session.get(
+                f"{api_base}/v2/products/{m.group(1)}", headers=headers, timeout=REQUEST_TIMEOUT
+            ) as resp:
+                if resp.status != 200:
+                    logger.debug("fetch_price_via_api: %s -> %s", product_url, resp.status)
+                    return None
+                data = json.loads(await resp.text(errors="ignore"))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.debug("fetch_price_via_api error %s -> %s", product_url, e)
+        return None
+
+    price = data.get("price") or data.get("min_price")
+    if isinstance(price, dict):
+        price = price.get("value")
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    old_price = data.get("old_price") or data.get("oldPrice")
+    try:
+        old_price = float(old_price) if old_price else None
+    except (TypeError, ValueError):
+        old_price = None
+    return {"price": price, "old_price": old_price, "title": data.get("name") or data.get("title")}
+
+
 async def scrape_yandex_market(
-    url: str, use_playwright: bool = False, playwright_page=None
+    url: str, use_playwright: bool = False, playwright_page=None, max_age: Optional[float] = None
 ):
     """
     Enhanced scraper with improved HTML parsing:
@@ -437,6 +492,7 @@ async def scrape_yandex_market(
         url: Product URL to scrape
         use_playwright: If True, use Playwright page.content() for dynamically rendered content
         playwright_page: Optional Playwright page object (if use_playwright=True)
+        max_age: Acceptable age of a cached page in seconds (None - HTTP_CACHE_DEFAULT_TTL)
 
     Returns:
         Dict with product data including: title, price, images, rating, category, discount, etc.
@@ -472,7 +528,7 @@ async def scrape_yandex_market(
         "Accept-Language": "ru-RU,ru;q=0.9",
         "Referer": "https://yandex.ru/",
     }
-    async with aiohttp.ClientSession() as session:
+    async with get_http_registry().borrow("bare") as session:
         # resolve URL + HTML
         final_url = url
         final_html = None
@@ -495,21 +551,32 @@ async def scrape_yandex_market(
 
         # Fallback to aiohttp if Playwright not used or failed
         if not use_playwright or not final_html:
-            try:
+
+            async def fetch(validators):
                 async with session.get(
-                    url, headers=headers, timeout=REQUEST_TIMEOUT, allow_redirects=True
+                    url,
+                    headers={**headers, **validators},
+                    timeout=REQUEST_TIMEOUT,
+                    allow_redirects=True,
                 ) as resp:
-                    final_url = str(resp.url)
                     try:
-                        final_html = await resp.text(errors="ignore")
+                        text = await resp.text(errors="ignore")
                     except Exception:
-                        final_html = None
+                        text = None
                     logger.info(
                         "resolve_final_url: %s -> final %s (status=%s)",
                         url,
-                        final_url,
+                        resp.url,
                         resp.status,
                     )
+                    return resp.status, text, resp.headers, str(resp.url)
+
+            try:
+                # Та же карточка за последние max_age секунд берется из кэша ответов
+                response = await get_response_cache().get_or_fetch(url, fetch, max_age)
+                if response is not None:
+                    final_url = response.url
+                    final_html = response.text
             except Exception as e:
                 logger.warning("resolve error %s -> %s", url, e)
                 final_url = url
@@ -529,8 +596,9 @@ async def scrape_yandex_market(
 
         # Try the new core parser first
         try:
-            from parsers.yandex_market_parser_core import parse_yandex_market_core
-            core_data = parse_yandex_market_core(html=final_html, url=final_url)
+            # Парсинг в пуле процессов: event loop не блокируется на время разбора HTML
+            from utils.parse_executor import get_parse_executor
+            core_data = await get_parse_executor().parse("product", final_html, final_url)
             if core_data:
                 logger.info(
                     f"scrape_yandex_market: core parser succeeded for {url[:80]}... - title: {core_data['title'][:50]}..., price: {core_data['price']}"
@@ -1089,7 +1157,9 @@ async def scrape_yandex_market(
                         "cc_code": cc_code_from_url or cc_code,
                         "cc_tail": cc_tail_from_url,
                     }
-                    ai_result = await ai_service.enrich_product_safe(raw_data)
+                    from services.ai_worker import PRIORITY_NORMAL, get_ai_worker
+
+                    ai_result = await get_ai_worker().enrich(raw_data, priority=PRIORITY_NORMAL)
                     if ai_result and isinstance(ai_result, ValidatedResult):
                         logger.info(
                             f"AI enrichment successful, using AI data (fallback reasons: {fallback_reasons})"
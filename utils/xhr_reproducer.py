@@ -7,47 +7,26 @@ Network-first approach: capture XHR in Playwright, reproduce via httpx
 import logging
 import json
 import random
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional, Any
 from urllib.parse import urlparse
 import httpx
 
 from config.link_generation_config import (
     USER_AGENTS, XHR_REPRODUCTION_TIMEOUT, XHR_HEADERS_TO_REMOVE
 )
+from services.http_registry import get_http_registry
 
 logger = logging.getLogger(__name__)
 
-# Global httpx client pool for connection reuse
-_http_client: Optional[httpx.AsyncClient] = None
-
 
 def get_http_client() -> httpx.AsyncClient:
-    """Get or create global httpx client for connection pooling."""
-    global _http_client
-    if _http_client is None:
-        # Try to enable HTTP/2 if h2 package is available
-        try:
-            import h2
-            http2_enabled = True
-        except ImportError:
-            http2_enabled = False
-            logger.debug("HTTP/2 not available (h2 package not installed), using HTTP/1.1")
-        
-        _http_client = httpx.AsyncClient(
-            timeout=XHR_REPRODUCTION_TIMEOUT,
-            follow_redirects=True,
-            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
-            http2=http2_enabled  # Enable HTTP/2 if available
-        )
-    return _http_client
+    """Shared httpx client from the HTTP registry (keep-alive pool, HTTP/2 if h2 is installed)."""
+    return get_http_registry().httpx_client(timeout=XHR_REPRODUCTION_TIMEOUT)
 
 
 async def close_http_client():
-    """Close global httpx client (call on shutdown)."""
-    global _http_client
-    if _http_client:
-        await _http_client.aclose()
-        _http_client = None
+    """Close pooled HTTP clients (call on shutdown)."""
+    await get_http_registry().close_all()
 
 
 def prepare_headers(
@@ -296,9 +275,11 @@ def extract_short_url_from_response(response_data: Dict[str, Any]) -> Optional[s
         # Extract /cc/ link if present
         cc_match = cc_pattern.search(str(short_url))
         if cc_match:
-            result = cc_match.group(0).split('?')[0]            return result
+            result = cc_match.group(0).split('?')[0]
+            return result
         # Return as-is if it's a valid URL
-        if isinstance(short_url, str) and short_url.startswith(('http://', 'https://')):            return short_url
+        if isinstance(short_url, str) and short_url.startswith(('http://', 'https://')):
+            return short_url
     
     # Deep recursive search in all string values
     def search_dict(d, depth=0, max_depth=15):
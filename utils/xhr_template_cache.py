@@ -0,0 +1,317 @@
+# utils/xhr_template_cache.py
+"""
+XHR Template Cache - learned share-link request templates
+Captured share XHR is generalized by product: market id and product URL
+are replaced with placeholders, so one capture serves every product.
+Templates are kept per cookie set with health tracking (success rate,
+consecutive failures, staleness) and persisted to disk.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from hashlib import md5
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+from config.link_generation_config import (
+    DEBUG_DIR,
+    XHR_TEMPLATE_MAX_FAILURES,
+    XHR_TEMPLATE_MIN_SUCCESS_RATE,
+    XHR_TEMPLATE_STALE_AFTER,
+)
+
+logger = logging.getLogger(__name__)
+
+XHR_TEMPLATE_FILE = DEBUG_DIR / "xhr_templates.json"
+
+PRODUCT_ID_PLACEHOLDER = "{{product_id}}"
+PRODUCT_URL_PLACEHOLDER = "{{product_url}}"
+PRODUCT_URL_QUOTED_PLACEHOLDER = "{{product_url_quoted}}"
+
+# Cookies, identifying the session (tracking cookies change on every visit)
+SESSION_COOKIES = ("Session_id", "sessionid2", "yandexuid", "L", "yandex_login")
+
+# Minimum attempts before success rate is taken into account
+MIN_ATTEMPTS_FOR_RATE = 10
+
+
+def extract_market_id(url: str) -> Optional[str]:
+    """Market product id (6+ digits in path, as in product_key.normalize_url)."""
+    match = re.search(r"/(\d{6,})(?:/|$)", urlparse(url).path)
+    return match.group(1) if match else None
+
+
+def _cookies_from_header(cookie_header: str) -> Dict[str, str]:
+    cookies = {}
+    for pair in cookie_header.split(";"):
+        if "=" in pair:
+            name, value = pair.strip().split("=", 1)
+            cookies[name.strip()] = value.strip()
+    return cookies
+
+
+def cookie_fingerprint(cookies: Optional[Dict[str, str]] = None, xhr_info: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Fingerprint of the session cookie set.
+
+    Args:
+        cookies: Cookies dict (takes precedence)
+        xhr_info: Captured XHR (Cookie header is used when cookies not given)
+
+    Returns:
+        Short hash or "anonymous"
+    """
+    if cookies is None and xhr_info:
+        headers = xhr_info.get("headers", {}) or {}
+        cookies = _cookies_from_header(headers.get("Cookie") or headers.get("cookie") or "")
+    session = sorted((name, value) for name, value in (cookies or {}).items() if name in SESSION_COOKIES)
+    if not session:
+        return "anonymous"
+    return md5(json.dumps(session).encode()).hexdigest()[:12]
+
+
+def _replace_id(text: str, market_id: str, placeholder: str) -> str:
+    return re.sub(rf"(?<!\d){re.escape(market_id)}(?!\d)", placeholder, text)
+
+
+def build_template(xhr_info: Dict[str, Any], product_url: str) -> Optional[Dict[str, Any]]:
+    """
+    Generalize captured XHR by product.
+
+    Returns:
+        Template (xhr_info with placeholders) or None if the request
+        does not reference the product (cannot be reused for others)
+    """
+    market_id = extract_market_id(product_url)
+    if not market_id or not xhr_info.get("url"):
+        return None
+
+    def generalize(value: Optional[str]) -> Optional[str]:
+        if not isinstance(value, str):
+            return value
+        value = value.replace(quote(product_url, safe=""), PRODUCT_URL_QUOTED_PLACEHOLDER)
+        value = value.replace(product_url, PRODUCT_URL_PLACEHOLDER)
+        return _replace_id(value, market_id, PRODUCT_ID_PLACEHOLDER)
+
+    template = {
+        "method": xhr_info.get("method", "POST"),
+        "url": generalize(xhr_info["url"]),
+        "headers": {
+            name: value
+            for name, value in (xhr_info.get("headers") or {}).items()
+            # Referer is set per product by prepare_headers
+            if name.lower() != "referer"
+        },
+        "body": generalize(xhr_info.get("body")),
+    }
+    generalized = f"{template['url']}{template['body'] or ''}"
+    if not any(p in generalized for p in (PRODUCT_ID_PLACEHOLDER, PRODUCT_URL_PLACEHOLDER, PRODUCT_URL_QUOTED_PLACEHOLDER)):
+        return None
+    return template
+
+
+def render_template(template: Dict[str, Any], product_url: str) -> Optional[Dict[str, Any]]:
+    """Instantiate template for a product (None if URL has no market id)."""
+    market_id = extract_market_id(product_url)
+    if not market_id:
+        return None
+
+    def render(value: Optional[str]) -> Optional[str]:
+        if not isinstance(value, str):
+            return value
+        return (
+            value.replace(PRODUCT_ID_PLACEHOLDER, market_id)
+            .replace(PRODUCT_URL_QUOTED_PLACEHOLDER, quote(product_url, safe=""))
+            .replace(PRODUCT_URL_PLACEHOLDER, product_url)
+        )
+
+    return {
+        "method": template["method"],
+        "url": render(template["url"]),
+        "headers": dict(template.get("headers") or {}),
+        "body": render(template.get("body")),
+    }
+
+
+@dataclass
+class TemplateHealth:
+    """Replay statistics of one template."""
+    learned_at: float = field(default_factory=time.time)
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_success_at: float = 0.0
+    last_failure_at: float = 0.0
+
+    @property
+    def attempts(self) -> int:
+        return self.successes + self.failures
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 1.0
+
+    def is_stale(self, now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        return now - max(self.learned_at, self.last_success_at) > XHR_TEMPLATE_STALE_AFTER
+
+    def is_healthy(self, now: Optional[float] = None) -> bool:
+        if self.consecutive_failures >= XHR_TEMPLATE_MAX_FAILURES:
+            return False
+        if self.attempts >= MIN_ATTEMPTS_FOR_RATE and self.success_rate < XHR_TEMPLATE_MIN_SUCCESS_RATE:
+            return False
+        return not self.is_stale(now)
+
+    def record(self, success: bool):
+        if success:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.last_success_at = time.time()
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure_at = time.time()
+
+
+class XHRTemplateCache:
+    """
+    Learned XHR templates keyed by cookie fingerprint.
+    Same locking/persistence model as XHRCache.
+    """
+
+    def __init__(self, cache_file: Path = XHR_TEMPLATE_FILE):
+        self.cache_file = cache_file
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._health: Dict[str, TemplateHealth] = {}
+        self._lock = asyncio.Lock()
+        self._load()
+
+    def _load(self):
+        """Load templates from disk."""
+        try:
+            if self.cache_file.exists():
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for fingerprint, entry in data.items():
+                    self._templates[fingerprint] = entry["template"]
+                    self._health[fingerprint] = TemplateHealth(**entry.get("health", {}))
+                logger.info(f"📦 Loaded {len(self._templates)} XHR templates")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to load XHR templates: {e}")
+            self._templates, self._health = {}, {}
+
+    def _save(self):
+        """Save templates to disk."""
+        try:
+            data = {
+                fingerprint: {"template": template, "health": asdict(self._health[fingerprint])}
+                for fingerprint, template in self._templates.items()
+            }
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to save XHR templates: {e}")
+
+    def _schedule_save(self):
+        try:
+            asyncio.get_running_loop()
+            asyncio.create_task(asyncio.to_thread(self._save))
+        except RuntimeError:
+            self._save()
+
+    async def learn(self, xhr_info: Dict[str, Any], product_url: str, cookies: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """
+        Store template from a successful capture (replaces the previous one).
+
+        Returns:
+            Cookie fingerprint or None if the XHR cannot be generalized
+        """
+        template = build_template(xhr_info, product_url)
+        if not template:
+            logger.debug(f"XHR does not reference product, not a template: {xhr_info.get('url', '')[:100]}")
+            return None
+        fingerprint = cookie_fingerprint(cookies, xhr_info)
+        async with self._lock:
+            if self._templates.get(fingerprint) != template:
+                self._templates[fingerprint] = template
+                self._health[fingerprint] = TemplateHealth()
+                logger.info(f"💾 Learned XHR template for cookie set {fingerprint}")
+            self._schedule_save()
+        return fingerprint
+
+    async def get(self, fingerprint: Optional[str] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Healthy template for the cookie set (or the best one overall).
+
+        Returns:
+            (fingerprint, template) or None
+        """
+        async with self._lock:
+            now = time.time()
+            if fingerprint is not None:
+                health = self._health.get(fingerprint)
+                if health and health.is_healthy(now):
+                    return fingerprint, self._templates[fingerprint]
+                return None
+            healthy = [fp for fp, health in self._health.items() if health.is_healthy(now)]
+            if not healthy:
+                return None
+            best = max(healthy, key=lambda fp: (self._health[fp].success_rate, self._health[fp].last_success_at))
+            return best, self._templates[best]
+
+    async def record(self, fingerprint: str, success: bool):
+        """Record replay outcome."""
+        async with self._lock:
+            health = self._health.get(fingerprint)
+            if not health:
+                return
+            health.record(success)
+            if not success and not health.is_healthy():
+                logger.warning(
+                    f"⚠️ XHR template {fingerprint} benched "
+                    f"({health.consecutive_failures} consecutive failures, {health.success_rate:.0%} success)"
+                )
+            # Сохраняем не на каждый запрос, а на изменениях статуса и периодически
+            if not success or health.attempts % 20 == 0:
+                self._schedule_save()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Template health per cookie set."""
+        now = time.time()
+        return {
+            fingerprint: {
+                "healthy": health.is_healthy(now),
+                "stale": health.is_stale(now),
+                "attempts": health.attempts,
+                "success_rate": round(health.success_rate, 3),
+                "consecutive_failures": health.consecutive_failures,
+                "age_seconds": int(now - health.learned_at),
+            }
+            for fingerprint, health in self._health.items()
+        }
+
+    def clear(self):
+        """Forget all templates."""
+        self._templates.clear()
+        self._health.clear()
+        try:
+            if self.cache_file.exists():
+                self.cache_file.unlink()
+        except Exception:
+            pass
+
+
+# Global template cache instance
+_xhr_template_cache: Optional[XHRTemplateCache] = None
+
+
+def get_xhr_template_cache() -> XHRTemplateCache:
+    """Get or create global XHR template cache instance."""
+    global _xhr_template_cache
+    if _xhr_template_cache is None:
+        _xhr_template_cache = XHRTemplateCache()
+    return _xhr_template_cache
@@ -20,7 +20,7 @@ from config.link_generation_config import (
     BROWSER_LAUNCH_ARGS, BROWSER_LOCALE, BROWSER_TIMEZONE, BROWSER_PERMISSIONS,
     HOVER_DELAY_MIN, HOVER_DELAY_MAX, CLICK_DELAY_MIN, CLICK_DELAY_MAX,
     MOUSE_MOVE_DELAY_MIN, MOUSE_MOVE_DELAY_MAX, NETWORK_WAIT_MIN, NETWORK_WAIT_MAX,
-    RETRY_DELAY_MIN, RETRY_DELAY_MAX, STORAGE_STATE_HASH_MOD
+    RETRY_DELAY_MIN, RETRY_DELAY_MAX, STORAGE_STATE_HASH_MOD, XHR_REPRODUCTION_TIMEOUT
 )
 from exceptions.link_generation_exceptions import (
     LinkGenerationError, NetworkError, TimeoutError as LinkTimeoutError,
@@ -448,7 +448,8 @@ class YandexMarketLinkGen:
                             
                             # Look for shortUrl in common locations
                             cc_link = None
-                            if isinstance(data, dict):                                # #endregion
+                            if isinstance(data, dict):
+                                # #endregion
                                 
                                 # Direct fields
                                 # #region agent edit - дополнительные поля для resolveSharingPopupV2
@@ -742,7 +743,8 @@ class YandexMarketLinkGen:
                     captcha_indicators = ['я не робот', 'вы не робот', 'i am not a robot', 'подтвердите, что запросы отправляли вы', 'smartcaptcha', 'нажмите в таком порядке']
                     for indicator in captcha_indicators:
                         if indicator in page_text.lower():
-                            logger.error(f"🚫 CAPTCHA text detected: '{indicator}'")                            if self.debug and job_id:
+                            logger.error(f"🚫 CAPTCHA text detected: '{indicator}'")
+                            if self.debug and job_id:
                                 await page.screenshot(path=str(DEBUG_DIR / f"{job_id}_captcha_text.jpg"), full_page=True)
                             if not self.headless:
                                 logger.warning("⏳ Ожидаю решения CAPTCHA вручную...")
@@ -753,9 +755,11 @@ class YandexMarketLinkGen:
                                     await asyncio.sleep(2)
                                     new_text = await page.text_content('body')
                                     if new_text:
-                                        has_captcha = any(ind in new_text.lower() for ind in captcha_indicators)                                        if not has_captcha:
+                                        has_captcha = any(ind in new_text.lower() for ind in captcha_indicators)
+                                        if not has_captcha:
                                             logger.info("✅ CAPTCHA решена")
-                                            await self._save_storage_state(page.context, page.url, only_if_success=True)                                            return False
+                                            await self._save_storage_state(page.context, page.url, only_if_success=True)
+                                            return False
                                     if attempt % 15 == 0 and attempt > 0:  # Каждые 30 секунд
                                         logger.info(f"⏳ Ожидаю решения CAPTCHA... (попытка {attempt}/150, прошло {attempt * 2} секунд)")
                                 logger.error("⏱️ Timeout ожидания решения CAPTCHA (5 минут)")
@@ -793,14 +797,16 @@ class YandexMarketLinkGen:
                 ]
                 for indicator in login_indicators:
                     if indicator in page_text.lower():
-                        logger.warning(f"⚠️ Обнаружен индикатор входа: '{indicator}'")                        if self.debug and job_id:
+                        logger.warning(f"⚠️ Обнаружен индикатор входа: '{indicator}'")
+                        if self.debug and job_id:
                             await page.screenshot(path=str(DEBUG_DIR / f"{job_id}_login_required.jpg"), full_page=True)
                         return True
             
             # Проверяем наличие кнопки "Войти"
             login_button = page.locator('button:has-text("Войти"), a:has-text("Войти"), button:has-text("Вход"), a:has-text("Вход")')
             if await login_button.count() > 0:
-                logger.warning("⚠️ Обнаружена кнопка входа")                return True
+                logger.warning("⚠️ Обнаружена кнопка входа")
+                return True
             
             return False
         except Exception as e:
@@ -1215,7 +1221,8 @@ class YandexMarketLinkGen:
         
         # Find share button with multiple selectors
         share_button = None
-        used_selector = None        for selector in SHARE_BUTTON_SELECTORS:
+        used_selector = None
+        for selector in SHARE_BUTTON_SELECTORS:
             try:
                 share_button = await asyncio.wait_for(
                     page.query_selector(selector),
@@ -1223,12 +1230,16 @@ class YandexMarketLinkGen:
                 )
                 if share_button:
                     used_selector = selector
-                    logger.info(f"✅ Found share button: {selector}")                    break
-            except asyncio.TimeoutError:                continue
+                    logger.info(f"✅ Found share button: {selector}")
+                    break
+            except asyncio.TimeoutError:
+                continue
             except Exception as e:
-                logger.debug(f"Selector {selector} failed: {e}")                continue
+                logger.debug(f"Selector {selector} failed: {e}")
+                continue
         
-        if not share_button:            raise ButtonNotFoundError(
+        if not share_button:
+            raise ButtonNotFoundError(
                 f"Share button not found on page (tried {len(SHARE_BUTTON_SELECTORS)} selectors)",
                 xhr_info=captured.get("xhr_info")
             )
@@ -1342,7 +1353,8 @@ class YandexMarketLinkGen:
                                             if cc_link not in xhr_captured_links["links"]:
                                                 xhr_captured_links["links"].append(cc_link)
                                                 captured["link"] = cc_link
-                                                logger.info(f"✅ Found link via XHR after share click (direct field): {cc_link}")                                                return
+                                                logger.info(f"✅ Found link via XHR after share click (direct field): {cc_link}")
+                                                return
                                 
                                 # Если не нашли в прямых полях, ищем рекурсивно
                                 if not cc_link:
@@ -1352,8 +1364,10 @@ class YandexMarketLinkGen:
                                         if cc_link and cc_link not in xhr_captured_links["links"]:
                                             xhr_captured_links["links"].append(cc_link)
                                             captured["link"] = cc_link
-                                            logger.info(f"✅ Found link via XHR after share click (recursive): {cc_link}")                                            return
-                            except Exception as e:                                try:
+                                            logger.info(f"✅ Found link via XHR after share click (recursive): {cc_link}")
+                                            return
+                            except Exception as e:
+                                try:
                                     text = await response.text()
                                     matches = re.findall(r'market\.yandex\.ru/cc/([A-Za-z0-9_-]+)', text, re.IGNORECASE)
                                     if matches:
@@ -1363,11 +1377,13 @@ class YandexMarketLinkGen:
                                                 if self._extract_cc_link(cc_link) and cc_link not in xhr_captured_links["links"]:
                                                     xhr_captured_links["links"].append(cc_link)
                                                     captured["link"] = cc_link
-                                                    logger.info(f"✅ Found link via XHR text after share click: {cc_link}")                                                    break
+                                                    logger.info(f"✅ Found link via XHR text after share click: {cc_link}")
+                                                    break
                                 except:
                                     pass
                         # #endregion
-                    except Exception as e:                        pass
+                    except Exception as e:
+                        pass
                 
                 # Устанавливаем дополнительный перехватчик для всех ответов после клика на "Поделиться"
                 page.on("response", capture_all_xhr_after_share)
@@ -1385,7 +1401,8 @@ class YandexMarketLinkGen:
                         timeout=NETWORK_RESPONSE_TIMEOUT / 1000  # Convert to seconds
                     )
                     
-                    # Human-like click (mouse down/up sequence)                    await self._human_like_click(page, share_button)
+                    # Human-like click (mouse down/up sequence)
+                    await self._human_like_click(page, share_button)
                     logger.debug("✅ Clicked button (human-like)")                    
                     # Wait for network response
                     try:
@@ -1418,8 +1435,9 @@ class YandexMarketLinkGen:
                                 cc_link = self._extract_cc_link(short_url)
                                 if cc_link:
                                     captured["link"] = cc_link
-                                    logger.info(f"✅ Found link via click response: {cc_link}")                                    break
-                                else:                        except asyncio.TimeoutError:
+                                    logger.info(f"✅ Found link via click response: {cc_link}")
+                                    break
+                        except asyncio.TimeoutError:
                             logger.debug("⚠️ Response parsing timeout")
                         except Exception as e:
                             logger.debug(f"⚠️ Response parsing failed: {e}")
@@ -1438,8 +1456,8 @@ class YandexMarketLinkGen:
                 
                 # STEP 5: Check if network interception captured link during click
                 if captured.get("link"):
-                    logger.info(f"✅ Link captured by network interception: {captured['link']}")                    break
-                else:                
+                    logger.info(f"✅ Link captured by network interception: {captured['link']}")
+                    break
                 # STEP 6: ROBUST FALLBACK - Try clipboard and DOM search
                 # Wait for modal to appear (with increased timeout: 45s)
                 # #region agent edit - добавляем проверку модального окна через JavaScript
@@ -1470,7 +1488,8 @@ class YandexMarketLinkGen:
                             modal_found = True
                             break
                         await asyncio.sleep(2.0)
-                        modal_check_result = await page.evaluate(modal_check_js)                        if modal_check_result.get("found"):
+                        modal_check_result = await page.evaluate(modal_check_js)
+                        if modal_check_result.get("found"):
                             logger.info(f"✅ Share modal found via JavaScript: {modal_check_result.get('selector')}")
                             modal_found = True
                             # #region agent edit - сразу после обнаружения модального окна ищем ссылку в нем
@@ -1701,7 +1720,8 @@ class YandexMarketLinkGen:
                                         ]:
                                             try:
                                                 copy_link_button = await page.query_selector(selector)
-                                                if copy_link_button:                                                    break
+                                                if copy_link_button:
+                                                    break
                                             except Exception:
                                                 continue
                                         
@@ -1815,7 +1835,8 @@ class YandexMarketLinkGen:
                                                         cc_link = self._extract_cc_link(copied_text)
                                                         if cc_link:
                                                             captured["link"] = cc_link
-                                                            logger.info(f"✅ Found link via copy event interception: {cc_link}")                                                            break
+                                                            logger.info(f"✅ Found link via copy event interception: {cc_link}")
+                                                            break
                                                     
                                                     # Проверяем ссылку, найденную через MutationObserver
                                                     found_link = await page.evaluate("() => window.__foundLink || null")
@@ -1823,7 +1844,8 @@ class YandexMarketLinkGen:
                                                         cc_link = self._extract_cc_link(found_link)
                                                         if cc_link:
                                                             captured["link"] = cc_link
-                                                            logger.info(f"✅ Found link via MutationObserver: {cc_link}")                                                            break
+                                                            logger.info(f"✅ Found link via MutationObserver: {cc_link}")
+                                                            break
                                                     
                                                     # Проверяем DOM модального окна
                                                     modal_link_after_click = await page.evaluate("""
@@ -1860,7 +1882,8 @@ class YandexMarketLinkGen:
                                                         cc_link = self._extract_cc_link(modal_link_after_click)
                                                         if cc_link:
                                                             captured["link"] = cc_link
-                                                            logger.info(f"✅ Found link in modal after copy button click: {cc_link}")                                                            break
+                                                            logger.info(f"✅ Found link in modal after copy button click: {cc_link}")
+                                                            break
                                                     
                                                     # Проверяем localStorage и sessionStorage
                                                     storage_link = await page.evaluate("""
@@ -1891,7 +1914,8 @@ class YandexMarketLinkGen:
                                                         cc_link = self._extract_cc_link(storage_link)
                                                         if cc_link:
                                                             captured["link"] = cc_link
-                                                            logger.info(f"✅ Found link in storage: {cc_link}")                                                            break
+                                                            logger.info(f"✅ Found link in storage: {cc_link}")
+                                                            break
                                                     
                                                     # МЕТОД 7: Поиск ссылки в iframe (если модальное окно в iframe)
                                                     iframe_link = await page.evaluate("""
@@ -1928,7 +1952,8 @@ class YandexMarketLinkGen:
                                                         cc_link = self._extract_cc_link(iframe_link)
                                                         if cc_link:
                                                             captured["link"] = cc_link
-                                                            logger.info(f"✅ Found link in iframe: {cc_link}")                                                            break
+                                                            logger.info(f"✅ Found link in iframe: {cc_link}")
+                                                            break
                                                     
                                                     # МЕТОД 8: Поиск ссылки в глобальных переменных JavaScript
                                                     global_link = await page.evaluate("""
@@ -1961,7 +1986,8 @@ class YandexMarketLinkGen:
                                                         cc_link = self._extract_cc_link(global_link)
                                                         if cc_link:
                                                             captured["link"] = cc_link
-                                                            logger.info(f"✅ Found link in global variables: {cc_link}")                                                            break
+                                                            logger.info(f"✅ Found link in global variables: {cc_link}")
+                                                            break
                                                     
                                                     if captured.get("link"):
                                                         break
@@ -1974,23 +2000,29 @@ class YandexMarketLinkGen:
                                                             cc_link = self._extract_cc_link(clipboard_text)
                                                             if cc_link:
                                                                 captured["link"] = cc_link
-                                                                logger.info(f"✅ Found link in clipboard after copy button click: {cc_link}")                                                    except Exception as e:
+                                                                logger.info(f"✅ Found link in clipboard after copy button click: {cc_link}")
+                                                    except Exception as e:
                                                         logger.debug(f"⚠️ Failed to read clipboard: {e}")                                                
                                                 if captured.get("link"):
                                                     break
                                                     
                                             except Exception as e:
-                                                logger.debug(f"⚠️ Failed to click copy button via JS: {e}")                                            # #endregion
-                                        else:                                    except Exception as e:
-                                        logger.debug(f"⚠️ Failed to click copy button: {e}")                                # #endregion
+                                                logger.debug(f"⚠️ Failed to click copy button via JS: {e}")
+                                            # #endregion
+                                    except Exception as e:
+                                        logger.debug(f"⚠️ Failed to click copy button: {e}")
+                                # #endregion
                                 
                                 if modal_link:
-                                    cc_link = self._extract_cc_link(modal_link)                                    if cc_link:
+                                    cc_link = self._extract_cc_link(modal_link)
+                                    if cc_link:
                                         captured["link"] = cc_link
-                                        logger.info(f"✅ Found link in modal via JavaScript: {cc_link}")                                        # Прерываем цикл проверки модального окна, так как ссылка найдена
+                                        logger.info(f"✅ Found link in modal via JavaScript: {cc_link}")
+                                        # Прерываем цикл проверки модального окна, так как ссылка найдена
                                         break
-                                else:                            except Exception as e:
-                                logger.debug(f"⚠️ Failed to find link in modal via JavaScript: {e}")                            # #endregion
+                            except Exception as e:
+                                logger.debug(f"⚠️ Failed to find link in modal via JavaScript: {e}")
+                            # #endregion
                             # Прерываем цикл проверки модального окна
                             break
                     
@@ -2008,8 +2040,10 @@ class YandexMarketLinkGen:
                         logger.debug("✅ Share modal appeared via Playwright")
                         modal_found = True
                 except asyncio.TimeoutError:
-                    logger.warning("⚠️ Share modal did not appear within 45s, continuing with DOM search...")                except Exception as e:
-                    logger.debug(f"⚠️ Modal wait error: {e}, continuing...")                # #endregion
+                    logger.warning("⚠️ Share modal did not appear within 45s, continuing with DOM search...")
+                except Exception as e:
+                    logger.debug(f"⚠️ Modal wait error: {e}, continuing...")
+                # #endregion
                 
                 # Wait a bit for modal to stabilize
                 await asyncio.sleep(random.uniform(0.5, 1.0))
@@ -2055,7 +2089,8 @@ class YandexMarketLinkGen:
                 dom_link = await self._try_dom_search(page)
                 if dom_link:
                     captured["link"] = dom_link
-                    logger.info(f"✅ Found link via DOM search: {dom_link}")                    break
+                    logger.info(f"✅ Found link via DOM search: {dom_link}")
+                    break
                 
                 # #region agent edit - если модальное окно не появилось, пробуем найти ссылку в DOM без модального окна
                 # Иногда ссылка может быть в DOM даже без модального окна
@@ -2090,7 +2125,8 @@ class YandexMarketLinkGen:
                             cc_link = self._extract_cc_link(js_link)
                             if cc_link:
                                 captured["link"] = cc_link
-                                logger.info(f"✅ Found link via JavaScript DOM search (without modal): {cc_link}")                                break
+                                logger.info(f"✅ Found link via JavaScript DOM search (without modal): {cc_link}")
+                                break
                     except Exception as e:
                         logger.debug(f"⚠️ JavaScript DOM search failed: {e}")
                 # #endregion
@@ -2351,6 +2387,15 @@ class YandexMarketLinkGen:
         except Exception:
             return {}
     
+    async def _learn_xhr_template(self, captured: Dict[str, Any], url: str, cookies: Optional[Dict[str, str]] = None):
+        """Teach XHRLinkEngine the share request captured during a successful run."""
+        try:
+            from services.xhr_link_engine import get_xhr_link_engine
+
+            await get_xhr_link_engine().learn(captured.get("xhr_info"), url, cookies)
+        except Exception as e:
+            logger.debug(f"Failed to learn XHR template: {e}")
+
     async def _save_storage_state(self, context, url: str, only_if_success: bool = False):
         """
         Сохраняет storage state (cookies, localStorage) для повторного использования.
@@ -2456,6 +2501,17 @@ class YandexMarketLinkGen:
         # STEP 2: PRIMARY METHOD - Try cached XHR reproduction (NO BROWSER NEEDED)
         # This is the fastest path: pure HTTP client, no rendering
         logger.info("🔄 STEP 2: Trying cached XHR reproduction (PRIMARY METHOD - no browser)...")
+        try:
+            # Learned template works for any product, per-URL cache only for repeats
+            from services.xhr_link_engine import get_xhr_link_engine
+
+            template_link = await get_xhr_link_engine().generate(url)
+            if template_link:
+                return template_link
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"XHR template replay failed: {e}, trying per-URL cache")
         try:
             from utils.xhr_cache import get_xhr_cache
             from utils.xhr_reproducer import reproduce_xhr_directly, extract_short_url_from_response
@@ -2517,7 +2573,8 @@ class YandexMarketLinkGen:
                 url=url
             )
         
-        async with async_playwright() as pw:            try:
+        async with async_playwright() as pw:
+            try:
                 # Use context pool for better performance
                 from utils.context_pool import get_context_pool
                 
@@ -2528,7 +2585,8 @@ class YandexMarketLinkGen:
                 logger.info(f"🔄 STEP 3: Using Playwright fallback (UA: {user_agent[:50]}...)")
                 logger.debug(f"🔄 Using viewport: {viewport}")
                 
-                # Проверяем, нужно ли использовать браузер Yandex с существующим профилем                import config
+                # Проверяем, нужно ли использовать браузер Yandex с существующим профилем
+                import config
                 use_yandex_profile = getattr(config, 'USE_YANDEX_BROWSER_PROFILE', False)
                 yandex_user_data_dir = getattr(config, 'YANDEX_BROWSER_USER_DATA_DIR', '')
                 yandex_executable_path = getattr(config, 'YANDEX_BROWSER_EXECUTABLE_PATH', '')
@@ -2541,13 +2599,16 @@ class YandexMarketLinkGen:
                 # Пытаемся подключиться даже если connect_to_existing=False, так как браузер запускается при старте бота
                 cdp_url_to_try = existing_browser_cdp_url if existing_browser_cdp_url else 'http://127.0.0.1:9222'
                 # ВСЕГДА пытаемся подключиться через CDP - это приоритетный способ
-                logger.info(f"🔗 Attempting to connect to browser via CDP: {cdp_url_to_try}")                try:
+                logger.info(f"🔗 Attempting to connect to browser via CDP: {cdp_url_to_try}")
+                try:
                     browser = await pw.chromium.connect_over_cdp(cdp_url_to_try)
                     is_connected_browser = True
-                    logger.info("✅ Connected to existing browser via CDP - will use existing browser window")                except Exception as e:
+                    logger.info("✅ Connected to existing browser via CDP - will use existing browser window")
+                except Exception as e:
                     logger.error(f"❌ Failed to connect to existing browser via CDP: {e}")
                     logger.error(f"❌ Browser must be running with --remote-debugging-port=9222")
-                    logger.error(f"❌ Will NOT launch new browser to avoid creating second window")                    browser = None
+                    logger.error(f"❌ Will NOT launch new browser to avoid creating second window")
+                    browser = None
                     is_connected_browser = False
                     # НЕ запускаем новый браузер - это создаст второе окно
                     # Вместо этого выдаем ошибку
@@ -2559,7 +2620,9 @@ class YandexMarketLinkGen:
                 # Это предотвращает создание второго окна браузера
                 # КОД ОТКЛЮЧЕН - НЕ ЗАПУСКАЕМ НОВЫЙ БРАУЗЕР
                 if False:  # ВСЕГДА False - этот блок никогда не выполнится
-                    logger.warning("⚠️ CDP connection failed, but attempting to use Yandex profile - this may create a second browser window")                    logger.info(f"🌐 Using Yandex browser profile: {yandex_user_data_dir}")                    try:
+                    logger.warning("⚠️ CDP connection failed, but attempting to use Yandex profile - this may create a second browser window")
+                    logger.info(f"🌐 Using Yandex browser profile: {yandex_user_data_dir}")
+                    try:
                         from pathlib import Path
                         import shutil
                         user_data_path = Path(yandex_user_data_dir)
@@ -2573,14 +2636,16 @@ class YandexMarketLinkGen:
                         else:
                             # Используем launch_persistent_context для работы с user data directory
                             # Это позволяет использовать user data directory даже если браузер уже запущен
-                            logger.info("✅ Using Yandex browser user data directory with launch_persistent_context")                            # Используем launch_persistent_context - это правильный способ работы с user data directory
+                            logger.info("✅ Using Yandex browser user data directory with launch_persistent_context")
+                            # Используем launch_persistent_context - это правильный способ работы с user data directory
                             # Persistent context создает BrowserContext напрямую, но нам нужен Browser для pool
                             # Решение: используем launch с правильными параметрами, но с отдельным профилем
                             # чтобы избежать конфликта с запущенным браузером
                             try:
                                 # Пробуем использовать оригинальный профиль напрямую через launch_persistent_context
                                 # Это позволит использовать cookies и авторизацию из основного браузера
-                                logger.info(f"📋 Using original Yandex profile: {user_data_path}")                                persistent_context = await pw.chromium.launch_persistent_context(
+                                logger.info(f"📋 Using original Yandex profile: {user_data_path}")
+                                persistent_context = await pw.chromium.launch_persistent_context(
                                     user_data_dir=str(user_data_path),
                                     headless=self.headless and not self.debug,
                                     executable_path=yandex_executable_path if yandex_executable_path else None,
@@ -2589,11 +2654,13 @@ class YandexMarketLinkGen:
                                 # Получаем browser из persistent context
                                 browser = persistent_context.browser
                                 if browser:
-                                    logger.info("✅ Browser obtained from persistent context (original profile)")                                else:
+                                    logger.info("✅ Browser obtained from persistent context (original profile)")
+                                else:
                                     logger.warning("⚠️ Browser not available from persistent context")
                                     browser = None
                             except Exception as persistent_error:
-                                logger.warning(f"⚠️ Failed to use launch_persistent_context: {persistent_error}")                                # Если persistent context не может быть запущен (например, браузер уже использует user_data_dir),
+                                logger.warning(f"⚠️ Failed to use launch_persistent_context: {persistent_error}")
+                                # Если persistent context не может быть запущен (например, браузер уже использует user_data_dir),
                                 # пробуем использовать обычный launch с отдельным профилем
                                 logger.info("⚠️ Persistent context failed, trying regular launch with separate profile...")
                                 try:
@@ -2627,7 +2694,8 @@ class YandexMarketLinkGen:
                                     logger.warning(f"⚠️ Failed to use separate profile: {e2}")
                                     browser = None
                     except Exception as e:
-                        logger.warning(f"⚠️ Failed to use Yandex browser profile: {e}, using default")                        browser = None
+                        logger.warning(f"⚠️ Failed to use Yandex browser profile: {e}, using default")
+                        browser = None
                 
                 # Вариант 3: Обычный запуск (по умолчанию)
                 # ВАЖНО: Этот вариант НЕ должен выполняться, если CDP подключение не удалось
@@ -2638,7 +2706,8 @@ class YandexMarketLinkGen:
                         "to avoid creating second window. "
                         "Please ensure browser is running with --remote-debugging-port=9222"
                     )
-                    logger.error(error_msg)                    raise LinkGenerationError(
+                    logger.error(error_msg)
+                    raise LinkGenerationError(
                         error_msg,
                         debug_path=None,
                         job_id=job_id,
@@ -2674,9 +2743,11 @@ class YandexMarketLinkGen:
                         logger.info(f"✅ Page already on target URL, skipping navigation: {current_page_url[:100]}")
                         skip_navigation = True
                     else:
-                        logger.info(f"✅ Using existing page from CDP context (page URL: {current_page_url[:100]})")                else:
+                        logger.info(f"✅ Using existing page from CDP context (page URL: {current_page_url[:100]})")
+                else:
                     # Создаем новую страницу
-                    logger.info("🆕 Creating new page in context")                    page = await context.new_page()
+                    logger.info("🆕 Creating new page in context")
+                    page = await context.new_page()
                 # #endregion                
                 # Apply stealth and anti-detection (ALWAYS, even if stealth plugin fails)
                 await self._apply_stealth_and_anti_detection(page, context)
@@ -2702,7 +2773,8 @@ class YandexMarketLinkGen:
                     logger.info("⏭️ Skipping navigation - page already on target URL")
                     navigation_success = True
                 else:
-                    logger.info(f"📄 Navigating to: {url}")                    navigation_success = False
+                    logger.info(f"📄 Navigating to: {url}")
+                    navigation_success = False
                     for nav_attempt in range(3):  # Retry navigation up to 3 times
                         try:
                             # #region agent edit - проверяем captured["link"] во время навигации и прерываем, если найдена
@@ -2720,7 +2792,8 @@ class YandexMarketLinkGen:
                             await navigation_task
                             navigation_success = True
                             # #endregion
-                            # #endregion                            if navigation_success:
+                            # #endregion
+                            if navigation_success:
                                 break
                         except asyncio.TimeoutError:
                             if nav_attempt < 2:
@@ -2811,9 +2884,11 @@ class YandexMarketLinkGen:
                 # Правильная ссылка должна извлекаться через клик на кнопку "Поделиться" и модальное окно
                 # Поэтому мы НЕ возвращаем ссылку здесь, а продолжаем выполнение до клика на кнопку "Поделиться"
                 if captured["link"]:
-                    logger.warning(f"⚠️ Found link during navigation, but ignoring it (will get correct link via Share button): {captured['link']}")                    # Очищаем captured["link"], чтобы продолжить выполнение до клика на кнопку "Поделиться"
+                    logger.warning(f"⚠️ Found link during navigation, but ignoring it (will get correct link via Share button): {captured['link']}")
+                    # Очищаем captured["link"], чтобы продолжить выполнение до клика на кнопку "Поделиться"
                     captured["link"] = None
-                logger.debug("⚠️ No link captured during navigation (or ignored), will try Share button click method")                # #endregion
+                logger.debug("⚠️ No link captured during navigation (or ignored), will try Share button click method")
+                # #endregion
                 
                 # STEP 4: Try XHR reproduction if we captured one during navigation
                 if captured.get("xhr_info"):
@@ -2844,6 +2919,7 @@ class YandexMarketLinkGen:
                                 # Cache successful XHR for future use
                                 cache = get_xhr_cache()
                                 await cache.put(url, captured["xhr_info"])
+                                await self._learn_xhr_template(captured, url, cookies_dict)
                                 # Save network dump before returning
                                 await self._save_network_dump(captured, job_id=job_id)
                                 await self._save_storage_state(context, url, only_if_success=True)
@@ -2865,6 +2941,7 @@ class YandexMarketLinkGen:
                         timeout=self.timeout
                     )
                     if button_link:
+                        await self._learn_xhr_template(captured, url, await self._get_cookies_from_context(context))
                         # Save network dump before returning
                         await self._save_network_dump(captured, job_id=job_id)
                         await self._save_storage_state(context, url, only_if_success=True)